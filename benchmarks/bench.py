@@ -0,0 +1,293 @@
+"""Benchmark suite for the hot paths of the project repository manager. Runs
+each benchmark against synthetic repositories of configurable size, stores the
+results as Json, and compares them against a baseline result file to detect
+scaling regressions.
+
+Usage: python -m benchmarks.bench [--scale <name>] [--output <file>]
+                                  [--baseline <file>] [--tolerance <float>]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from prjrepo.config.context import ContextManager, get_settings_value
+from prjrepo.log import DefaultLogger
+from prjrepo.workflow.engine import WorkflowEngine
+from prjrepo.workflow.expand import CommandTemplate, grid
+from prjrepo.workflow.repository import DefaultCommandRepository
+
+from benchmarks.synthetic import SyntheticRepository, COMMAND_NAME, key_name
+
+
+# ------------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------------
+
+"""Predefined repository sizes. Each scale is a dictionary of arguments for
+the SyntheticRepository constructor.
+"""
+SCALES = {
+    'small': {
+        'contexts': 10,
+        'depth': 3,
+        'keys': 20,
+        'variables': 5,
+        'log_size': 1000
+    },
+    'medium': {
+        'contexts': 100,
+        'depth': 5,
+        'keys': 200,
+        'variables': 20,
+        'log_size': 10000
+    },
+    'large': {
+        'contexts': 1000,
+        'depth': 10,
+        'keys': 1000,
+        'variables': 50,
+        'log_size': 100000
+    }
+}
+
+"""Number of command lines per call in the expansion benchmark."""
+EXPAND_ROWS = 1000
+
+"""Default tolerance for regressions when comparing against a baseline."""
+DEFAULT_TOLERANCE = 0.25
+
+
+# ------------------------------------------------------------------------------
+# Benchmarks
+# ------------------------------------------------------------------------------
+
+class NullWriter(object):
+    """File-like object that discards everything that is written to it. Used to
+    suppress the output of commands that print to STDOUT.
+    """
+    def write(self, s):
+        pass
+
+    def flush(self):
+        pass
+
+
+def benchmarks(repo):
+    """Get the list of benchmarks for a given synthetic repository. Each
+    benchmark is a tuple of name and a function without arguments.
+
+    Parameters
+    ----------
+    repo: benchmarks.synthetic.SyntheticRepository
+        Synthetic repository (already created)
+
+    Returns
+    -------
+    list((string, function))
+    """
+    work_dir = repo.work_dir
+    context = ContextManager(work_dir)
+    config = context.context_settings()
+    settings = config.settings
+    para = key_name(repo.variables - 1)
+    repository = DefaultCommandRepository(context.cmd_dir)
+    engine = WorkflowEngine(DefaultLogger(context.log_file))
+    logger = DefaultLogger(repo.log_file)
+
+    template = CommandTemplate(context, COMMAND_NAME)
+    parameters = [('arg', [str(i) for i in range(EXPAND_ROWS)])]
+
+    def expand_grid():
+        for line in template.lines(grid(parameters)):
+            pass
+
+    def run_print_only():
+        stdout = sys.stdout
+        sys.stdout = NullWriter()
+        try:
+            engine.run_command(context, COMMAND_NAME, {'arg': 'x'}, print_only=True)
+        finally:
+            sys.stdout = stdout
+
+    return [
+        ('ContextManager', lambda: ContextManager(work_dir)),
+        ('Config.settings', lambda: config.settings),
+        ('Config.get_value', lambda: config.get_value(para)),
+        ('get_settings_value', lambda: get_settings_value(settings, para)),
+        ('get_command', lambda: repository.get_command(COMMAND_NAME)),
+        ('run_command.print_only', run_print_only),
+        ('CommandTemplate.lines.' + str(EXPAND_ROWS), expand_grid),
+        ('DefaultLogger.lines', logger.lines)
+    ]
+
+
+def measure(func, min_time=0.2, repeat=3):
+    """Measure the execution time of a function. The function is called in a
+    loop until the loop takes at least min_time seconds. The loop is repeated
+    and the best average time per call is returned.
+
+    Parameters
+    ----------
+    func: function
+        Function without arguments
+    min_time: float, optional
+        Minimal duration of a loop in seconds
+    repeat: int, optional
+        Number of times the loop is repeated
+
+    Returns
+    -------
+    float
+    """
+    # Determine the number of calls per loop
+    loops = 1
+    while True:
+        start = time.time()
+        for i in range(loops):
+            func()
+        elapsed = time.time() - start
+        if elapsed >= min_time:
+            break
+        loops *= 2
+    best = elapsed / loops
+    for i in range(repeat - 1):
+        start = time.time()
+        for i in range(loops):
+            func()
+        best = min(best, (time.time() - start) / loops)
+    return best
+
+
+def run_benchmarks(scales, min_time=0.2):
+    """Run all benchmarks for the given list of scales. Returns a dictionary
+    that contains for each scale the repository parameters and the measured
+    times (in seconds per call).
+
+    Parameters
+    ----------
+    scales: list(string)
+        Names of repository scales
+    min_time: float, optional
+        Minimal duration of a measurement loop in seconds
+
+    Returns
+    -------
+    dict
+    """
+    results = dict()
+    for scale in scales:
+        repo = SyntheticRepository(**SCALES[scale])
+        repo.create()
+        try:
+            times = dict()
+            for name, func in benchmarks(repo):
+                times[name] = measure(func, min_time=min_time)
+            results[scale] = {'parameters': repo.parameters, 'times': times}
+        finally:
+            repo.delete()
+    return results
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Compare benchmark results against a baseline. Returns a list of
+    tuples (scale, benchmark, baseline time, current time, ratio) for all
+    benchmarks that are contained in both result sets and a flag indicating
+    whether the current time exceeds the baseline by more than the tolerance.
+
+    Parameters
+    ----------
+    results: dict
+        Current benchmark results
+    baseline: dict
+        Baseline benchmark results
+    tolerance: float, optional
+        Relative slow-down that is accepted before a benchmark is considered a
+        regression
+
+    Returns
+    -------
+    list((string, string, float, float, float, bool))
+    """
+    comparison = list()
+    for scale in sorted(results):
+        if not scale in baseline:
+            continue
+        base_times = baseline[scale]['times']
+        for name in sorted(results[scale]['times']):
+            if not name in base_times:
+                continue
+            t_base = base_times[name]
+            t_cur = results[scale]['times'][name]
+            ratio = t_cur / t_base if t_base > 0 else float('inf')
+            comparison.append(
+                (scale, name, t_base, t_cur, ratio, ratio > 1 + tolerance)
+            )
+    return comparison
+
+
+def main(args):
+    """Run the benchmark suite from the command line. Returns the process exit
+    code which is non-zero if a regression against the baseline was detected.
+
+    Parameters
+    ----------
+    args: list(string)
+        Command line arguments
+
+    Returns
+    -------
+    int
+    """
+    parser = argparse.ArgumentParser(description='Benchmark hot paths.')
+    parser.add_argument(
+        '--scale',
+        action='append',
+        choices=sorted(SCALES.keys()),
+        help='Repository scale (default: small and medium)'
+    )
+    parser.add_argument('--output', help='Write results to file')
+    parser.add_argument('--baseline', help='Compare against baseline file')
+    parser.add_argument(
+        '--tolerance',
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help='Accepted relative slow-down'
+    )
+    parser.add_argument(
+        '--min-time',
+        type=float,
+        default=0.2,
+        help='Minimal duration of a measurement loop'
+    )
+    opts = parser.parse_args(args)
+    scales = opts.scale if opts.scale else ['small', 'medium']
+    results = run_benchmarks(scales, min_time=opts.min_time)
+    for scale in scales:
+        print scale + ' ' + json.dumps(results[scale]['parameters'], sort_keys=True)
+        for name in sorted(results[scale]['times']):
+            print '  %-24s %12.3f us' % (name, results[scale]['times'][name] * 1e6)
+    if opts.output:
+        with open(opts.output, 'w') as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+    exit_code = 0
+    if opts.baseline:
+        with open(opts.baseline, 'r') as f:
+            baseline = json.load(f)
+        print
+        print 'Comparison against ' + os.path.basename(opts.baseline)
+        for scale, name, t_base, t_cur, ratio, regression in compare(results, baseline, tolerance=opts.tolerance):
+            line = '  %-8s %-24s %12.3f us %12.3f us %7.2fx' % (
+                scale, name, t_base * 1e6, t_cur * 1e6, ratio
+            )
+            if regression:
+                line += '  REGRESSION'
+                exit_code = 1
+            print line
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
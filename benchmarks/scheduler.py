@@ -0,0 +1,147 @@
+"""Throughput benchmark for resource-aware scheduling. Runs a mixed workload
+of light (single CPU) and heavy (multi CPU) CPU-bound commands with fixed
+numbers of concurrent jobs and with resource-aware job slots, and reports the
+throughput for each policy.
+
+Usage: python -m benchmarks.scheduler [--light <n>] [--heavy <n>]
+                                      [--heavy-cpus <n>] [--work <n>]
+"""
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+import yaml
+
+import prjrepo.config as conf
+from prjrepo.config.context import ContextManager
+from prjrepo.log import DefaultLogger
+from prjrepo.workflow.asyncengine import AsyncWorkflowEngine, JobSlots
+from prjrepo.workflow.scheduler import ResourceSlots
+
+
+def create_repository(heavy_cpus, work):
+    """Create a temporary repository with a light and a heavy command. The
+    heavy command runs heavy_cpus busy loops in parallel. Returns the path to
+    the repository base directory.
+
+    Parameters
+    ----------
+    heavy_cpus: int
+        Number of CPUs used by the heavy command
+    work: int
+        Number of loop iterations per busy loop
+
+    Returns
+    -------
+    string
+    """
+    base_dir = tempfile.mkdtemp(prefix='prm-sched-')
+    cwd = os.getcwd()
+    os.chdir(base_dir)
+    try:
+        conf.init_repository()
+    finally:
+        os.chdir(cwd)
+    loop = sys.executable + ' -c "for i in xrange(' + str(work) + '): pass"'
+    commands = {
+        'light': (loop, 1),
+        'heavy': ('(' + ' & '.join([loop] * heavy_cpus) + ' & wait)', heavy_cpus)
+    }
+    for name in commands:
+        cmd_line, cpus = commands[name]
+        filename = os.path.join(
+            base_dir,
+            conf.REPO_DIR,
+            conf.COMMAND_DIR,
+            name + '.yaml'
+        )
+        with open(filename, 'w') as f:
+            yaml.dump({
+                'type': 'EXEC',
+                'spec': {'components': [{'type': 'CONST', 'value': cmd_line}]},
+                'resources': {'cpus': cpus}
+            }, f, default_flow_style=False)
+    return base_dir
+
+
+def run_workload(base_dir, slots, light, heavy):
+    """Run the workload with the given slot policy. Returns the elapsed time
+    in seconds.
+
+    Parameters
+    ----------
+    base_dir: string
+        Path to the repository base directory
+    slots: prjrepo.workflow.asyncengine.JobSlots
+        Slot policy
+    light: int
+        Number of light jobs
+    heavy: int
+        Number of heavy jobs
+
+    Returns
+    -------
+    float
+    """
+    context = ContextManager(base_dir)
+    engine = AsyncWorkflowEngine(DefaultLogger(context.log_file), slots=slots)
+    # Interleave heavy jobs with light jobs
+    names = ['light'] * light
+    step = max(1, len(names) // max(1, heavy))
+    for i in range(heavy):
+        names.insert(min(len(names), i * (step + 1)), 'heavy')
+    start = time.time()
+    for name in names:
+        engine.submit(context, name, dict())
+    engine.run()
+    return time.time() - start
+
+
+def main(args):
+    """Run the scheduler benchmark from the command line.
+
+    Parameters
+    ----------
+    args: list(string)
+        Command line arguments
+    """
+    cpus = multiprocessing.cpu_count()
+    parser = argparse.ArgumentParser(description='Benchmark job scheduling.')
+    parser.add_argument('--light', type=int, default=40, help='Light jobs')
+    parser.add_argument('--heavy', type=int, default=10, help='Heavy jobs')
+    parser.add_argument(
+        '--heavy-cpus',
+        type=int,
+        default=max(2, cpus // 2),
+        help='CPUs per heavy job'
+    )
+    parser.add_argument(
+        '--work',
+        type=int,
+        default=2000000,
+        help='Loop iterations per busy loop'
+    )
+    opts = parser.parse_args(args)
+    base_dir = create_repository(opts.heavy_cpus, opts.work)
+    try:
+        policies = list()
+        for j in sorted(set([1, cpus, 2 * cpus])):
+            policies.append(('fixed -j ' + str(j), JobSlots(j)))
+        policies.append(('resources', ResourceSlots(cpus=cpus)))
+        jobs = opts.light + opts.heavy
+        print 'cpus=%d light=%d heavy=%d heavy-cpus=%d' % (
+            cpus, opts.light, opts.heavy, opts.heavy_cpus
+        )
+        for name, slots in policies:
+            elapsed = run_workload(base_dir, slots, opts.light, opts.heavy)
+            print '  %-16s %8.2f s %8.2f jobs/s' % (name, elapsed, jobs / elapsed)
+    finally:
+        shutil.rmtree(base_dir)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,227 @@
+"""Generator for synthetic project repositories that are used to benchmark the
+hot paths of the project repository manager.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import yaml
+
+import prjrepo.config as conf
+
+
+# ------------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------------
+
+"""Name of the synthetic command that is generated for each repository."""
+COMMAND_NAME = 'synthetic-cmd'
+
+"""Name of the input file that is referenced by the synthetic command."""
+INPUT_FILE = 'input.txt'
+
+"""Number of keys per nested group in a generated settings file."""
+GROUP_SIZE = 10
+
+
+# ------------------------------------------------------------------------------
+# Synthetic Repository
+# ------------------------------------------------------------------------------
+
+class SyntheticRepository(object):
+    """Synthetic project repository in a temporary directory. The repository
+    size is controlled by the number of contexts in the CONTEXTLIST, the depth
+    of the context tree, the number of keys per settings file, the number of
+    variables in the synthetic command, and the number of LOG entries.
+
+    Contexts are arranged in branches of length depth. The working directory
+    of the deepest context in the first branch is used as the default working
+    directory for benchmarks (i.e., the context with the longest path).
+    """
+    def __init__(self, contexts=10, depth=3, keys=20, variables=5, log_size=1000):
+        """Initialize the size parameters of the repository.
+
+        Raises ValueError if any of the parameters is invalid.
+
+        Parameters
+        ----------
+        contexts: int, optional
+            Number of contexts in CONTEXTLIST
+        depth: int, optional
+            Depth of the context tree
+        keys: int, optional
+            Number of keys per settings file
+        variables: int, optional
+            Number of variable components in the synthetic command
+        log_size: int, optional
+            Number of entries in the LOG file
+        """
+        if depth < 1:
+            raise ValueError('invalid depth \'' + str(depth) + '\'')
+        if contexts < depth:
+            raise ValueError('number of contexts smaller than depth')
+        if variables > keys:
+            raise ValueError('number of variables larger than number of keys')
+        self.contexts = contexts
+        self.depth = depth
+        self.keys = keys
+        self.variables = variables
+        self.log_size = log_size
+        self.base_dir = None
+        self.work_dir = None
+
+    @property
+    def parameters(self):
+        """Dictionary of size parameters for the repository.
+
+        Returns
+        -------
+        dict
+        """
+        return {
+            'contexts': self.contexts,
+            'depth': self.depth,
+            'keys': self.keys,
+            'variables': self.variables,
+            'logSize': self.log_size
+        }
+
+    def create(self):
+        """Create the repository in a new temporary directory. Returns the
+        path to the working directory of the deepest context.
+
+        Returns
+        -------
+        string
+        """
+        self.base_dir = tempfile.mkdtemp(prefix='prm-bench-')
+        repo_dir = os.path.join(self.base_dir, conf.REPO_DIR)
+        os.mkdir(repo_dir)
+        os.mkdir(os.path.join(repo_dir, conf.COMMAND_DIR))
+        os.mkdir(os.path.join(repo_dir, conf.CONTEXT_DIR))
+        # Project settings
+        write_yaml(
+            os.path.join(repo_dir, conf.SETTINGS_FILE),
+            settings_dict(self.keys, 'project')
+        )
+        # Context tree
+        with open(os.path.join(repo_dir, conf.CONTEXTLIST_FILE), 'w') as f:
+            for i in range(self.contexts):
+                branch, level = i // self.depth, i % self.depth
+                rel_path = '/'.join(
+                    ['n' + str(branch) + '_' + str(l) for l in range(level + 1)]
+                )
+                os.makedirs(os.path.join(self.base_dir, rel_path))
+                context_file = 'ctx' + str(i) + '.yaml'
+                write_yaml(
+                    os.path.join(repo_dir, conf.CONTEXT_DIR, context_file),
+                    settings_dict(self.keys, 'context' + str(i))
+                )
+                f.write(rel_path + '\t' + context_file + '\n')
+        self.work_dir = os.path.join(
+            self.base_dir,
+            '/'.join(['n0_' + str(l) for l in range(self.depth)])
+        )
+        # Input file that is located by the synthetic command
+        open(os.path.join(self.base_dir, INPUT_FILE), 'w').close()
+        # Command specification
+        components = [{'type': 'CONST', 'value': 'echo'}]
+        for i in range(self.variables):
+            components.append({'type': 'VAR', 'value': '[[' + key_name(i) + ']]'})
+        components.append({'type': 'VAR', 'value': '[[arg]]'})
+        components.append({
+            'type': 'VAR',
+            'value': '[[inputFile]]',
+            'ioType': 'FILE',
+            'asInput': True
+        })
+        write_yaml(
+            os.path.join(repo_dir, conf.COMMAND_DIR, COMMAND_NAME + '.yaml'),
+            {'type': 'EXEC', 'spec': {'components': components}}
+        )
+        # Log file
+        entry = {
+            'name': COMMAND_NAME,
+            'components': [{'value': c['value']} for c in components]
+        }
+        line = json.dumps(entry) + '\n'
+        with open(os.path.join(repo_dir, conf.LOG_FILE), 'w') as f:
+            for i in range(self.log_size):
+                f.write(line)
+        return self.work_dir
+
+    def delete(self):
+        """Remove the temporary directory containing the repository."""
+        if not self.base_dir is None:
+            shutil.rmtree(self.base_dir)
+            self.base_dir = None
+            self.work_dir = None
+
+    @property
+    def log_file(self):
+        """Path to the repository LOG file.
+
+        Returns
+        -------
+        string
+        """
+        return os.path.join(self.base_dir, conf.REPO_DIR, conf.LOG_FILE)
+
+
+# ------------------------------------------------------------------------------
+# Helper Methods
+# ------------------------------------------------------------------------------
+
+def key_name(i):
+    """Get the path expression for the i-th key in a settings file. Keys are
+    organized in nested groups of GROUP_SIZE keys each.
+
+    Parameters
+    ----------
+    i: int
+        Key index
+
+    Returns
+    -------
+    string
+    """
+    return 'g' + str(i // GROUP_SIZE) + '.k' + str(i % GROUP_SIZE)
+
+
+def settings_dict(keys, value_prefix):
+    """Get a nested settings dictionary with the given number of keys.
+
+    Parameters
+    ----------
+    keys: int
+        Number of keys in the dictionary
+    value_prefix: string
+        Prefix for the generated values
+
+    Returns
+    -------
+    dict
+    """
+    settings = dict()
+    for i in range(keys):
+        group, key = key_name(i).split('.')
+        if not group in settings:
+            settings[group] = dict()
+        settings[group][key] = value_prefix + '-' + str(i)
+    settings['inputFile'] = INPUT_FILE
+    return settings
+
+
+def write_yaml(filename, obj):
+    """Write the given object to file in Yaml format.
+
+    Parameters
+    ----------
+    filename: string
+        Path to the output file
+    obj: dict
+        Object that is written
+    """
+    with open(filename, 'w') as f:
+        yaml.dump(obj, f, default_flow_style=False)
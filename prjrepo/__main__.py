@@ -1,11 +1,33 @@
 #!/home/heiko/.venv/prm/bin/python
 
+import json
+import os
+import time
 import yaml
 import sys
 
+import prjrepo.completion as cmpl
 import prjrepo.config as conf
 import prjrepo.config.context as cntxt
+import prjrepo.config.gc as gc
+import prjrepo.config.migrate as migrate
+import prjrepo.foreach as frch
+import prjrepo.impact as impact
+import prjrepo.journal as jrnl
+import prjrepo.metrics as metrics
+import prjrepo.outputs as outputs
+import prjrepo.provenance as prov
+import prjrepo.results as res
+import prjrepo.sampling as smpl
+import prjrepo.staging as stg
+import prjrepo.workflow.asyncengine as aeng
+import prjrepo.workflow.command as command
+import prjrepo.workflow.distributed as dist
 import prjrepo.workflow.engine as eng
+import prjrepo.workflow.expand as expand
+import prjrepo.workflow.rerun as rerun
+import prjrepo.workflow.scheduler as sched
+import prjrepo.workflow.watch as watch
 import prjrepo.log as log
 
 
@@ -14,16 +36,64 @@ import prjrepo.log as log
 # ------------------------------------------------------------------------------
 
 """Command names."""
+# Completion candidates for a partial command line
+CMD_COMPLETE = 'complete'
+# Print shell completion script
+CMD_COMPLETION = 'completion'
 # Manipulate local context
 CMD_CONTEXT = 'context'
+# Print command lines for a parameter space
+CMD_EXPAND = 'expand'
+# Run a command in all project repositories under a root directory
+CMD_FOREACH = 'foreach'
+# Remove dead context entries and orphaned context files
+CMD_GC = 'gc'
+# Commands that are affected by a change of a variable
+CMD_IMPACT = 'impact'
 # Initialize the project repository
 CMD_INIT = 'init'
 # Command history
 CMD_LOG = 'log'
+# Runs that consumed or produced a file
+CMD_LINEAGE = 'lineage'
+# Run metrics in OpenMetrics format
+CMD_METRICS = 'metrics'
+# Move settings between settings files and the settings store
+CMD_MIGRATE = 'migrate'
 # Run a script as part of an experiment
 CMD_RUN = 'run'
+# Re-execute logged runs
+CMD_RERUN = 'rerun'
 # Manipulate project variables
 CMD_PROJECT = 'project'
+# Output values of a command
+CMD_RESULTS = 'results'
+# Resource usage of running jobs
+CMD_TOP = 'top'
+# Run jobs that are handed out by a coordinator
+CMD_WORKER = 'worker'
+
+"""List of all command names."""
+COMMANDS = [
+    CMD_COMPLETE,
+    CMD_COMPLETION,
+    CMD_CONTEXT,
+    CMD_EXPAND,
+    CMD_FOREACH,
+    CMD_GC,
+    CMD_IMPACT,
+    CMD_INIT,
+    CMD_LOG,
+    CMD_LINEAGE,
+    CMD_METRICS,
+    CMD_MIGRATE,
+    CMD_RUN,
+    CMD_RERUN,
+    CMD_PROJECT,
+    CMD_RESULTS,
+    CMD_TOP,
+    CMD_WORKER
+]
 
 
 # ------------------------------------------------------------------------------
@@ -44,18 +114,64 @@ def help(prg_name):
 These are the commands for the project repository manager:
 
   init      Initialize a new project repository
+            [--store]
 
   context   List and set context variables
             [--create [<var> <value>]]
+            --tree [--yaml]
             --delete <var>
             --delete-cascade <var>
   project   List and set project variables
             [<var> <value>]
 
+  completion
+            Print shell completion script (e.g., source <(prm completion bash))
+            <bash | zsh>
+
+  expand    Print command lines for a grid of (or zipped) parameter values
+            [--zip] [--jsonl <file>] <command-name> [<key>=<value> ...]
+
+  foreach   Run a command in all project repositories under a directory
+            [--root <dir>] [--jobs <n>] <command> [<arguments>]
+
+  gc        Remove dead context entries and orphaned context files
+            [--archive] [--dry-run]
+
+  impact    Show commands that depend on a variable in each context
+            (changed in the project or in the current context)
+            [--context] [--invalidate] <var>
+
+  lineage   Show runs that consumed or produced a file
+            <path> | --run <run-id>
+
   log       Show execution history
+            [--command <name> | --show-output <run> | --rotate | --compact]
+
+  metrics   Print run counts, failures and durations in OpenMetrics format
+            [--rebuild]
+
+  migrate   Move all settings into a single settings store (or back to files)
+            [--files]
+
+  rerun     Re-execute logged runs (exact command lines or re-resolved)
+            [--command <name>] [--since <time>] [--until <time>]
+            [--match <pattern>] [--jobs <n>] [--resolve] [--print]
+
+  results   Show output values of a command
+            [--tsv | --npz <file>] <command-name>
 
   run       Run a registered script command
-            [--print] <command-name> [<arguments>]
+            [--print] [--jobs <n> | --resources | --listen <address>]
+            [--sweep <file>] [--journal <name>] [--resume] [--watch]
+            [--stage <dir> [--stage-size <size>]] [--sample <seconds>]
+            <command-name> [<arguments>]
+
+  top       Show running jobs and the CPU and memory usage of jobs that are
+            sampled ('run --sample <seconds>') (or the usage of a logged run)
+            [--refresh <seconds> | --run <run>]
+
+  worker    Run jobs for a coordinator ('run --listen <address>')
+            [--jobs <n>] [--retry <seconds>] <address>
 """
 
 
@@ -73,10 +189,16 @@ def main(prg_name, args):
     cmd_name = args[0]
     cmd_help = ['usage:', prg_name, args[0]]
     if cmd_name == CMD_INIT:
-        # Initialize a new repository. Init does not take any further arguments.
-        if len(args) == 1:
+        # [--store]
+        # Initialize a new repository. Settings are kept in the settings store
+        # if requested.
+        opts, args = parse_options(args[1:], ['--store'], [])
+        if len(args) == 0:
             conf.init_repository()
+            if '--store' in opts:
+                migrate.migrate_to_store(cntxt.ContextManager('.'))
         else:
+            cmd_help += ['[--store]']
             print ' '.join(cmd_help)
     elif cmd_name == CMD_CONTEXT:
         # Local context settings
@@ -86,6 +208,12 @@ def main(prg_name, args):
                 cntxt.ContextManager('.').context_settings().settings,
                 default_flow_style=False
             )
+        elif len(args) in [2, 3] and args[1] == '--tree':
+            # --tree [--yaml]
+            # Print effective settings for all contexts in the project
+            if len(args) == 3 and args[2] != '--yaml':
+                raise ValueError('unknown option \'' + args[2] + '\'')
+            print_context_tree(cntxt.ContextManager('.'), as_yaml=len(args) == 3)
         elif len(args) == 2 and args[-1] == '--create':
             # --create
             # Create an empty context in the current working directory
@@ -112,19 +240,203 @@ def main(prg_name, args):
                 '[',
                 '[--create] [<var> <value>]',
                 '|',
+                '--tree [--yaml]',
+                '|',
                 '--delete <var>',
                 '|',
                 '--delete-cascade <var>',
                 ']'
             ]
             print ' '.join(cmd_help)
+    elif cmd_name == CMD_COMPLETE:
+        # [--refresh] [<word> ...]
+        opts, words = parse_options(args[1:], ['--refresh'], [])
+        if len(words) > 1 or '--refresh' in opts:
+            index = cmpl.CompletionIndex(cntxt.ContextManager('.').project_dir)
+            if '--refresh' in opts:
+                index.refresh()
+            for word in index.complete(words, COMMANDS):
+                print word
+        else:
+            for word in [c for c in COMMANDS if c.startswith(''.join(words))]:
+                print word
+    elif cmd_name == CMD_COMPLETION:
+        # <bash | zsh>
+        if len(args) == 2:
+            sys.stdout.write(cmpl.completion_script(args[1], prg_name, COMMANDS))
+        else:
+            cmd_help += ['<' + ' | '.join(cmpl.SHELLS) + '>']
+            print ' '.join(cmd_help)
+    elif cmd_name == CMD_FOREACH:
+        # [--root <dir>] [--jobs <n>] <command> [<arguments> ...]
+        opts, args = parse_options(args[1:], [], ['--root', '--jobs'])
+        if len(args) >= 1 and args[0] in frch.FOREACH_COMMANDS:
+            directories = conf.find_repositories(opts.get('--root', '.'))
+            failed = frch.foreach(
+                prg_name,
+                directories,
+                args,
+                processes=int(opts['--jobs']) if '--jobs' in opts else None
+            )
+            if failed > 0:
+                raise RuntimeError('command failed in ' + str(failed) + ' of ' + str(len(directories)) + ' repositories')
+        else:
+            cmd_help += [
+                '[--root <dir>]',
+                '[--jobs <n>]',
+                '<' + ' | '.join(frch.FOREACH_COMMANDS) + '>',
+                '[<arguments> ...]'
+            ]
+            print ' '.join(cmd_help)
+    elif cmd_name == CMD_EXPAND:
+        # [--zip] [--jsonl <file>] <command-name> [<key>=<value> ...]
+        opts, cmd_args = parse_options(args[1:], ['--zip'], ['--jsonl'])
+        if len(cmd_args) > 0:
+            context = cntxt.ContextManager('.')
+            template = expand.CommandTemplate(context, cmd_args[0])
+            parameters, arguments = parse_parameters(cmd_args[1:])
+            if '--jsonl' in opts:
+                if len(parameters) > 0:
+                    raise ValueError('multiple values for \'' + parameters[0][0] + '\'')
+                filename = opts['--jsonl']
+                f = sys.stdin if filename == '-' else open(filename, 'r')
+                try:
+                    template.write(expand.read_jsonl(f, arguments), sys.stdout)
+                finally:
+                    if not f is sys.stdin:
+                        f.close()
+            elif '--zip' in opts:
+                template.write(expand.zipped(parameters, arguments), sys.stdout)
+            else:
+                template.write(expand.grid(parameters, arguments), sys.stdout)
+        else:
+            cmd_help += ['[--zip]', '[--jsonl <file>]', '<command-name>', '[<key>=<value> ...]']
+            print ' '.join(cmd_help)
+    elif cmd_name == CMD_GC:
+        # [--archive] [--dry-run]
+        opts, args = parse_options(args[1:], ['--archive', '--dry-run'], [])
+        if len(args) == 0:
+            report = gc.collect_garbage(
+                cntxt.ContextManager('.'),
+                archive='--archive' in opts,
+                dry_run='--dry-run' in opts
+            )
+            for line in report.lines():
+                print line
+        else:
+            cmd_help += ['[--archive]', '[--dry-run]']
+            print ' '.join(cmd_help)
+    elif cmd_name == CMD_IMPACT:
+        # [--context] [--invalidate] <var>
+        opts, args = parse_options(args[1:], ['--context', '--invalidate'], [])
+        if len(args) == 1:
+            context = cntxt.ContextManager('.')
+            # The variable is changed in the project settings unless it is
+            # changed in the current context
+            path = ''
+            if '--context' in opts:
+                path = impact.context_path(
+                    os.path.dirname(context.project_dir),
+                    context.list_contexts(),
+                    context.work_dir
+                )
+            affected = list(
+                impact.DependencyGraph(context).impact(args[0], path=path)
+            )
+            for path, commands in affected:
+                for name in commands:
+                    print (path if path != '' else '.') + '\t' + name
+            if '--invalidate' in opts:
+                rows, entries = impact.invalidate(context, affected)
+                sys.stderr.write(
+                    'removed ' + str(rows) + ' results and ' +
+                    str(entries) + ' journal entries\n'
+                )
+        else:
+            cmd_help += ['[--context]', '[--invalidate]', '<var>']
+            print ' '.join(cmd_help)
+    elif cmd_name == CMD_LINEAGE:
+        # <path> | --run <run-id>
+        if len(args) == 2 or (len(args) == 3 and args[1] == '--run'):
+            context = cntxt.ContextManager('.')
+            index = prov.ProvenanceIndex(context.provenance_file)
+            index.sync(log.DefaultLogger(context.log_file))
+            if len(args) == 2:
+                for run_id, is_input, name, timestamp, line in index.runs(args[1]):
+                    print ('input ' if is_input else 'output') + '\t' + run_id + '\t' + line
+            else:
+                in_files, out_files = index.files(args[2])
+                for path in in_files:
+                    print 'input \t' + os.path.relpath(path)
+                for path in out_files:
+                    print 'output\t' + os.path.relpath(path)
+            index.close()
+        else:
+            cmd_help += ['<path>', '|', '--run <run-id>']
+            print ' '.join(cmd_help)
     elif cmd_name == CMD_LOG:
         # Print the list of experiment script commands that have been run
         if len(args) == 1:
             logger = log.DefaultLogger(cntxt.ContextManager('.').log_file)
             for line in logger.lines():
                 print line
+        elif len(args) == 3 and args[1] == '--command':
+            logger = log.DefaultLogger(cntxt.ContextManager('.').log_file)
+            for entry in logger.entries(command=args[2]):
+                print log.entry_line(entry)
+        elif len(args) == 3 and args[1] == '--show-output':
+            # Print the captured STDOUT of a run. The run is referenced by its
+            # position in the log or by its identifier.
+            context = cntxt.ContextManager('.')
+            entry = log.DefaultLogger(context.log_file).get_entry(args[2])
+            if not 'outputs' in entry:
+                raise ValueError('no output captured for run \'' + args[2] + '\'')
+            store = outputs.OutputStore(context.output_dir)
+            sys.stdout.write(store.get(entry['outputs']['stdout']))
+        elif len(args) == 2 and args[1] == '--rotate':
+            log.DefaultLogger(cntxt.ContextManager('.').log_file).rotate()
+        elif len(args) == 2 and args[1] == '--compact':
+            log.DefaultLogger(cntxt.ContextManager('.').log_file).compact()
         else:
+            cmd_help += [
+                '[',
+                '--command <name>',
+                '|',
+                '--show-output <run>',
+                '|',
+                '--rotate',
+                '|',
+                '--compact',
+                ']'
+            ]
+            print ' '.join(cmd_help)
+    elif cmd_name == CMD_METRICS:
+        # [--rebuild]
+        opts, args = parse_options(args[1:], ['--rebuild'], [])
+        if len(args) == 0:
+            context = cntxt.ContextManager('.')
+            if '--rebuild' in opts and os.path.isfile(context.metrics_file):
+                os.remove(context.metrics_file)
+            run_metrics = metrics.RunMetrics(context.metrics_file)
+            if run_metrics.update(log.DefaultLogger(context.log_file)) > 0:
+                run_metrics.save()
+            run_metrics.write(sys.stdout)
+        else:
+            cmd_help += ['[--rebuild]']
+            print ' '.join(cmd_help)
+    elif cmd_name == CMD_MIGRATE:
+        # [--files]
+        opts, args = parse_options(args[1:], ['--files'], [])
+        if len(args) == 0:
+            context = cntxt.ContextManager('.')
+            if '--files' in opts:
+                count = migrate.migrate_to_files(context)
+                print 'migrated ' + str(count) + ' context(s) to settings files'
+            else:
+                count = migrate.migrate_to_store(context)
+                print 'migrated ' + str(count) + ' context(s) to ' + conf.STORE_FILE
+        else:
+            cmd_help += ['[--files]']
             print ' '.join(cmd_help)
     elif cmd_name == CMD_PROJECT:
         # Global project settings
@@ -151,22 +463,256 @@ def main(prg_name, args):
             print ' '.join(cmd_help)
     elif cmd_name == CMD_RUN:
         # Run a registered command
-        # [--print] <command-name> [<arguments> ...]
-        if len(args) >= 2:
-            print_only = False
-            if args[1] == '--print':
-                print_only = True
-                args = args[1:]
-        if len(args) >= 2:
-            context = cntxt.ContextManager('.')
-            eng.WorkflowEngine(log.DefaultLogger(context.log_file)).run_command(
-                context,
-                args[1],
-                parse_args(args[2:]),
-                print_only=print_only
+        # [--print] [--jobs <n> | --resources | --listen <address>]
+        # [--sweep <file>] [--journal <name>] [--resume] [--watch]
+        # [--stage <dir> [--stage-size <size>]] [--sample <seconds>]
+        # <command-name> [<arguments> ...]
+        opts, args = parse_options(
+            args[1:],
+            ['--print', '--resources', '--resume', '--watch'],
+            ['--jobs', '--listen', '--sweep', '--journal', '--stage', '--stage-size', '--sample']
+        )
+        if len(args) >= 1:
+            context = cntxt.ContextManager('.')
+            # Printing command lines does not write to the repository
+            index, store, results = None, None, None
+            if not '--print' in opts:
+                index = prov.ProvenanceIndex(context.provenance_file)
+                store = outputs.OutputStore(context.output_dir)
+                results = res.ResultCollector(context.results_dir)
+            logger = log.DefaultLogger(context.log_file, index=index)
+            staging = None
+            if '--stage' in opts:
+                if '--listen' in opts:
+                    raise ValueError('cannot stage inputs for remote workers')
+                staging = stg.StagingCache(
+                    opts['--stage'],
+                    max_size=command.parse_memory(
+                        opts.get('--stage-size', stg.DEFAULT_MAX_SIZE)
+                    )
+                )
+            # Local runs are registered as running for 'prm top' and are
+            # only sampled if requested
+            sampling = None
+            if '--sample' in opts and '--listen' in opts:
+                raise ValueError('cannot sample jobs of remote workers')
+            if not '--print' in opts and not '--listen' in opts:
+                interval = None
+                if '--sample' in opts:
+                    interval = float(opts['--sample'])
+                sampling = smpl.ResourceMonitor(
+                    context.series_dir,
+                    context.running_dir,
+                    interval=interval
+                )
+            if '--resources' in opts and '--jobs' in opts:
+                raise ValueError('cannot combine --resources and --jobs')
+            if len(set(opts.keys()) - set(['--print', '--sample'])) > 0:
+                if '--resources' in opts:
+                    slots = sched.ResourceSlots()
+                else:
+                    slots = aeng.JobSlots(int(opts.get('--jobs', 1)))
+                journal = None
+                if '--journal' in opts or '--resume' in opts:
+                    # The journal is named after the command by default
+                    journal = jrnl.RunJournal(
+                        context.journal_file(opts.get('--journal', args[0]))
+                    )
+                if '--listen' in opts and not '--print' in opts:
+                    # Jobs are run by workers that connect to the address
+                    engine = dist.Coordinator(
+                        logger,
+                        opts['--listen'],
+                        store=store,
+                        results=results
+                    )
+                else:
+                    engine = aeng.AsyncWorkflowEngine(
+                        logger,
+                        slots=slots,
+                        store=store,
+                        results=results,
+                        staging=staging,
+                        sampling=sampling
+                    )
+                try:
+                    run_sweep(
+                        engine,
+                        context,
+                        args[0],
+                        parse_args(args[1:]),
+                        opts.get('--sweep'),
+                        print_only='--print' in opts,
+                        journal=journal,
+                        resume='--resume' in opts,
+                        watch_inputs='--watch' in opts
+                    )
+                finally:
+                    engine.close()
+                    if not staging is None:
+                        staging.close()
+                    if not sampling is None:
+                        sampling.close()
+            else:
+                engine = eng.WorkflowEngine(
+                    logger,
+                    store=store,
+                    results=results,
+                    sampling=sampling
+                )
+                try:
+                    engine.run_command(
+                        context,
+                        args[0],
+                        parse_args(args[1:]),
+                        print_only='--print' in opts
+                    )
+                finally:
+                    engine.close()
+                    if not staging is None:
+                        staging.close()
+                    if not sampling is None:
+                        sampling.close()
+        else:
+            cmd_help += [
+                '[--print]',
+                '[--jobs <n> | --resources | --listen <address>]',
+                '[--sweep <file>]',
+                '[--journal <name>]',
+                '[--stage <dir> [--stage-size <size>]]',
+                '[--sample <seconds>]',
+                '[--resume]',
+                '[--watch]',
+                '<command-name>',
+                '[<arguments> ...]'
+            ]
+            print ' '.join(cmd_help)
+    elif cmd_name == CMD_RERUN:
+        # [--command <name>] [--since <time>] [--until <time>]
+        # [--match <pattern>] [--jobs <n>] [--resolve] [--print]
+        opts, args = parse_options(
+            args[1:],
+            ['--print', '--resolve'],
+            ['--command', '--since', '--until', '--match', '--jobs']
+        )
+        if len(args) == 0:
+            context = cntxt.ContextManager('.')
+            # Printing command lines does not write to the repository
+            index, store, results = None, None, None
+            if not '--print' in opts:
+                index = prov.ProvenanceIndex(context.provenance_file)
+                store = outputs.OutputStore(context.output_dir)
+                results = res.ResultCollector(context.results_dir)
+            logger = log.DefaultLogger(context.log_file, index=index)
+            engine = aeng.AsyncWorkflowEngine(
+                logger,
+                max_jobs=int(opts.get('--jobs', 1)),
+                store=store,
+                results=results
+            )
+            # Runs that are logged during the replay are not selected again
+            entries = rerun.select_entries(
+                logger,
+                command=opts.get('--command'),
+                since=rerun.parse_time(opts['--since']) if '--since' in opts else None,
+                until=rerun.parse_time(opts['--until']) if '--until' in opts else None,
+                match=opts.get('--match'),
+                stop=logger.count()
+            )
+            replay = rerun.RunReplay(engine, context, resolve='--resolve' in opts)
+            jobs = replay.jobs(entries, callback=print_job)
+            try:
+                if '--print' in opts:
+                    for job in jobs:
+                        print job.cmd_line
+                else:
+                    success, failed = engine.run(jobs)
+            finally:
+                engine.close()
+            if replay.skipped > 0:
+                sys.stderr.write('skipped ' + str(replay.skipped) + ' runs\n')
+            if not '--print' in opts and failed > 0:
+                raise RuntimeError(str(failed) + ' of ' + str(success + failed) + ' runs failed')
+        else:
+            cmd_help += [
+                '[--command <name>]',
+                '[--since <time>]',
+                '[--until <time>]',
+                '[--match <pattern>]',
+                '[--jobs <n>]',
+                '[--resolve]',
+                '[--print]'
+            ]
+            print ' '.join(cmd_help)
+    elif cmd_name == CMD_RESULTS:
+        # [--tsv | --npz <file>] <command-name>
+        opts, args = parse_options(args[1:], ['--tsv'], ['--npz'])
+        if len(args) == 1:
+            context = cntxt.ContextManager('.')
+            table = res.ResultCollector(context.results_dir).table(args[0])
+            columns = table.columns()
+            if '--npz' in opts:
+                if res.np is None:
+                    raise RuntimeError('numpy is required for \'--npz\'')
+                res.np.savez(opts['--npz'], **dict(columns))
+            elif '--tsv' in opts:
+                print '\t'.join([name for name, values in columns])
+                if len(columns) > 0:
+                    for i in range(len(columns[0][1])):
+                        print '\t'.join([str(values[i]) for name, values in columns])
+            else:
+                rows = len(columns[0][1]) if len(columns) > 0 else 0
+                print str(rows) + ' runs'
+                for name, values in columns:
+                    if name == res.VALUE_COLUMN:
+                        print name + '\t' + table.dtype
+                    else:
+                        print name + '\t' + str(len(set(values))) + ' distinct values'
+        else:
+            cmd_help += ['[--tsv | --npz <file>]', '<command-name>']
+            print ' '.join(cmd_help)
+    elif cmd_name == CMD_TOP:
+        # [--refresh <seconds> | --run <run>]
+        opts, args = parse_options(args[1:], [], ['--refresh', '--run'])
+        if len(args) == 0 and len(opts) <= 1:
+            context = cntxt.ContextManager('.')
+            if '--run' in opts:
+                # Print the resource usage time series of a logged run
+                entry = log.DefaultLogger(context.log_file).get_entry(
+                    opts['--run'],
+                    failed=True
+                )
+                if not 'series' in entry:
+                    raise ValueError('no resource samples for run \'' + opts['--run'] + '\'')
+                print_series(os.path.join(context.series_dir, entry['series']))
+            elif '--refresh' in opts:
+                interval = float(opts['--refresh'])
+                try:
+                    while True:
+                        # Clear the terminal before each refresh
+                        sys.stdout.write('\033[H\033[J')
+                        print_running_jobs(context)
+                        sys.stdout.flush()
+                        time.sleep(interval)
+                except KeyboardInterrupt:
+                    pass
+            else:
+                print_running_jobs(context)
+        else:
+            cmd_help += ['[--refresh <seconds> | --run <run>]']
+            print ' '.join(cmd_help)
+    elif cmd_name == CMD_WORKER:
+        # [--jobs <n>] [--retry <seconds>] <address>
+        opts, args = parse_options(args[1:], [], ['--jobs', '--retry'])
+        if len(args) == 1:
+            worker = dist.Worker(
+                args[0],
+                slots=int(opts.get('--jobs', 1)),
+                retry=float(opts.get('--retry', dist.DEFAULT_RETRY))
             )
+            worker.run()
         else:
-            cmd_help += ['[--print]', '<command-name>', '[<arguments> ...]']
+            cmd_help += ['[--jobs <n>]', '[--retry <seconds>]', '<address>']
             print ' '.join(cmd_help)
     elif cmd_name == '--help':
         # Print help information
@@ -199,6 +745,275 @@ def parse_args(args):
     return arguments
 
 
+def parse_options(args, flags, options):
+    """Split a list of command line arguments into leading options and the
+    remaining arguments. Flags are options without a value. All other options
+    take the following argument as their value.
+
+    Raises ValueError if an option is missing its value.
+
+    Parameters
+    ----------
+    args: list(string)
+        Command line arguments
+    flags: list(string)
+        Names of options without value
+    options: list(string)
+        Names of options with value
+
+    Returns
+    -------
+    dict, list(string)
+    """
+    opts = dict()
+    while len(args) > 0:
+        if args[0] in flags:
+            opts[args[0]] = True
+            args = args[1:]
+        elif args[0] in options:
+            if len(args) < 2:
+                raise ValueError('missing value for \'' + args[0] + '\'')
+            opts[args[0]] = args[1]
+            args = args[2:]
+        else:
+            break
+    return opts, args
+
+
+def parse_parameters(args):
+    """Get parameter values from a list of key=value pairs. Keys that occur
+    more than once define a parameter with a list of values. Keys that occur
+    once are returned as arguments that are shared by all argument sets.
+
+    Raises ValueError if arguments are not in expected format.
+
+    Parameters
+    ----------
+    args: list(string)
+        Command line arguments in format key=value
+
+    Returns
+    -------
+    list((string, list(string))), dict
+    """
+    names = list()
+    values = dict()
+    for arg in args:
+        pos = arg.find('=')
+        if pos < 0:
+            raise ValueError('invalid argument \'' + arg + '\'')
+        key = arg[:pos]
+        if not key in values:
+            names.append(key)
+            values[key] = list()
+        values[key].append(arg[pos+1:])
+    parameters = [(key, values[key]) for key in names if len(values[key]) > 1]
+    arguments = dict([(key, values[key][0]) for key in names if len(values[key]) == 1])
+    return parameters, arguments
+
+
+def print_context_tree(context, as_yaml=False):
+    """Print the effective settings of the project and all its contexts.
+    Each context is printed as soon as its settings are available, either as
+    a JSON object per line or as a Yaml document.
+
+    Parameters
+    ----------
+    context: prjrepo.config.context.ContextManager
+        Any context in the project
+    as_yaml: bool, optional
+        Print Yaml documents instead of JSON lines
+    """
+    for path, settings in context.context_tree():
+        doc = {'context': path, 'settings': settings}
+        if as_yaml:
+            sys.stdout.write(
+                yaml.dump(doc, default_flow_style=False, explicit_start=True)
+            )
+        else:
+            sys.stdout.write(json.dumps(doc, sort_keys=True, default=str) + '\n')
+
+
+def print_job(job):
+    """Print the output of a terminated job. For failed jobs STDERR and the
+    failed command line are printed as well.
+
+    Parameters
+    ----------
+    job: prjrepo.workflow.asyncengine.Job
+        Terminated job
+    """
+    sys.stdout.write(job.stdout)
+    if not job.succeeded:
+        sys.stderr.write(job.stderr)
+        sys.stderr.write(
+            'failed (' + str(job.returncode) + '): ' + job.cmd_line + '\n'
+        )
+
+
+def print_running_jobs(context):
+    """Print the most recent resource usage of all running jobs in the
+    project. Usage columns are empty for jobs that are not sampled.
+
+    Parameters
+    ----------
+    context: prjrepo.config.context.ContextManager
+        Any context in the project
+    """
+    print '\t'.join(['PID', 'COMMAND', 'ELAPSED', 'PROCS', 'CPU%', 'RSS(MB)', 'DIRECTORY'])
+    now = time.time()
+    for job in smpl.running_jobs(context.running_dir):
+        usage = None
+        if not job.get('series') is None:
+            try:
+                usage = smpl.current_usage(
+                    os.path.join(context.series_dir, job['series'])
+                )
+            except (IOError, ValueError):
+                pass
+        if usage is None:
+            count, cpu, rss = '-', '-', '-'
+        else:
+            count = str(usage[0])
+            cpu = '%.1f' % usage[1]
+            rss = '%.1f' % (usage[2] / 1048576.0)
+        print '\t'.join([
+            str(job['pid']),
+            job['name'],
+            '%.0fs' % (now - job['startTime']),
+            count,
+            cpu,
+            rss,
+            job['workDir']
+        ])
+
+
+def print_series(filename):
+    """Print the samples of a resource usage time series as tab-delimited
+    lines with elapsed seconds, number of processes, CPU seconds and resident
+    set size in bytes.
+
+    Parameters
+    ----------
+    filename: string
+        Path to the time series file
+    """
+    start_time, interval, samples = smpl.read_series(filename)
+    print '\t'.join(['elapsed', 'processes', 'cpu', 'rss'])
+    for elapsed, count, cpu, rss in samples:
+        print '\t'.join(['%.3f' % elapsed, str(count), '%.3f' % cpu, str(rss)])
+
+
+def read_sweep(filename, arguments):
+    """Read argument sets for a sweep from file. Each non-empty line that does
+    not start with '#' contains a list of key=value pairs. The values in each
+    line override the given arguments. If filename is None the result is the
+    given argument set.
+
+    Raises ValueError if a line contains an invalid argument.
+
+    Parameters
+    ----------
+    filename: string
+        Path to the sweep file or '-' for STDIN
+    arguments: dict
+        Arguments that are shared by all runs
+
+    Returns
+    -------
+    iterator(dict)
+    """
+    if filename is None:
+        yield arguments
+        return
+    f = sys.stdin if filename == '-' else open(filename, 'r')
+    try:
+        for line in f:
+            line = line.strip()
+            if line == '' or line.startswith('#'):
+                continue
+            run_args = dict(arguments)
+            run_args.update(parse_args(line.split()))
+            yield run_args
+    finally:
+        if not f is sys.stdin:
+            f.close()
+
+
+def run_sweep(engine, context, cmd_name, arguments, sweep_file, print_only=False, journal=None, resume=False, watch_inputs=False):
+    """Run a command for each argument set in a sweep file using the given
+    engine. The output of each job is printed when the job terminates.
+
+    If a journal is given, the key of each successful run is recorded in the
+    journal. When resuming, runs that are already recorded in the journal are
+    skipped.
+
+    In watch mode, runs are repeated whenever their input files, the context
+    settings or the command specification change until interrupted.
+
+    Raises RuntimeError if any of the runs failed.
+
+    Parameters
+    ----------
+    engine: prjrepo.workflow.asyncengine.AsyncWorkflowEngine
+        Engine that executes the jobs
+    context: prjrepo.config.context.ContextManager
+        Execution context
+    cmd_name: string
+        Command name
+    arguments: dict
+        Arguments that are shared by all runs
+    sweep_file: string
+        Path to the sweep file (or None for a single run)
+    print_only: bool, optional
+        If True, print the generated command lines only
+    journal: prjrepo.journal.RunJournal, optional
+        Journal of completed runs
+    resume: bool, optional
+        If True, skip runs that are recorded in the journal
+    watch_inputs: bool, optional
+        If True, re-run commands when their dependencies change
+    """
+    def print_output(job):
+        print_job(job)
+        if job.succeeded and not journal is None:
+            journal.record(job)
+    if print_only and not resume:
+        template = expand.CommandTemplate(context, cmd_name)
+        template.write(read_sweep(sweep_file, arguments), sys.stdout)
+        return
+    if watch_inputs and not print_only:
+        runner = watch.WatchRunner(
+            engine,
+            context,
+            cmd_name,
+            read_sweep(sweep_file, arguments),
+            callback=print_output
+        )
+        try:
+            runner.run()
+        except KeyboardInterrupt:
+            pass
+        return
+    jobs = engine.jobs(
+        context,
+        cmd_name,
+        read_sweep(sweep_file, arguments),
+        callback=print_output
+    )
+    if resume:
+        jobs = journal.filter(jobs)
+    if print_only:
+        for job in jobs:
+            print job.cmd_line
+        return
+    success, failed = engine.run(jobs)
+    if resume and journal.skipped > 0:
+        sys.stderr.write('skipped ' + str(journal.skipped) + ' completed runs\n')
+    if failed > 0:
+        raise RuntimeError(str(failed) + ' of ' + str(success + failed) + ' runs failed')
+
+
 if __name__ == '__main__':
     # Extract the program name as the last component of the command path
     prg_name = sys.argv[0].split('/')[-1]
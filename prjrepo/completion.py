@@ -0,0 +1,447 @@
+"""Index for shell completion of command names, command variables and settings
+keys. Parsing all command specifications and settings files on every key press
+is too slow for large repositories. The index is a small text file in the
+project directory that the completion scripts query directly. It is refreshed
+incrementally: only files whose modification time or size changed since the
+last refresh are parsed again.
+
+Each line in the index is a tab-separated record for one file:
+
+    C <command-name> <mtime> <size> <var> <var> ...
+    S <settings-file> <mtime> <size> <key> <key> ...
+
+where settings files are named relative to the project directory and keys are
+path expressions (e.g., a.b) for all values in the file. For projects that
+use the settings store, the project settings are recorded under the name of
+the project settings file and the settings of all contexts under the name of
+the store.
+"""
+
+import os
+import yaml
+
+import prjrepo.config as conf
+from prjrepo.config.context import read_settings
+from prjrepo.config.store import SettingsStore
+from prjrepo.workflow.repository import DefaultCommandRepository
+
+
+# ------------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------------
+
+"""Record types in the completion index."""
+RECORD_COMMAND = 'C'
+RECORD_SETTINGS = 'S'
+
+"""Command line options that take a value (skipped when looking for the
+command name in run and expand).
+"""
+VALUE_OPTIONS = ['--jobs', '--journal', '--jsonl', '--listen', '--sample', '--stage', '--stage-size', '--sweep']
+
+"""Completion script for bash. Placeholders are replaced by the program name,
+the list of program commands, and the value options.
+"""
+BASH_SCRIPT = """# Completion for @PRG@ (generated by '@PRG@ completion bash')
+_@FUNC@_index() {
+    local dir=$PWD
+    while [ -n "$dir" ] && [ ! -d "$dir/@REPO@" ]; do
+        dir=${dir%/*}
+    done
+    [ -d "$dir/@REPO@" ] || return 1
+    _@FUNC@_index_file=$dir/@REPO@/@INDEX@
+    if [ ! -f "$_@FUNC@_index_file" ] || [ -n "$(find "$dir/@REPO@/@SETTINGS@" "$dir/@REPO@/@STORE@" "$dir/@REPO@/@COMMANDS@" "$dir/@REPO@/@CONTEXTS@" -newer "$_@FUNC@_index_file" -print -quit 2>/dev/null)" ]; then
+        (cd "$dir" && @PRG@ complete --refresh >/dev/null 2>&1)
+    fi
+    [ -f "$_@FUNC@_index_file" ]
+}
+
+_@FUNC@() {
+    local cur=${COMP_WORDS[COMP_CWORD]} name= i=2 word words
+    COMPREPLY=()
+    if [ "$COMP_CWORD" -eq 1 ]; then
+        COMPREPLY=($(compgen -W "@COMMAND_LIST@" -- "$cur"))
+        return
+    fi
+    case "${COMP_WORDS[1]}" in
+        run|expand)
+            while [ "$i" -lt "$COMP_CWORD" ]; do
+                word=${COMP_WORDS[i]}
+                case "$word" in
+                    @VALUE_OPTIONS@) i=$((i + 2)) ;;
+                    -*) i=$((i + 1)) ;;
+                    *) name=$word; break ;;
+                esac
+            done
+            _@FUNC@_index || return
+            if [ -z "$name" ]; then
+                words=$(awk -F'\\t' '$1 == "C" {print $2}' "$_@FUNC@_index_file")
+            else
+                compopt -o nospace 2>/dev/null
+                words=$(awk -F'\\t' -v n="$name" '$1 == "C" && $2 == n && $5 != "" {gsub(/ /, "= ", $5); print $5 "="}' "$_@FUNC@_index_file")
+            fi
+            ;;
+        context)
+            _@FUNC@_index || return
+            words=$(awk -F'\\t' '$1 == "S" {print $5}' "$_@FUNC@_index_file")
+            ;;
+        project)
+            _@FUNC@_index || return
+            words=$(awk -F'\\t' '$1 == "S" && $2 == "@SETTINGS@" {print $5}' "$_@FUNC@_index_file")
+            ;;
+        *)
+            return
+            ;;
+    esac
+    COMPREPLY=($(compgen -W "$words" -- "$cur"))
+}
+
+complete -F _@FUNC@ @PRG@
+"""
+
+"""Prefix for the completion script for zsh (which uses the bash script)."""
+ZSH_PREFIX = """autoload -U +X bashcompinit && bashcompinit
+"""
+
+"""Supported shells for completion scripts."""
+SHELLS = ['bash', 'zsh']
+
+
+# ------------------------------------------------------------------------------
+# Completion Index
+# ------------------------------------------------------------------------------
+
+class CompletionIndex(object):
+    """Index of the command names, the variables that are referenced by each
+    command, and the keys in all settings files of a project.
+    """
+    def __init__(self, project_dir):
+        """Initialize the project directory and the index file.
+
+        Parameters
+        ----------
+        project_dir: string
+            Path to the project directory (.prm)
+        """
+        self.project_dir = project_dir
+        self.filename = os.path.join(project_dir, conf.COMPLETION_FILE)
+        self.records = None
+
+    def commands(self):
+        """Get the names of all commands in the index.
+
+        Returns
+        -------
+        list(string)
+        """
+        return sorted([name for r_type, name in self.load() if r_type == RECORD_COMMAND])
+
+    def complete(self, words, commands):
+        """Get completion candidates for a partial command line. The first
+        word is the program command and the last word is the word that is
+        being completed.
+
+        Parameters
+        ----------
+        words: list(string)
+            Command line arguments (without the program name)
+        commands: list(string)
+            Names of all program commands
+
+        Returns
+        -------
+        list(string)
+        """
+        if len(words) == 0:
+            return sorted(commands)
+        cur = words[-1]
+        if len(words) == 1:
+            candidates = commands
+        elif words[0] in ['run', 'expand']:
+            name = None
+            i = 1
+            while i < len(words) - 1:
+                if words[i] in VALUE_OPTIONS:
+                    i += 2
+                elif words[i].startswith('-'):
+                    i += 1
+                else:
+                    name = words[i]
+                    break
+            if name is None:
+                candidates = self.commands()
+            else:
+                candidates = [var + '=' for var in self.variables(name)]
+        elif words[0] == 'context':
+            candidates = self.keys()
+        elif words[0] == 'project':
+            candidates = self.keys(project_only=True)
+        else:
+            candidates = list()
+        return sorted([c for c in candidates if c.startswith(cur)])
+
+    def keys(self, project_only=False):
+        """Get all keys in the project settings and context settings files.
+
+        Parameters
+        ----------
+        project_only: bool, optional
+            Only include keys from the project settings file
+
+        Returns
+        -------
+        list(string)
+        """
+        keys = set()
+        for key, record in self.load().items():
+            r_type, name = key
+            if r_type == RECORD_SETTINGS:
+                if not project_only or name == conf.SETTINGS_FILE:
+                    keys.update(record[2])
+        return sorted(keys)
+
+    def load(self):
+        """Read the index file (once). Returns a dictionary that maps record
+        keys (type, name) to (mtime, size, values) tuples.
+
+        Returns
+        -------
+        dict
+        """
+        if self.records is None:
+            self.records = read_index(self.filename)
+        return self.records
+
+    def refresh(self):
+        """Update the index for all command specifications and settings files
+        that changed since the last refresh. The index file is rewritten if
+        any record changed and otherwise only touched, such that the
+        completion scripts can detect changes by comparing modification times.
+        Returns True if the index was rewritten.
+
+        Returns
+        -------
+        bool
+        """
+        old = read_index(self.filename)
+        records = dict()
+        files = list()
+        cmd_dir = os.path.join(self.project_dir, conf.COMMAND_DIR)
+        suffix = DefaultCommandRepository.COMMAND_SPEC_SUFFIX
+        for filename in os.listdir(cmd_dir):
+            if filename.endswith(suffix):
+                files.append((RECORD_COMMAND, filename[:-len(suffix)], os.path.join(cmd_dir, filename)))
+        store_file = os.path.join(self.project_dir, conf.STORE_FILE)
+        if os.path.isfile(store_file):
+            files.append((RECORD_SETTINGS, conf.SETTINGS_FILE, store_file))
+            files.append((RECORD_SETTINGS, conf.STORE_FILE, store_file))
+        else:
+            files.append((RECORD_SETTINGS, conf.SETTINGS_FILE, os.path.join(self.project_dir, conf.SETTINGS_FILE)))
+        context_dir = os.path.join(self.project_dir, conf.CONTEXT_DIR)
+        for filename in os.listdir(context_dir):
+            files.append((
+                RECORD_SETTINGS,
+                conf.CONTEXT_DIR + '/' + filename,
+                os.path.join(context_dir, filename)
+            ))
+        changed = False
+        for r_type, name, path in files:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            key = (r_type, name)
+            mtime, size = repr(stat.st_mtime), str(stat.st_size)
+            record = old.get(key)
+            if not record is None and record[0] == mtime and record[1] == size:
+                records[key] = record
+                continue
+            if r_type == RECORD_COMMAND:
+                values = command_variables(cmd_dir, name)
+            elif path == store_file:
+                values = store_keys(path, name == conf.SETTINGS_FILE)
+            else:
+                values = settings_keys(read_settings(path))
+            records[key] = (mtime, size, values)
+            changed = True
+        if changed or set(records.keys()) != set(old.keys()):
+            tmp_file = self.filename + '.tmp'
+            with open(tmp_file, 'w') as f:
+                for key in sorted(records.keys()):
+                    mtime, size, values = records[key]
+                    f.write('\t'.join(list(key) + [mtime, size, ' '.join(values)]) + '\n')
+            os.rename(tmp_file, self.filename)
+            changed = True
+        else:
+            os.utime(self.filename, None)
+        self.records = records
+        return changed
+
+    def variables(self, cmd_name):
+        """Get the names of the variables that are referenced by a command.
+
+        Parameters
+        ----------
+        cmd_name: string
+            Command name
+
+        Returns
+        -------
+        list(string)
+        """
+        record = self.load().get((RECORD_COMMAND, cmd_name))
+        return list(record[2]) if not record is None else list()
+
+
+# ------------------------------------------------------------------------------
+# Helper Methods
+# ------------------------------------------------------------------------------
+
+def command_variables(cmd_dir, cmd_name):
+    """Get the names of the variables that are referenced by the components of
+    a command in order of their first occurrence. Commands that cannot be
+    parsed do not have any variables.
+
+    Parameters
+    ----------
+    cmd_dir: string
+        Path to the command directory
+    cmd_name: string
+        Command name
+
+    Returns
+    -------
+    list(string)
+    """
+    try:
+        cmd = DefaultCommandRepository(cmd_dir).get_command(cmd_name)
+    except (KeyError, TypeError, ValueError, yaml.YAMLError):
+        return list()
+    variables = list()
+    for el in cmd.components:
+        if el.is_var:
+            for token in el.tokens:
+                if token.startswith('[[') and token.endswith(']]'):
+                    if not token[2:-2] in variables:
+                        variables.append(token[2:-2])
+    return variables
+
+
+def completion_script(shell, prg_name, commands):
+    """Get the completion script for the given shell.
+
+    Raises ValueError if the shell is not supported.
+
+    Parameters
+    ----------
+    shell: string
+        Shell name (bash or zsh)
+    prg_name: string
+        Name with which the program is called
+    commands: list(string)
+        Names of all program commands
+
+    Returns
+    -------
+    string
+    """
+    if not shell in SHELLS:
+        raise ValueError('unsupported shell \'' + shell + '\'')
+    script = BASH_SCRIPT
+    for placeholder, value in [
+        ('@FUNC@', ''.join([c if c.isalnum() else '_' for c in prg_name])),
+        ('@PRG@', prg_name),
+        ('@COMMAND_LIST@', ' '.join(sorted(commands))),
+        ('@VALUE_OPTIONS@', '|'.join(VALUE_OPTIONS)),
+        ('@REPO@', conf.REPO_DIR),
+        ('@INDEX@', conf.COMPLETION_FILE),
+        ('@SETTINGS@', conf.SETTINGS_FILE),
+        ('@STORE@', conf.STORE_FILE),
+        ('@COMMANDS@', conf.COMMAND_DIR),
+        ('@CONTEXTS@', conf.CONTEXT_DIR)
+    ]:
+        script = script.replace(placeholder, value)
+    if shell == 'zsh':
+        script = ZSH_PREFIX + script
+    return script
+
+
+def read_index(filename):
+    """Read the records in a completion index file. Returns an empty
+    dictionary if the file does not exist.
+
+    Parameters
+    ----------
+    filename: string
+        Path to the index file
+
+    Returns
+    -------
+    dict
+    """
+    records = dict()
+    if not os.path.isfile(filename):
+        return records
+    with open(filename, 'r') as f:
+        for line in f:
+            tokens = line.rstrip('\n').split('\t')
+            if len(tokens) == 5:
+                values = tokens[4].split(' ') if tokens[4] != '' else list()
+                records[(tokens[0], tokens[1])] = (tokens[2], tokens[3], values)
+    return records
+
+
+def settings_keys(settings, prefix=''):
+    """Get path expressions for all values in a (nested) settings dictionary.
+    Keys that contain whitespace cannot be completed and are ignored.
+
+    Parameters
+    ----------
+    settings: dict
+        Settings dictionary
+    prefix: string, optional
+        Path expression of the dictionary
+
+    Returns
+    -------
+    list(string)
+    """
+    keys = list()
+    if not isinstance(settings, dict):
+        return keys
+    for key in sorted(settings.keys()):
+        name = prefix + str(key)
+        if len(name.split()) != 1:
+            continue
+        if isinstance(settings[key], dict):
+            keys.extend(settings_keys(settings[key], prefix=name + '.'))
+        else:
+            keys.append(name)
+    return keys
+
+
+def store_keys(filename, project_only):
+    """Get path expressions for all values in the settings store. Includes
+    either the project settings only or the settings of all contexts.
+
+    Parameters
+    ----------
+    filename: string
+        Path to the settings store
+    project_only: bool
+        Only include keys from the project settings
+
+    Returns
+    -------
+    list(string)
+    """
+    store = SettingsStore(filename)
+    try:
+        stored = store.read_all()
+    finally:
+        store.close()
+    keys = set()
+    for path, settings in stored.items():
+        if (path == '') == project_only:
+            keys.update(settings_keys(settings))
+    return sorted(keys)
@@ -6,15 +6,25 @@ import os
 # ------------------------------------------------------------------------------
 
 """Name of the directories that contains the reporitory data."""
+ARCHIVE_DIR = 'archive'
 COMMAND_DIR = 'commands'
 CONTEXT_DIR = 'contexts'
+JOURNAL_DIR = 'journals'
+OUTPUT_DIR = 'outputs'
 REPO_DIR = '.prm'
+RESULTS_DIR = 'results'
+RUNNING_DIR = 'running'
+SERIES_DIR = 'series'
 
 
 """Name of configuration files."""
+COMPLETION_FILE = 'COMPLETION'
 CONTEXTLIST_FILE = 'CONTEXTLIST'
 LOG_FILE = 'LOG'
+METRICS_FILE = 'METRICS'
+PROVENANCE_FILE = 'PROVENANCE'
 SETTINGS_FILE = 'SETTINGS'
+STORE_FILE = 'SETTINGS.db'
 
 
 # ------------------------------------------------------------------------------
@@ -46,3 +56,32 @@ def init_repository():
     open(os.path.join(REPO_DIR, CONTEXTLIST_FILE), 'a').close()
     open(os.path.join(REPO_DIR, LOG_FILE), 'a').close()
     open(os.path.join(REPO_DIR, SETTINGS_FILE), 'a').close()
+
+
+def find_repositories(root):
+    """Find all project repositories under the given root directory in a
+    single walk of the directory tree. Returns the list of directories that
+    contain a repository directory. The walk does not descend into project
+    directories (repositories cannot be nested) or hidden directories.
+
+    Raises ValueError if the root is not a directory.
+
+    Parameters
+    ----------
+    root: string
+        Path to the root directory
+
+    Returns
+    -------
+    list(string)
+    """
+    if not os.path.isdir(root):
+        raise ValueError('not a directory \'' + root + '\'')
+    projects = list()
+    for dirpath, dirnames, filenames in os.walk(root):
+        if REPO_DIR in dirnames:
+            projects.append(dirpath)
+            dirnames[:] = []
+        else:
+            dirnames[:] = sorted([d for d in dirnames if not d.startswith('.')])
+    return projects
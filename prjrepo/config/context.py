@@ -1,14 +1,32 @@
 """Context manager."""
 
+import copy
+import fcntl
 import os
 import uuid
 import yaml
 
 import prjrepo.config as conf
+from prjrepo.config.store import SettingsStore
 
 
 class ContextManager(object):
-    def __init__(self, work_dir):
+    def __init__(self, work_dir, store=None):
+        """Initialize the context for the given working directory. An open
+        settings store can be shared by context managers of the same project
+        such that each of them does not open its own database connection.
+        The given store is only used if it is the store of the project that
+        contains the working directory.
+
+        Raises ValueError if the directory is not in a project repository.
+
+        Parameters
+        ----------
+        work_dir: string
+            Working directory
+        store: prjrepo.config.store.SettingsStore, optional
+            Open settings store of the project
+        """
         if not os.path.isdir(work_dir):
             raise ValueError('not a directory \'' + work_dir + '\'')
         abs_dir = os.path.abspath(work_dir)
@@ -44,6 +62,15 @@ class ContextManager(object):
         self.contextls_file = is_file(self.project_dir, conf.CONTEXTLIST_FILE)
         self.log_file = is_file(self.project_dir, conf.LOG_FILE)
         self.settings_file = is_file(self.project_dir, conf.SETTINGS_FILE)
+        # Use the settings store instead of settings files if the project has
+        # been migrated
+        store_file = os.path.join(self.project_dir, conf.STORE_FILE)
+        if not store is None and store.filename == store_file:
+            self.store = store
+        elif os.path.isfile(store_file):
+            self.store = SettingsStore(store_file)
+        else:
+            self.store = None
 
     def context_settings(self):
         """Get settings for the current context.
@@ -52,7 +79,57 @@ class ContextManager(object):
         -------
         prjrepo.config.context.Config
         """
-        return Config(self.get_context_files(), False)
+        return Config(self.get_context_files(), False, store=self.store)
+
+    def context_tree(self, contexts=None):
+        """Generator for the effective settings of the project and of all
+        contexts in the project. The context listing is traversed as a trie in
+        depth-first order, i.e., each context follows its parent context. Each
+        settings file is read once and the effective settings of a context
+        are derived from the effective settings of its parent (the closest
+        context along the path).
+
+        The generated dictionaries share nested dictionaries that are not
+        modified by a context with the dictionaries of its ancestors and must
+        not be modified.
+
+        The generated tuples contain the path to the context (empty for the
+        project) and the effective settings.
+
+        Parameters
+        ----------
+        contexts: dict or set, optional
+            Context listing of the project (read from the listing file or the
+            settings store if not given)
+
+        Returns
+        -------
+        iterator((string, dict))
+        """
+        if contexts is None:
+            contexts = self.list_contexts()
+        if not self.store is None:
+            # Read all settings from the store at once
+            stored = self.store.read_all()
+            root = stored.get('', dict())
+            read = lambda key: stored.get(key, dict())
+        else:
+            root = read_settings(self.settings_file)
+            read = lambda key: read_settings(
+                os.path.join(self.context_dir, contexts[key])
+            )
+        yield '', root
+        # Stack of (path, settings) for the ancestors of the current context.
+        # Sorting paths by their components ensures that each context follows
+        # its ancestors.
+        stack = [([], root)]
+        for key in sorted(contexts, key=lambda k: k.split('/')):
+            path = key.split('/')
+            while len(stack) > 1 and stack[-1][0] != path[:len(stack[-1][0])]:
+                stack.pop()
+            settings = merge_settings(stack[-1][1], read(key))
+            stack.append((path, settings))
+            yield key, settings
 
     def create_context(self):
         """Create a new context for the current working directory.
@@ -69,38 +146,101 @@ class ContextManager(object):
         # to the relative path
         if self.get_context_files()[-1][0] == rel_path:
             raise RuntimeError('context already exists for \'' + rel_path + '\'')
+        if not self.store is None:
+            self.store.create(rel_path)
+            return
         # Append entry for new context to context listing file
         context_id = str(uuid.uuid4()).replace('-', '')
         while os.path.isfile(os.path.join(self.context_dir, context_id + '.yaml')):
             context_id = str(uuid.uuid4()).replace('-', '')
-        with open(self.contextls_file, 'a') as f:
+        # The listing may be replaced by garbage collection while waiting for
+        # the lock. In this case the new listing is opened.
+        while True:
+            f = open(self.contextls_file, 'a')
+            fcntl.flock(f, fcntl.LOCK_EX)
+            if os.fstat(f.fileno()).st_ino == os.stat(self.contextls_file).st_ino:
+                break
+            f.close()
+        try:
             f.write(rel_path + '\t' + context_id + '.yaml\n')
+        finally:
+            f.close()
 
-    def get_context_files(self):
+    def get_context_files(self, contexts=None):
         """Get a list of context files along the path from the project directory
         to the working directory. The first entry is a reference to the settings
         file for the project.
 
         The list elements are tuples with the first element being the path to
         the conext and the second element the absolute path to the settings
-        file.
+        file. If the project uses the settings store, the second element is
+        the path to the store for all contexts.
+
+        Parameters
+        ----------
+        contexts: dict or set, optional
+            Context listing of the project (read from the listing file or the
+            settings store if not given)
 
         Returns
         -------
         list((string, string))
         """
-        contexts = read_contexts(self.contextls_file)
+        if contexts is None:
+            contexts = self.list_contexts()
         context_files = list()
-        context_files.append(('', self.settings_file))
+        if not self.store is None:
+            context_files.append(('', self.store.filename))
+        else:
+            context_files.append(('', self.settings_file))
         if len(self.path) > 0:
             for i in range(1, len(self.path) + 1):
                 key = '/'.join(self.path[:i])
                 if key in contexts:
-                    context_files.append(
-                        (key, os.path.join(self.context_dir, contexts[key]))
-                    )
+                    if not self.store is None:
+                        context_files.append((key, self.store.filename))
+                    else:
+                        context_files.append(
+                            (key, os.path.join(self.context_dir, contexts[key]))
+                        )
         return context_files
 
+    def journal_file(self, name):
+        """Get the path to the run journal with the given name. The journal
+        directory is created if it does not exist.
+
+        Raises ValueError if the name is not a valid file name.
+
+        Parameters
+        ----------
+        name: string
+            Journal name
+
+        Returns
+        -------
+        string
+        """
+        if name == '' or '/' in name or name.startswith('.'):
+            raise ValueError('invalid journal name \'' + name + '\'')
+        journal_dir = os.path.join(self.project_dir, conf.JOURNAL_DIR)
+        if not os.path.isdir(journal_dir):
+            os.mkdir(journal_dir)
+        return os.path.join(journal_dir, name)
+
+    def list_contexts(self):
+        """Get the context listing of the project. For projects that use
+        settings files the result is a dictionary that maps context paths to
+        settings file names. For projects that use the settings store the
+        result is the set of context paths.
+
+        Returns
+        -------
+        dict or set
+        """
+        if not self.store is None:
+            return self.store.contexts()
+        return read_contexts(self.contextls_file)
+
     def locate_input_file(self, name, is_file):
         """Locate an input file (ordirectory) in the context path. Returns the
         first resource that matches the given name (i.e., relative path). The
@@ -136,6 +276,64 @@ class ContextManager(object):
             base_dir, dir_name = os.path.split(base_dir)
         raise ValueError('file not found \'' + name + '\'')
 
+    @property
+    def metrics_file(self):
+        """Path to the state file for incremental metrics of the project's
+        run history.
+
+        Returns
+        -------
+        string
+        """
+        return os.path.join(self.project_dir, conf.METRICS_FILE)
+
+    @property
+    def output_dir(self):
+        """Path to the directory of the project's output store.
+
+        Returns
+        -------
+        string
+        """
+        return os.path.join(self.project_dir, conf.OUTPUT_DIR)
+
+    def own_settings(self, key, contexts=None):
+        """Read the settings that are defined by a context itself (without
+        the settings that it inherits). Returns an empty dictionary for
+        unknown contexts.
+
+        Parameters
+        ----------
+        key: string
+            Path to the context (empty for the project)
+        contexts: dict or set, optional
+            Context listing of the project (read from the listing file or the
+            settings store if not given)
+
+        Returns
+        -------
+        dict
+        """
+        if not self.store is None:
+            return self.store.read(key)
+        if key == '':
+            return read_settings(self.settings_file)
+        if contexts is None:
+            contexts = self.list_contexts()
+        if not key in contexts:
+            return dict()
+        return read_settings(os.path.join(self.context_dir, contexts[key]))
+
+    @property
+    def provenance_file(self):
+        """Path to the database file of the project's provenance index.
+
+        Returns
+        -------
+        string
+        """
+        return os.path.join(self.project_dir, conf.PROVENANCE_FILE)
+
     def project_settings(self):
         """Get project settings for the context's project.
 
@@ -143,12 +341,44 @@ class ContextManager(object):
         -------
         prjrepo.config.context.Config
         """
+        if not self.store is None:
+            return Config([('', self.store.filename)], True, store=self.store)
         return Config([('', self.settings_file)], True)
 
+    @property
+    def results_dir(self):
+        """Path to the directory of the project's result tables.
+
+        Returns
+        -------
+        string
+        """
+        return os.path.join(self.project_dir, conf.RESULTS_DIR)
+
+    @property
+    def running_dir(self):
+        """Path to the directory of the project's registry of running jobs.
+
+        Returns
+        -------
+        string
+        """
+        return os.path.join(self.project_dir, conf.RUNNING_DIR)
+
+    @property
+    def series_dir(self):
+        """Path to the directory of the project's resource usage time series.
+
+        Returns
+        -------
+        string
+        """
+        return os.path.join(self.project_dir, conf.SERIES_DIR)
+
 
 class Config(object):
     """Object excapsulating context settings."""
-    def __init__(self, settings, is_project_config):
+    def __init__(self, settings, is_project_config, layers=None, store=None):
         """Initialize the settings dictionary from the given dictionary and an
         optional dictionary containing default values.
 
@@ -162,9 +392,17 @@ class Config(object):
         is_project_config: bool
             Flag indicating whether this object represents the project settings
             or settings for a project context.
+        layers: prjrepo.config.context.SettingsChain, optional
+            Settings of the context files if they have already been read (e.g.,
+            from a cache)
+        store: prjrepo.config.store.SettingsStore, optional
+            Settings store of the project. If given, settings are read from
+            and written to the store using the context paths.
         """
         self.files = settings
         self.is_project_config = is_project_config
+        self._layers = layers
+        self.store = store
 
     def get_value(self, para, default_values=dict()):
         """Return the value that is associated with the given parameter. The
@@ -182,16 +420,35 @@ class Config(object):
         -------
         string
         """
-        return get_settings_value(self.settings, para, default_values=default_values)
+        return get_settings_value(self.layers, para, default_values=default_values)
+
+    @property
+    def layers(self):
+        """Layered view of the settings files along the context path. The
+        files are read once and are not merged. Lookups check the layers from
+        the most to the least specific context.
+
+        Returns
+        -------
+        prjrepo.config.context.SettingsChain
+        """
+        if self._layers is None:
+            if not self.store is None:
+                maps = [self.store.read(f[0]) for f in reversed(self.files)]
+            else:
+                maps = [read_settings(f[1]) for f in reversed(self.files)]
+            self._layers = SettingsChain(maps)
+        return self._layers
 
     @property
     def settings(self):
-        settings = read_settings(self.files[0][1])
-        for i in range(1, len(self.files)):
-            settings = nested_merge(
-                settings, read_settings(self.files[i][1])
-            )
-        return settings
+        """Effective settings for the context as a merged dictionary.
+
+        Returns
+        -------
+        dict
+        """
+        return self.layers.to_dict()
 
     def update_value(self, para, value=None, cascade=False):
         """Update the value of a configuration parameter. The para argument may
@@ -221,9 +478,7 @@ class Config(object):
             start = 1
         else:
             start = len(self.files) - 1
-        for i in range(start, len(self.files)):
-            filename = self.files[i][1]
-            settings = read_settings(filename)
+        def modify(settings):
             el = settings
             # Find the element that is referenced by the path prefix. Create
             # elements along the path if necessary (only if not deleting)
@@ -243,9 +498,100 @@ class Config(object):
             elif not el is None:
                 if key in el:
                     del el[key]
-            # Write the modified settings to the context file
-            with open(filename, 'w') as f:
-                yaml.dump(settings, f, default_flow_style=False)
+        if not self.store is None:
+            # All contexts are updated in a single transaction
+            self.store.update([f[0] for f in self.files[start:]], modify)
+        else:
+            for i in range(start, len(self.files)):
+                filename = self.files[i][1]
+                settings = read_settings(filename)
+                modify(settings)
+                # Write the modified settings to the context file
+                with open(filename, 'w') as f:
+                    yaml.dump(settings, f, default_flow_style=False)
+        # Force settings files to be read again on next access
+        self._layers = None
+
+
+class SettingsChain(object):
+    """Read-only layered view over a list of nested settings dictionaries
+    (similar to a nested ChainMap). The dictionaries are ordered from the most
+    to the least specific context. A value in a more specific layer shadows the
+    values in all less specific layers unless both values are dictionaries. In
+    the latter case the result is a chain over the nested dictionaries.
+
+    The semantics are the same as for merging the layers with nested_merge but
+    no dictionary is copied or modified.
+    """
+    def __init__(self, maps):
+        """Initialize the list of layers.
+
+        Parameters
+        ----------
+        maps: list(dict)
+            Settings dictionaries ordered from most to least specific
+        """
+        self.maps = maps
+
+    def __contains__(self, key):
+        """Test if the key is defined in any of the layers.
+
+        Parameters
+        ----------
+        key: string
+            Settings key
+
+        Returns
+        -------
+        bool
+        """
+        for m in self.maps:
+            if key in m:
+                return True
+        return False
+
+    def __getitem__(self, key):
+        """Get the effective value for the given key. If the value is a
+        dictionary the result is a SettingsChain over the dictionaries for the
+        key in all layers up to the first layer where the key references a
+        non-dictionary value.
+
+        Raises KeyError if the key is not defined in any of the layers.
+
+        Parameters
+        ----------
+        key: string
+            Settings key
+
+        Returns
+        -------
+        any
+        """
+        children = list()
+        for m in self.maps:
+            if key in m:
+                value = m[key]
+                if not isinstance(value, dict):
+                    if len(children) == 0:
+                        return value
+                    break
+                children.append(value)
+        if len(children) == 0:
+            raise KeyError(key)
+        return SettingsChain(children)
+
+    def to_dict(self):
+        """Materialize the effective settings as a single merged dictionary.
+        The layers remain unchanged.
+
+        Returns
+        -------
+        dict
+        """
+        settings = dict()
+        for m in reversed(self.maps):
+            settings = nested_merge(settings, copy.deepcopy(m))
+        return settings
 
 
 
@@ -253,10 +599,15 @@ class Config(object):
 # Helper Methods
 # ------------------------------------------------------------------------------
 
-def get_settings_value(settings, para, var_list=[], default_values=dict()):
+def get_settings_value(settings, para, var_list=None, default_values=dict()):
+    # The list of variables that are being resolved is created for each call
+    # (and not shared between calls) such that values can be resolved
+    # concurrently.
+    if var_list is None:
+        var_list = list()
     el = settings
     for comp in para.split('.'):
-        if isinstance(el, dict):
+        if isinstance(el, (dict, SettingsChain)):
             if comp in el:
                 el = el[comp]
             elif para in default_values:
@@ -265,7 +616,7 @@ def get_settings_value(settings, para, var_list=[], default_values=dict()):
                 return None
         else:
             raise ValueError('cannot get value of \'' + para + '\'')
-    if not isinstance(el, dict):
+    if not isinstance(el, (dict, SettingsChain)):
         if isinstance(el, basestring):
             return resolve_variables(settings, el, var_list, default_values)
         else:
@@ -320,6 +671,34 @@ def is_file(parent, filename):
     return file_path
 
 
+def merge_settings(parent, child):
+    """Get the effective settings for a context from the effective settings
+    of its parent and the settings in the context file. Has the same semantics
+    as merging the child into a copy of the parent with nested_merge. Neither
+    dictionary is modified. Only dictionaries along paths that are modified by
+    the child are copied, all other values are shared with the parent and the
+    child.
+
+    Parameters
+    ----------
+    parent: dict
+        Effective settings of the parent context
+    child: dict
+        Settings of the context
+
+    Returns
+    -------
+    dict
+    """
+    settings = dict(parent)
+    for key in child:
+        if key in settings and isinstance(settings[key], dict) and isinstance(child[key], dict):
+            settings[key] = merge_settings(settings[key], child[key])
+        else:
+            settings[key] = child[key]
+    return settings
+
+
 def nested_merge(d1, d2):
     """Merge two dictionaries such that d1 will contain all the values from d2.
 
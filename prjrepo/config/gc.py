@@ -0,0 +1,284 @@
+"""Garbage collection for the context listing and the contexts directory.
+Contexts are only ever appended to CONTEXTLIST. Entries for directories that
+have been deleted and entries that are shadowed by a later entry for the same
+directory are never removed, and neither are the settings files that they
+reference. Garbage collection rewrites the listing with the live entries only
+and deletes (or archives) all context files that are no longer referenced.
+
+For projects that use the settings store, the settings of contexts whose
+directory no longer exists are removed from the store in a single
+transaction.
+"""
+
+import fcntl
+import os
+import StringIO
+import tarfile
+import time
+import yaml
+
+import prjrepo.config as conf
+from prjrepo.config.context import read_contexts
+
+
+# ------------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------------
+
+"""Number of times the context listing is read to measure the lookup time."""
+LOOKUP_REPEAT = 10
+
+
+# ------------------------------------------------------------------------------
+# Garbage Collection
+# ------------------------------------------------------------------------------
+
+class GarbageCollectionReport(object):
+    """Summary of a garbage collection run."""
+    def __init__(self):
+        """Initialize all counters."""
+        self.entries_before = 0
+        self.entries_after = 0
+        self.dead_entries = 0
+        self.duplicate_entries = 0
+        self.listing_bytes_before = 0
+        self.listing_bytes_after = 0
+        self.orphan_files = list()
+        self.orphan_bytes = 0
+        self.lookup_time_before = 0.0
+        self.lookup_time_after = 0.0
+        self.archive_file = None
+        # Paths of contexts that were removed from the settings store (None
+        # for projects that use settings files)
+        self.dead_contexts = None
+
+    def lines(self):
+        """Get a human-readable summary.
+
+        Returns
+        -------
+        list(string)
+        """
+        action = 'deleted' if self.archive_file is None else 'archived'
+        if not self.dead_contexts is None:
+            lines = [
+                'settings store: ' + str(self.entries_before) + ' -> ' +
+                str(self.entries_after) + ' contexts',
+                action + ' ' + str(len(self.dead_contexts)) + ' dead contexts'
+            ]
+            if not self.archive_file is None:
+                lines.append('archive: ' + self.archive_file)
+            return lines
+        lines = [
+            'CONTEXTLIST: ' + str(self.entries_before) + ' -> ' +
+            str(self.entries_after) + ' entries (' +
+            str(self.listing_bytes_before) + ' -> ' +
+            str(self.listing_bytes_after) + ' bytes)',
+            'removed ' + str(self.dead_entries) + ' dead and ' +
+            str(self.duplicate_entries) + ' duplicate entries',
+            action + ' ' + str(len(self.orphan_files)) + ' context files (' +
+            str(self.orphan_bytes) + ' bytes)',
+            'lookup time: ' + format_ms(self.lookup_time_before) + ' -> ' +
+            format_ms(self.lookup_time_after)
+        ]
+        if not self.archive_file is None:
+            lines.append('archive: ' + self.archive_file)
+        return lines
+
+
+def collect_garbage(context, archive=False, dry_run=False):
+    """Remove dead and duplicate entries from the context listing of the
+    project that contains the given context and delete all context files that
+    are not referenced by a remaining entry. An entry is dead if the directory
+    it refers to no longer exists. Of several entries for the same directory
+    only the last one is used by read_contexts and therefore kept.
+
+    The listing is rewritten atomically while holding an exclusive lock on the
+    listing file. If archive is True, orphaned context files are added to a
+    compressed archive in the project directory before they are deleted. If
+    dry_run is True, the report is computed but nothing is changed.
+
+    For projects that use the settings store, contexts whose directory no
+    longer exists are removed from the store instead (see
+    collect_store_garbage).
+
+    Parameters
+    ----------
+    context: prjrepo.config.context.ContextManager
+        Any context in the project
+    archive: bool, optional
+        Archive orphaned context files instead of only deleting them
+    dry_run: bool, optional
+        Report what would be removed without changing anything
+
+    Returns
+    -------
+    prjrepo.config.gc.GarbageCollectionReport
+    """
+    if not context.store is None:
+        return collect_store_garbage(context, archive=archive, dry_run=dry_run)
+    report = GarbageCollectionReport()
+    base_dir = os.path.dirname(context.project_dir)
+    listing = context.contextls_file
+    f = open(listing, 'r+')
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        report.lookup_time_before = lookup_time(listing)
+        report.listing_bytes_before = os.path.getsize(listing)
+        # Keep the last entry for each live directory in order of appearance
+        entries = list()
+        for line in f:
+            tokens = line.strip().split('\t')
+            if len(tokens) == 2:
+                entries.append((tokens[0], tokens[1]))
+        report.entries_before = len(entries)
+        last = dict()
+        for i in range(len(entries)):
+            last[entries[i][0]] = i
+        live = list()
+        for i in range(len(entries)):
+            rel_path, filename = entries[i]
+            if last[rel_path] != i:
+                report.duplicate_entries += 1
+            elif not os.path.isdir(os.path.join(base_dir, rel_path)):
+                report.dead_entries += 1
+            else:
+                live.append(entries[i])
+        report.entries_after = len(live)
+        content = ''.join([p + '\t' + n + '\n' for p, n in live])
+        report.listing_bytes_after = len(content)
+        # Context files that are not referenced by a live entry
+        referenced = set([n for p, n in live])
+        for filename in sorted(os.listdir(context.context_dir)):
+            if not filename in referenced:
+                path = os.path.join(context.context_dir, filename)
+                if os.path.isfile(path):
+                    report.orphan_files.append(filename)
+                    report.orphan_bytes += os.path.getsize(path)
+        if dry_run:
+            report.lookup_time_after = report.lookup_time_before
+            if len(entries) > 0:
+                report.lookup_time_after *= float(len(live)) / len(entries)
+            return report
+        # Archive orphaned context files before anything is deleted
+        if archive and len(report.orphan_files) > 0:
+            archive_dir = os.path.join(context.project_dir, conf.ARCHIVE_DIR)
+            if not os.path.isdir(archive_dir):
+                os.mkdir(archive_dir)
+            report.archive_file = os.path.join(
+                archive_dir,
+                'contexts-' + time.strftime('%Y%m%d%H%M%S') + '.tar.gz'
+            )
+            with tarfile.open(report.archive_file, 'w:gz') as tar:
+                for filename in report.orphan_files:
+                    tar.add(
+                        os.path.join(context.context_dir, filename),
+                        arcname=filename
+                    )
+        # Replace the listing. Processes that wait for the lock on the old file
+        # will notice that it was replaced and reopen the listing.
+        tmp_file = listing + '.tmp'
+        with open(tmp_file, 'w') as tmp:
+            tmp.write(content)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        os.rename(tmp_file, listing)
+        for filename in report.orphan_files:
+            os.remove(os.path.join(context.context_dir, filename))
+        report.lookup_time_after = lookup_time(listing)
+    finally:
+        f.close()
+    return report
+
+
+def collect_store_garbage(context, archive=False, dry_run=False):
+    """Remove the settings of all contexts whose directory no longer exists
+    from the settings store of the project that contains the given context.
+    Contexts are removed in a single transaction. If archive is True, the
+    settings of removed contexts are added to a compressed archive in the
+    project directory (one Yaml file per context) before they are removed. If
+    dry_run is True, the report is computed but nothing is changed.
+
+    Parameters
+    ----------
+    context: prjrepo.config.context.ContextManager
+        Any context in the project (that uses the settings store)
+    archive: bool, optional
+        Archive the settings of removed contexts
+    dry_run: bool, optional
+        Report what would be removed without changing anything
+
+    Returns
+    -------
+    prjrepo.config.gc.GarbageCollectionReport
+    """
+    report = GarbageCollectionReport()
+    base_dir = os.path.dirname(context.project_dir)
+    is_live = lambda path: os.path.isdir(os.path.join(base_dir, path))
+    dead = context.store.prune(is_live, dry_run=True)
+    if not dry_run and len(dead) > 0:
+        # Archive the settings of dead contexts before anything is removed
+        if archive:
+            archive_dir = os.path.join(context.project_dir, conf.ARCHIVE_DIR)
+            if not os.path.isdir(archive_dir):
+                os.mkdir(archive_dir)
+            report.archive_file = os.path.join(
+                archive_dir,
+                'contexts-' + time.strftime('%Y%m%d%H%M%S') + '.tar.gz'
+            )
+            with tarfile.open(report.archive_file, 'w:gz') as tar:
+                for path in sorted(dead.keys()):
+                    data = yaml.dump(dead[path], default_flow_style=False)
+                    info = tarfile.TarInfo(path + '.yaml')
+                    info.size = len(data)
+                    info.mtime = time.time()
+                    tar.addfile(info, StringIO.StringIO(data))
+        # Only contexts that were found dead above are removed. Contexts whose
+        # directory was created again in the meantime are kept.
+        dead = context.store.prune(lambda path: not path in dead or is_live(path))
+    report.dead_contexts = sorted(dead.keys())
+    report.dead_entries = len(dead)
+    report.entries_after = len(context.store.contexts())
+    report.entries_before = report.entries_after
+    if not dry_run:
+        report.entries_before += len(dead)
+    else:
+        report.entries_after -= len(dead)
+    return report
+
+
+# ------------------------------------------------------------------------------
+# Helper Methods
+# ------------------------------------------------------------------------------
+
+def format_ms(seconds):
+    """Format a duration in milliseconds.
+
+    Parameters
+    ----------
+    seconds: float
+        Duration in seconds
+
+    Returns
+    -------
+    string
+    """
+    return '%.3f ms' % (seconds * 1000)
+
+
+def lookup_time(filename):
+    """Measure the average time to read the context listing.
+
+    Parameters
+    ----------
+    filename: string
+        Path to the context listing
+
+    Returns
+    -------
+    float
+    """
+    start = time.time()
+    for i in range(LOOKUP_REPEAT):
+        read_contexts(filename)
+    return (time.time() - start) / LOOKUP_REPEAT
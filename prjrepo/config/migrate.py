@@ -0,0 +1,155 @@
+"""Migration of project settings between settings files (the context listing
+and one Yaml file per context) and the settings store. Migration is done
+while holding the lock on the context listing such that no context is created
+concurrently. The new representation is complete before the old one is
+removed.
+"""
+
+import fcntl
+import os
+import uuid
+import yaml
+
+import prjrepo.config as conf
+from prjrepo.config.context import read_contexts, read_settings
+from prjrepo.config.store import SettingsStore
+
+
+# ------------------------------------------------------------------------------
+# Migration
+# ------------------------------------------------------------------------------
+
+def migrate_to_files(context):
+    """Move all settings from the settings store back to settings files.
+    Returns the number of migrated contexts (excluding the project settings).
+
+    Raises RuntimeError if the project does not use the settings store.
+
+    Parameters
+    ----------
+    context: prjrepo.config.context.ContextManager
+        Any context in the project
+
+    Returns
+    -------
+    int
+    """
+    if context.store is None:
+        raise RuntimeError('project does not use the settings store')
+    f = lock_listing(context.contextls_file)
+    try:
+        stored = context.store.read_all()
+        lines = list()
+        for path in sorted([p for p in stored if p != '']):
+            context_id = str(uuid.uuid4()).replace('-', '')
+            while os.path.isfile(os.path.join(context.context_dir, context_id + '.yaml')):
+                context_id = str(uuid.uuid4()).replace('-', '')
+            write_settings(
+                os.path.join(context.context_dir, context_id + '.yaml'),
+                stored[path]
+            )
+            lines.append(path + '\t' + context_id + '.yaml\n')
+        write_settings(context.settings_file, stored.get('', dict()))
+        tmp_file = context.contextls_file + '.tmp'
+        with open(tmp_file, 'w') as tmp:
+            tmp.write(''.join(lines))
+        os.rename(tmp_file, context.contextls_file)
+        # The settings files are complete. Removing the store switches the
+        # project back to settings files.
+        context.store.close()
+        os.remove(context.store.filename)
+        context.store = None
+    finally:
+        f.close()
+    return len(lines)
+
+
+def migrate_to_store(context):
+    """Move the project settings and the settings of all contexts in the
+    context listing into the settings store. Context files that are not
+    referenced by the listing (see prjrepo.config.gc) are left unchanged.
+    Returns the number of migrated contexts (excluding the project settings).
+
+    Raises RuntimeError if the project already uses the settings store.
+
+    Parameters
+    ----------
+    context: prjrepo.config.context.ContextManager
+        Any context in the project
+
+    Returns
+    -------
+    int
+    """
+    if not context.store is None:
+        raise RuntimeError('project already uses the settings store')
+    f = lock_listing(context.contextls_file)
+    try:
+        contexts = read_contexts(context.contextls_file)
+        stored = {'': read_settings(context.settings_file)}
+        for path, filename in contexts.items():
+            stored[path] = read_settings(os.path.join(context.context_dir, filename))
+        # Write the store under a temporary name first. Renaming the complete
+        # store switches the project to the store.
+        store_file = os.path.join(context.project_dir, conf.STORE_FILE)
+        tmp_file = store_file + '.tmp'
+        if os.path.isfile(tmp_file):
+            os.remove(tmp_file)
+        store = SettingsStore(tmp_file)
+        store.write_all(stored)
+        store.close()
+        os.rename(tmp_file, store_file)
+        context.store = SettingsStore(store_file)
+        # Remove the migrated settings files. The (empty) listing and project
+        # settings file remain part of the project directory layout.
+        for filename in set(contexts.values()):
+            path = os.path.join(context.context_dir, filename)
+            if os.path.isfile(path):
+                os.remove(path)
+        open(context.settings_file, 'w').close()
+        with open(context.contextls_file, 'w') as listing:
+            listing.truncate()
+    finally:
+        f.close()
+    return len(contexts)
+
+
+# ------------------------------------------------------------------------------
+# Helper Methods
+# ------------------------------------------------------------------------------
+
+def lock_listing(filename):
+    """Open the context listing and acquire an exclusive lock. The listing may
+    be replaced by garbage collection while waiting for the lock. In this case
+    the new listing is opened. The lock is released when the returned file is
+    closed.
+
+    Parameters
+    ----------
+    filename: string
+        Path to the context listing
+
+    Returns
+    -------
+    file
+    """
+    while True:
+        f = open(filename, 'a')
+        fcntl.flock(f, fcntl.LOCK_EX)
+        if os.fstat(f.fileno()).st_ino == os.stat(filename).st_ino:
+            return f
+        f.close()
+
+
+def write_settings(filename, settings):
+    """Write settings to a Yaml file.
+
+    Parameters
+    ----------
+    filename: string
+        Path to the settings file
+    settings: dict
+        Settings dictionary
+    """
+    with open(filename, 'w') as f:
+        yaml.dump(settings, f, default_flow_style=False)
@@ -0,0 +1,254 @@
+"""Settings store that keeps the project settings and the settings of all
+contexts in a single SQLite database instead of one Yaml file per context and
+the context listing. The store is used for a project if the database file
+exists in the project directory (see prjrepo.config.migrate for converting
+an existing project).
+
+Settings are stored in the same Yaml format as in settings files. The project
+settings are stored under the empty path. Updates of one or more contexts are
+done in a single transaction.
+"""
+
+import sqlite3
+import threading
+import yaml
+
+
+# ------------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------------
+
+"""Database schema for the settings store."""
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS settings(path TEXT PRIMARY KEY, value TEXT)'
+]
+
+
+# ------------------------------------------------------------------------------
+# Settings Store
+# ------------------------------------------------------------------------------
+
+class SettingsStore(object):
+    """Project and context settings in a SQLite database. Contexts are
+    identified by their path relative to the project base directory.
+    """
+    def __init__(self, filename):
+        """Initialize the database file. The file is created if it does not
+        exist.
+
+        Parameters
+        ----------
+        filename: string
+            Path to the database file
+        """
+        self.filename = filename
+        self.lock = threading.Lock()
+        # Transactions are started explicitly such that settings can be read
+        # and written under the same database lock
+        self.con = sqlite3.connect(
+            filename,
+            timeout=60,
+            isolation_level=None,
+            check_same_thread=False
+        )
+        with self.lock:
+            for stmt in SCHEMA:
+                self.con.execute(stmt)
+
+    def close(self):
+        """Close the database connection."""
+        self.con.close()
+
+    def contexts(self):
+        """Get the paths of all contexts in the store.
+
+        Returns
+        -------
+        set(string)
+        """
+        with self.lock:
+            rows = self.con.execute(
+                'SELECT path FROM settings WHERE path <> \'\''
+            ).fetchall()
+        return set([row[0] for row in rows])
+
+    def create(self, path):
+        """Create an empty context for the given path. Existing settings for
+        the path are not changed.
+
+        Parameters
+        ----------
+        path: string
+            Context path
+        """
+        with self.lock:
+            self.con.execute(
+                'INSERT OR IGNORE INTO settings(path, value) VALUES(?, ?)',
+                (path, dump_settings(dict()))
+            )
+
+    def prune(self, keep, dry_run=False):
+        """Remove the settings of all contexts for which the keep function
+        returns False in a single transaction. The project settings are never
+        removed. Returns a dictionary that maps the paths of removed contexts
+        to their settings.
+
+        Parameters
+        ----------
+        keep: function
+            Function that takes a context path and returns True if the
+            context is kept
+        dry_run: bool, optional
+            Only return the contexts that would be removed
+
+        Returns
+        -------
+        dict
+        """
+        with self.lock:
+            self.con.execute('BEGIN IMMEDIATE')
+            try:
+                removed = dict()
+                rows = self.con.execute(
+                    'SELECT path, value FROM settings WHERE path <> \'\''
+                ).fetchall()
+                for path, value in rows:
+                    if not keep(path):
+                        removed[path] = load_settings(value)
+                        if not dry_run:
+                            self.con.execute(
+                                'DELETE FROM settings WHERE path = ?',
+                                (path,)
+                            )
+            except:
+                self.con.execute('ROLLBACK')
+                raise
+            self.con.execute('COMMIT')
+        return removed
+
+    def read(self, path):
+        """Read the settings for the given path. Returns an empty dictionary
+        if the path is not in the store.
+
+        Parameters
+        ----------
+        path: string
+            Context path (empty for the project settings)
+
+        Returns
+        -------
+        dict
+        """
+        with self.lock:
+            row = self.con.execute(
+                'SELECT value FROM settings WHERE path = ?',
+                (path,)
+            ).fetchone()
+        if row is None:
+            return dict()
+        return load_settings(row[0])
+
+    def read_all(self):
+        """Read the settings of the project and of all contexts. Returns a
+        dictionary that maps context paths to settings.
+
+        Returns
+        -------
+        dict
+        """
+        with self.lock:
+            rows = self.con.execute('SELECT path, value FROM settings').fetchall()
+        return dict([(path, load_settings(value)) for path, value in rows])
+
+    def update(self, paths, modify):
+        """Modify the settings for a list of paths in a single transaction.
+        The modify function is called with the settings dictionary of each
+        path and changes the dictionary in place. If the function raises an
+        exception none of the settings are changed.
+
+        Parameters
+        ----------
+        paths: list(string)
+            Context paths
+        modify: function
+            Function that takes a settings dictionary and modifies it
+        """
+        with self.lock:
+            self.con.execute('BEGIN IMMEDIATE')
+            try:
+                for path in paths:
+                    row = self.con.execute(
+                        'SELECT value FROM settings WHERE path = ?',
+                        (path,)
+                    ).fetchone()
+                    settings = load_settings(row[0]) if not row is None else dict()
+                    modify(settings)
+                    self.con.execute(
+                        'INSERT OR REPLACE INTO settings(path, value) VALUES(?, ?)',
+                        (path, dump_settings(settings))
+                    )
+            except:
+                self.con.execute('ROLLBACK')
+                raise
+            self.con.execute('COMMIT')
+
+    def write_all(self, settings):
+        """Replace the content of the store with the given settings in a
+        single transaction.
+
+        Parameters
+        ----------
+        settings: dict
+            Dictionary that maps context paths to settings
+        """
+        with self.lock:
+            self.con.execute('BEGIN IMMEDIATE')
+            try:
+                self.con.execute('DELETE FROM settings')
+                for path in sorted(settings.keys()):
+                    self.con.execute(
+                        'INSERT INTO settings(path, value) VALUES(?, ?)',
+                        (path, dump_settings(settings[path]))
+                    )
+            except:
+                self.con.execute('ROLLBACK')
+                raise
+            self.con.execute('COMMIT')
+
+
+# ------------------------------------------------------------------------------
+# Helper Methods
+# ------------------------------------------------------------------------------
+
+def dump_settings(settings):
+    """Serialize a settings dictionary in the format of settings files.
+
+    Parameters
+    ----------
+    settings: dict
+        Settings dictionary
+
+    Returns
+    -------
+    string
+    """
+    return yaml.dump(settings, default_flow_style=False)
+
+
+def load_settings(value):
+    """Parse serialized settings. Returns an empty dictionary for empty
+    settings.
+
+    Parameters
+    ----------
+    value: string
+        Settings in Yaml format
+
+    Returns
+    -------
+    dict
+    """
+    obj = yaml.load(value)
+    if obj is None:
+        obj = dict()
+    return obj
@@ -0,0 +1,101 @@
+"""Run repository commands in many project repositories in parallel."""
+
+from multiprocessing import Pool
+import os
+import StringIO
+import sys
+
+
+# ------------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------------
+
+"""Commands that can be run in multiple repositories."""
+FOREACH_COMMANDS = ['context', 'log', 'project', 'run']
+
+
+# ------------------------------------------------------------------------------
+# API
+# ------------------------------------------------------------------------------
+
+def foreach(prg_name, directories, args, processes=None, out=sys.stdout):
+    """Run a repository command in each of the given directories using a
+    pool of worker processes. The output of each command is written to the
+    given output stream when the command finishes. Each line is prefixed with
+    the directory. Returns the number of directories for which the command
+    failed.
+
+    Raises ValueError if the command cannot be run in multiple repositories.
+
+    Parameters
+    ----------
+    prg_name: string
+        Name with which the program was called
+    directories: list(string)
+        Project directories
+    args: list(string)
+        Command name and arguments
+    processes: int, optional
+        Number of worker processes (default is number of CPUs)
+    out: file, optional
+        Output stream
+
+    Returns
+    -------
+    int
+    """
+    if len(args) == 0 or not args[0] in FOREACH_COMMANDS:
+        raise ValueError('invalid foreach command \'' + ' '.join(args) + '\'')
+    tasks = [(prg_name, os.path.abspath(d), args) for d in directories]
+    failed = 0
+    pool = Pool(processes=processes)
+    try:
+        for directory, output, error in pool.imap_unordered(run_in_directory, tasks):
+            prefix = os.path.relpath(directory) + ': '
+            for line in output.splitlines():
+                out.write(prefix + line + '\n')
+            if not error is None:
+                out.write(prefix + prg_name + ' (ERROR): ' + error + '\n')
+                failed += 1
+            out.flush()
+    finally:
+        pool.close()
+        pool.join()
+    return failed
+
+
+def run_in_directory(task):
+    """Run a repository command in a given directory and capture its output.
+    Returns a tuple of directory, output, and error message (None if the
+    command was successful).
+
+    Parameters
+    ----------
+    task: (string, string, list(string))
+        Program name, directory, and command arguments
+
+    Returns
+    -------
+    (string, string, string)
+    """
+    # Import here to avoid circular imports with the command line interface
+    import prjrepo.__main__ as cli
+    prg_name, directory, args = task
+    stdout, stderr = sys.stdout, sys.stderr
+    buf = StringIO.StringIO()
+    error = None
+    cwd = os.getcwd()
+    try:
+        os.chdir(directory)
+        sys.stdout, sys.stderr = buf, buf
+        cli.main(prg_name, args)
+    except (ValueError, RuntimeError) as ex:
+        error = str(ex)
+    except Exception as ex:
+        # Unexpected errors (e.g., I/O errors or invalid files) are reported
+        # for the repository and do not affect other repositories
+        error = type(ex).__name__ + ': ' + str(ex)
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+        os.chdir(cwd)
+    return directory, buf.getvalue(), error
@@ -0,0 +1,344 @@
+"""Impact analysis for changes of settings values. Commands reference
+variables in their components ([[var]]) and settings values may reference
+other variables. The dependency graph of a context is built from the command
+specifications and the effective settings of the context. Variables are path
+expressions. A reference to a variable is affected by a change of the variable
+itself, of any of its ancestors, and of any of its descendants.
+
+A change is made in the settings of the project or of a context and only
+affects the context in which it is made and its descendants. Descendant
+contexts that define the changed variable themselves (or any of its
+ancestors or descendants) shadow the change for their whole subtree.
+
+Result tables and run journals record the working directory of each run.
+Cached results are invalidated for the runs of an affected command whose
+working directory belongs to a context in which the command is affected (the
+closest context along the path). Contexts that shadow the changed variable
+keep their results. Runs without a recorded working directory are always
+invalidated.
+"""
+
+import os
+
+import prjrepo.config as conf
+from prjrepo.completion import command_variables
+from prjrepo.journal import RunJournal
+from prjrepo.results import ResultCollector
+from prjrepo.workflow.repository import DefaultCommandRepository
+
+
+# ------------------------------------------------------------------------------
+# Dependency Graph
+# ------------------------------------------------------------------------------
+
+class DependencyGraph(object):
+    """Dependencies between the commands of a project and the variables in
+    the project and context settings.
+    """
+    def __init__(self, context):
+        """Initialize the variables that are referenced by each command.
+
+        Parameters
+        ----------
+        context: prjrepo.config.context.ContextManager
+            Any context in the project
+        """
+        self.context = context
+        self.commands = dict()
+        repository = DefaultCommandRepository(context.cmd_dir)
+        for name in repository.list_commands():
+            self.commands[name] = command_variables(context.cmd_dir, name)
+
+    def affected_commands(self, settings, var):
+        """Get the names of all commands whose command line depends on the
+        given variable in a context with the given effective settings.
+
+        Parameters
+        ----------
+        settings: dict
+            Effective settings of the context
+        var: string
+            Variable name (path expression)
+
+        Returns
+        -------
+        list(string)
+        """
+        affected = self.affected_variables(settings, var)
+        commands = list()
+        for name in sorted(self.commands.keys()):
+            for ref in self.commands[name]:
+                if is_affected(ref, affected):
+                    commands.append(name)
+                    break
+        return commands
+
+    def affected_variables(self, settings, var):
+        """Get all variables whose value depends on the given variable in a
+        context with the given effective settings. The result includes the
+        variable itself.
+
+        Parameters
+        ----------
+        settings: dict
+            Effective settings of the context
+        var: string
+            Variable name (path expression)
+
+        Returns
+        -------
+        set(string)
+        """
+        references = settings_references(settings)
+        affected = set([var])
+        queue = [var]
+        while len(queue) > 0:
+            name = queue.pop()
+            for key, refs in references.items():
+                if key in affected:
+                    continue
+                for ref in refs:
+                    if is_affected(ref, [name]):
+                        affected.add(key)
+                        queue.append(key)
+                        break
+        return affected
+
+    def impact(self, var, path=''):
+        """Generator for the commands that are affected by a change of the
+        given variable in the settings of the context with the given path.
+        The change affects the context itself and all its descendants except
+        for the subtrees of contexts that define the variable themselves.
+        Contexts without affected commands are omitted.
+
+        The generated tuples contain the path to the context (empty for the
+        project) and the list of affected command names.
+
+        Parameters
+        ----------
+        var: string
+            Variable name (path expression)
+        path: string, optional
+            Path to the context in which the variable is changed (empty for
+            the project)
+
+        Returns
+        -------
+        iterator((string, list(string)))
+        """
+        contexts = self.context.list_contexts()
+        shadowed = list()
+        for key, settings in self.context.context_tree(contexts=contexts):
+            if not is_subpath(key, path):
+                continue
+            if key != path:
+                if len([s for s in shadowed if is_subpath(key, s)]) > 0:
+                    continue
+                own = defined_variables(self.context.own_settings(key, contexts))
+                if len([v for v in own if is_affected(v, [var])]) > 0:
+                    shadowed.append(key)
+                    continue
+            commands = self.affected_commands(settings, var)
+            if len(commands) > 0:
+                yield key, commands
+
+
+# ------------------------------------------------------------------------------
+# Helper Methods
+# ------------------------------------------------------------------------------
+
+def context_path(base_dir, contexts, work_dir):
+    """Get the path of the context whose settings are used for runs in the
+    given working directory, i.e., the closest context along the path from
+    the project base directory. Returns the empty path for the project and
+    None if the working directory is unknown or not in the project.
+
+    Parameters
+    ----------
+    base_dir: string
+        Project base directory
+    contexts: dict or set
+        Context listing of the project
+    work_dir: string
+        Working directory of a run
+
+    Returns
+    -------
+    string
+    """
+    if work_dir is None:
+        return None
+    rel_path = os.path.relpath(work_dir, base_dir)
+    if rel_path == '.':
+        return ''
+    if rel_path == '..' or rel_path.startswith('..' + os.sep):
+        return None
+    names = rel_path.split(os.sep)
+    for i in range(len(names), 0, -1):
+        key = '/'.join(names[:i])
+        if key in contexts:
+            return key
+    return ''
+
+
+def defined_variables(settings, prefix=''):
+    """Get the path expressions of all values in a (nested) settings
+    dictionary.
+
+    Parameters
+    ----------
+    settings: dict
+        Settings dictionary
+    prefix: string, optional
+        Path expression of the dictionary
+
+    Returns
+    -------
+    list(string)
+    """
+    variables = list()
+    for key, value in settings.items():
+        name = prefix + str(key)
+        if isinstance(value, dict):
+            variables.extend(defined_variables(value, prefix=name + '.'))
+        else:
+            variables.append(name)
+    return variables
+
+
+def invalidate(context, impact):
+    """Remove cached results and journal entries for the runs of affected
+    commands. The impact is a list of context paths and affected commands as
+    generated by DependencyGraph.impact. Only runs whose working directory
+    belongs to a context in which the command is affected are removed.
+    Returns the number of removed result rows and the number of removed
+    journal entries.
+
+    Parameters
+    ----------
+    context: prjrepo.config.context.ContextManager
+        Any context in the project
+    impact: list((string, list(string)))
+        Context paths and the names of affected commands
+
+    Returns
+    -------
+    (int, int)
+    """
+    base_dir = os.path.dirname(context.project_dir)
+    contexts = context.list_contexts()
+    scopes = dict()
+    for path, cmd_names in impact:
+        for name in cmd_names:
+            scopes.setdefault(name, set()).add(path)
+    def selector(name):
+        def select(work_dir):
+            path = context_path(base_dir, contexts, work_dir)
+            return path is None or path in scopes[name]
+        return select
+    collector = ResultCollector(context.results_dir)
+    rows = 0
+    for name in sorted(scopes.keys()):
+        rows += collector.remove(name, selector(name))
+    collector.close()
+    entries = 0
+    journal_dir = os.path.join(context.project_dir, conf.JOURNAL_DIR)
+    if os.path.isdir(journal_dir):
+        for filename in sorted(os.listdir(journal_dir)):
+            if filename.startswith('.') or filename.endswith('.tmp'):
+                continue
+            journal = RunJournal(os.path.join(journal_dir, filename))
+            for name in sorted(scopes.keys()):
+                entries += journal.discard([name], select=selector(name))
+    return rows, entries
+
+
+def is_affected(ref, variables):
+    """Test if a variable reference is affected by a change of any of the
+    given variables.
+
+    Parameters
+    ----------
+    ref: string
+        Referenced variable
+    variables: iterable(string)
+        Changed variables
+
+    Returns
+    -------
+    bool
+    """
+    for var in variables:
+        if ref == var or ref.startswith(var + '.') or var.startswith(ref + '.'):
+            return True
+    return False
+
+
+def is_subpath(key, path):
+    """Test if a context path equals or is below the given path. The empty
+    path is the project that contains all contexts.
+
+    Parameters
+    ----------
+    key: string
+        Context path
+    path: string
+        Path of the ancestor context
+
+    Returns
+    -------
+    bool
+    """
+    return path == '' or key == path or key.startswith(path + '/')
+
+
+def settings_references(settings, prefix=''):
+    """Get the variables that are referenced by each text value in a (nested)
+    settings dictionary. Returns a dictionary that maps path expressions for
+    values that contain at least one reference to the list of referenced
+    variables.
+
+    Parameters
+    ----------
+    settings: dict
+        Settings dictionary
+    prefix: string, optional
+        Path expression of the dictionary
+
+    Returns
+    -------
+    dict
+    """
+    references = dict()
+    for key, value in settings.items():
+        name = prefix + str(key)
+        if isinstance(value, dict):
+            references.update(settings_references(value, prefix=name + '.'))
+        elif isinstance(value, basestring):
+            refs = value_references(value)
+            if len(refs) > 0:
+                references[name] = refs
+    return references
+
+
+def value_references(value):
+    """Get the variables that are referenced in a text value.
+
+    Parameters
+    ----------
+    value: string
+        Text value
+
+    Returns
+    -------
+    list(string)
+    """
+    refs = list()
+    i_start = value.find('[[')
+    while i_start != -1:
+        i_end = value.find(']]', i_start)
+        if i_end == -1:
+            break
+        refs.append(value[i_start+2:i_end])
+        i_start = value.find('[[', i_end)
+    return refs
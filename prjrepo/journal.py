@@ -0,0 +1,227 @@
+"""Completion journal for sweeps of command runs."""
+
+import hashlib
+import json
+import os
+import threading
+
+
+class RunJournal(object):
+    """Append-only journal that records a stable run key for each completed
+    run. Each line contains the run key, the command name and the working
+    directory of the run separated by tabs (the working directory is missing
+    in journals that were written by earlier versions). The journal is loaded into a dictionary on first access such that
+    testing whether a run has completed takes constant time.
+
+    Incomplete lines (e.g., after a crash while writing) are ignored.
+    """
+    def __init__(self, filename):
+        """Initialize the journal file.
+
+        Parameters
+        ----------
+        filename: string
+            Path to the journal file
+        """
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.skipped = 0
+        self._keys = None
+        self._work_dirs = None
+
+    def __contains__(self, key):
+        """Test if a run with the given key has completed.
+
+        Parameters
+        ----------
+        key: string
+            Run key
+
+        Returns
+        -------
+        bool
+        """
+        return key in self.keys
+
+    def __len__(self):
+        """Number of completed runs in the journal.
+
+        Returns
+        -------
+        int
+        """
+        return len(self.keys)
+
+    def add(self, key, cmd_name, work_dir=None):
+        """Record a completed run.
+
+        Parameters
+        ----------
+        key: string
+            Run key
+        cmd_name: string
+            Name of the executed command
+        work_dir: string, optional
+            Working directory of the run
+        """
+        with self.lock:
+            if key in self.keys:
+                return
+            with open(self.filename, 'a') as f:
+                f.write(journal_line(key, cmd_name, work_dir))
+            self.keys[key] = cmd_name
+            self._work_dirs[key] = work_dir
+
+    def discard(self, cmd_names, select=None):
+        """Remove the entries for all runs of the given commands, such that
+        they are run again when a sweep is resumed. If a select function is
+        given, only entries whose working directory is selected by the
+        function are removed. The function is called with the working
+        directory of each entry (None if it was not recorded). The journal is
+        rewritten if any entry is removed. Returns the number of removed
+        entries.
+
+        Parameters
+        ----------
+        cmd_names: list(string)
+            Command names
+        select: function, optional
+            Function that takes a working directory and returns True if the
+            entry is removed
+
+        Returns
+        -------
+        int
+        """
+        with self.lock:
+            keys = dict()
+            for key, cmd_name in self.keys.items():
+                if not cmd_name in cmd_names:
+                    keys[key] = cmd_name
+                elif not select is None and not select(self._work_dirs[key]):
+                    keys[key] = cmd_name
+            removed = len(self.keys) - len(keys)
+            if removed > 0:
+                tmp_file = self.filename + '.tmp'
+                with open(tmp_file, 'w') as f:
+                    for key, cmd_name in keys.items():
+                        f.write(journal_line(key, cmd_name, self._work_dirs[key]))
+                os.rename(tmp_file, self.filename)
+                self._keys = keys
+                self._work_dirs = dict([(key, self._work_dirs[key]) for key in keys])
+            return removed
+
+    def filter(self, jobs):
+        """Generator that skips all jobs that have completed according to
+        the journal. The number of skipped jobs is counted in the skipped
+        attribute.
+
+        Parameters
+        ----------
+        jobs: iterator(prjrepo.workflow.asyncengine.Job)
+            Rendered jobs
+
+        Returns
+        -------
+        iterator(prjrepo.workflow.asyncengine.Job)
+        """
+        self.skipped = 0
+        for job in jobs:
+            if job_key(job) in self:
+                self.skipped += 1
+            else:
+                yield job
+
+    @property
+    def keys(self):
+        """Dictionary of run keys and command names for all completed runs.
+
+        Returns
+        -------
+        dict
+        """
+        if self._keys is None:
+            keys, work_dirs = dict(), dict()
+            if os.path.isfile(self.filename):
+                with open(self.filename, 'r') as f:
+                    for line in f:
+                        if not line.endswith('\n'):
+                            continue
+                        tokens = line[:-1].split('\t')
+                        if len(tokens) in [2, 3]:
+                            keys[tokens[0]] = tokens[1]
+                            work_dirs[tokens[0]] = tokens[2] if len(tokens) == 3 else None
+            self._keys = keys
+            self._work_dirs = work_dirs
+        return self._keys
+
+    def record(self, job):
+        """Record the given job if it terminated successfully. Can be used as
+        job callback.
+
+        Parameters
+        ----------
+        job: prjrepo.workflow.asyncengine.Job
+            Terminated job
+        """
+        if job.succeeded:
+            self.add(job_key(job), job.cmd.name, work_dir=job.work_dir)
+
+
+# ------------------------------------------------------------------------------
+# Helper Methods
+# ------------------------------------------------------------------------------
+
+def job_key(job):
+    """Get the run key for a rendered job.
+
+    Parameters
+    ----------
+    job: prjrepo.workflow.asyncengine.Job
+        Rendered job
+
+    Returns
+    -------
+    string
+    """
+    return run_key(job.cmd.name, job.cmd_components)
+
+
+def journal_line(key, cmd_name, work_dir):
+    """Get the journal line for a completed run.
+
+    Parameters
+    ----------
+    key: string
+        Run key
+    cmd_name: string
+        Name of the executed command
+    work_dir: string
+        Working directory of the run (may be None)
+
+    Returns
+    -------
+    string
+    """
+    tokens = [key, cmd_name]
+    if not work_dir is None:
+        tokens.append(work_dir)
+    return '\t'.join(tokens) + '\n'
+
+
+def run_key(cmd_name, cmd_components):
+    """Get a stable key for a command run from the command name and the
+    resolved command line components.
+
+    Parameters
+    ----------
+    cmd_name: string
+        Command name
+    cmd_components: list(string)
+        Resolved command line components
+
+    Returns
+    -------
+    string
+    """
+    return hashlib.sha1(json.dumps([cmd_name] + list(cmd_components))).hexdigest()
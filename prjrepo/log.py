@@ -1,19 +1,264 @@
 """Logger for workflow commands."""
 
+import errno
+import fcntl
+import gzip
+import hashlib
 import json
+import os
+import threading
+import time
+import uuid
 
 
+# ------------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------------
+
+"""Name of the directory containing compressed log segments (relative to the
+directory containing the log file) and of the segment manifest file.
+"""
+LOG_SEGMENT_DIR = 'logs'
+MANIFEST_FILE = 'MANIFEST'
+
+"""Default maximum size of the active log file (in bytes) before it is turned
+into a compressed segment.
+"""
+DEFAULT_SEGMENT_SIZE = 16 * 1024 * 1024
+
+
+# ------------------------------------------------------------------------------
+# Logger
+# ------------------------------------------------------------------------------
+
 class DefaultLogger(object):
-    """Default logger appends each command as Json object to log file."""
-    def __init__(self, filename):
+    """Default logger appends each command as Json object to log file. Entries
+    for failed runs contain the non-zero exit code. They are only returned by
+    readers that explicitly ask for them.
+
+    The log file is the active segment of the log. When the active segment
+    exceeds a maximum size (or its first entry exceeds a maximum age) it is
+    compressed into a new segment file. A manifest records for each segment
+    the time range of its entries, the names of the logged commands and the
+    number of entries. Readers only open the segments that can contain entries
+    that match a query. The log is read as if it were a single file.
+
+    Readers take a shared lock on the log file while they read the manifest
+    and the active log file. Segments are opened when they are read. A
+    segment that was merged by compaction in the meantime is read from the
+    merged segment instead. Rotation appends the
+    manifest record before the active log file is truncated. The record
+    identifies the rotated content (size and digest of the first line) such
+    that content that was not truncated (e.g., after a crash) is skipped by
+    readers and removed by the next writer that rotates or compacts the log.
+    """
+    def __init__(self, filename, max_size=DEFAULT_SEGMENT_SIZE, max_age=None, index=None):
         """Initialize the log file.
 
         Parameters
         ----------
         filename: string
             Path to the log file
+        max_size: int, optional
+            Maximum size of the active log file in bytes
+        max_age: float, optional
+            Maximum age of the first entry in the active log file in seconds
+        index: prjrepo.provenance.ProvenanceIndex, optional
+            Index that is updated for each new log entry
         """
         self.filename = filename
+        self.max_size = max_size
+        self.max_age = max_age
+        self.index = index
+        self.segment_dir = os.path.join(os.path.dirname(filename), LOG_SEGMENT_DIR)
+        self.manifest_file = os.path.join(self.segment_dir, MANIFEST_FILE)
+        self.lock = threading.Lock()
+
+    def compact(self, max_size=DEFAULT_SEGMENT_SIZE):
+        """Merge consecutive segments into larger segments. Segments are
+        merged as long as the total size of the merged (compressed) segments
+        does not exceed max_size. Returns the number of segments after
+        compaction.
+
+        Parameters
+        ----------
+        max_size: int, optional
+            Maximum size of a merged segment in bytes
+
+        Returns
+        -------
+        int
+        """
+        with self.lock:
+            with open(self.filename, 'a') as f_lock:
+                fcntl.flock(f_lock, fcntl.LOCK_EX)
+                try:
+                    # Merged records do not identify rotated content. The
+                    # active log file therefore has to be truncated first.
+                    self.repair_locked()
+                    segments = self.segments()
+                    groups = list()
+                    size = 0
+                    for segment in segments:
+                        seg_size = os.path.getsize(
+                            os.path.join(self.segment_dir, segment['file'])
+                        )
+                        if len(groups) > 0 and size + seg_size <= max_size:
+                            groups[-1].append(segment)
+                            size += seg_size
+                        else:
+                            groups.append([segment])
+                            size = seg_size
+                    if len(groups) == len(segments):
+                        return len(segments)
+                    manifest = list()
+                    obsolete = list()
+                    for group in groups:
+                        if len(group) == 1:
+                            manifest.append(group[0])
+                            continue
+                        lines = list()
+                        for segment in group:
+                            filename = os.path.join(self.segment_dir, segment['file'])
+                            with gzip.open(filename, 'rb') as f:
+                                lines.append(f.read())
+                            obsolete.append(filename)
+                        record = merge_segment_records(group)
+                        record['file'] = self.next_segment_name()
+                        self.write_segment(record['file'], ''.join(lines))
+                        manifest.append(record)
+                    self.write_manifest(manifest)
+                    for filename in obsolete:
+                        os.remove(filename)
+                    return len(manifest)
+                finally:
+                    fcntl.flock(f_lock, fcntl.LOCK_UN)
+
+    def count(self):
+        """Get the total number of entries in the log.
+
+        Returns
+        -------
+        int
+        """
+        segments, data = self.snapshot()
+        return sum([s['entries'] for s in segments]) + len(data.splitlines())
+
+    def entries(self, command=None, since=None, until=None, start=0, stop=None, failed=False):
+        """Generator for all entries in the log in order of their creation.
+        Entries can be filtered by command name and time range. Segments that
+        cannot contain matching entries are not read. If start is given, the
+        first start entries of the log are skipped. If stop is given, entries
+        at or after position stop (e.g., entries that are added while the log
+        is read) are not returned. Positions include the entries of failed
+        runs, which are only returned if failed is True.
+
+        Parameters
+        ----------
+        command: string, optional
+            Only return entries for the command with given name
+        since: float, optional
+            Only return entries with timestamp greater or equal
+        until: float, optional
+            Only return entries with timestamp less or equal
+        start: int, optional
+            Number of entries at the beginning of the log that are skipped
+        stop: int, optional
+            Position of the first entry that is not returned
+        failed: bool, optional
+            Include entries for failed runs
+
+        Returns
+        -------
+        iterator(dict)
+        """
+        segments, data = self.snapshot()
+        skip = start
+        pos = 0
+        for segment in segments:
+            if not stop is None and pos >= stop:
+                return
+            if skip >= segment['entries']:
+                skip -= segment['entries']
+                pos += segment['entries']
+                continue
+            if not command is None and not command in segment['commands']:
+                pos += segment['entries']
+                skip = 0
+                continue
+            if not since is None and not segment['end'] is None and segment['end'] < since:
+                pos += segment['entries']
+                skip = 0
+                continue
+            if not until is None and not segment['start'] is None and segment['start'] > until:
+                pos += segment['entries']
+                skip = 0
+                continue
+            handle, offset = self.open_segment(segment, pos)
+            try:
+                with gzip.GzipFile(fileobj=handle, mode='rb') as f:
+                    remaining = segment['entries']
+                    for line in f:
+                        # Skip entries of a merged segment that precede the
+                        # segment of the snapshot
+                        if offset > 0:
+                            offset -= 1
+                            continue
+                        if remaining == 0:
+                            break
+                        remaining -= 1
+                        pos += 1
+                        if skip > 0:
+                            skip -= 1
+                            continue
+                        if not stop is None and pos > stop:
+                            return
+                        entry = json.loads(line)
+                        if match_entry(entry, command, since, until, failed):
+                            yield entry
+            finally:
+                handle.close()
+            skip = 0
+        for line in data.splitlines():
+            pos += 1
+            if skip > 0:
+                skip -= 1
+                continue
+            if not stop is None and pos > stop:
+                return
+            entry = json.loads(line)
+            if match_entry(entry, command, since, until, failed):
+                yield entry
+
+    def get_entry(self, run, failed=False):
+        """Get the log entry for a run. The run is either referenced by its
+        position in the log (starting at 1) or by a prefix of the run
+        identifier.
+
+        Raises ValueError if no or more than one matching entry exists.
+
+        Parameters
+        ----------
+        run: string
+            Run position or run identifier prefix
+        failed: bool, optional
+            Include failed runs
+
+        Returns
+        -------
+        dict
+        """
+        match = None
+        for pos, entry in enumerate(self.entries(failed=failed)):
+            if run.isdigit() and int(run) == pos + 1:
+                return entry
+            if entry.get('id', '').startswith(run):
+                if not match is None:
+                    raise ValueError('ambiguous run identifier \'' + run + '\'')
+                match = entry
+        if match is None:
+            raise ValueError('unknown run \'' + run + '\'')
+        return match
 
     def lines(self):
         """Get list of command lines in the log file.
@@ -22,19 +267,11 @@ class DefaultLogger(object):
         -------
         list(string)
         """
-        lines = list()
-        with open(self.filename, 'r') as f:
-            for line in f:
-                entry = json.loads(line)
-                cmd = []
-                cmd.append(entry['name'])
-                for comp in entry['components']:
-                    cmd.append(comp['value'])
-                lines.append(' '.join(cmd))
-        return lines
+        return [entry_line(entry) for entry in self.entries()]
 
-    def log(self, cmd, cmd_components):
-        """Add log entry for executed command.
+    def log(self, cmd, cmd_components, outputs=None, work_dir=None, arguments=None, start_time=None, end_time=None, returncode=0, rusage=None, series=None):
+        """Add log entry for executed command. Returns the unique identifier
+        of the new entry.
 
         Parameters
         ----------
@@ -42,9 +279,35 @@ class DefaultLogger(object):
             Specification of executed command
         cmd_components: list(string)
             Command line components
+        outputs: dict, optional
+            References to the captured outputs of the command in the project's
+            output store
+        work_dir: string, optional
+            Working directory of the run
+        arguments: dict, optional
+            Arguments that were used to render the command
+        start_time: float, optional
+            Time when the run was started
+        end_time: float, optional
+            Time when the run terminated
+        returncode: int, optional
+            Exit code of the run
+        rusage: dict, optional
+            Resource usage of the run (user and system CPU time in seconds
+            and maximum resident set size in kilobytes)
+        series: string, optional
+            Name of the resource usage time series of the run
+
+        Returns
+        -------
+        string
         """
         entry = dict()
+        entry['id'] = uuid.uuid4().hex
+        entry['timestamp'] = time.time()
         entry['name'] = cmd.name
+        if not work_dir is None:
+            entry['workDir'] = work_dir
         entry['components'] = []
         for i in range(len(cmd.components)):
             comp = dict()
@@ -57,5 +320,404 @@ class DefaultLogger(object):
                 else:
                     comp['io'] = 'DIR'
                 comp['input'] = str(c.as_input)
-        with open(self.filename, 'a') as f:
-            f.write(json.dumps(entry) + '\n')
+        if not outputs is None:
+            entry['outputs'] = outputs
+        if not arguments is None and len(arguments) > 0:
+            entry['arguments'] = arguments
+        if not start_time is None:
+            entry['startTime'] = start_time
+        if not end_time is None:
+            entry['endTime'] = end_time
+        entry['returncode'] = returncode
+        if not rusage is None:
+            entry['rusage'] = rusage
+        if not series is None:
+            entry['series'] = series
+        # Each entry is written with a single write call while holding the
+        # lock such that concurrent writers never interleave entries.
+        line = json.dumps(entry) + '\n'
+        with self.lock:
+            with open(self.filename, 'a') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.write(line)
+                    f.flush()
+                    if self.needs_rotation(f.tell(), entry['timestamp']):
+                        self.rotate_locked()
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+        if not self.index is None:
+            self.index.add_entry(entry)
+        return entry['id']
+
+    def needs_rotation(self, size, timestamp):
+        """Test whether the active log file needs to be rotated.
+
+        Parameters
+        ----------
+        size: int
+            Current size of the active log file
+        timestamp: float
+            Current time
+
+        Returns
+        -------
+        bool
+        """
+        if not self.max_size is None and size >= self.max_size:
+            return True
+        if not self.max_age is None:
+            with open(self.filename, 'r') as f:
+                line = f.readline()
+            if line != '':
+                start = json.loads(line).get('timestamp')
+                if not start is None and timestamp - start >= self.max_age:
+                    return True
+        return False
+
+    def next_segment_name(self):
+        """Get the file name for a new segment. Segment names contain a
+        sequence number that is larger than the number of any existing
+        segment.
+
+        Returns
+        -------
+        string
+        """
+        seq = 0
+        if os.path.isdir(self.segment_dir):
+            for name in os.listdir(self.segment_dir):
+                tokens = name.split('.')
+                if len(tokens) == 3 and tokens[1].isdigit():
+                    seq = max(seq, int(tokens[1]))
+        return os.path.basename(self.filename) + '.' + '%08d' % (seq + 1) + '.gz'
+
+    def open_segment(self, segment, pos):
+        """Open the file of a segment record. If the file was removed by
+        compaction, the merged segment that contains the entry at the given
+        log position (i.e., the first entry of the segment) is opened instead
+        while holding a shared lock on the log file. Returns the open file and
+        the number of entries in the file that precede the segment.
+
+        Raises IOError if no segment contains the given position.
+
+        Parameters
+        ----------
+        segment: dict
+            Segment record
+        pos: int
+            Log position of the first entry in the segment
+
+        Returns
+        -------
+        (file, int)
+        """
+        try:
+            return open(os.path.join(self.segment_dir, segment['file']), 'rb'), 0
+        except IOError as ex:
+            if ex.errno != errno.ENOENT:
+                raise
+        # Compaction preserves the order and number of entries. Segment files
+        # are not removed while the shared lock is held.
+        with open(self.filename, 'r') as f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            try:
+                offset = 0
+                for record in self.segments():
+                    if offset + record['entries'] > pos:
+                        filename = os.path.join(self.segment_dir, record['file'])
+                        return open(filename, 'rb'), pos - offset
+                    offset += record['entries']
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        raise IOError('missing log segment \'' + segment['file'] + '\'')
+
+    def repair_locked(self):
+        """Remove content from the active log file that was rotated into the
+        last segment but not truncated. Returns the remaining content of the
+        active log file. Expects the caller to hold the lock on the log file.
+
+        Returns
+        -------
+        string
+        """
+        with open(self.filename, 'r') as f:
+            data = f.read()
+        segments = self.segments()
+        if len(segments) > 0 and is_rotated(segments[-1], data):
+            data = data[segments[-1]['logSize']:]
+            with open(self.filename, 'w') as f:
+                f.write(data)
+        return data
+
+    def rotate(self):
+        """Turn the active log file into a compressed segment (if it is not
+        empty).
+        """
+        with self.lock:
+            with open(self.filename, 'a') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    self.rotate_locked()
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def rotate_locked(self):
+        """Turn the active log file into a compressed segment. Expects the
+        caller to hold the lock on the log file.
+        """
+        data = self.repair_locked()
+        if data == '':
+            return
+        lines = data.splitlines()
+        record = segment_record(lines)
+        if not os.path.isdir(self.segment_dir):
+            os.makedirs(self.segment_dir)
+        record['file'] = self.next_segment_name()
+        # Identify the rotated content in case the active log file is not
+        # truncated
+        record['logSize'] = len(data)
+        record['logHead'] = line_digest(lines[0])
+        self.write_segment(record['file'], data)
+        with open(self.manifest_file, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        with open(self.filename, 'w') as f:
+            pass
+
+    def segments(self):
+        """Get the list of segment records from the manifest in order of their
+        creation.
+
+        Returns
+        -------
+        list(dict)
+        """
+        segments = list()
+        if os.path.isfile(self.manifest_file):
+            with open(self.manifest_file, 'r') as f:
+                for line in f:
+                    if line.strip() != '':
+                        segments.append(json.loads(line))
+        return segments
+
+    def snapshot(self):
+        """Get a consistent view of the log while holding a shared lock on
+        the log file. Returns the list of segment records and the content of
+        the active log file without content that was already rotated.
+
+        Returns
+        -------
+        (list(dict), string)
+        """
+        with open(self.filename, 'r') as f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            try:
+                segments = self.segments()
+                data = f.read()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        if len(segments) > 0 and is_rotated(segments[-1], data):
+            data = data[segments[-1]['logSize']:]
+        return segments, data
+
+    def write_manifest(self, segments):
+        """Replace the manifest with the given list of segment records. The
+        new manifest is written to a temporary file first that then replaces
+        the existing manifest.
+
+        Parameters
+        ----------
+        segments: list(dict)
+            Segment records
+        """
+        tmp_file = self.manifest_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            for record in segments:
+                f.write(json.dumps(record) + '\n')
+        os.rename(tmp_file, self.manifest_file)
+
+    def write_segment(self, name, data):
+        """Write a compressed segment file. The file is written under a
+        temporary name first and renamed when complete.
+
+        Parameters
+        ----------
+        name: string
+            Segment file name
+        data: string
+            Log file content
+        """
+        filename = os.path.join(self.segment_dir, name)
+        with gzip.open(filename + '.tmp', 'wb') as f:
+            f.write(data)
+        os.rename(filename + '.tmp', filename)
+
+
+# ------------------------------------------------------------------------------
+# Helper Methods
+# ------------------------------------------------------------------------------
+
+def entry_line(entry):
+    """Get the command line representation of a log entry, i.e., the command
+    name followed by the values of all command components.
+
+    Parameters
+    ----------
+    entry: dict
+        Log entry
+
+    Returns
+    -------
+    string
+    """
+    cmd = []
+    cmd.append(entry['name'])
+    for comp in entry['components']:
+        cmd.append(comp['value'])
+    return ' '.join(cmd)
+
+
+def is_failed(entry):
+    """Test if a log entry is for a failed run. Entries without exit code are
+    for successful runs.
+
+    Parameters
+    ----------
+    entry: dict
+        Log entry
+
+    Returns
+    -------
+    bool
+    """
+    return entry.get('returncode', 0) != 0
+
+
+def is_rotated(segment, data):
+    """Test if the content of the active log file starts with the content
+    that was rotated into the given segment, i.e., the active log file was
+    not truncated after the rotation.
+
+    Parameters
+    ----------
+    segment: dict
+        Manifest record of the last segment
+    data: string
+        Content of the active log file
+
+    Returns
+    -------
+    bool
+    """
+    size = segment.get('logSize')
+    if size is None or len(data) < size:
+        return False
+    return line_digest(data[:data.find('\n')]) == segment['logHead']
+
+
+def line_digest(line):
+    """Get the digest that identifies a log line.
+
+    Parameters
+    ----------
+    line: string
+        Json log entry
+
+    Returns
+    -------
+    string
+    """
+    return hashlib.md5(line.rstrip('\n')).hexdigest()
+
+
+def match_entry(entry, command, since, until, failed=False):
+    """Test if a log entry satisfies the given filter conditions. Entries
+    without timestamp never satisfy a time range condition.
+
+    Parameters
+    ----------
+    entry: dict
+        Log entry
+    command: string
+        Command name or None
+    since: float
+        Lower bound for timestamp or None
+    until: float
+        Upper bound for timestamp or None
+    failed: bool, optional
+        Match entries for failed runs
+
+    Returns
+    -------
+    bool
+    """
+    if not failed and is_failed(entry):
+        return False
+    if not command is None and entry['name'] != command:
+        return False
+    if not since is None or not until is None:
+        ts = entry.get('timestamp')
+        if ts is None:
+            return False
+        if not since is None and ts < since:
+            return False
+        if not until is None and ts > until:
+            return False
+    return True
+
+
+def merge_segment_records(segments):
+    """Get the manifest record for a segment that results from merging the
+    given segments.
+
+    Parameters
+    ----------
+    segments: list(dict)
+        Manifest records of merged segments
+
+    Returns
+    -------
+    dict
+    """
+    starts = [s['start'] for s in segments if not s['start'] is None]
+    ends = [s['end'] for s in segments if not s['end'] is None]
+    commands = set()
+    for s in segments:
+        commands.update(s['commands'])
+    return {
+        'start': min(starts) if len(starts) > 0 else None,
+        'end': max(ends) if len(ends) > 0 else None,
+        'commands': sorted(commands),
+        'entries': sum([s['entries'] for s in segments])
+    }
+
+
+def segment_record(lines):
+    """Get the manifest record for a segment from the segment's log lines.
+
+    Parameters
+    ----------
+    lines: list(string)
+        Json log entries
+
+    Returns
+    -------
+    dict
+    """
+    start, end = None, None
+    commands = set()
+    for line in lines:
+        entry = json.loads(line)
+        commands.add(entry['name'])
+        ts = entry.get('timestamp')
+        if not ts is None:
+            start = ts if start is None else min(start, ts)
+            end = ts if end is None else max(end, ts)
+    return {
+        'start': start,
+        'end': end,
+        'commands': sorted(commands),
+        'entries': len(lines)
+    }
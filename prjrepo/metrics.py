@@ -0,0 +1,210 @@
+"""Run metrics for monitoring. Metrics are aggregated per command from the
+run history: the number of runs and failed runs, a histogram of run
+durations, and the total CPU time of all runs. Metrics are exported in the
+OpenMetrics text format (which Prometheus also accepts).
+
+Aggregates are maintained incrementally. The state file contains the
+aggregates together with the number of log entries that they include. Each
+export only reads the log entries that were added since the previous export.
+Entries that were written before start and end times were logged count as
+runs but are not included in the duration histogram.
+"""
+
+import json
+import os
+
+from prjrepo.log import is_failed
+
+
+# ------------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------------
+
+"""Upper bounds (in seconds) of the buckets in the run duration histogram."""
+DURATION_BUCKETS = [0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0]
+
+"""Prefix for all metric names."""
+METRIC_PREFIX = 'prm_'
+
+
+# ------------------------------------------------------------------------------
+# Metrics
+# ------------------------------------------------------------------------------
+
+class RunMetrics(object):
+    """Per-command aggregates of the run history of a project."""
+    def __init__(self, filename):
+        """Initialize the state file. The aggregates are read from the file if
+        it exists.
+
+        Parameters
+        ----------
+        filename: string
+            Path to the state file
+        """
+        self.filename = filename
+        self.offset = 0
+        self.commands = dict()
+        if os.path.isfile(filename):
+            with open(filename, 'r') as f:
+                state = json.load(f)
+            # Aggregates for a different bucket layout cannot be updated
+            if state.get('buckets') == DURATION_BUCKETS:
+                self.offset = state['offset']
+                self.commands = state['commands']
+
+    def add(self, entry):
+        """Add a log entry to the aggregates of its command.
+
+        Parameters
+        ----------
+        entry: dict
+            Log entry
+        """
+        stats = self.commands.get(entry['name'])
+        if stats is None:
+            stats = {
+                'runs': 0,
+                'failures': 0,
+                'buckets': [0] * len(DURATION_BUCKETS),
+                'durationCount': 0,
+                'durationSum': 0.0,
+                'cpuSeconds': 0.0
+            }
+            self.commands[entry['name']] = stats
+        stats['runs'] += 1
+        if is_failed(entry):
+            stats['failures'] += 1
+        start, end = entry.get('startTime'), entry.get('endTime')
+        if not start is None and not end is None:
+            duration = max(end - start, 0.0)
+            for i in range(len(DURATION_BUCKETS)):
+                if duration <= DURATION_BUCKETS[i]:
+                    stats['buckets'][i] += 1
+                    break
+            stats['durationCount'] += 1
+            stats['durationSum'] += duration
+        rusage = entry.get('rusage')
+        if not rusage is None:
+            stats['cpuSeconds'] += rusage['utime'] + rusage['stime']
+
+    def save(self):
+        """Write the aggregates to the state file. The file is written under a
+        temporary name first and then replaces the existing file.
+        """
+        tmp_file = self.filename + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(
+                {
+                    'offset': self.offset,
+                    'buckets': DURATION_BUCKETS,
+                    'commands': self.commands
+                },
+                f
+            )
+        os.rename(tmp_file, self.filename)
+
+    def update(self, logger):
+        """Add all log entries that were written since the last update.
+        Returns the number of added entries.
+
+        Parameters
+        ----------
+        logger: prjrepo.log.DefaultLogger
+            Run history
+
+        Returns
+        -------
+        int
+        """
+        count = 0
+        for entry in logger.entries(start=self.offset, failed=True):
+            self.add(entry)
+            count += 1
+        self.offset += count
+        return count
+
+    def write(self, out):
+        """Write all metrics in OpenMetrics text format.
+
+        Parameters
+        ----------
+        out: file
+            Output stream
+        """
+        names = sorted(self.commands.keys())
+        runs = METRIC_PREFIX + 'runs'
+        out.write('# TYPE ' + runs + ' counter\n')
+        out.write('# HELP ' + runs + ' Number of runs.\n')
+        for name in names:
+            write_sample(out, runs + '_total', name, self.commands[name]['runs'])
+        failures = METRIC_PREFIX + 'run_failures'
+        out.write('# TYPE ' + failures + ' counter\n')
+        out.write('# HELP ' + failures + ' Number of runs with non-zero exit code.\n')
+        for name in names:
+            write_sample(out, failures + '_total', name, self.commands[name]['failures'])
+        ratio = METRIC_PREFIX + 'run_failure_ratio'
+        out.write('# TYPE ' + ratio + ' gauge\n')
+        out.write('# HELP ' + ratio + ' Fraction of runs with non-zero exit code.\n')
+        for name in names:
+            stats = self.commands[name]
+            write_sample(out, ratio, name, float(stats['failures']) / stats['runs'])
+        duration = METRIC_PREFIX + 'run_duration_seconds'
+        out.write('# TYPE ' + duration + ' histogram\n')
+        out.write('# HELP ' + duration + ' Wall-clock time of runs.\n')
+        for name in names:
+            stats = self.commands[name]
+            count = 0
+            for bound, bucket in zip(DURATION_BUCKETS, stats['buckets']):
+                count += bucket
+                write_sample(out, duration + '_bucket', name, count, le=repr(bound))
+            write_sample(out, duration + '_bucket', name, stats['durationCount'], le='+Inf')
+            write_sample(out, duration + '_sum', name, stats['durationSum'])
+            write_sample(out, duration + '_count', name, stats['durationCount'])
+        cpu = METRIC_PREFIX + 'run_cpu_seconds'
+        out.write('# TYPE ' + cpu + ' counter\n')
+        out.write('# HELP ' + cpu + ' User and system CPU time of runs.\n')
+        for name in names:
+            write_sample(out, cpu + '_total', name, self.commands[name]['cpuSeconds'])
+        out.write('# EOF\n')
+
+
+# ------------------------------------------------------------------------------
+# Helper Methods
+# ------------------------------------------------------------------------------
+
+def escape_label(value):
+    """Escape a label value for the OpenMetrics text format.
+
+    Parameters
+    ----------
+    value: string
+        Label value
+
+    Returns
+    -------
+    string
+    """
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def write_sample(out, metric, command, value, le=None):
+    """Write a single sample for a command.
+
+    Parameters
+    ----------
+    out: file
+        Output stream
+    metric: string
+        Metric name
+    command: string
+        Command name
+    value: int or float
+        Sample value
+    le: string, optional
+        Upper bound label for histogram buckets
+    """
+    labels = 'command="' + escape_label(command) + '"'
+    if not le is None:
+        labels += ',le="' + le + '"'
+    out.write(metric + '{' + labels + '} ' + repr(value) + '\n')
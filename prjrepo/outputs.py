@@ -0,0 +1,224 @@
+"""Content-addressed store for captured command outputs."""
+
+import bz2
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+
+# ------------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------------
+
+"""Names of the files in the output store directory."""
+INDEX_FILE = 'INDEX'
+PACK_FILE = 'PACK'
+
+"""Compression codecs. Outputs are stored uncompressed if compression does not
+reduce their size.
+"""
+CODEC_RAW = 0
+CODEC_ZLIB = 1
+CODEC_BZ2 = 2
+CODECS = {
+    'raw': CODEC_RAW,
+    'zlib': CODEC_ZLIB,
+    'bz2': CODEC_BZ2
+}
+
+"""Fixed-size index record: SHA-1 digest, offset and length of the stored
+object in the pack file, and the codec identifier.
+"""
+INDEX_RECORD = struct.Struct('<20sQIB')
+
+
+# ------------------------------------------------------------------------------
+# Output Store
+# ------------------------------------------------------------------------------
+
+class OutputStore(object):
+    """Store for captured command outputs (STDOUT, STDERR and output files).
+    Outputs are deduplicated by the SHA-1 hash of their content. Each distinct
+    output is compressed and appended to a single pack file. A binary index
+    file maps hashes to the position of the output in the pack file.
+
+    Reads use a memory map of the pack file such that retrieving an output only
+    decompresses the requested object.
+    """
+    def __init__(self, base_dir, codec='zlib'):
+        """Initialize the store directory and the compression codec for new
+        outputs. The directory is created if it does not exist.
+
+        Raises ValueError if the codec is unknown.
+
+        Parameters
+        ----------
+        base_dir: string
+            Path to the store directory
+        codec: string, optional
+            Name of the codec that is used to compress new outputs
+        """
+        if not codec in CODECS:
+            raise ValueError('unknown codec \'' + codec + '\'')
+        if not os.path.isdir(base_dir):
+            os.makedirs(base_dir)
+        self.base_dir = base_dir
+        self.codec = CODECS[codec]
+        self.index_file = os.path.join(base_dir, INDEX_FILE)
+        self.pack_file = os.path.join(base_dir, PACK_FILE)
+        # The lock is reentrant since index updates refresh the index while
+        # holding it
+        self.lock = threading.RLock()
+        self._index = None
+        self._index_size = 0
+        self._map = None
+
+    def __contains__(self, key):
+        """Test if an output with the given hash exists.
+
+        Parameters
+        ----------
+        key: string
+            Hexadecimal SHA-1 hash of the output
+
+        Returns
+        -------
+        bool
+        """
+        return self.find(key) is not None
+
+    def close(self):
+        """Release the memory map of the pack file."""
+        if not self._map is None:
+            self._map.close()
+            self._map = None
+
+    def find(self, key):
+        """Get the index record for the output with given hash. Returns None
+        if no such output exists.
+
+        Parameters
+        ----------
+        key: string
+            Hexadecimal SHA-1 hash of the output
+
+        Returns
+        -------
+        (int, int, int)
+        """
+        try:
+            digest = key.decode('hex')
+        except (TypeError, ValueError):
+            return None
+        self.refresh()
+        return self._index.get(digest)
+
+    def get(self, key):
+        """Get the output with the given hash.
+
+        Raises ValueError if no output with the given hash exists.
+
+        Parameters
+        ----------
+        key: string
+            Hexadecimal SHA-1 hash of the output
+
+        Returns
+        -------
+        string
+        """
+        record = self.find(key)
+        if record is None:
+            raise ValueError('unknown output \'' + key + '\'')
+        offset, length, codec = record
+        if length == 0:
+            return ''
+        with self.lock:
+            if self._map is None or len(self._map) < offset + length:
+                self.close()
+                with open(self.pack_file, 'rb') as f:
+                    self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            data = self._map[offset:offset + length]
+        if codec == CODEC_ZLIB:
+            return zlib.decompress(data)
+        elif codec == CODEC_BZ2:
+            return bz2.decompress(data)
+        return data
+
+    def put(self, data):
+        """Add an output to the store. Returns the hash of the output. The
+        output is only written if it does not exist in the store.
+
+        Parameters
+        ----------
+        data: string
+            Output content
+
+        Returns
+        -------
+        string
+        """
+        sha = hashlib.sha1(data)
+        digest = sha.digest()
+        self.refresh()
+        if digest in self._index:
+            return sha.hexdigest()
+        if self.codec == CODEC_ZLIB:
+            stored, codec = zlib.compress(data), CODEC_ZLIB
+        elif self.codec == CODEC_BZ2:
+            stored, codec = bz2.compress(data), CODEC_BZ2
+        else:
+            stored, codec = data, CODEC_RAW
+        if len(stored) >= len(data):
+            stored, codec = data, CODEC_RAW
+        with self.lock:
+            # Lock the index file to serialize writers from different
+            # processes. The pack file is written before the index such that
+            # readers never see index records for incomplete objects.
+            with open(self.index_file, 'ab') as f_index:
+                fcntl.flock(f_index, fcntl.LOCK_EX)
+                try:
+                    self.refresh()
+                    if not digest in self._index:
+                        with open(self.pack_file, 'ab') as f_pack:
+                            f_pack.seek(0, os.SEEK_END)
+                            offset = f_pack.tell()
+                            f_pack.write(stored)
+                        f_index.write(
+                            INDEX_RECORD.pack(digest, offset, len(stored), codec)
+                        )
+                        f_index.flush()
+                        self._index[digest] = (offset, len(stored), codec)
+                        # All records up to the end of the file have been read
+                        # while holding the file lock
+                        self._index_size = f_index.tell()
+                finally:
+                    fcntl.flock(f_index, fcntl.LOCK_UN)
+        return sha.hexdigest()
+
+    def refresh(self):
+        """Read index records that have been added to the index file since it
+        was last read.
+        """
+        with self.lock:
+            if self._index is None:
+                self._index = dict()
+                self._index_size = 0
+            if not os.path.isfile(self.index_file):
+                return
+            size = os.path.getsize(self.index_file)
+            # Ignore incomplete trailing records
+            size -= size % INDEX_RECORD.size
+            if size <= self._index_size:
+                return
+            with open(self.index_file, 'rb') as f:
+                f.seek(self._index_size)
+                buf = f.read(size - self._index_size)
+            for pos in range(0, len(buf), INDEX_RECORD.size):
+                digest, offset, length, codec = INDEX_RECORD.unpack_from(buf, pos)
+                self._index[digest] = (offset, length, codec)
+            self._index_size = size
@@ -0,0 +1,289 @@
+"""Embeddable API for a project repository. The command line tool creates new
+context managers, settings and command specifications for each call and reads
+all files again. A long-running process that resolves commands for many
+working directories uses a single Project object instead. The project keeps
+shared caches for the context listing, parsed settings files and command
+specifications that can be used from multiple threads.
+
+For projects that use the settings store, the listing and the settings of
+all contexts are cached as a whole and validated against the database file.
+
+Cached objects are validated against the modification time, size and inode of
+their file on each access, i.e., changes that are made by other processes are
+picked up without restarting. Cached settings and commands are shared between
+threads and must not be modified by the caller.
+
+The settings store is opened once and shared by all context managers of the
+project. It is closed by Project.close.
+"""
+
+import os
+import threading
+
+from prjrepo.config.context import Config, ContextManager, SettingsChain
+from prjrepo.config.context import read_contexts, read_settings
+from prjrepo.workflow.engine import render_components
+from prjrepo.workflow.repository import DefaultCommandRepository
+
+
+# ------------------------------------------------------------------------------
+# Caches
+# ------------------------------------------------------------------------------
+
+class FileCache(object):
+    """Thread-safe cache for objects that are read from files. An entry is
+    valid as long as the file's modification time, size and inode do not
+    change. Files are read outside of the cache lock. Concurrent misses for
+    the same file may read the file more than once.
+    """
+    def __init__(self, read):
+        """Initialize the function that reads an object from file.
+
+        Parameters
+        ----------
+        read: function
+            Function that takes a file name and returns the object
+        """
+        self.read = read
+        self.entries = dict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        """Remove all entries from the cache."""
+        with self.lock:
+            self.entries = dict()
+
+    def get(self, filename):
+        """Get the object for the given file. The file is read if it is not
+        in the cache or if it changed since it was read.
+
+        Parameters
+        ----------
+        filename: string
+            Path to the file
+
+        Returns
+        -------
+        any
+        """
+        try:
+            stat = os.stat(filename)
+            version = (stat.st_mtime, stat.st_size, stat.st_ino)
+        except OSError:
+            version = None
+        with self.lock:
+            entry = self.entries.get(filename)
+            if not entry is None and entry[0] == version:
+                self.hits += 1
+                return entry[1]
+        value = self.read(filename)
+        with self.lock:
+            self.entries[filename] = (version, value)
+            self.misses += 1
+        return value
+
+
+# ------------------------------------------------------------------------------
+# Project
+# ------------------------------------------------------------------------------
+
+class Project(object):
+    """Facade for a project repository that is safe to use from multiple
+    threads. Context managers, the context listing, settings files and command
+    specifications are cached and shared by all threads.
+    """
+    def __init__(self, base_dir):
+        """Initialize the project that contains the given directory.
+
+        Raises ValueError if the directory is not in a project repository.
+
+        Parameters
+        ----------
+        base_dir: string
+            Any directory in the project
+        """
+        root = ContextManager(base_dir)
+        self.project_dir = root.project_dir
+        self.base_dir = os.path.dirname(self.project_dir)
+        self.cmd_dir = root.cmd_dir
+        self.contextls_file = root.contextls_file
+        self.settings_file = root.settings_file
+        self.store = root.store
+        self.repository = DefaultCommandRepository(self.cmd_dir)
+        self.contexts = dict()
+        self.lock = threading.Lock()
+        if not self.store is None:
+            self.listing_cache = FileCache(lambda filename: self.store.contexts())
+            self.settings_cache = FileCache(lambda filename: self.store.read_all())
+        else:
+            self.listing_cache = FileCache(read_contexts)
+            self.settings_cache = FileCache(read_settings)
+        self.command_cache = FileCache(self.read_command)
+
+    def close(self):
+        """Close the settings store of the project (if any). The store is
+        shared by all context managers of the project.
+        """
+        if not self.store is None:
+            self.store.close()
+
+    def context(self, work_dir):
+        """Get the context manager for a working directory in the project.
+
+        Raises ValueError if the directory is not in the project.
+
+        Parameters
+        ----------
+        work_dir: string
+            Working directory
+
+        Returns
+        -------
+        prjrepo.config.context.ContextManager
+        """
+        abs_dir = os.path.abspath(work_dir)
+        with self.lock:
+            context = self.contexts.get(abs_dir)
+        if context is None:
+            context = ContextManager(abs_dir, store=self.store)
+            if context.project_dir != self.project_dir:
+                raise ValueError('not in project \'' + work_dir + '\'')
+            with self.lock:
+                self.contexts[abs_dir] = context
+        return context
+
+    def context_settings(self, work_dir):
+        """Get the settings for a working directory in the project. All
+        settings files along the context path are taken from the cache.
+
+        Parameters
+        ----------
+        work_dir: string
+            Working directory
+
+        Returns
+        -------
+        prjrepo.config.context.Config
+        """
+        context = self.context(work_dir)
+        if not self.store is None:
+            files = context.get_context_files(
+                contexts=self.listing_cache.get(self.store.filename)
+            )
+            stored = self.settings_cache.get(self.store.filename)
+            layers = SettingsChain(
+                [stored.get(f[0], dict()) for f in reversed(files)]
+            )
+            return Config(files, False, layers=layers, store=self.store)
+        files = context.get_context_files(
+            contexts=self.listing_cache.get(self.contextls_file)
+        )
+        layers = SettingsChain(
+            [self.settings_cache.get(f[1]) for f in reversed(files)]
+        )
+        return Config(files, False, layers=layers)
+
+    def get_command(self, name):
+        """Get the specification of the command with the given name.
+
+        Raises ValueError if no command with given name exists.
+
+        Parameters
+        ----------
+        name: string
+            Command name
+
+        Returns
+        -------
+        prjrepo.workflow.command.Command
+        """
+        return self.command_cache.get(
+            os.path.join(
+                self.cmd_dir,
+                name + DefaultCommandRepository.COMMAND_SPEC_SUFFIX
+            )
+        )
+
+    def invalidate(self):
+        """Clear all caches. Changes to files are detected automatically.
+        Invalidation is only needed if files are modified more than once
+        within the resolution of the file system's modification time without
+        changing their size.
+        """
+        with self.lock:
+            self.contexts = dict()
+        self.listing_cache.clear()
+        self.settings_cache.clear()
+        self.command_cache.clear()
+
+    def list_commands(self):
+        """Get the names of all commands in the project.
+
+        Returns
+        -------
+        list(string)
+        """
+        return self.repository.list_commands()
+
+    def project_settings(self):
+        """Get the project settings.
+
+        Returns
+        -------
+        prjrepo.config.context.Config
+        """
+        if not self.store is None:
+            stored = self.settings_cache.get(self.store.filename)
+            layers = SettingsChain([stored.get('', dict())])
+            return Config([('', self.store.filename)], True, layers=layers, store=self.store)
+        layers = SettingsChain([self.settings_cache.get(self.settings_file)])
+        return Config([('', self.settings_file)], True, layers=layers)
+
+    def read_command(self, filename):
+        """Read the specification of a command from file.
+
+        Raises ValueError if the file does not exist.
+
+        Parameters
+        ----------
+        filename: string
+            Path to the command specification
+
+        Returns
+        -------
+        prjrepo.workflow.command.Command
+        """
+        name = os.path.basename(filename)
+        name = name[:-len(DefaultCommandRepository.COMMAND_SPEC_SUFFIX)]
+        return self.repository.get_command(name)
+
+    def render_command(self, work_dir, cmd_name, default_values):
+        """Generate the command line components for a command in the context
+        of the given working directory. Has the same semantics as the
+        render_command method of the workflow engine but uses the cached
+        settings and command specifications.
+
+        Raises ValueError if the command is unknown or if a referenced variable
+        or input file does not exist.
+
+        Parameters
+        ----------
+        work_dir: string
+            Working directory
+        cmd_name: string
+            Command name
+        default_values: dict
+            Arguments that are used as default values for variables that are
+            not set in the context
+
+        Returns
+        -------
+        (prjrepo.workflow.command.Command, prjrepo.config.context.Config, list(string))
+        """
+        context = self.context(work_dir)
+        cmd = self.get_command(cmd_name)
+        settings = self.context_settings(work_dir)
+        cmd_components = render_components(context, cmd, settings, default_values)
+        return cmd, settings, cmd_components
@@ -0,0 +1,241 @@
+"""Provenance index that maps files to the runs that consumed or produced
+them (and vice versa).
+"""
+
+import os
+import sqlite3
+import threading
+
+import prjrepo.log as log
+
+
+# ------------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------------
+
+"""Database schema for the provenance index."""
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS runs(id TEXT PRIMARY KEY, name TEXT, timestamp REAL, line TEXT)',
+    'CREATE TABLE IF NOT EXISTS files(path TEXT, run_id TEXT, input INTEGER, UNIQUE(path, run_id, input))',
+    'CREATE INDEX IF NOT EXISTS files_path ON files(path)',
+    'CREATE INDEX IF NOT EXISTS files_run ON files(run_id)',
+    'CREATE TABLE IF NOT EXISTS entries(id TEXT PRIMARY KEY)',
+    'CREATE TABLE IF NOT EXISTS state(key TEXT PRIMARY KEY, value INTEGER)'
+]
+
+"""Key in the state table for the log position up to which all entries have
+been checked by sync.
+"""
+STATE_SYNCED = 'synced'
+
+
+# ------------------------------------------------------------------------------
+# Provenance Index
+# ------------------------------------------------------------------------------
+
+class ProvenanceIndex(object):
+    """Index of the files (FILE and DIR components) that are used as input or
+    output by logged runs. Files are identified by their absolute path. The
+    index is maintained incrementally when log entries are added and is stored
+    in a SQLite database.
+
+    The identifiers of all indexed log entries (including failed runs) are
+    recorded such that sync only adds entries that are missing, independently
+    of whether they were logged before or after the index was created. Log
+    entries without identifier (written by earlier versions) are indexed
+    under their position in the log.
+    """
+    def __init__(self, filename, base_dir=None):
+        """Initialize the database file. The base directory is used to
+        resolve relative paths in log entries that do not contain the working
+        directory of the run.
+
+        Parameters
+        ----------
+        filename: string
+            Path to the database file
+        base_dir: string, optional
+            Default working directory for log entries
+        """
+        self.filename = filename
+        self.base_dir = base_dir if not base_dir is None else os.path.dirname(
+            os.path.dirname(os.path.abspath(filename))
+        )
+        self.lock = threading.Lock()
+        self.con = sqlite3.connect(filename, timeout=60, check_same_thread=False)
+        with self.lock:
+            for stmt in SCHEMA:
+                self.con.execute(stmt)
+            self.con.commit()
+
+    def add_entry(self, entry):
+        """Add the files of a log entry to the index.
+
+        Parameters
+        ----------
+        entry: dict
+            Log entry
+        """
+        with self.lock:
+            self.insert_entry(entry)
+            self.con.commit()
+
+    def close(self):
+        """Close the database connection."""
+        self.con.close()
+
+    def files(self, run_id):
+        """Get the input and output files of a run. The run is referenced by
+        its identifier (or an unambiguous prefix) or by its position in the
+        log if the log entry has no identifier.
+
+        Returns a pair of lists of absolute paths for inputs and outputs.
+
+        Parameters
+        ----------
+        run_id: string
+            Run identifier or prefix
+
+        Returns
+        -------
+        (list(string), list(string))
+        """
+        inputs, outputs = list(), list()
+        with self.lock:
+            rows = list()
+            if run_id.isdigit():
+                rows = self.con.execute(
+                    'SELECT path, input FROM files WHERE run_id = ? ORDER BY path',
+                    (run_id,)
+                ).fetchall()
+            if len(rows) == 0:
+                rows = self.con.execute(
+                    'SELECT path, input FROM files WHERE run_id LIKE ? ORDER BY path',
+                    (run_id + '%',)
+                ).fetchall()
+        for path, is_input in rows:
+            if is_input:
+                inputs.append(path)
+            else:
+                outputs.append(path)
+        return inputs, outputs
+
+    def insert_entry(self, entry, run_id=None):
+        """Insert a log entry without committing. Files of failed runs are
+        not indexed. Expects the caller to hold the lock.
+
+        Raises ValueError if the entry has no identifier and no run
+        identifier is given.
+
+        Parameters
+        ----------
+        entry: dict
+            Log entry
+        run_id: string, optional
+            Identifier for the run (defaults to the identifier of the entry)
+        """
+        if run_id is None:
+            if not 'id' in entry:
+                raise ValueError('missing run identifier')
+            run_id = entry['id']
+        self.con.execute('INSERT OR IGNORE INTO entries(id) VALUES(?)', (run_id,))
+        if log.is_failed(entry):
+            return
+        self.con.execute(
+            'INSERT OR REPLACE INTO runs(id, name, timestamp, line) VALUES(?, ?, ?, ?)',
+            (run_id, entry['name'], entry.get('timestamp'), log.entry_line(entry))
+        )
+        work_dir = entry.get('workDir', self.base_dir)
+        for comp in entry['components']:
+            if not 'io' in comp:
+                continue
+            path = os.path.normpath(os.path.join(work_dir, comp['value']))
+            self.con.execute(
+                'INSERT OR IGNORE INTO files(path, run_id, input) VALUES(?, ?, ?)',
+                (path, run_id, 1 if comp.get('input') == 'True' else 0)
+            )
+
+    def runs(self, path):
+        """Get the runs that consumed or produced the file with the given
+        path. Returns a list of tuples (run identifier, input flag, command
+        name, timestamp, command line) ordered by timestamp.
+
+        Parameters
+        ----------
+        path: string
+            Path to file or directory (relative to the current directory)
+
+        Returns
+        -------
+        list((string, bool, string, float, string))
+        """
+        with self.lock:
+            rows = self.con.execute(
+                'SELECT r.id, f.input, r.name, r.timestamp, r.line '
+                'FROM files f JOIN runs r ON f.run_id = r.id '
+                'WHERE f.path = ? ORDER BY r.timestamp',
+                (os.path.abspath(path),)
+            ).fetchall()
+        return [(r[0], r[1] == 1, r[2], r[3], r[4]) for r in rows]
+
+    def is_indexed(self, run_id):
+        """Test if the log entry with the given identifier has been indexed.
+        Expects the caller to hold the lock.
+
+        Parameters
+        ----------
+        run_id: string
+            Run identifier
+
+        Returns
+        -------
+        bool
+        """
+        for table in ['entries', 'runs']:
+            row = self.con.execute(
+                'SELECT 1 FROM ' + table + ' WHERE id = ?',
+                (run_id,)
+            ).fetchone()
+            if not row is None:
+                return True
+        return False
+
+    def sync(self, logger):
+        """Index all log entries that have not been indexed yet (e.g., entries
+        that were written before the index existed). Returns the number of
+        newly indexed entries. Entries before the log position that was
+        reached by the previous sync are not read again.
+
+        Parameters
+        ----------
+        logger: prjrepo.log.DefaultLogger
+            Logger for the indexed log
+
+        Returns
+        -------
+        int
+        """
+        with self.lock:
+            row = self.con.execute(
+                'SELECT value FROM state WHERE key = ?',
+                (STATE_SYNCED,)
+            ).fetchone()
+        synced = row[0] if not row is None else 0
+        pos = synced
+        count = 0
+        with self.lock:
+            for entry in logger.entries(start=synced, failed=True):
+                pos += 1
+                # Entries without identifier are indexed under their position
+                # in the log (starting at 1)
+                run_id = entry.get('id', str(pos))
+                if not self.is_indexed(run_id):
+                    self.insert_entry(entry, run_id=run_id)
+                    count += 1
+            if pos > synced:
+                self.con.execute(
+                    'INSERT OR REPLACE INTO state(key, value) VALUES(?, ?)',
+                    (STATE_SYNCED, pos)
+                )
+                self.con.commit()
+        return count
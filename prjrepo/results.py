@@ -0,0 +1,660 @@
+"""Columnar store for VALUE outputs of commands. Values are parsed once when a
+run completes and appended to a typed column in NumPy's .npy format. The
+arguments and the working directory of each run are stored in
+dictionary-encoded columns (int32 codes into a list of distinct values). All
+columns of a command are in a separate directory and have one entry per run,
+such that a whole sweep can be loaded as arrays (memory-mapped if NumPy is
+available) without parsing any text.
+
+The .npy headers are written directly (format version 1.0 with a fixed header
+size) so that NumPy is only needed for loading results as NumPy arrays.
+"""
+
+import fcntl
+import json
+import os
+import re
+import shutil
+import struct
+import sys
+import urllib
+
+from prjrepo.workflow.command import OUTPUT_LOCATION_STDOUT
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# ------------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------------
+
+"""Npy format version 1.0 magic string and total header size. The header is
+padded to a fixed size such that it can be updated in place when values are
+appended.
+"""
+NPY_MAGIC = '\x93NUMPY\x01\x00'
+NPY_HEADER_SIZE = 128
+
+"""Npy type descriptors and struct format characters for value data types."""
+DTYPES = {
+    'float32': ('<f4', 'f'),
+    'float64': ('<f8', 'd'),
+    'int32': ('<i4', 'i'),
+    'int64': ('<i8', 'q')
+}
+
+"""Data type for dictionary codes of argument columns."""
+CODE_DTYPE = 'int32'
+
+"""File names for columns of a result table."""
+ARG_PREFIX = 'arg.'
+DICT_SUFFIX = '.dict'
+LOCK_FILE = 'LOCK'
+NPY_SUFFIX = '.npy'
+VALUE_COLUMN = 'value'
+WORK_DIR_COLUMN = 'workdir'
+
+
+# ------------------------------------------------------------------------------
+# Columns
+# ------------------------------------------------------------------------------
+
+class NpyColumn(object):
+    """One-dimensional array in .npy format that values are appended to. The
+    shape in the header is updated after each append.
+    """
+    def __init__(self, filename, dtype):
+        """Open the column file. The file is created if it does not exist.
+
+        Parameters
+        ----------
+        filename: string
+            Path to the .npy file
+        dtype: string
+            Data type of the column
+        """
+        self.filename = filename
+        self.dtype = dtype
+        self.fmt = '<' + DTYPES[dtype][1]
+        self.itemsize = struct.calcsize(self.fmt)
+        if not os.path.isfile(filename):
+            with open(filename, 'wb') as f:
+                f.write(npy_header(dtype, 0))
+        self.f = open(filename, 'r+b')
+
+    def __len__(self):
+        """Number of values in the column (as recorded in the header).
+
+        Returns
+        -------
+        int
+        """
+        self.f.seek(0)
+        return read_npy_header(self.f.read(NPY_HEADER_SIZE))[1]
+
+    def append(self, values, start=None):
+        """Append a list of values to the column. If start is given, the
+        values are written at the given position and all values after them are
+        dropped (e.g., values of an incomplete row that was written by an
+        interrupted process).
+
+        Parameters
+        ----------
+        values: list
+            Values of the column data type
+        start: int, optional
+            Position of the first value
+        """
+        count = len(self) if start is None else start
+        self.f.seek(NPY_HEADER_SIZE + count * self.itemsize)
+        self.f.write(struct.pack('<' + str(len(values)) + self.fmt[1:], *values))
+        self.f.seek(0)
+        self.f.write(npy_header(self.dtype, count + len(values)))
+        self.f.flush()
+
+    def close(self):
+        """Close the column file."""
+        self.f.close()
+
+    def read(self, count):
+        """Read the first count values of the column.
+
+        Parameters
+        ----------
+        count: int
+            Number of values
+
+        Returns
+        -------
+        list
+        """
+        self.f.seek(NPY_HEADER_SIZE)
+        fmt = '<' + str(count) + self.fmt[1:]
+        return list(struct.unpack(fmt, self.f.read(struct.calcsize(fmt))))
+
+    def replace(self, values):
+        """Replace all values in the column.
+
+        Parameters
+        ----------
+        values: list
+            Values of the column data type
+        """
+        self.append(values, start=0)
+        self.f.truncate(NPY_HEADER_SIZE + len(values) * self.itemsize)
+        self.f.flush()
+
+
+class ResultTable(object):
+    """Result columns for a single command. The table consists of the value
+    column, one dictionary-encoded column for each argument and a
+    dictionary-encoded column with the working directory of each run.
+    Arguments that are not set for a run are stored as empty strings. Rows
+    that were added before working directories were recorded have no working
+    directory (None).
+
+    Writers hold an exclusive lock on the table while appending such that
+    multiple processes can collect results for the same command.
+    """
+    def __init__(self, directory, dtype='float64'):
+        """Initialize the table directory. The directory is created if it does
+        not exist. The data type of an existing value column takes precedence
+        over the given data type.
+
+        Parameters
+        ----------
+        directory: string
+            Path to the table directory
+        dtype: string, optional
+            Data type of the value column
+        """
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        filename = os.path.join(directory, VALUE_COLUMN + NPY_SUFFIX)
+        if os.path.isfile(filename):
+            with open(filename, 'rb') as f:
+                descr, count = read_npy_header(f.read(NPY_HEADER_SIZE))
+            for key, (d, c) in DTYPES.items():
+                if d == descr:
+                    dtype = key
+        self.dtype = dtype
+        self.work_dir_file = os.path.join(directory, WORK_DIR_COLUMN + NPY_SUFFIX)
+        self.values = None
+        self.arguments = dict()
+        self.work_dirs = None
+        # Dictionaries of the encoded columns keyed by column file
+        self.dictionaries = dict()
+        # Number of rows when the table was last opened or written
+        self.rows = 0
+
+    def add(self, arguments, value, work_dir=None):
+        """Append the result of a run.
+
+        Parameters
+        ----------
+        arguments: dict
+            Arguments of the run
+        value: int or float
+            Output value
+        work_dir: string, optional
+            Working directory of the run
+        """
+        with open(os.path.join(self.directory, LOCK_FILE), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self.open()
+            count = len(self.values)
+            for name in arguments:
+                if not name in self.arguments:
+                    self.arguments[name] = self.add_column(self.column_file(name), count, '')
+            if self.work_dirs is None:
+                self.work_dirs = self.add_column(self.work_dir_file, count, None)
+            for name, column in self.arguments.items():
+                code = self.encode(column.filename, arguments.get(name, ''))
+                column.append([code], start=count)
+            code = self.encode(self.work_dir_file, work_dir)
+            self.work_dirs.append([code], start=count)
+            # The value column is written last. Its length is the number of
+            # complete rows in the table.
+            self.values.append([value], start=count)
+            self.rows = count + 1
+
+    def add_column(self, filename, count, missing):
+        """Add a new dictionary-encoded column. Existing rows get the given
+        value.
+
+        Parameters
+        ----------
+        filename: string
+            Path to the column file
+        count: int
+            Number of existing rows
+        missing: string
+            Value for existing rows (None if unknown)
+
+        Returns
+        -------
+        prjrepo.results.NpyColumn
+        """
+        column = NpyColumn(filename, CODE_DTYPE)
+        self.dictionaries[filename] = (dict(), list())
+        missing_rows = count - len(column)
+        if missing_rows > 0:
+            code = self.encode(filename, missing)
+            column.append([code] * missing_rows)
+        return column
+
+    def close(self):
+        """Close all column files."""
+        if not self.values is None:
+            self.values.close()
+            for column in self.arguments.values():
+                column.close()
+            if not self.work_dirs is None:
+                self.work_dirs.close()
+        self.values = None
+        self.arguments = dict()
+        self.work_dirs = None
+        self.dictionaries = dict()
+
+    def column_file(self, name):
+        """Path to the file for the argument column with the given name.
+
+        Parameters
+        ----------
+        name: string
+            Argument name
+
+        Returns
+        -------
+        string
+        """
+        return os.path.join(
+            self.directory,
+            ARG_PREFIX + urllib.quote(name, safe='') + NPY_SUFFIX
+        )
+
+    def columns(self):
+        """Load all columns. Returns a list of (name, values) pairs. The value
+        column is first, followed by the argument columns in alphabetical
+        order. Argument columns are named with the argument prefix (e.g.,
+        arg.value) such that they cannot collide with the value column.
+        Values are NumPy arrays if NumPy is available (the value column is
+        memory-mapped) and lists otherwise.
+
+        Returns
+        -------
+        list((string, array))
+        """
+        filename = os.path.join(self.directory, VALUE_COLUMN + NPY_SUFFIX)
+        if not os.path.isfile(filename):
+            return list()
+        values = read_npy(filename)
+        count = len(values)
+        result = [(VALUE_COLUMN, values)]
+        for name in sorted(self.list_arguments()):
+            codes = read_npy(self.column_file(name))[:count]
+            dictionary = read_dictionary(self.column_file(name)[:-len(NPY_SUFFIX)] + DICT_SUFFIX)
+            if not np is None:
+                values = np.array(dictionary, dtype=object)[codes]
+            else:
+                values = [dictionary[c] for c in codes]
+            result.append((ARG_PREFIX + name, values))
+        return result
+
+    def encode(self, filename, value):
+        """Get the dictionary code for a value of an encoded column. New
+        values are appended to the dictionary file.
+
+        Parameters
+        ----------
+        filename: string
+            Path to the column file
+        value: string
+            Column value
+
+        Returns
+        -------
+        int
+        """
+        codes, values = self.dictionaries[filename]
+        if not value in codes:
+            with open(filename[:-len(NPY_SUFFIX)] + DICT_SUFFIX, 'a') as f:
+                f.write(json.dumps(value) + '\n')
+            codes[value] = len(values)
+            values.append(value)
+        return codes[value]
+
+    def list_arguments(self):
+        """Get the names of all argument columns.
+
+        Returns
+        -------
+        list(string)
+        """
+        names = list()
+        for filename in os.listdir(self.directory):
+            if filename.startswith(ARG_PREFIX) and filename.endswith(NPY_SUFFIX):
+                names.append(urllib.unquote(filename[len(ARG_PREFIX):-len(NPY_SUFFIX)]))
+        return names
+
+    def open(self):
+        """Open the table columns. Columns and dictionaries are re-read if
+        another process appended to the table since it was last opened.
+        """
+        if not self.values is None:
+            count = len(self.values)
+            if count == self.rows and len(self.list_arguments()) == len(self.arguments):
+                if not self.work_dirs is None or not os.path.isfile(self.work_dir_file):
+                    return
+            self.close()
+        self.values = NpyColumn(
+            os.path.join(self.directory, VALUE_COLUMN + NPY_SUFFIX),
+            self.dtype
+        )
+        for name in self.list_arguments():
+            self.arguments[name] = self.open_column(self.column_file(name))
+        if os.path.isfile(self.work_dir_file):
+            self.work_dirs = self.open_column(self.work_dir_file)
+        self.rows = len(self.values)
+
+    def open_column(self, filename):
+        """Open an existing dictionary-encoded column and read its
+        dictionary.
+
+        Parameters
+        ----------
+        filename: string
+            Path to the column file
+
+        Returns
+        -------
+        prjrepo.results.NpyColumn
+        """
+        values = read_dictionary(filename[:-len(NPY_SUFFIX)] + DICT_SUFFIX)
+        codes = dict([(values[i], i) for i in range(len(values))])
+        self.dictionaries[filename] = (codes, values)
+        return NpyColumn(filename, CODE_DTYPE)
+
+    def remove(self, select):
+        """Remove all rows whose working directory is selected by the given
+        function. The function is called with the working directory of each
+        row (None if it was not recorded). Columns are rewritten in place.
+        Returns the number of removed rows.
+
+        Parameters
+        ----------
+        select: function
+            Function that takes a working directory and returns True if the
+            row is removed
+
+        Returns
+        -------
+        int
+        """
+        with open(os.path.join(self.directory, LOCK_FILE), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self.open()
+            count = len(self.values)
+            if not self.work_dirs is None:
+                codes, work_dirs = self.dictionaries[self.work_dir_file]
+                row_dirs = [work_dirs[c] for c in self.work_dirs.read(count)]
+            else:
+                row_dirs = [None] * count
+            keep = [i for i in range(count) if not select(row_dirs[i])]
+            if len(keep) == count:
+                return 0
+            # Empty the value column first such that an interrupted rewrite
+            # leaves an empty table instead of rows with mixed up columns
+            values = self.values.read(count)
+            self.values.replace(list())
+            columns = list(self.arguments.values())
+            if not self.work_dirs is None:
+                columns.append(self.work_dirs)
+            for column in columns:
+                codes = column.read(count)
+                column.replace([codes[i] for i in keep])
+            self.values.replace([values[i] for i in keep])
+            self.rows = len(keep)
+            return count - len(keep)
+
+
+class ResultCollector(object):
+    """Collect VALUE outputs of successful runs. There is one result table for
+    each command under the base directory.
+    """
+    def __init__(self, base_dir):
+        """Initialize the base directory.
+
+        Parameters
+        ----------
+        base_dir: string
+            Path to the results directory
+        """
+        self.base_dir = base_dir
+        self.tables = dict()
+
+    def add(self, cmd, arguments, stdout, stderr, work_dir=None):
+        """Parse the output value of a run and add it to the result table of
+        the command. Runs of commands that do not declare a VALUE output are
+        ignored. Returns True if a value was added.
+
+        Parameters
+        ----------
+        cmd: prjrepo.workflow.command.Command
+            Executed command
+        arguments: dict
+            Arguments of the run
+        stdout: string
+            Captured STDOUT
+        stderr: string
+            Captured STDERR
+        work_dir: string, optional
+            Working directory of the run
+
+        Returns
+        -------
+        bool
+        """
+        spec = cmd.output_spec
+        if spec is None or not spec.is_value:
+            return False
+        text = stdout if spec.location == OUTPUT_LOCATION_STDOUT else stderr
+        try:
+            value = parse_value(text, spec.dtype)
+        except ValueError as ex:
+            sys.stderr.write(cmd.name + ': ' + str(ex) + '\n')
+            return False
+        self.table(cmd.name, dtype=spec.dtype).add(
+            arguments if not arguments is None else dict(),
+            value,
+            work_dir=work_dir
+        )
+        return True
+
+    def close(self):
+        """Close all result tables."""
+        for table in self.tables.values():
+            table.close()
+        self.tables = dict()
+
+    def drop(self, cmd_name):
+        """Remove the result table of a command. Returns True if the table
+        existed.
+
+        Parameters
+        ----------
+        cmd_name: string
+            Command name
+
+        Returns
+        -------
+        bool
+        """
+        if cmd_name in self.tables:
+            self.tables[cmd_name].close()
+            del self.tables[cmd_name]
+        directory = os.path.join(self.base_dir, cmd_name)
+        if not os.path.isdir(directory):
+            return False
+        shutil.rmtree(directory)
+        return True
+
+    def remove(self, cmd_name, select):
+        """Remove the rows of the result table of a command whose working
+        directory is selected by the given function (see
+        ResultTable.remove). Returns the number of removed rows.
+
+        Parameters
+        ----------
+        cmd_name: string
+            Command name
+        select: function
+            Function that takes a working directory and returns True if the
+            row is removed
+
+        Returns
+        -------
+        int
+        """
+        if not os.path.isdir(os.path.join(self.base_dir, cmd_name)):
+            return 0
+        return self.table(cmd_name).remove(select)
+
+    def table(self, cmd_name, dtype='float64'):
+        """Get the result table for a command.
+
+        Parameters
+        ----------
+        cmd_name: string
+            Command name
+        dtype: string, optional
+            Data type of the value column
+
+        Returns
+        -------
+        prjrepo.results.ResultTable
+        """
+        if not cmd_name in self.tables:
+            self.tables[cmd_name] = ResultTable(
+                os.path.join(self.base_dir, cmd_name),
+                dtype=dtype
+            )
+        return self.tables[cmd_name]
+
+
+# ------------------------------------------------------------------------------
+# Helper Methods
+# ------------------------------------------------------------------------------
+
+def npy_header(dtype, count):
+    """Get the .npy header for a one-dimensional array.
+
+    Parameters
+    ----------
+    dtype: string
+        Data type of the array
+    count: int
+        Number of elements
+
+    Returns
+    -------
+    string
+    """
+    header = "{'descr': '" + DTYPES[dtype][0] + "', 'fortran_order': False, 'shape': (" + str(count) + ",), }"
+    padding = NPY_HEADER_SIZE - len(NPY_MAGIC) - 2 - len(header) - 1
+    return NPY_MAGIC + struct.pack('<H', NPY_HEADER_SIZE - len(NPY_MAGIC) - 2) + header + ' ' * padding + '\n'
+
+
+def parse_value(text, dtype):
+    """Convert the output of a run into a value of the given data type.
+
+    Raises ValueError if the output is not a single number.
+
+    Parameters
+    ----------
+    text: string
+        Command output
+    dtype: string
+        Data type
+
+    Returns
+    -------
+    int or float
+    """
+    text = text.strip()
+    try:
+        if dtype.startswith('int'):
+            return int(text)
+        return float(text)
+    except ValueError:
+        raise ValueError('invalid ' + dtype + ' value \'' + text[:40] + '\'')
+
+
+def read_dictionary(filename):
+    """Read the dictionary of an argument column.
+
+    Parameters
+    ----------
+    filename: string
+        Path to the dictionary file
+
+    Returns
+    -------
+    list(string)
+    """
+    if not os.path.isfile(filename):
+        return list()
+    with open(filename, 'r') as f:
+        return [json.loads(line) for line in f if line.strip() != '']
+
+
+def read_npy(filename):
+    """Read a one-dimensional .npy file. Uses a read-only memory map if NumPy
+    is available. Otherwise the values are returned as a list.
+
+    Parameters
+    ----------
+    filename: string
+        Path to the .npy file
+
+    Returns
+    -------
+    numpy.ndarray or list
+    """
+    if not np is None:
+        return np.load(filename, mmap_mode='r')
+    with open(filename, 'rb') as f:
+        descr, count = read_npy_header(f.read(NPY_HEADER_SIZE))
+        fmt = None
+        for d, c in DTYPES.values():
+            if d == descr:
+                fmt = '<' + str(count) + c
+        if fmt is None:
+            raise ValueError('unsupported data type \'' + descr + '\'')
+        return list(struct.unpack(fmt, f.read(struct.calcsize(fmt))))
+
+
+def read_npy_header(header):
+    """Get the type descriptor and the number of elements from a .npy header.
+
+    Raises ValueError if the header is invalid.
+
+    Parameters
+    ----------
+    header: string
+        File header
+
+    Returns
+    -------
+    (string, int)
+    """
+    if not header.startswith(NPY_MAGIC):
+        raise ValueError('invalid npy header')
+    m = re.search("'descr': '([^']+)'.*'shape': \\((\\d+),\\)", header)
+    if m is None:
+        raise ValueError('invalid npy header')
+    return m.group(1), int(m.group(2))
@@ -0,0 +1,487 @@
+"""Sampling of the resource usage of running commands. A single background
+thread of the resource monitor periodically reads the process table from
+/proc (Linux only) and appends a sample for the process tree of each
+running command to a binary time series for the run. The name of the time
+series file is stored in the log entry of the run.
+
+Each time series file starts with a header (magic string, format version,
+start time and sampling interval) followed by fixed-size records. Each
+record contains the elapsed time since the start of the run, the number of
+processes in the tree, the accumulated CPU time (user and system time of all
+processes in the tree including their terminated children) and the total
+resident set size.
+
+Running jobs are registered in a directory with one small JSON file per job
+such that other processes (i.e., 'prm top') can show them. The file is
+removed when the job terminates. A monitor without sampling interval only
+registers running jobs and does not write time series.
+"""
+
+import json
+import os
+import struct
+import threading
+import time
+import uuid
+
+
+# ------------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------------
+
+"""Default sampling interval in seconds."""
+DEFAULT_INTERVAL = 1.0
+
+"""Header of time series files (magic string, version, start time and
+sampling interval).
+"""
+HEADER = struct.Struct('<4sBdd')
+MAGIC = 'PRMS'
+VERSION = 1
+
+"""Time series record (elapsed seconds, number of processes, CPU seconds,
+resident set size in bytes).
+"""
+RECORD = struct.Struct('<fIfQ')
+
+"""Clock ticks per second and page size for values in /proc/<pid>/stat."""
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+"""Directory of the process file system."""
+PROC_DIR = '/proc'
+
+
+# ------------------------------------------------------------------------------
+# Sampling
+# ------------------------------------------------------------------------------
+
+class ResourceMonitor(object):
+    """Monitor for the resource usage of running commands. Time series are
+    written to the series directory and running jobs are registered in the
+    running directory. Both directories are created if they do not exist.
+
+    The process trees of all started samplers are sampled by a single
+    background thread that reads the process table once per interval. The
+    thread is started with the first sampler. If the interval is None jobs
+    are registered as running but not sampled.
+    """
+    def __init__(self, series_dir, running_dir, interval=DEFAULT_INTERVAL):
+        """Initialize the directories and the sampling interval.
+
+        Raises ValueError if the interval is not positive.
+
+        Parameters
+        ----------
+        series_dir: string
+            Directory for time series files
+        running_dir: string
+            Directory for the registry of running jobs
+        interval: float, optional
+            Sampling interval in seconds (None to register jobs only)
+        """
+        if not interval is None and interval <= 0:
+            raise ValueError('invalid sampling interval \'' + str(interval) + '\'')
+        self.series_dir = series_dir
+        self.running_dir = running_dir
+        self.interval = interval
+        for dir_name in [series_dir, running_dir]:
+            if not os.path.isdir(dir_name):
+                os.makedirs(dir_name)
+        # Started samplers and the sampling thread. The condition guards both
+        # and wakes the thread when samplers are added or the monitor is
+        # closed.
+        self.cond = threading.Condition()
+        self.samplers = list()
+        self.thread = None
+
+    def add(self, sampler):
+        """Add a started sampler to the samplers of the sampling thread. The
+        thread is started if it is not running.
+
+        Parameters
+        ----------
+        sampler: prjrepo.sampling.Sampler
+            Started sampler
+        """
+        with self.cond:
+            self.samplers.append(sampler)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run)
+                self.thread.daemon = True
+                self.thread.start()
+            self.cond.notify()
+
+    def close(self):
+        """Stop the sampling thread. The thread is started again when the
+        next sampler is added.
+        """
+        with self.cond:
+            thread = self.thread
+            self.thread = None
+            self.cond.notify_all()
+        if not thread is None:
+            thread.join()
+
+    def remove(self, sampler):
+        """Remove a sampler from the samplers of the sampling thread. A
+        sampler that is removed while the process table is read may still be
+        passed the result of that scan (see Sampler.sample).
+
+        Parameters
+        ----------
+        sampler: prjrepo.sampling.Sampler
+            Started sampler
+        """
+        with self.cond:
+            if sampler in self.samplers:
+                self.samplers.remove(sampler)
+
+    def run(self):
+        """Sample the process trees of all samplers once per interval until
+        the monitor is closed. The thread waits without reading the process
+        table while there are no samplers. The process table is read without
+        holding the lock such that adding and removing samplers does not
+        wait for the scan.
+        """
+        thread = threading.current_thread()
+        while True:
+            with self.cond:
+                while self.thread is thread and len(self.samplers) == 0:
+                    self.cond.wait()
+                if not self.thread is thread:
+                    return
+                samplers = list(self.samplers)
+            stats, children = read_processes()
+            now = time.time()
+            for sampler in samplers:
+                sampler.sample(stats, children, now)
+            with self.cond:
+                if self.thread is thread:
+                    self.cond.wait(self.interval)
+
+    def sampler(self, cmd_name, work_dir):
+        """Get a sampler for a run of the given command. The sampler is
+        started once the process of the run has been created.
+
+        Parameters
+        ----------
+        cmd_name: string
+            Command name
+        work_dir: string
+            Working directory of the run
+
+        Returns
+        -------
+        prjrepo.sampling.Sampler
+        """
+        return Sampler(self, cmd_name, work_dir)
+
+
+class Sampler(object):
+    """Registration and time series of a single run. Samples are taken by
+    the sampling thread of the monitor.
+    """
+    def __init__(self, monitor, cmd_name, work_dir):
+        """Initialize the run information.
+
+        Parameters
+        ----------
+        monitor: prjrepo.sampling.ResourceMonitor
+            Monitor that created the sampler
+        cmd_name: string
+            Command name
+        work_dir: string
+            Working directory of the run
+        """
+        self.monitor = monitor
+        self.cmd_name = cmd_name
+        self.work_dir = work_dir
+        self.pid = None
+        self.series = None
+        self.series_file = None
+        self.running_file = None
+        self.start_time = None
+        # Guards the time series file against being closed by stop while the
+        # sampling thread writes a sample
+        self.lock = threading.Lock()
+
+    def sample(self, stats, children, now):
+        """Append a sample of the process tree of the run to the time series.
+        No sample is written if no process of the tree exists anymore.
+
+        Parameters
+        ----------
+        stats: dict
+            Process statistics by process identifier (see read_processes)
+        children: dict
+            Child process identifiers by parent process identifier
+        now: float
+            Time of the sample
+        """
+        count, cpu, rss = tree_usage(self.pid, stats, children)
+        if count == 0:
+            return
+        with self.lock:
+            # The sampler may have been stopped after the thread took its list
+            # of samplers
+            if self.series_file is None:
+                return
+            self.series_file.write(RECORD.pack(now - self.start_time, count, cpu, rss))
+            self.series_file.flush()
+
+    def start(self, proc):
+        """Register the run as running and start sampling the process tree of
+        the given process. The time series file is only created if the
+        monitor has a sampling interval.
+
+        Parameters
+        ----------
+        proc: subprocess.Popen
+            Process of the run
+        """
+        self.pid = proc.pid
+        self.start_time = time.time()
+        name = uuid.uuid4().hex
+        if not self.monitor.interval is None:
+            self.series = name
+            self.series_file = open(os.path.join(self.monitor.series_dir, name), 'wb')
+            self.series_file.write(
+                HEADER.pack(MAGIC, VERSION, self.start_time, self.monitor.interval)
+            )
+            self.series_file.flush()
+        self.running_file = os.path.join(self.monitor.running_dir, name)
+        with open(self.running_file, 'w') as reg:
+            json.dump(
+                {
+                    'pid': self.pid,
+                    'name': self.cmd_name,
+                    'workDir': self.work_dir,
+                    'startTime': self.start_time,
+                    'series': self.series
+                },
+                reg
+            )
+        if not self.series_file is None:
+            self.monitor.add(self)
+
+    def stop(self):
+        """Stop sampling and unregister the run. Returns the name of the time
+        series file or None if the run was not sampled.
+
+        Returns
+        -------
+        string
+        """
+        if self.running_file is None:
+            return None
+        if not self.series_file is None:
+            self.monitor.remove(self)
+            with self.lock:
+                self.series_file.close()
+                self.series_file = None
+        if os.path.isfile(self.running_file):
+            os.remove(self.running_file)
+        self.running_file = None
+        return self.series
+
+
+# ------------------------------------------------------------------------------
+# Helper Methods
+# ------------------------------------------------------------------------------
+
+def current_usage(filename):
+    """Get the most recent resource usage from a time series. Returns the
+    number of processes, the CPU utilization (in percent of one CPU) over the
+    last sampling interval and the resident set size in bytes. Returns None
+    if the time series has no samples yet.
+
+    Parameters
+    ----------
+    filename: string
+        Path to the time series file
+
+    Returns
+    -------
+    (int, float, int)
+    """
+    start_time, interval, samples = read_series(filename)
+    if len(samples) == 0:
+        return None
+    elapsed, count, cpu, rss = samples[-1]
+    if len(samples) > 1:
+        prev_elapsed, prev_cpu = samples[-2][0], samples[-2][2]
+    else:
+        prev_elapsed, prev_cpu = 0.0, 0.0
+    if elapsed > prev_elapsed:
+        utilization = 100.0 * (cpu - prev_cpu) / (elapsed - prev_elapsed)
+    else:
+        utilization = 0.0
+    return count, utilization, rss
+
+
+def read_processes():
+    """Read the statistics of all processes from /proc. Returns a dictionary
+    that maps process identifiers to the result of read_stat and a
+    dictionary that maps process identifiers to the identifiers of their
+    child processes.
+
+    Returns
+    -------
+    (dict, dict)
+    """
+    stats = dict()
+    children = dict()
+    for name in os.listdir(PROC_DIR):
+        if not name.isdigit():
+            continue
+        stat = read_stat(int(name))
+        if stat is None:
+            continue
+        stats[int(name)] = stat
+        children.setdefault(stat[0], list()).append(int(name))
+    return stats, children
+
+
+def read_series(filename):
+    """Read a time series file. Returns the start time, the sampling interval
+    and the list of samples. Each sample is a tuple of elapsed seconds,
+    number of processes, CPU seconds and resident set size in bytes. An
+    incomplete last record (of a running job) is ignored.
+
+    Raises ValueError if the file is not a time series file.
+
+    Parameters
+    ----------
+    filename: string
+        Path to the time series file
+
+    Returns
+    -------
+    (float, float, list((float, int, float, int)))
+    """
+    with open(filename, 'rb') as f:
+        data = f.read()
+    if len(data) < HEADER.size:
+        raise ValueError('invalid time series file \'' + filename + '\'')
+    magic, version, start_time, interval = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('invalid time series file \'' + filename + '\'')
+    samples = list()
+    offset = HEADER.size
+    while offset + RECORD.size <= len(data):
+        samples.append(RECORD.unpack_from(data, offset))
+        offset += RECORD.size
+    return start_time, interval, samples
+
+
+def read_stat(pid):
+    """Read the parent process identifier, the CPU time (in clock ticks) and
+    the resident set size (in pages) of a process from /proc. The CPU time
+    includes the time of terminated children that the process waited for.
+    Returns None if the process does not exist or has terminated and waits
+    to be reaped (zombie processes have no resident memory).
+
+    Parameters
+    ----------
+    pid: int
+        Process identifier
+
+    Returns
+    -------
+    (int, int, int)
+    """
+    try:
+        with open(os.path.join(PROC_DIR, str(pid), 'stat'), 'r') as f:
+            line = f.read()
+    except IOError:
+        return None
+    # The command name is enclosed in parentheses and may contain blanks
+    fields = line[line.rfind(')') + 2:].split()
+    if fields[0] == 'Z':
+        return None
+    ticks = int(fields[11]) + int(fields[12]) + int(fields[13]) + int(fields[14])
+    return int(fields[1]), ticks, int(fields[21])
+
+
+def running_jobs(running_dir):
+    """Get the registered running jobs ordered by their start time.
+    Registrations of processes that no longer exist (e.g., of a killed
+    engine) are removed.
+
+    Parameters
+    ----------
+    running_dir: string
+        Directory for the registry of running jobs
+
+    Returns
+    -------
+    list(dict)
+    """
+    jobs = list()
+    if not os.path.isdir(running_dir):
+        return jobs
+    for filename in os.listdir(running_dir):
+        path = os.path.join(running_dir, filename)
+        try:
+            with open(path, 'r') as f:
+                job = json.load(f)
+        except (IOError, ValueError):
+            continue
+        if read_stat(job['pid']) is None:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            continue
+        jobs.append(job)
+    return sorted(jobs, key=lambda j: j['startTime'])
+
+
+def sample_tree(pid):
+    """Sample the process tree with the given root. Returns the number of
+    processes, the accumulated CPU time in seconds and the total resident
+    set size in bytes.
+
+    Parameters
+    ----------
+    pid: int
+        Process identifier of the root process
+
+    Returns
+    -------
+    (int, float, int)
+    """
+    stats, children = read_processes()
+    return tree_usage(pid, stats, children)
+
+
+def tree_usage(pid, stats, children):
+    """Get the resource usage of the process tree with the given root from a
+    listing of the process table. Returns the number of processes, the
+    accumulated CPU time in seconds and the total resident set size in bytes.
+
+    Parameters
+    ----------
+    pid: int
+        Process identifier of the root process
+    stats: dict
+        Process statistics by process identifier (see read_processes)
+    children: dict
+        Child process identifiers by parent process identifier
+
+    Returns
+    -------
+    (int, float, int)
+    """
+    if not pid in stats:
+        return 0, 0.0, 0
+    count, ticks, pages = 0, 0, 0
+    stack = [pid]
+    while len(stack) > 0:
+        p = stack.pop()
+        count += 1
+        ticks += stats[p][1]
+        pages += stats[p][2]
+        stack.extend(children.get(p, list()))
+    return count, float(ticks) / CLOCK_TICKS, pages * PAGE_SIZE
@@ -0,0 +1,320 @@
+"""Node-local staging cache for input files. Input files and directories of
+commands often reside on a shared network file system. When many concurrent
+runs read the same large input the file server becomes the bottleneck. With
+staging enabled, each resolved input is copied (or reflinked where the file
+system supports it) into a local cache directory once and the executed
+command line references the staged copy. Logged command lines, run journals
+and the provenance index keep referencing the original files.
+
+Entries are keyed by the absolute path, the modification time and the size of
+the input (for directories the latest modification time and the total size of
+all files). A changed input is staged again under a new key. The cache is
+limited by a size budget. Entries are evicted in least recently used order,
+where the modification time of an entry directory is its last use. Inputs
+that do not fit into the budget are not staged. Multiple processes on the
+same node can share a cache directory. Each process holds a shared lock
+(flock) on the directory of every entry that it uses until the cache is
+closed. Eviction only removes entries for which it gets an exclusive lock,
+i.e., entries that are used by running jobs of any process are kept.
+"""
+
+import fcntl
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+
+
+# ------------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------------
+
+"""Default size budget for the staging cache (in bytes)."""
+DEFAULT_MAX_SIZE = 10 * 1024 * 1024 * 1024
+
+"""Name of the lock file that serializes modifications of the cache."""
+LOCK_FILE = 'LOCK'
+
+"""Pattern for the names of cache entries (key and size in bytes)."""
+ENTRY_PATTERN = re.compile('^([0-9a-f]{40})-([0-9]+)$')
+
+"""Prefix for temporary directories of entries that are being copied."""
+TMP_PREFIX = '.tmp-'
+
+
+# ------------------------------------------------------------------------------
+# Staging Cache
+# ------------------------------------------------------------------------------
+
+class StagingCache(object):
+    """Size-bounded cache of local copies of input files and directories."""
+    def __init__(self, cache_dir, max_size=DEFAULT_MAX_SIZE):
+        """Initialize the cache directory and the size budget. The directory
+        is created if it does not exist.
+
+        Parameters
+        ----------
+        cache_dir: string
+            Path to the local cache directory
+        max_size: int, optional
+            Maximum total size of all cache entries (in bytes)
+        """
+        self.cache_dir = os.path.abspath(cache_dir)
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        self.max_size = max_size
+        # Inputs that were staged by this process. Maps the absolute path of
+        # an input to the modification time and size of the path and the
+        # staged copy.
+        self.staged = dict()
+        # Open file descriptors of the locked entry directories by entry name
+        self.pins = dict()
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        """Release the locks on all entries that were used by this process.
+        Released entries can be evicted by other processes.
+        """
+        for fd in self.pins.values():
+            os.close(fd)
+        self.pins = dict()
+        self.staged = dict()
+
+    def entries(self):
+        """Get the entries in the cache. Returns a list of (last use, name,
+        size) tuples.
+
+        Returns
+        -------
+        list((float, string, int))
+        """
+        entries = list()
+        for name in os.listdir(self.cache_dir):
+            m = ENTRY_PATTERN.match(name)
+            if m is None:
+                continue
+            try:
+                mtime = os.stat(os.path.join(self.cache_dir, name)).st_mtime
+            except OSError:
+                continue
+            entries.append((mtime, name, int(m.group(2))))
+        return entries
+
+    def evict(self, size):
+        """Remove least recently used entries until an entry of the given
+        size fits into the budget. Entries that are locked by any process
+        (including this one) are kept. Returns False if the entry does not
+        fit. Expects the caller to hold the cache lock.
+
+        Parameters
+        ----------
+        size: int
+            Size of the new entry (in bytes)
+
+        Returns
+        -------
+        bool
+        """
+        entries = sorted(self.entries())
+        total = sum([e[2] for e in entries])
+        for mtime, name, entry_size in entries:
+            if total + size <= self.max_size:
+                break
+            if name in self.pins:
+                continue
+            entry_dir = os.path.join(self.cache_dir, name)
+            try:
+                fd = os.open(entry_dir, os.O_RDONLY)
+            except OSError:
+                continue
+            try:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except (IOError, OSError):
+                    # The entry is used by another process
+                    continue
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                total -= entry_size
+            finally:
+                os.close(fd)
+        return total + size <= self.max_size
+
+    def pin(self, staged):
+        """Acquire a shared lock on the entry of a staged copy that is held
+        until the cache is closed. Returns False if the entry was removed.
+
+        Parameters
+        ----------
+        staged: string
+            Path to the staged copy
+
+        Returns
+        -------
+        bool
+        """
+        entry_dir = os.path.dirname(staged)
+        name = os.path.basename(entry_dir)
+        if name in self.pins:
+            return True
+        try:
+            fd = os.open(entry_dir, os.O_RDONLY)
+        except OSError:
+            return False
+        fcntl.flock(fd, fcntl.LOCK_SH)
+        # The entry may have been evicted (and staged again) while waiting
+        # for the lock
+        try:
+            valid = os.fstat(fd).st_ino == os.stat(entry_dir).st_ino
+        except OSError:
+            valid = False
+        if not valid or not os.path.exists(staged):
+            os.close(fd)
+            return False
+        self.pins[name] = fd
+        return True
+
+    def stage(self, path):
+        """Get the path to the staged copy of an input file or directory. The
+        input is copied into the cache if necessary. Returns the given path if
+        the input cannot be staged (e.g., because it does not exist, is
+        larger than the budget, or copying fails).
+
+        Parameters
+        ----------
+        path: string
+            Path to the input file or directory
+
+        Returns
+        -------
+        string
+        """
+        abs_path = os.path.abspath(path)
+        try:
+            stat = os.stat(abs_path)
+        except OSError:
+            return path
+        stat_key = (stat.st_mtime, stat.st_size)
+        # Inputs that were staged before are only validated against the
+        # status of the path itself (directories are not traversed again)
+        entry = self.staged.get(abs_path)
+        if not entry is None and entry[0] == stat_key and os.path.exists(entry[1]):
+            self.touch(entry[1])
+            self.hits += 1
+            return entry[1]
+        try:
+            mtime, size = input_version(abs_path)
+        except OSError:
+            return path
+        key = hashlib.sha1(repr((abs_path, mtime, size))).hexdigest()
+        entry_dir = os.path.join(self.cache_dir, key + '-' + str(size))
+        staged = os.path.join(entry_dir, os.path.basename(abs_path))
+        if os.path.exists(staged) and self.pin(staged):
+            self.touch(staged)
+            self.hits += 1
+            self.staged[abs_path] = (stat_key, staged)
+            return staged
+        if size > self.max_size:
+            return path
+        with open(os.path.join(self.cache_dir, LOCK_FILE), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if not os.path.exists(staged) or not self.pin(staged):
+                if not self.evict(size):
+                    return path
+                tmp_dir = os.path.join(
+                    self.cache_dir,
+                    TMP_PREFIX + str(os.getpid()) + '-' + key
+                )
+                try:
+                    os.mkdir(tmp_dir)
+                    copy_input(abs_path, os.path.join(tmp_dir, os.path.basename(abs_path)))
+                    os.rename(tmp_dir, entry_dir)
+                except (IOError, OSError, shutil.Error):
+                    shutil.rmtree(tmp_dir, ignore_errors=True)
+                    return path
+                # Entries are not evicted while the cache lock is held
+                if not self.pin(staged):
+                    return path
+        self.misses += 1
+        self.staged[abs_path] = (stat_key, staged)
+        return staged
+
+    def touch(self, staged):
+        """Mark the entry of a staged copy as used.
+
+        Parameters
+        ----------
+        staged: string
+            Path to the staged copy
+        """
+        try:
+            os.utime(os.path.dirname(staged), None)
+        except OSError:
+            pass
+
+
+# ------------------------------------------------------------------------------
+# Helper Methods
+# ------------------------------------------------------------------------------
+
+def copy_input(source, target):
+    """Copy a file or directory. Uses cp with reflinks where the file system
+    supports them and falls back to a regular copy otherwise.
+
+    Parameters
+    ----------
+    source: string
+        Path to the input file or directory
+    target: string
+        Path to the copy (must not exist)
+    """
+    try:
+        with open(os.devnull, 'w') as devnull:
+            returncode = subprocess.call(
+                ['cp', '--reflink=auto', '-pR', source, target],
+                stdout=devnull,
+                stderr=devnull
+            )
+        if returncode == 0:
+            return
+    except OSError:
+        pass
+    if os.path.isdir(target):
+        shutil.rmtree(target)
+    elif os.path.exists(target):
+        os.remove(target)
+    if os.path.isdir(source):
+        shutil.copytree(source, target)
+    else:
+        shutil.copy2(source, target)
+
+
+def input_version(path):
+    """Get the modification time and size of an input. For directories the
+    result is the latest modification time and the total size of all files
+    and directories in the tree.
+
+    Parameters
+    ----------
+    path: string
+        Path to the input file or directory
+
+    Returns
+    -------
+    (float, int)
+    """
+    stat = os.stat(path)
+    if not os.path.isdir(path):
+        return stat.st_mtime, stat.st_size
+    mtime = stat.st_mtime
+    size = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        for name in dirnames:
+            mtime = max(mtime, os.lstat(os.path.join(dirpath, name)).st_mtime)
+        for name in filenames:
+            stat = os.lstat(os.path.join(dirpath, name))
+            mtime = max(mtime, stat.st_mtime)
+            size += stat.st_size
+    return mtime, size
+
@@ -0,0 +1,923 @@
+"""Event-driven workflow engine for running large numbers of short-lived
+commands concurrently. All processes are multiplexed from a single thread
+using non-blocking polls on their output pipes. There is no thread or process
+per job and all log entries are written from the thread that drives the
+engine. If the engine has a staging cache, inputs of queued jobs are copied by
+a single helper thread and a job is only started once its inputs are staged.
+
+The engine can either be run to completion (run) or be driven step-wise from
+an external event loop (poll) that watches the file descriptors returned by
+fds.
+
+Runs of commands in batch mode are combined into batch jobs when they are read
+by run. Each batch job is executed by a single process and its output is split
+into the outputs of the individual runs when it terminates.
+"""
+
+from collections import deque, OrderedDict
+import os
+import Queue
+import select
+import sys
+import tempfile
+import threading
+import time
+
+from prjrepo.workflow.command import popen, wait_process
+from prjrepo.workflow.engine import WorkflowEngine, render_components
+from prjrepo.workflow.workers import parse_response
+
+
+# ------------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------------
+
+"""Job states."""
+JOB_STATE_PENDING = 'PENDING'
+JOB_STATE_RUNNING = 'RUNNING'
+JOB_STATE_SUCCESS = 'SUCCESS'
+JOB_STATE_FAILED = 'FAILED'
+
+"""Identifier for captured output streams."""
+STREAM_STDOUT = 'STDOUT'
+STREAM_STDERR = 'STDERR'
+
+"""Number of bytes that are read from an output pipe at once."""
+READ_SIZE = 65536
+
+"""Maximum number of rendered jobs that are kept in the queue when reading jobs
+from an iterator.
+"""
+QUEUE_SIZE = 1024
+
+"""Poll timeout (in seconds) when jobs are waiting but none can be started."""
+WAIT_TIMEOUT = 0.1
+
+"""Number of times a job is sent to a persistent worker if workers terminate
+while running it.
+"""
+WORKER_ATTEMPTS = 2
+
+"""Maximum number of incomplete batches that are kept open when combining runs
+of commands in batch mode. The oldest batch is started when the limit is
+exceeded.
+"""
+OPEN_BATCHES = 1024
+
+
+# ------------------------------------------------------------------------------
+# Jobs
+# ------------------------------------------------------------------------------
+
+class Job(object):
+    """Rendered instance of a command that is run by the engine. Captures the
+    output of the executed process and the exit code.
+    """
+    def __init__(self, cmd, settings, cmd_components, work_dir, arguments=None, callback=None):
+        """Initialize the command and the rendered command line components.
+
+        Parameters
+        ----------
+        cmd: prjrepo.workflow.command.Command
+            Specification of the executed command
+        settings: prjrepo.config.context.Config
+            Execution context settings
+        cmd_components: list(string)
+            Command line components
+        work_dir: string
+            Working directory for the process
+        arguments: dict, optional
+            Arguments that were used to render the command
+        callback: function, optional
+            Function that is called with the job as argument when the job
+            terminates
+        """
+        self.cmd = cmd
+        self.settings = settings
+        self.cmd_components = cmd_components
+        self.work_dir = work_dir
+        self.run_id = None
+        self.arguments = arguments if not arguments is None else dict()
+        self.callback = callback
+        self.state = JOB_STATE_PENDING
+        self.returncode = None
+        self.start_time = None
+        self.end_time = None
+        # Resource usage of the process (if available) and the sampler for
+        # its resource usage time series
+        self.rusage = None
+        self.sampler = None
+        self.series = None
+        self.proc = None
+        self.stdout_chunks = list()
+        self.stderr_chunks = list()
+        # Number of times the job was sent to a persistent worker
+        self.attempts = 0
+        # Executed command line components (with staged inputs) and the event
+        # that is set once the inputs of the job are staged
+        self.exec_components = None
+        self.staged = None
+
+    @property
+    def cmd_line(self):
+        """Command line for the job.
+
+        Returns
+        -------
+        string
+        """
+        return ' '.join(self.cmd_components)
+
+    @property
+    def stdout(self):
+        """Captured STDOUT of the job.
+
+        Returns
+        -------
+        string
+        """
+        return ''.join(self.stdout_chunks)
+
+    @property
+    def stderr(self):
+        """Captured STDERR of the job.
+
+        Returns
+        -------
+        string
+        """
+        return ''.join(self.stderr_chunks)
+
+    @property
+    def succeeded(self):
+        """Flag indicating whether the job terminated successfully.
+
+        Returns
+        -------
+        bool
+        """
+        return self.state == JOB_STATE_SUCCESS
+
+
+class BatchJob(Job):
+    """Job that executes multiple runs of a command in batch mode with a
+    single process. The runs (members) only differ in the values of batchable
+    components. The command line is created by render once all members have
+    been added.
+    """
+    def __init__(self, job):
+        """Initialize the batch with its first member.
+
+        Parameters
+        ----------
+        job: prjrepo.workflow.asyncengine.Job
+            First run in the batch
+        """
+        super(BatchJob, self).__init__(
+            job.cmd,
+            job.settings,
+            list(job.cmd_components),
+            job.work_dir
+        )
+        self.members = [job]
+        # Temporary file with the batched values if the command takes an
+        # argument file
+        self.arg_file = None
+
+    def add(self, job):
+        """Add a run to the batch.
+
+        Parameters
+        ----------
+        job: prjrepo.workflow.asyncengine.Job
+            Run with the same non-batchable values as the batch
+        """
+        self.members.append(job)
+
+    def render(self):
+        """Create the command line of the batch. The values of all batchable
+        components of all members replace the first batchable component. If
+        the command takes an argument file, the values are written to a
+        temporary file instead and the first batchable component is replaced
+        by the argument file option and the file name. The argument file is
+        created in the working directory of the batch such that it is readable
+        by workers on other nodes that share the file system.
+        """
+        positions = [i for i, el in enumerate(self.cmd.components) if el.batchable]
+        values = [[job.cmd_components[i] for i in positions] for job in self.members]
+        batch_components = list()
+        if self.cmd.batch.arg_file is None:
+            for run_values in values:
+                batch_components.extend(run_values)
+        else:
+            fd, self.arg_file = tempfile.mkstemp(
+                prefix='.prm-batch-',
+                suffix='.args',
+                dir=os.path.abspath(self.work_dir)
+            )
+            with os.fdopen(fd, 'w') as f:
+                for run_values in values:
+                    f.write('\t'.join(run_values) + '\n')
+            batch_components = [self.cmd.batch.arg_file, self.arg_file]
+        cmd_components = list()
+        for i in range(len(self.cmd.components)):
+            if i == positions[0]:
+                cmd_components.extend(batch_components)
+            elif not self.cmd.components[i].batchable:
+                cmd_components.append(self.members[0].cmd_components[i])
+        self.cmd_components = cmd_components
+
+    def split(self):
+        """Distribute the output of the terminated batch to its members. Each
+        member gets one line of STDOUT. STDERR of a successful batch is
+        assigned to the first member. If the batch failed or the number of
+        lines does not match the number of members, all members fail with the
+        STDERR of the batch.
+        """
+        if not self.arg_file is None:
+            try:
+                os.remove(self.arg_file)
+            except OSError:
+                pass
+            self.arg_file = None
+        lines = self.stdout.splitlines()
+        if self.returncode == 0 and len(lines) != len(self.members):
+            self.returncode = -1
+            self.stderr_chunks.append(
+                'expected ' + str(len(self.members)) + ' output lines but got ' +
+                str(len(lines)) + '\n'
+            )
+        for i in range(len(self.members)):
+            job = self.members[i]
+            job.returncode = self.returncode
+            job.start_time = self.start_time
+            job.end_time = self.end_time
+            job.series = self.series
+            if self.returncode == 0:
+                job.stdout_chunks = [lines[i] + '\n']
+                job.stderr_chunks = [self.stderr] if i == 0 else list()
+            else:
+                job.stderr_chunks = [self.stderr]
+
+
+class JobSlots(object):
+    """Counting semaphore that limits the number of concurrently running jobs.
+    Slot objects are consulted by the engine before a job is started and are
+    notified when a job terminates.
+    """
+    def __init__(self, max_jobs):
+        """Initialize the maximum number of concurrent jobs.
+
+        Raises ValueError if max_jobs is not positive.
+
+        Parameters
+        ----------
+        max_jobs: int
+            Maximum number of concurrently running jobs
+        """
+        if max_jobs < 1:
+            raise ValueError('invalid number of jobs \'' + str(max_jobs) + '\'')
+        self.max_jobs = max_jobs
+        self.running = 0
+        # Number of queued jobs that are considered when trying to start a job.
+        # Jobs only differ in the number of slots they need if the value is
+        # larger than one.
+        self.lookahead = 1
+
+    def acquire(self, job):
+        """Reserve a slot for the given job. Returns False if the job cannot be
+        started at this point.
+
+        Parameters
+        ----------
+        job: prjrepo.workflow.asyncengine.Job
+            Job that is about to be started
+
+        Returns
+        -------
+        bool
+        """
+        if self.running < self.max_jobs:
+            self.running += 1
+            return True
+        return False
+
+    def cancel(self, job):
+        """Release the slot of a job that was acquired but could not be
+        started (e.g., because all persistent workers are busy). The job
+        remains queued.
+
+        Parameters
+        ----------
+        job: prjrepo.workflow.asyncengine.Job
+            Queued job
+        """
+        self.release(job)
+
+    def release(self, job):
+        """Release the slot that was reserved for a terminated job.
+
+        Parameters
+        ----------
+        job: prjrepo.workflow.asyncengine.Job
+            Terminated job
+        """
+        self.running -= 1
+
+
+# ------------------------------------------------------------------------------
+# Engine
+# ------------------------------------------------------------------------------
+
+class AsyncWorkflowEngine(WorkflowEngine):
+    """Workflow engine that runs many jobs concurrently from a single thread.
+    Output of running jobs is captured in a streaming fashion and successful
+    jobs are logged as they terminate.
+    """
+    def __init__(self, logger, max_jobs=1, slots=None, on_output=None, store=None, results=None, staging=None, sampling=None):
+        """Initialize the logger and the limit for concurrent jobs.
+
+        Parameters
+        ----------
+        logger: prjrepo.DefaultLogger
+            Logger for successful executed commands.
+        max_jobs: int, optional
+            Maximum number of concurrently running jobs. Ignored if slots is
+            given.
+        slots: prjrepo.workflow.asyncengine.JobSlots, optional
+            Policy that decides whether a queued job can be started
+        on_output: function, optional
+            Function that is called with the job, the stream identifier and the
+            data whenever a running job produces output
+        store: prjrepo.outputs.OutputStore, optional
+            Store for STDOUT, STDERR and output files of executed commands
+        results: prjrepo.results.ResultCollector, optional
+            Collector for VALUE outputs of executed commands
+        staging: prjrepo.staging.StagingCache, optional
+            Local cache for input files of executed commands
+        sampling: prjrepo.sampling.ResourceMonitor, optional
+            Monitor for sampling the resource usage of running jobs
+        """
+        super(AsyncWorkflowEngine, self).__init__(
+            logger,
+            store=store,
+            results=results,
+            staging=staging,
+            sampling=sampling
+        )
+        self.slots = slots if not slots is None else JobSlots(max_jobs)
+        self.on_output = on_output
+        self.queue = deque()
+        # Mapping of open pipe file descriptors to (job, stream) pairs
+        self.pipes = dict()
+        # Number of open pipes for each running job
+        self.open_pipes = dict()
+        # Mapping of STDOUT file descriptors to persistent workers
+        self.worker_pipes = dict()
+        if hasattr(select, 'poll'):
+            self.poller = select.poll()
+        else:
+            self.poller = None
+        # Helper thread that stages the inputs of queued jobs (started when
+        # the first job is queued)
+        self.stager = None
+        self.staging_queue = Queue.Queue()
+
+    def close(self):
+        """Stop all persistent workers that were started by the engine and
+        the staging thread.
+        """
+        for worker in list(self.worker_pipes.values()):
+            self.unregister_worker(worker)
+        if not self.stager is None:
+            self.staging_queue.put(None)
+            self.stager.join()
+            self.stager = None
+        super(AsyncWorkflowEngine, self).close()
+
+    def fds(self):
+        """Get the file descriptors of all output pipes of running jobs and
+        persistent workers. An external event loop can watch these for
+        readability and call poll when any of them is ready.
+
+        Returns
+        -------
+        list(int)
+        """
+        return list(self.pipes.keys()) + list(self.worker_pipes.keys())
+
+    @property
+    def is_idle(self):
+        """Flag indicating that there are no queued or running jobs.
+
+        Returns
+        -------
+        bool
+        """
+        return len(self.queue) == 0 and len(self.open_pipes) == 0 and self.workers.busy == 0
+
+    def jobs(self, context, cmd_name, argument_sets, callback=None):
+        """Generator for rendered jobs that run the given command for each
+        argument set. The command specification and the context settings are
+        read once and shared by all jobs.
+
+        Parameters
+        ----------
+        context: prjrepo.config.context.ContextManager
+            Execution context
+        cmd_name: string
+            Command name
+        argument_sets: iterable(dict)
+            Arguments for individual command runs
+        callback: function, optional
+            Function that is called for each terminated job
+
+        Returns
+        -------
+        iterator(prjrepo.workflow.asyncengine.Job)
+        """
+        cmd, settings = None, None
+        for arguments in argument_sets:
+            if cmd is None:
+                cmd, settings, cmd_components = self.render_command(
+                    context,
+                    cmd_name,
+                    arguments
+                )
+            else:
+                cmd_components = render_components(context, cmd, settings, arguments)
+            yield Job(
+                cmd,
+                settings,
+                cmd_components,
+                context.work_dir,
+                arguments=arguments,
+                callback=callback
+            )
+
+    def poll(self, timeout=0):
+        """Start queued jobs if possible and process output of running jobs.
+        Waits at most timeout seconds for output. A timeout of None blocks
+        until at least one running job produced output or terminated. Returns
+        the list of jobs that terminated.
+
+        Parameters
+        ----------
+        timeout: float, optional
+            Maximum time to wait for output (in seconds)
+
+        Returns
+        -------
+        list(prjrepo.workflow.asyncengine.Job)
+        """
+        finished = list()
+        self.start_jobs(finished)
+        if len(self.pipes) == 0 and self.workers.busy == 0:
+            if len(self.queue) > 0 and not self.queue[0].staged is None:
+                # Wait for the inputs of the next job instead of returning
+                # immediately
+                self.queue[0].staged.wait(WAIT_TIMEOUT if timeout is None else timeout)
+            return finished
+        if timeout is None and len(self.queue) > 0:
+            timeout = WAIT_TIMEOUT
+        for fd in self.wait(timeout):
+            if fd in self.worker_pipes:
+                self.read_worker(self.worker_pipes[fd], finished)
+                continue
+            job, stream = self.pipes[fd]
+            data = os.read(fd, READ_SIZE)
+            if data:
+                if stream == STREAM_STDOUT:
+                    job.stdout_chunks.append(data)
+                else:
+                    job.stderr_chunks.append(data)
+                if not self.on_output is None:
+                    self.on_output(job, stream, data)
+                continue
+            # End of stream. The job terminates once both pipes are closed.
+            self.close_pipe(fd)
+            self.open_pipes[job] -= 1
+            if self.open_pipes[job] == 0:
+                del self.open_pipes[job]
+                job.returncode, job.rusage = wait_process(job.proc)
+                self.finish_job(job, finished)
+        return finished
+
+    def run(self, jobs=None):
+        """Run all queued jobs and all jobs from the given iterator until
+        completion. Jobs are read lazily from the iterator such that only a
+        bounded number of rendered jobs is kept in memory. Runs of commands in
+        batch mode are combined into batch jobs. Returns the number of
+        successful and failed runs.
+
+        Parameters
+        ----------
+        jobs: iterator(prjrepo.workflow.asyncengine.Job), optional
+            Additional jobs that are run
+
+        Returns
+        -------
+        (int, int)
+        """
+        if not jobs is None:
+            jobs = batch_jobs(jobs)
+        success, failed = 0, 0
+        while True:
+            if not jobs is None:
+                while len(self.queue) < QUEUE_SIZE:
+                    try:
+                        self.submit_job(next(jobs))
+                    except StopIteration:
+                        jobs = None
+                        break
+            if self.is_idle and jobs is None:
+                break
+            for job in self.poll(timeout=None):
+                if job.succeeded:
+                    success += 1
+                else:
+                    failed += 1
+        return success, failed
+
+    def submit(self, context, cmd_name, default_values, callback=None):
+        """Render the registered command with given name and queue it for
+        execution.
+
+        Raises ValueError if the command is unknown or cannot be rendered.
+
+        Parameters
+        ----------
+        context: prjrepo.config.context.ContextManager
+            Execution context
+        cmd_name: string
+            Command name
+        default_values: dict
+            Arguments that are used as default values for variables that are
+            not set in the given context
+        callback: function, optional
+            Function that is called with the job when it terminates
+
+        Returns
+        -------
+        prjrepo.workflow.asyncengine.Job
+        """
+        return self.submit_job(
+            next(self.jobs(context, cmd_name, [default_values], callback))
+        )
+
+    def submit_job(self, job):
+        """Queue a rendered job for execution.
+
+        Raises ValueError if the job is not an executable command.
+
+        Parameters
+        ----------
+        job: prjrepo.workflow.asyncengine.Job
+            Rendered job
+
+        Returns
+        -------
+        prjrepo.workflow.asyncengine.Job
+        """
+        if not job.cmd.is_exec:
+            raise ValueError('not an executable command \'' + job.cmd.name + '\'')
+        self.queue.append(job)
+        # Batches are not staged since their components do not match the
+        # command specification
+        if not self.staging is None and not isinstance(job, BatchJob):
+            job.staged = threading.Event()
+            if self.stager is None:
+                self.stager = threading.Thread(target=self.stage_jobs)
+                self.stager.daemon = True
+                self.stager.start()
+            self.staging_queue.put(job)
+        return job
+
+    # --------------------------------------------------------------------------
+    # Internal helper methods
+    # --------------------------------------------------------------------------
+
+    def close_pipe(self, fd):
+        """Stop watching and close the given pipe.
+
+        Parameters
+        ----------
+        fd: int
+            Pipe file descriptor
+        """
+        if not self.poller is None:
+            self.poller.unregister(fd)
+        del self.pipes[fd]
+        os.close(fd)
+
+    def complete_job(self, job, finished):
+        """Set the final state of a terminated run, log the run and call the
+        job callback. Failed runs are logged with their exit code.
+
+        Parameters
+        ----------
+        job: prjrepo.workflow.asyncengine.Job
+            Terminated run
+        finished: list(prjrepo.workflow.asyncengine.Job)
+            List of terminated jobs to which the job is appended
+        """
+        if job.returncode == 0:
+            job.state = JOB_STATE_SUCCESS
+        else:
+            job.state = JOB_STATE_FAILED
+        job.run_id = self.log_run(
+            job.cmd,
+            job.cmd_components,
+            job.work_dir,
+            job.stdout,
+            job.stderr,
+            arguments=job.arguments,
+            start_time=job.start_time,
+            end_time=job.end_time,
+            returncode=job.returncode,
+            rusage=job.rusage,
+            series=job.series
+        )
+        finished.append(job)
+        if not job.callback is None:
+            job.callback(job)
+
+    def finish_job(self, job, finished):
+        """Set the final state of a terminated job, release its slot, log the
+        job if successful and call the job callback. The output of a batch
+        job is split and each of its runs is completed individually.
+
+        Parameters
+        ----------
+        job: prjrepo.workflow.asyncengine.Job
+            Terminated job
+        finished: list(prjrepo.workflow.asyncengine.Job)
+            List of terminated jobs to which the job is appended
+        """
+        job.end_time = time.time()
+        job.proc = None
+        if not job.sampler is None:
+            job.series = job.sampler.stop()
+            job.sampler = None
+        self.slots.release(job)
+        if isinstance(job, BatchJob):
+            job.split()
+            for member in job.members:
+                self.complete_job(member, finished)
+        else:
+            self.complete_job(job, finished)
+
+    def lose_persistent_worker(self, worker, finished):
+        """Remove a persistent worker that terminated. The job of the worker
+        is queued again unless it reached the maximum number of attempts.
+
+        Parameters
+        ----------
+        worker: prjrepo.workflow.workers.PersistentWorker
+            Terminated worker
+        finished: list(prjrepo.workflow.asyncengine.Job)
+            List of terminated jobs
+        """
+        self.unregister_worker(worker)
+        job = worker.job
+        messages = worker.take_messages()
+        self.workers.remove(worker)
+        if job is None:
+            return
+        if job.attempts < WORKER_ATTEMPTS:
+            self.slots.release(job)
+            job.state = JOB_STATE_PENDING
+            self.queue.appendleft(job)
+        else:
+            job.stderr_chunks.append(
+                messages + 'worker terminated (' + str(worker.proc.returncode) + ')\n'
+            )
+            job.returncode = worker.proc.returncode if worker.proc.returncode else -1
+            self.finish_job(job, finished)
+
+    def read_worker(self, worker, finished):
+        """Read output of a persistent worker. Finishes the worker's job when
+        the response is complete.
+
+        Parameters
+        ----------
+        worker: prjrepo.workflow.workers.PersistentWorker
+            Worker with readable STDOUT
+        finished: list(prjrepo.workflow.asyncengine.Job)
+            List of terminated jobs
+        """
+        data = os.read(worker.fd, READ_SIZE)
+        if not data:
+            self.lose_persistent_worker(worker, finished)
+            return
+        response = worker.feed(data)
+        job = worker.job
+        if response is None or job is None:
+            return
+        stdout, stderr, job.returncode = parse_response(
+            response,
+            worker.take_messages()
+        )
+        job.stdout_chunks.append(stdout)
+        job.stderr_chunks.append(stderr)
+        if not self.on_output is None:
+            self.on_output(job, STREAM_STDOUT, stdout)
+            self.on_output(job, STREAM_STDERR, stderr)
+        if not self.workers.release(worker, job.cmd.worker):
+            self.unregister_worker(worker)
+            self.workers.remove(worker)
+        self.finish_job(job, finished)
+
+    def start_jobs(self, finished):
+        """Start queued jobs for which the slot policy grants a slot. Jobs
+        that fail to start are added to the list of finished jobs.
+
+        Parameters
+        ----------
+        finished: list(prjrepo.workflow.asyncengine.Job)
+            List of terminated jobs
+        """
+        i = 0
+        while i < len(self.queue) and i < self.slots.lookahead:
+            job = self.queue[i]
+            if not job.staged is None and not job.staged.is_set():
+                # The inputs of the job are still being staged
+                i += 1
+                continue
+            if not self.slots.acquire(job):
+                i += 1
+                continue
+            exec_components = job.exec_components
+            if exec_components is None:
+                exec_components = job.cmd_components
+            worker = None
+            if not job.cmd.worker is None:
+                prefix = job.cmd.worker.prefix
+                try:
+                    worker = self.workers.acquire(
+                        job.cmd.worker,
+                        ' '.join(exec_components[:prefix]),
+                        job.work_dir
+                    )
+                except OSError as ex:
+                    del self.queue[i]
+                    job.stderr_chunks.append(str(ex))
+                    job.returncode = -1
+                    self.finish_job(job, finished)
+                    continue
+                if worker is None:
+                    # All workers for the command are busy
+                    self.slots.cancel(job)
+                    i += 1
+                    continue
+            del self.queue[i]
+            job.state = JOB_STATE_RUNNING
+            job.start_time = time.time()
+            if not worker is None:
+                self.start_worker_job(job, worker, finished, exec_components)
+                continue
+            try:
+                job.proc = popen(' '.join(exec_components), work_dir=job.work_dir)
+            except OSError as ex:
+                job.stderr_chunks.append(str(ex))
+                job.returncode = -1
+                self.finish_job(job, finished)
+                continue
+            if not self.sampling is None:
+                job.sampler = self.sampling.sampler(job.cmd.name, job.work_dir)
+                job.sampler.start(job.proc)
+            self.open_pipes[job] = 2
+            for f, stream in [(job.proc.stdout, STREAM_STDOUT), (job.proc.stderr, STREAM_STDERR)]:
+                fd = os.dup(f.fileno())
+                f.close()
+                self.pipes[fd] = (job, stream)
+                if not self.poller is None:
+                    self.poller.register(fd, select.POLLIN | select.POLLHUP)
+
+    def stage_jobs(self):
+        """Stage the inputs of queued jobs in the order in which they were
+        queued. Runs in the staging thread until None is received. Jobs
+        whose inputs cannot be staged run with the original inputs.
+        """
+        while True:
+            job = self.staging_queue.get()
+            if job is None:
+                return
+            try:
+                job.exec_components = self.stage_inputs(
+                    job.cmd,
+                    job.cmd_components,
+                    job.work_dir
+                )
+            except Exception as ex:
+                sys.stderr.write('cannot stage inputs of ' + job.cmd.name + ': ' + str(ex) + '\n')
+            finally:
+                job.staged.set()
+
+    def start_worker_job(self, job, worker, finished, exec_components):
+        """Send a job to a persistent worker.
+
+        Parameters
+        ----------
+        job: prjrepo.workflow.asyncengine.Job
+            Job that is started
+        worker: prjrepo.workflow.workers.PersistentWorker
+            Idle worker
+        finished: list(prjrepo.workflow.asyncengine.Job)
+            List of terminated jobs
+        exec_components: list(string)
+            Executed command line components (with staged inputs)
+        """
+        worker.job = job
+        job.attempts += 1
+        if not worker.fd in self.worker_pipes:
+            self.worker_pipes[worker.fd] = worker
+            if not self.poller is None:
+                self.poller.register(worker.fd, select.POLLIN | select.POLLHUP)
+        try:
+            worker.send(exec_components[job.cmd.worker.prefix:])
+        except IOError:
+            self.lose_persistent_worker(worker, finished)
+
+    def unregister_worker(self, worker):
+        """Stop watching the STDOUT of a persistent worker.
+
+        Parameters
+        ----------
+        worker: prjrepo.workflow.workers.PersistentWorker
+            Persistent worker
+        """
+        if worker.fd in self.worker_pipes:
+            if not self.poller is None:
+                self.poller.unregister(worker.fd)
+            del self.worker_pipes[worker.fd]
+
+    def wait(self, timeout):
+        """Wait for output pipes to become readable. Returns the list of file
+        descriptors that are ready.
+
+        Parameters
+        ----------
+        timeout: float
+            Maximum time to wait (in seconds). Blocks if None.
+
+        Returns
+        -------
+        list(int)
+        """
+        if not self.poller is None:
+            ms = -1 if timeout is None else int(timeout * 1000)
+            return [fd for fd, event in self.poller.poll(ms)]
+        readable, _, _ = select.select(self.fds(), [], [], timeout)
+        return readable
+
+
+# ------------------------------------------------------------------------------
+# Helper Methods
+# ------------------------------------------------------------------------------
+
+def batch_jobs(jobs):
+    """Combine runs of commands in batch mode into batch jobs. Runs are added
+    to an open batch for the same command, working directory and values of
+    all non-batchable components. A batch is returned when it is full, when
+    the number of open batches exceeds OPEN_BATCHES, or when the given jobs
+    are exhausted. Batches with a single run are returned as the run itself.
+    Jobs of commands that are not in batch mode are passed through.
+
+    Parameters
+    ----------
+    jobs: iterable(prjrepo.workflow.asyncengine.Job)
+        Rendered jobs
+
+    Returns
+    -------
+    iterator(prjrepo.workflow.asyncengine.Job)
+    """
+    def close_batch(batch):
+        if len(batch.members) == 1:
+            return batch.members[0]
+        batch.render()
+        return batch
+    batches = OrderedDict()
+    for job in jobs:
+        if job.cmd.batch is None:
+            yield job
+            continue
+        key = tuple(
+            [job.cmd.name, job.work_dir] + [
+                job.cmd_components[i]
+                    for i in range(len(job.cmd.components))
+                        if not job.cmd.components[i].batchable
+            ]
+        )
+        batch = batches.get(key)
+        if batch is None:
+            batches[key] = BatchJob(job)
+            if len(batches) > OPEN_BATCHES:
+                yield close_batch(batches.popitem(last=False)[1])
+        else:
+            batch.add(job)
+        if len(batches[key].members) >= job.cmd.batch.max_size:
+            yield close_batch(batches.pop(key))
+    for batch in batches.values():
+        yield close_batch(batch)
@@ -1,5 +1,9 @@
 """Objects representing commands that can be executed as part of a project ."""
 
+import os
+import select
+import subprocess
+
 
 # ------------------------------------------------------------------------------
 # Constants
@@ -20,6 +24,17 @@ IO_TYPE_DIR = 'DIR'
 IO_TYPE_FILE = 'FILE'
 IO_TYPES = [IO_TYPE_DIR, IO_TYPE_FILE]
 
+"""Output types, locations of outputs, and data types for VALUE outputs."""
+OUTPUT_TYPE_VALUE = 'VALUE'
+OUTPUT_TYPES = [OUTPUT_TYPE_VALUE]
+OUTPUT_LOCATION_STDERR = 'STDERR'
+OUTPUT_LOCATION_STDOUT = 'STDOUT'
+OUTPUT_LOCATIONS = [OUTPUT_LOCATION_STDERR, OUTPUT_LOCATION_STDOUT]
+VALUE_DTYPES = ['float32', 'float64', 'int32', 'int64']
+
+"""Unit suffixes for memory sizes."""
+MEMORY_UNITS = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
 # ------------------------------------------------------------------------------
 # Command Specification
 # ------------------------------------------------------------------------------
@@ -38,8 +53,12 @@ class Command(object):
     the concatenation of all components forms the command line that executes the
     command with all arguments. In case of a SQL command, the concatenation
     of all components is the SQL statement that is being executed.
+
+    Commands optionally specify the resources (CPUs and memory) that a single
+    run requires, whether runs are handed to persistent worker processes, and
+    whether multiple runs can be combined into a single invocation.
     """
-    def __init__(self, name, command_type, components, output_spec):
+    def __init__(self, name, command_type, components, output_spec, resources=None, worker=None, batch=None):
         """Initialize the components of a command specification.
 
         Raises ValueError if an invalid command type is given.
@@ -54,7 +73,15 @@ class Command(object):
         components: list(CommandComponent)
             List of command components from which the executable command is
             being generated
-        output_spec
+        output_spec: prjrepo.workflow.command.OutputSpec
+            Description of the command output (None if not specified)
+        resources: prjrepo.workflow.command.Resources, optional
+            Resources that are required by a single run of the command
+        worker: prjrepo.workflow.command.WorkerSpec, optional
+            Persistent worker mode for the command (None if every run starts
+            a new process)
+        batch: prjrepo.workflow.command.BatchSpec, optional
+            Batch mode for the command (None if runs cannot be combined)
         """
         if not command_type in COMMAND_TYPES:
             raise ValueError('invalid command type \'' + command_type + '\'')
@@ -62,6 +89,9 @@ class Command(object):
         self.command_type = command_type
         self.components = components
         self.output_spec = output_spec
+        self.resources = resources if not resources is None else Resources()
+        self.worker = worker
+        self.batch = batch
 
     @property
     def is_exec(self):
@@ -73,6 +103,34 @@ class Command(object):
         """
         return self.command_type == COMMAND_TYPE_EXEC
 
+    def compute(self, cmd_line, settings, work_dir=None, on_start=None, on_exit=None):
+        """Execute the given command line (as generated from the command
+        components). Returns a tuple of the STDOUT and STDERR output and the
+        result code (zero for success).
+
+        Raises RuntimeError if commands of this type cannot be executed.
+
+        Parameters
+        ----------
+        cmd_line: string
+            Command line or statement generated from the command components
+        settings: prjrepo.config.context.Config
+            Execution context settings
+        work_dir: string, optional
+            Working directory for the command
+        on_start: function, optional
+            Function that is called with the process of the command after it
+            was started (for commands that run in a separate process)
+        on_exit: function, optional
+            Function that is called with the resource usage of the process
+            after it terminated (for commands that run in a separate process)
+
+        Returns
+        -------
+        (string, string, int)
+        """
+        raise RuntimeError('cannot execute command of type \'' + self.command_type + '\'')
+
     @property
     def is_sql(self):
         """Flag indicating whther this is an SQL command.
@@ -86,7 +144,7 @@ class Command(object):
 
 class ExecCommand(Command):
     """Specification of a command that runs an external executable."""
-    def __init__(self, name, components, output_spec):
+    def __init__(self, name, components, output_spec, resources=None, worker=None, batch=None):
         """Initialize the command element list and output specification.
 
         Parameters
@@ -97,18 +155,58 @@ class ExecCommand(Command):
             List of command components from which the executable command is
             being generated
         output_spec
+        resources: prjrepo.workflow.command.Resources, optional
+            Resources that are required by a single run of the command
+        worker: prjrepo.workflow.command.WorkerSpec, optional
+            Persistent worker mode for the command
+        batch: prjrepo.workflow.command.BatchSpec, optional
+            Batch mode for the command
         """
         super(ExecCommand, self).__init__(
             name,
             COMMAND_TYPE_EXEC,
             components,
-            output_spec
+            output_spec,
+            resources=resources,
+            worker=worker,
+            batch=batch
         )
 
+    def compute(self, cmd_line, settings, work_dir=None, on_start=None, on_exit=None):
+        """Run the command line in a shell. Returns a tuple of the STDOUT and
+        STDERR output and the exit code of the process.
+
+        Parameters
+        ----------
+        cmd_line: string
+            Command line generated from the command components
+        settings: prjrepo.config.context.Config
+            Execution context settings
+        work_dir: string, optional
+            Working directory for the command
+        on_start: function, optional
+            Function that is called with the process after it was started
+        on_exit: function, optional
+            Function that is called with the resource usage of the process
+            (None if not available) after it terminated
+
+        Returns
+        -------
+        (string, string, int)
+        """
+        proc = popen(cmd_line, work_dir=work_dir)
+        if not on_start is None:
+            on_start(proc)
+        stdout, stderr = read_output(proc)
+        returncode, rusage = wait_process(proc)
+        if not on_exit is None:
+            on_exit(rusage)
+        return stdout, stderr, returncode
+
 
 class SQLCommand(Command):
     """Specification for a command that executes a SQL query."""
-    def __init__(self, name, components, output_spec):
+    def __init__(self, name, components, output_spec, resources=None):
         """Initialize the command element list and output specification.
 
         Parameters
@@ -119,12 +217,15 @@ class SQLCommand(Command):
             List of command components from which the SQL statement is being
             generated
         output_spec
+        resources: prjrepo.workflow.command.Resources, optional
+            Resources that are required by a single run of the command
         """
         super(SQLCommand, self).__init__(
             name,
             COMMAND_TYPE_SQL,
             components,
-            output_spec
+            output_spec,
+            resources=resources
         )
 
 
@@ -140,8 +241,12 @@ class CommandComponent(object):
     system automatically will find the first existing file that matches the
     component value along the path from the current working directory to the
     project repository root.
+
+    Variable components of commands in batch mode can be batchable. The values
+    of batchable components of all runs in a batch are passed to a single
+    invocation of the command.
     """
-    def __init__(self, obj_type, value, io_type=None, as_input=False):
+    def __init__(self, obj_type, value, io_type=None, as_input=False, batchable=False):
         """Initialize the component type and value.
 
         Raises ValueError if an invalid element type is given. Valid type
@@ -162,10 +267,17 @@ class CommandComponent(object):
         io_type: string, optional
             IO type specifications for components that reference files or
             directories
+        as_input: bool, optional
+            Flag indicating whether the referenced resource is an input
+        batchable: bool, optional
+            Flag indicating whether values of multiple runs can be passed to
+            a single invocation (variable components only)
         """
         # Make sure that given component type is valid
         if not obj_type in COMPONENT_TYPES:
             raise ValueError('invalid component type \'' + obj_type + '\'')
+        if batchable and obj_type != COMPONENT_TYPE_VAR:
+            raise ValueError('batchable component is not a variable \'' + value + '\'')
         # Make sure that IO type is valie (if given)
         if not io_type is None:
             if not io_type in IO_TYPES:
@@ -189,6 +301,7 @@ class CommandComponent(object):
         self.io_type = io_type
         self.value = value
         self.as_input = as_input
+        self.batchable = batchable
 
     @property
     def is_const(self):
@@ -279,3 +392,273 @@ class CommandComponent(object):
                 else:
                     values.append(token)
             return ''.join(values)
+
+
+class BatchSpec(object):
+    """Batch mode for a command. Pending runs of the command that only differ
+    in the values of batchable components are combined into batches of at
+    most max_size runs. Each batch is executed by a single invocation. The
+    batched values are either placed on the command line (in order of the runs)
+    or, if arg_file is given, written to a file (one line per run with
+    tab-separated values) that is passed to the command as the argument of the
+    arg_file option.
+
+    A batch invocation has to print one line on STDOUT for each run in the
+    order of the runs. The lines become the outputs of the individual runs.
+    """
+    def __init__(self, max_size, arg_file=None):
+        """Initialize the batch settings.
+
+        Raises ValueError if the maximum batch size is not positive.
+
+        Parameters
+        ----------
+        max_size: int
+            Maximum number of runs in a batch
+        arg_file: string, optional
+            Command line option for the argument file (e.g., --args)
+        """
+        if max_size < 1:
+            raise ValueError('invalid batch size \'' + str(max_size) + '\'')
+        self.max_size = max_size
+        self.arg_file = arg_file
+
+
+class OutputSpec(object):
+    """Description of the output of a command. Currently the only output type
+    is VALUE, i.e., a single number that the command writes to STDOUT (or
+    STDERR). Values are converted to the given data type.
+    """
+    def __init__(self, output_type, location=OUTPUT_LOCATION_STDOUT, dtype='float64'):
+        """Initialize the output type, location and data type.
+
+        Raises ValueError if any of the arguments is invalid.
+
+        Parameters
+        ----------
+        output_type: string
+            Output type identifier
+        location: string, optional
+            Output stream that contains the value
+        dtype: string, optional
+            Data type of the value
+        """
+        if not output_type in OUTPUT_TYPES:
+            raise ValueError('invalid output type \'' + str(output_type) + '\'')
+        if not location in OUTPUT_LOCATIONS:
+            raise ValueError('invalid output location \'' + str(location) + '\'')
+        if not dtype in VALUE_DTYPES:
+            raise ValueError('invalid data type \'' + str(dtype) + '\'')
+        self.output_type = output_type
+        self.location = location
+        self.dtype = dtype
+
+    @property
+    def is_value(self):
+        """Flag indicating whether the output is a single value.
+
+        Returns
+        -------
+        bool
+        """
+        return self.output_type == OUTPUT_TYPE_VALUE
+
+
+class Resources(object):
+    """Resources that are required by a single run of a command. The number of
+    CPUs is used to pack concurrent runs onto the available cores. The memory
+    is the expected peak memory of a run in bytes (zero if unknown).
+    """
+    def __init__(self, cpus=1, memory=0):
+        """Initialize the number of CPUs and the memory size.
+
+        Raises ValueError if the number of CPUs is not positive or if the
+        memory size is negative.
+
+        Parameters
+        ----------
+        cpus: int, optional
+            Number of CPUs
+        memory: int, optional
+            Memory size in bytes
+        """
+        if cpus < 1:
+            raise ValueError('invalid number of cpus \'' + str(cpus) + '\'')
+        if memory < 0:
+            raise ValueError('invalid memory size \'' + str(memory) + '\'')
+        self.cpus = cpus
+        self.memory = memory
+
+
+class WorkerSpec(object):
+    """Persistent worker mode for a command. The first components of the
+    command (prefix) form the command line of a worker process that is started
+    once and then runs many jobs. The remaining components of each run are
+    sent to the worker as a Json list (one line on STDIN). The worker answers
+    with a Json object (one line on STDOUT) that contains the returncode and
+    the stdout and stderr of the run.
+
+    The engine keeps up to pool_size worker processes for each distinct
+    worker command line. Workers are replaced after max_jobs runs (zero for
+    no limit) or when they terminate.
+    """
+    def __init__(self, prefix, pool_size=1, max_jobs=0):
+        """Initialize the worker settings.
+
+        Raises ValueError if any of the arguments is invalid.
+
+        Parameters
+        ----------
+        prefix: int
+            Number of components that form the worker command line
+        pool_size: int, optional
+            Maximum number of worker processes per worker command line
+        max_jobs: int, optional
+            Number of runs after which a worker is replaced
+        """
+        if prefix < 1:
+            raise ValueError('invalid worker prefix \'' + str(prefix) + '\'')
+        if pool_size < 1:
+            raise ValueError('invalid pool size \'' + str(pool_size) + '\'')
+        if max_jobs < 0:
+            raise ValueError('invalid number of jobs \'' + str(max_jobs) + '\'')
+        self.prefix = prefix
+        self.pool_size = pool_size
+        self.max_jobs = max_jobs
+
+
+# ------------------------------------------------------------------------------
+# Helper Methods
+# ------------------------------------------------------------------------------
+
+def parse_memory(value):
+    """Convert a memory size specification into number of bytes. The value is
+    either an integer (number of bytes) or a string with an optional unit
+    suffix K, M, G, or T (e.g., '512M' or '4G').
+
+    Raises ValueError if the value cannot be converted.
+
+    Parameters
+    ----------
+    value: int or string
+        Memory size specification
+
+    Returns
+    -------
+    int
+    """
+    if isinstance(value, (int, long)):
+        return value
+    text = str(value).strip().upper()
+    if text.endswith('B'):
+        text = text[:-1]
+    factor = 1
+    if len(text) > 0 and text[-1] in MEMORY_UNITS:
+        factor = MEMORY_UNITS[text[-1]]
+        text = text[:-1]
+    try:
+        return int(float(text) * factor)
+    except ValueError:
+        raise ValueError('invalid memory size \'' + str(value) + '\'')
+
+def popen(cmd_line, work_dir=None):
+    """Start a shell process for the given command line. STDOUT and STDERR of
+    the process are captured via pipes.
+
+    Parameters
+    ----------
+    cmd_line: string
+        Command line
+    work_dir: string, optional
+        Working directory for the process
+
+    Returns
+    -------
+    subprocess.Popen
+    """
+    return subprocess.Popen(
+        cmd_line,
+        shell=True,
+        cwd=work_dir,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        close_fds=True
+    )
+
+
+def read_output(proc):
+    """Read STDOUT and STDERR of a process started with popen until both
+    pipes are closed. Unlike Popen.communicate, the process is not waited for
+    such that its resource usage can be collected with wait_process.
+
+    Parameters
+    ----------
+    proc: subprocess.Popen
+        Process that was started with popen
+
+    Returns
+    -------
+    (string, string)
+    """
+    chunks = {proc.stdout.fileno(): list(), proc.stderr.fileno(): list()}
+    fds = list(chunks.keys())
+    while len(fds) > 0:
+        readable, _, _ = select.select(fds, [], [])
+        for fd in readable:
+            data = os.read(fd, 65536)
+            if data:
+                chunks[fd].append(data)
+            else:
+                fds.remove(fd)
+    stdout = ''.join(chunks[proc.stdout.fileno()])
+    stderr = ''.join(chunks[proc.stderr.fileno()])
+    proc.stdout.close()
+    proc.stderr.close()
+    return stdout, stderr
+
+
+def rusage_dict(usage):
+    """Get the user and system CPU time (in seconds) and the maximum resident
+    set size (in kilobytes) from a resource usage structure.
+
+    Parameters
+    ----------
+    usage: resource.struct_rusage
+        Resource usage
+
+    Returns
+    -------
+    dict
+    """
+    return {
+        'utime': usage.ru_utime,
+        'stime': usage.ru_stime,
+        'maxrss': usage.ru_maxrss
+    }
+
+
+def wait_process(proc):
+    """Wait for a process to terminate. Returns the exit code and the resource
+    usage of the process. The resource usage is None if it is not available
+    (e.g., if the process was already reaped).
+
+    Parameters
+    ----------
+    proc: subprocess.Popen
+        Process that was started with popen
+
+    Returns
+    -------
+    (int, dict)
+    """
+    if proc.returncode is None:
+        try:
+            pid, status, usage = os.wait4(proc.pid, 0)
+        except OSError:
+            return proc.wait(), None
+        if os.WIFSIGNALED(status):
+            proc.returncode = -os.WTERMSIG(status)
+        else:
+            proc.returncode = os.WEXITSTATUS(status)
+        return proc.returncode, rusage_dict(usage)
+    return proc.returncode, None
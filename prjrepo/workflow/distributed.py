@@ -0,0 +1,651 @@
+"""Coordinator and worker for running commands on multiple nodes. The
+coordinator renders jobs in the execution context and hands them out to
+connected workers. Workers run the command lines and return the exit code,
+timing and captured output. Successful runs are logged by the coordinator.
+Workers are expected to share the file system with the coordinator, i.e., the
+working directory of a job is the same on all nodes.
+
+Coordinator and workers communicate over a TCP or Unix domain socket using
+Json messages (one per line):
+
+    worker -> coordinator  {"type": "hello", "name": ..., "slots": n}
+    coordinator -> worker  {"type": "job", "id": n, "cmdLine": ..., "workDir": ...}
+    worker -> coordinator  {"type": "result", "id": n, "returncode": n,
+                            "stdout": ..., "stderr": ..., "elapsed": t}
+    worker -> coordinator  {"type": "heartbeat"}
+    coordinator -> worker  {"type": "shutdown"}
+
+Captured output is base64 encoded. Workers send heartbeat messages while
+they are connected. Jobs of a worker whose connection is lost or that did not
+send any message within the heartbeat timeout are dispatched again.
+
+The protocol is not authenticated. Workers execute any command line that they
+receive, so the coordinator should only listen on trusted networks.
+"""
+
+import base64
+import json
+import os
+import select
+import socket
+import threading
+import time
+
+from prjrepo.workflow.asyncengine import AsyncWorkflowEngine
+from prjrepo.workflow.asyncengine import JOB_STATE_RUNNING, STREAM_STDERR, STREAM_STDOUT
+from prjrepo.workflow.command import popen
+
+
+# ------------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------------
+
+"""Message types."""
+MSG_HEARTBEAT = 'heartbeat'
+MSG_HELLO = 'hello'
+MSG_JOB = 'job'
+MSG_RESULT = 'result'
+MSG_SHUTDOWN = 'shutdown'
+
+"""Default number of times a job is dispatched before it is considered
+failed when workers are lost.
+"""
+DEFAULT_MAX_ATTEMPTS = 3
+
+"""Default interval (in seconds) at which workers send heartbeat messages."""
+DEFAULT_HEARTBEAT = 10.0
+
+"""Default time (in seconds) without any message from a worker after which
+the coordinator considers the worker lost.
+"""
+DEFAULT_HEARTBEAT_TIMEOUT = 60.0
+
+"""Default time (in seconds) that a worker keeps trying to connect to the
+coordinator.
+"""
+DEFAULT_RETRY = 30.0
+
+"""Number of bytes that are read from a socket at once."""
+READ_SIZE = 65536
+
+
+# ------------------------------------------------------------------------------
+# Coordinator
+# ------------------------------------------------------------------------------
+
+class Coordinator(AsyncWorkflowEngine):
+    """Workflow engine that dispatches jobs to remote workers instead of
+    running them locally. Jobs are rendered, queued and logged as in the
+    asynchronous engine. A job is started as soon as a connected worker has a
+    free slot.
+    """
+    def __init__(self, logger, address, max_attempts=DEFAULT_MAX_ATTEMPTS, on_output=None, store=None, results=None, heartbeat_timeout=DEFAULT_HEARTBEAT_TIMEOUT):
+        """Initialize the logger and start listening for workers on the given
+        address.
+
+        Parameters
+        ----------
+        logger: prjrepo.DefaultLogger
+            Logger for successful executed commands.
+        address: string
+            Address in format host:port or path of a Unix domain socket
+        max_attempts: int, optional
+            Number of times a job is dispatched if workers are lost
+        on_output: function, optional
+            Function that is called with the job, the stream identifier and the
+            data when a job produced output
+        store: prjrepo.outputs.OutputStore, optional
+            Store for STDOUT, STDERR and output files of executed commands
+        results: prjrepo.results.ResultCollector, optional
+            Collector for VALUE outputs of executed commands
+        heartbeat_timeout: float, optional
+            Time (in seconds) without any message after which a worker is
+            considered lost
+        """
+        super(Coordinator, self).__init__(
+            logger,
+            slots=WorkerSlots(),
+            on_output=on_output,
+            store=store,
+            results=results
+        )
+        self.address = address
+        self.max_attempts = max_attempts
+        self.heartbeat_timeout = heartbeat_timeout
+        self.listener = listen(address)
+        # Mapping of socket file descriptors to worker connections
+        self.connections = dict()
+        self.job_count = 0
+
+    def close(self):
+        """Send shutdown messages to all connected workers and stop
+        listening.
+        """
+        for conn in self.connections.values():
+            try:
+                conn.send({'type': MSG_SHUTDOWN})
+            except socket.error:
+                pass
+            conn.sock.close()
+        self.connections = dict()
+        self.slots.connections = list()
+        self.listener.close()
+        family, addr = parse_address(self.address)
+        if family == socket.AF_UNIX and os.path.exists(addr):
+            os.remove(addr)
+        super(Coordinator, self).close()
+
+    def fds(self):
+        """Get the file descriptors of the listening socket and of all worker
+        connections.
+
+        Returns
+        -------
+        list(int)
+        """
+        return [self.listener.fileno()] + list(self.connections.keys())
+
+    @property
+    def is_idle(self):
+        """Flag indicating that there are no queued or dispatched jobs.
+
+        Returns
+        -------
+        bool
+        """
+        if len(self.queue) > 0:
+            return False
+        for conn in self.connections.values():
+            if len(conn.jobs) > 0:
+                return False
+        return True
+
+    def poll(self, timeout=0):
+        """Dispatch queued jobs to workers with free slots, accept new worker
+        connections and process messages from workers. Waits at most timeout
+        seconds for messages. A timeout of None blocks until at least one
+        message arrived or a worker missed the heartbeat timeout. Workers that
+        missed the heartbeat timeout are removed. Returns the list of jobs
+        that terminated.
+
+        Parameters
+        ----------
+        timeout: float, optional
+            Maximum time to wait for messages (in seconds)
+
+        Returns
+        -------
+        list(prjrepo.workflow.asyncengine.Job)
+        """
+        finished = list()
+        self.start_jobs(finished)
+        if len(self.connections) > 0:
+            # Do not wait beyond the earliest heartbeat deadline
+            deadline = min([c.last_seen for c in self.connections.values()])
+            deadline += self.heartbeat_timeout
+            wait = max(0, deadline - time.time())
+            if timeout is None or timeout > wait:
+                timeout = wait
+        readable, _, _ = select.select(self.fds(), [], [], timeout)
+        for fd in readable:
+            if fd == self.listener.fileno():
+                sock, addr = self.listener.accept()
+                sock.setblocking(True)
+                conn = WorkerConnection(sock)
+                self.connections[sock.fileno()] = conn
+                continue
+            conn = self.connections.get(fd)
+            if conn is None:
+                continue
+            try:
+                messages = conn.receive()
+            except (socket.error, ValueError):
+                messages = None
+            if messages is None:
+                self.lose_worker(conn, finished)
+                continue
+            for msg in messages:
+                self.process_message(conn, msg, finished)
+        now = time.time()
+        for conn in list(self.connections.values()):
+            if now - conn.last_seen >= self.heartbeat_timeout:
+                self.lose_worker(conn, finished)
+        return finished
+
+    def submit_job(self, job):
+        """Queue a rendered job for dispatch to a worker.
+
+        Raises ValueError if the job is not an executable command or if the
+        command runs in persistent worker processes, which remote workers do
+        not support.
+
+        Parameters
+        ----------
+        job: prjrepo.workflow.asyncengine.Job
+            Rendered job
+
+        Returns
+        -------
+        prjrepo.workflow.asyncengine.Job
+        """
+        if not job.cmd.worker is None:
+            raise ValueError('cannot run persistent worker command '' + job.cmd.name + '' on remote workers')
+        return super(Coordinator, self).submit_job(job)
+
+    # --------------------------------------------------------------------------
+    # Internal helper methods
+    # --------------------------------------------------------------------------
+
+    def lose_worker(self, conn, finished):
+        """Remove a worker whose connection was lost. Jobs that were
+        dispatched to the worker are queued again unless they reached the
+        maximum number of attempts.
+
+        Parameters
+        ----------
+        conn: prjrepo.workflow.distributed.WorkerConnection
+            Lost worker connection
+        finished: list(prjrepo.workflow.asyncengine.Job)
+            List of terminated jobs
+        """
+        self.connections.pop(conn.fd, None)
+        self.slots.remove(conn)
+        conn.sock.close()
+        for job_id in sorted(conn.jobs.keys(), reverse=True):
+            job = conn.jobs.pop(job_id)
+            job.worker = None
+            if job.attempts < self.max_attempts:
+                self.queue.appendleft(job)
+            else:
+                job.stderr_chunks.append('worker lost\n')
+                job.returncode = -1
+                self.finish_job(job, finished)
+
+    def process_message(self, conn, msg, finished):
+        """Process a message from a worker.
+
+        Parameters
+        ----------
+        conn: prjrepo.workflow.distributed.WorkerConnection
+            Worker connection
+        msg: dict
+            Received message
+        finished: list(prjrepo.workflow.asyncengine.Job)
+            List of terminated jobs
+        """
+        if msg.get('type') == MSG_HELLO:
+            conn.name = msg.get('name')
+            conn.slots = max(1, int(msg.get('slots', 1)))
+            self.slots.add(conn)
+        elif msg.get('type') == MSG_RESULT:
+            job = conn.jobs.pop(msg['id'], None)
+            if job is None:
+                return
+            job.stdout_chunks = [base64.b64decode(msg.get('stdout', ''))]
+            job.stderr_chunks = [base64.b64decode(msg.get('stderr', ''))]
+            job.elapsed = msg.get('elapsed')
+            if not self.on_output is None:
+                self.on_output(job, STREAM_STDOUT, job.stdout)
+                self.on_output(job, STREAM_STDERR, job.stderr)
+            job.returncode = msg['returncode']
+            self.finish_job(job, finished)
+
+    def start_jobs(self, finished):
+        """Dispatch queued jobs to workers with free slots.
+
+        Parameters
+        ----------
+        finished: list(prjrepo.workflow.asyncengine.Job)
+            List of terminated jobs
+        """
+        while len(self.queue) > 0:
+            job = self.queue[0]
+            if not self.slots.acquire(job):
+                break
+            self.queue.popleft()
+            conn = job.worker
+            self.job_count += 1
+            job.attempts = getattr(job, 'attempts', 0) + 1
+            job.state = JOB_STATE_RUNNING
+            job.start_time = time.time()
+            conn.jobs[self.job_count] = job
+            try:
+                conn.send({
+                    'type': MSG_JOB,
+                    'id': self.job_count,
+                    'cmdLine': job.cmd_line,
+                    'workDir': job.work_dir
+                })
+            except socket.error:
+                self.lose_worker(conn, finished)
+
+
+class WorkerConnection(object):
+    """Connection to a worker. Keeps the number of slots of the worker and the
+    jobs that are currently dispatched to it.
+    """
+    def __init__(self, sock):
+        """Initialize the socket.
+
+        Parameters
+        ----------
+        sock: socket.socket
+            Connected socket
+        """
+        self.sock = sock
+        self.fd = sock.fileno()
+        self.name = None
+        self.slots = 0
+        self.jobs = dict()
+        self.buffer = ''
+        self.last_seen = time.time()
+
+    def receive(self):
+        """Read from the socket and return the list of complete messages.
+        Returns None if the connection was closed.
+
+        Raises ValueError if a message is not valid Json.
+
+        Returns
+        -------
+        list(dict)
+        """
+        data = self.sock.recv(READ_SIZE)
+        if not data:
+            return None
+        self.last_seen = time.time()
+        self.buffer += data
+        lines = self.buffer.split('\n')
+        self.buffer = lines[-1]
+        return [json.loads(line) for line in lines[:-1] if line != '']
+
+    def send(self, msg):
+        """Send a message to the worker.
+
+        Parameters
+        ----------
+        msg: dict
+            Message
+        """
+        self.sock.sendall(json.dumps(msg) + '\n')
+
+
+class WorkerSlots(object):
+    """Slot policy of the coordinator. A job can be started if any connected
+    worker has a free slot. The selected worker is assigned to the job.
+    """
+    def __init__(self):
+        """Initialize the list of worker connections."""
+        self.connections = list()
+        self.lookahead = 1
+
+    def acquire(self, job):
+        """Assign the job to the worker with the most free slots. Returns
+        False if all workers are busy.
+
+        Parameters
+        ----------
+        job: prjrepo.workflow.asyncengine.Job
+            Job that is about to be dispatched
+
+        Returns
+        -------
+        bool
+        """
+        best = None
+        for conn in self.connections:
+            free = conn.slots - len(conn.jobs)
+            if free > 0 and (best is None or free > best[0]):
+                best = (free, conn)
+        if best is None:
+            return False
+        job.worker = best[1]
+        return True
+
+    def add(self, conn):
+        """Add a worker connection.
+
+        Parameters
+        ----------
+        conn: prjrepo.workflow.distributed.WorkerConnection
+            Worker connection
+        """
+        if not conn in self.connections:
+            self.connections.append(conn)
+
+    def release(self, job):
+        """Release the worker of a terminated job. The slot is freed when the
+        job is removed from the worker's dispatched jobs.
+
+        Parameters
+        ----------
+        job: prjrepo.workflow.asyncengine.Job
+            Terminated job
+        """
+        job.worker = None
+
+    def remove(self, conn):
+        """Remove a worker connection.
+
+        Parameters
+        ----------
+        conn: prjrepo.workflow.distributed.WorkerConnection
+            Worker connection
+        """
+        if conn in self.connections:
+            self.connections.remove(conn)
+
+
+# ------------------------------------------------------------------------------
+# Worker
+# ------------------------------------------------------------------------------
+
+class Worker(object):
+    """Worker that connects to a coordinator and runs the received command
+    lines. Each job is run in a separate thread. The number of slots is the
+    maximum number of concurrent jobs. A background thread sends heartbeat
+    messages while the worker is connected.
+    """
+    def __init__(self, address, slots=1, name=None, retry=DEFAULT_RETRY, heartbeat=DEFAULT_HEARTBEAT):
+        """Initialize the coordinator address and the number of slots.
+
+        Raises ValueError if the number of slots is not positive.
+
+        Parameters
+        ----------
+        address: string
+            Address in format host:port or path of a Unix domain socket
+        slots: int, optional
+            Maximum number of concurrent jobs
+        name: string, optional
+            Worker name (defaults to host name and process id)
+        retry: float, optional
+            Time (in seconds) to keep trying to connect to the coordinator
+        heartbeat: float, optional
+            Interval (in seconds) at which heartbeat messages are sent
+        """
+        if slots < 1:
+            raise ValueError('invalid number of slots \'' + str(slots) + '\'')
+        self.address = address
+        self.slots = slots
+        if name is None:
+            name = socket.gethostname() + ':' + str(os.getpid())
+        self.name = name
+        self.retry = retry
+        self.heartbeat = heartbeat
+        self.lock = threading.Lock()
+        self.sock = None
+
+    def connect(self):
+        """Connect to the coordinator. Retries until the retry interval has
+        passed.
+
+        Raises socket.error if the coordinator is not reachable.
+
+        Returns
+        -------
+        socket.socket
+        """
+        family, addr = parse_address(self.address)
+        start = time.time()
+        while True:
+            sock = socket.socket(family, socket.SOCK_STREAM)
+            try:
+                sock.connect(addr)
+                if family == socket.AF_INET:
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+                return sock
+            except socket.error:
+                sock.close()
+                if time.time() - start >= self.retry:
+                    raise
+                time.sleep(0.1)
+
+    def run(self):
+        """Connect to the coordinator and run jobs until the coordinator
+        sends a shutdown message or closes the connection. Returns the number
+        of jobs that were run.
+
+        Returns
+        -------
+        int
+        """
+        self.sock = self.connect()
+        self.send({'type': MSG_HELLO, 'name': self.name, 'slots': self.slots})
+        stopped = threading.Event()
+        heartbeat = threading.Thread(target=self.send_heartbeats, args=(stopped,))
+        heartbeat.daemon = True
+        heartbeat.start()
+        threads = list()
+        count = 0
+        f = self.sock.makefile('r')
+        try:
+            for line in f:
+                msg = json.loads(line)
+                if msg.get('type') == MSG_JOB:
+                    thread = threading.Thread(target=self.run_job, args=(msg,))
+                    thread.daemon = True
+                    thread.start()
+                    threads = [t for t in threads if t.is_alive()] + [thread]
+                    count += 1
+                elif msg.get('type') == MSG_SHUTDOWN:
+                    break
+        finally:
+            f.close()
+            for thread in threads:
+                thread.join()
+            stopped.set()
+            heartbeat.join()
+            self.sock.close()
+        return count
+
+    def run_job(self, msg):
+        """Run a received job and send the result to the coordinator.
+
+        Parameters
+        ----------
+        msg: dict
+            Job message
+        """
+        start = time.time()
+        try:
+            proc = popen(msg['cmdLine'], work_dir=msg.get('workDir'))
+            stdout, stderr = proc.communicate()
+            returncode = proc.returncode
+        except OSError as ex:
+            stdout, stderr, returncode = '', str(ex), -1
+        try:
+            self.send({
+                'type': MSG_RESULT,
+                'id': msg['id'],
+                'returncode': returncode,
+                'stdout': base64.b64encode(stdout),
+                'stderr': base64.b64encode(stderr),
+                'elapsed': time.time() - start
+            })
+        except socket.error:
+            # The coordinator is gone. The job will be dispatched again.
+            pass
+
+    def send(self, msg):
+        """Send a message to the coordinator. Messages from concurrent jobs are
+        serialized.
+
+        Parameters
+        ----------
+        msg: dict
+            Message
+        """
+        with self.lock:
+            self.sock.sendall(json.dumps(msg) + '\n')
+
+    def send_heartbeats(self, stopped):
+        """Send heartbeat messages to the coordinator until the event is set
+        or the connection is lost.
+
+        Parameters
+        ----------
+        stopped: threading.Event
+            Event that is set when the worker disconnects
+        """
+        while not stopped.wait(self.heartbeat):
+            try:
+                self.send({'type': MSG_HEARTBEAT})
+            except socket.error:
+                return
+
+
+# ------------------------------------------------------------------------------
+# Helper Methods
+# ------------------------------------------------------------------------------
+
+def listen(address):
+    """Create a socket that listens on the given address.
+
+    Parameters
+    ----------
+    address: string
+        Address in format host:port or path of a Unix domain socket
+
+    Returns
+    -------
+    socket.socket
+    """
+    family, addr = parse_address(address)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    if family == socket.AF_INET:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    elif os.path.exists(addr):
+        os.remove(addr)
+    sock.bind(addr)
+    sock.listen(64)
+    return sock
+
+
+def parse_address(address):
+    """Get socket family and address for an address string. Addresses that
+    contain a '/' are paths of Unix domain sockets. All other addresses are
+    expected to be in format host:port.
+
+    Raises ValueError if the address is invalid.
+
+    Parameters
+    ----------
+    address: string
+        Address in format host:port or path of a Unix domain socket
+
+    Returns
+    -------
+    (int, string or (string, int))
+    """
+    if '/' in address:
+        return socket.AF_UNIX, address
+    pos = address.rfind(':')
+    if pos < 0:
+        raise ValueError('invalid address \'' + address + '\'')
+    try:
+        port = int(address[pos+1:])
+    except ValueError:
+        raise ValueError('invalid address \'' + address + '\'')
+    host = address[:pos] if pos > 0 else 'localhost'
+    return socket.AF_INET, (host, port)
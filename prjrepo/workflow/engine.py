@@ -1,25 +1,149 @@
 """Workflow command execution engine."""
 
+import os
+import sys
+import time
 
 from prjrepo.workflow.repository import DefaultCommandRepository
+from prjrepo.workflow.workers import WorkerPool
 
 
 class WorkflowEngine(object):
-    def __init__(self, logger):
-        """Initialize the command logger.
+    def __init__(self, logger, store=None, results=None, staging=None, sampling=None):
+        """Initialize the command logger and the optional stores for captured
+        command outputs and output values.
 
         Parameters
         ----------
         logger: prjrepo.DefaultLogger
             Logger for successful executed commands.
+        store: prjrepo.outputs.OutputStore, optional
+            Store for STDOUT, STDERR and output files of executed commands
+        results: prjrepo.results.ResultCollector, optional
+            Collector for VALUE outputs of executed commands
+        staging: prjrepo.staging.StagingCache, optional
+            Local cache for input files of executed commands
+        sampling: prjrepo.sampling.ResourceMonitor, optional
+            Monitor for sampling the resource usage of running commands
         """
         self.logger = logger
+        self.store = store
+        self.results = results
+        self.staging = staging
+        self.sampling = sampling
+        # Persistent workers for commands that run in worker mode
+        self.workers = WorkerPool()
+
+    def close(self):
+        """Stop all persistent workers that were started by the engine."""
+        self.workers.close()
+
+    def log_run(self, cmd, cmd_components, work_dir, stdout, stderr, arguments=None, start_time=None, end_time=None, returncode=0, rusage=None, series=None):
+        """Log a terminated run. If the engine has an output store, the
+        captured STDOUT and STDERR and all existing output files of the run
+        are added to the store and referenced from the log entry. If the
+        engine has a result collector, the output value of the run is added to
+        the results of the command. Output files and output values are only
+        collected for successful runs. Returns the identifier of the log
+        entry.
+
+        Parameters
+        ----------
+        cmd: prjrepo.workflow.command.Command
+            Specification of executed command
+        cmd_components: list(string)
+            Command line components
+        work_dir: string
+            Working directory of the run
+        stdout: string
+            Captured STDOUT
+        stderr: string
+            Captured STDERR
+        arguments: dict, optional
+            Arguments that were used to render the command
+        start_time: float, optional
+            Time when the run was started
+        end_time: float, optional
+            Time when the run terminated
+        returncode: int, optional
+            Exit code of the run
+        rusage: dict, optional
+            Resource usage of the run
+        series: string, optional
+            Name of the resource usage time series of the run
+
+        Returns
+        -------
+        string
+        """
+        if not self.results is None and returncode == 0:
+            self.results.add(cmd, arguments, stdout, stderr, work_dir=work_dir)
+        outputs = None
+        if not self.store is None:
+            outputs = {
+                'stdout': self.store.put(stdout),
+                'stderr': self.store.put(stderr)
+            }
+            files = dict()
+            for i in range(len(cmd.components)):
+                c = cmd.components[i]
+                if c.ref_file and not c.as_input and returncode == 0:
+                    filename = os.path.join(work_dir, cmd_components[i])
+                    if os.path.isfile(filename):
+                        with open(filename, 'rb') as f:
+                            files[cmd_components[i]] = self.store.put(f.read())
+            if len(files) > 0:
+                outputs['files'] = files
+        return self.logger.log(
+            cmd,
+            cmd_components,
+            outputs=outputs,
+            work_dir=work_dir,
+            arguments=arguments,
+            start_time=start_time,
+            end_time=end_time,
+            returncode=returncode,
+            rusage=rusage,
+            series=series
+        )
+
+    def render_command(self, context, cmd_name, default_values):
+        """Generate the command line components for the registered command
+        with given name. Variables are resolved using the context settings and
+        the given default values. Input files are located along the context
+        path.
+
+        Raises ValueError if the command is unknown or if a referenced variable
+        or input file does not exist.
+
+        Parameters
+        ----------
+        context: prjrepo.config.context.ContextManager
+            Execution context
+        cmd_name: string
+            Command name
+        default_values: dict
+            List of arguments that are used as default values for variables that
+            are not set in the given context
+
+        Returns
+        -------
+        (prjrepo.workflow.command.Command, prjrepo.config.context.Config, list(string))
+        """
+        # Get command specification. Will raise ValueError if command name is
+        # unknown
+        cmd = DefaultCommandRepository(context.cmd_dir).get_command(cmd_name)
+        # Get context variables
+        settings = context.context_settings()
+        return cmd, settings, render_components(context, cmd, settings, default_values)
 
     def run_command(self, context, cmd_name, default_values, print_only=False):
         """Run the registered command with given name. Provides the context for
         execution and a list of arguments that override context settings. The
         command repository is accessible via the context manager.
 
+        Raises RuntimeError if the command does not terminate successfully.
+
         Parameters
         ----------
         context: prjrepo.config.context.ContextManager
@@ -33,22 +157,155 @@ class WorkflowEngine(object):
             If True, will only print the generated command line to STDOUT but
             not execute anything.
         """
-        # Get command specification. Will raise ValueError if command name is
-        # unknown
-        cmd = DefaultCommandRepository(context.cmd_dir).get_command(cmd_name)
-        # Get context variables
-        settings = context.context_settings()
-        cmd_components = []
-        for el in cmd.components:
-            val = el.to_cmd_string(settings, default_values)
-            if el.ref_io and el.as_input:
-                val = context.locate_input_file(val, el.ref_file)
-            cmd_components.append(val)
+        cmd, settings, cmd_components = self.render_command(
+            context,
+            cmd_name,
+            default_values
+        )
         # If print_ony is True output command line and we are done
-        cmd_line = ' '.join(cmd_components)
         if print_only:
-            print cmd_line
+            print ' '.join(cmd_components)
             return
-        stdin, stdout, result = cmd.compute(cmd_line, settings)
-        if result == 0:
-            self.logger.log(cmd, cmd_components)
+        exec_components = self.stage_inputs(cmd, cmd_components, context.work_dir)
+        start_time = time.time()
+        # Runs of persistent workers are not sampled since the worker process
+        # is shared by many runs
+        series = None
+        usage = list()
+        if not cmd.worker is None:
+            stdout, stderr, result = self.run_worker_job(
+                cmd,
+                exec_components,
+                context.work_dir
+            )
+        else:
+            sampler = None
+            if not self.sampling is None:
+                sampler = self.sampling.sampler(cmd.name, context.work_dir)
+            try:
+                stdout, stderr, result = cmd.compute(
+                    ' '.join(exec_components),
+                    settings,
+                    work_dir=context.work_dir,
+                    on_start=sampler.start if not sampler is None else None,
+                    on_exit=usage.append
+                )
+            finally:
+                if not sampler is None:
+                    series = sampler.stop()
+        end_time = time.time()
+        # The resource usage of the process is collected when it is reaped
+        # (runs of persistent workers do not terminate and have none)
+        rusage = usage[0] if len(usage) > 0 else None
+        sys.stdout.write(stdout)
+        sys.stderr.write(stderr)
+        self.log_run(
+            cmd,
+            cmd_components,
+            context.work_dir,
+            stdout,
+            stderr,
+            arguments=default_values,
+            start_time=start_time,
+            end_time=end_time,
+            returncode=result,
+            rusage=rusage,
+            series=series
+        )
+        if result != 0:
+            raise RuntimeError('command \'' + cmd_name + '\' failed with exit code ' + str(result))
+
+    def run_worker_job(self, cmd, cmd_components, work_dir):
+        """Run a command in worker mode using a persistent worker. Workers that
+        terminated are removed from the pool and replaced by the next run.
+        Returns a tuple of STDOUT, STDERR and returncode.
+
+        Parameters
+        ----------
+        cmd: prjrepo.workflow.command.Command
+            Command specification
+        cmd_components: list(string)
+            Command line components
+        work_dir: string
+            Working directory
+
+        Returns
+        -------
+        (string, string, int)
+        """
+        prefix = cmd.worker.prefix
+        worker = self.workers.acquire(
+            cmd.worker,
+            ' '.join(cmd_components[:prefix]),
+            work_dir
+        )
+        result = worker.run(cmd_components[prefix:])
+        if not self.workers.release(worker, cmd.worker) or not worker.proc.poll() is None:
+            self.workers.remove(worker)
+        return result
+
+    def stage_inputs(self, cmd, cmd_components, work_dir):
+        """Get the command line components that are executed for a rendered
+        command. If the engine has a staging cache, input files and
+        directories are replaced by their staged copies. The rendered
+        components are not modified.
+
+        Parameters
+        ----------
+        cmd: prjrepo.workflow.command.Command
+            Command specification
+        cmd_components: list(string)
+            Rendered command line components
+        work_dir: string
+            Working directory
+
+        Returns
+        -------
+        list(string)
+        """
+        if self.staging is None:
+            return cmd_components
+        exec_components = list(cmd_components)
+        for i in range(min(len(cmd.components), len(cmd_components))):
+            el = cmd.components[i]
+            if el.ref_io and el.as_input:
+                exec_components[i] = self.staging.stage(
+                    os.path.join(work_dir, cmd_components[i])
+                )
+        return exec_components
+
+
+# ------------------------------------------------------------------------------
+# Helper Methods
+# ------------------------------------------------------------------------------
+
+def render_components(context, cmd, settings, default_values):
+    """Generate the command line components for a command whose
+    specification and context settings have already been read. Input files
+    are located along the context path.
+
+    Raises ValueError if a referenced variable or input file does not exist.
+
+    Parameters
+    ----------
+    context: prjrepo.config.context.ContextManager
+        Execution context
+    cmd: prjrepo.workflow.command.Command
+        Command specification
+    settings: prjrepo.config.context.Config
+        Context settings
+    default_values: dict
+        Arguments that are used as default values for variables that are not
+        set in the given context
+
+    Returns
+    -------
+    list(string)
+    """
+    cmd_components = []
+    for el in cmd.components:
+        val = el.to_cmd_string(settings, default_values)
+        if el.ref_io and el.as_input:
+            val = context.locate_input_file(val, el.ref_file)
+        cmd_components.append(val)
+    return cmd_components
@@ -0,0 +1,412 @@
+"""Streaming expansion of command lines for large parameter spaces. A command
+specification is compiled once into a template for a given execution context.
+Tokens that do not depend on the command arguments are resolved at compile
+time. Rendering a command line for an argument set then only requires lookups
+of the argument values.
+
+Parameter spaces are generators of argument sets (cartesian grid, zipped value
+lists or a stream of Json objects) so that expansion runs in constant memory.
+"""
+
+import itertools
+import json
+import operator
+
+from prjrepo.workflow.repository import DefaultCommandRepository
+
+
+# ------------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------------
+
+"""Types of template parts."""
+PART_CONST = 'CONST'
+PART_PARAM = 'PARAM'
+PART_RESOLVE = 'RESOLVE'
+
+"""Maximum number of located input files that are cached by a template."""
+INPUT_CACHE_SIZE = 4096
+
+"""Number of command lines that are written to a file at once."""
+WRITE_BATCH_SIZE = 4096
+
+
+# ------------------------------------------------------------------------------
+# Command Template
+# ------------------------------------------------------------------------------
+
+class CommandTemplate(object):
+    """Compiled command specification for an execution context. Each variable
+    token is classified as either (1) constant, i.e., the token is resolved by
+    the context settings, (2) parameter, i.e., the value is taken directly from
+    the argument set, or (3) resolve, i.e., the value is defined by a settings
+    value that references arguments and is resolved for each argument set.
+
+    If the command line only contains constant and parameter tokens and no
+    variable input files it is rendered using a single format operation.
+    """
+    def __init__(self, context, cmd_name):
+        """Compile the command with the given name for the context.
+
+        Raises ValueError if the command is unknown or if a constant input
+        file does not exist.
+
+        Parameters
+        ----------
+        context: prjrepo.config.context.ContextManager
+            Execution context
+        cmd_name: string
+            Command name
+        """
+        self.context = context
+        self.cmd = DefaultCommandRepository(context.cmd_dir).get_command(cmd_name)
+        self.settings = context.context_settings()
+        self.input_cache = dict()
+        # List of (parts, input flag, is file) for each command component
+        self.components = list()
+        for el in self.cmd.components:
+            parts = self.compile_component(el)
+            is_input = el.ref_io and el.as_input
+            if is_input and is_constant(parts):
+                value = context.locate_input_file(parts[0][1], el.ref_file)
+                parts = [(PART_CONST, value)]
+                is_input = False
+            self.components.append((parts, is_input, el.ref_file))
+        # Format string and parameter getter for the fast path
+        self.format = None
+        if all([not c[1] for c in self.components]):
+            names = list()
+            fmt = list()
+            for parts, is_input, is_file in self.components:
+                for kind, value in parts:
+                    if kind == PART_CONST:
+                        fmt.append(value.replace('%', '%%'))
+                    elif kind == PART_PARAM:
+                        fmt.append('%s')
+                        names.append(value)
+                    else:
+                        names = None
+                        break
+                if names is None:
+                    break
+                fmt.append(' ')
+            if not names is None:
+                self.format = ''.join(fmt[:-1])
+                self.names = names
+                if len(names) == 0:
+                    self.getter = lambda row: ()
+                elif len(names) == 1:
+                    self.getter = lambda row, name=names[0]: (row[name],)
+                else:
+                    self.getter = operator.itemgetter(*names)
+
+    def compile_component(self, el):
+        """Get the list of template parts for a command component. Adjacent
+        constant parts are merged.
+
+        Parameters
+        ----------
+        el: prjrepo.workflow.command.CommandComponent
+            Command component
+
+        Returns
+        -------
+        list((string, string))
+        """
+        if el.is_const:
+            return [(PART_CONST, el.value)]
+        parts = list()
+        for token in el.tokens:
+            if token.startswith('[[') and token.endswith(']]'):
+                part = self.compile_variable(token[2:-2])
+            else:
+                part = (PART_CONST, token)
+            if part[0] == PART_CONST and len(parts) > 0 and parts[-1][0] == PART_CONST:
+                parts[-1] = (PART_CONST, parts[-1][1] + part[1])
+            else:
+                parts.append(part)
+        if len(parts) == 0:
+            parts.append((PART_CONST, ''))
+        return parts
+
+    def compile_variable(self, name):
+        """Classify a variable by resolving it against the context settings
+        without any arguments and recording which arguments are requested.
+
+        Parameters
+        ----------
+        name: string
+            Variable name
+
+        Returns
+        -------
+        (string, string)
+        """
+        probe = ArgumentProbe()
+        try:
+            value = self.settings.get_value(name, default_values=probe)
+        except (ValueError, TypeError):
+            return (PART_RESOLVE, name)
+        if len(probe.requested) == 0 and not value is None:
+            if not isinstance(value, basestring):
+                value = str(value)
+            return (PART_CONST, value)
+        elif value is None and probe.requested == [name]:
+            return (PART_PARAM, name)
+        else:
+            return (PART_RESOLVE, name)
+
+    def cmd_components(self, arguments):
+        """Render the command line components for an argument set.
+
+        Raises ValueError if a referenced variable is not set or if an input
+        file does not exist.
+
+        Parameters
+        ----------
+        arguments: dict
+            Command arguments
+
+        Returns
+        -------
+        list(string)
+        """
+        result = list()
+        for parts, is_input, is_file in self.components:
+            values = list()
+            for kind, value in parts:
+                if kind == PART_CONST:
+                    values.append(value)
+                elif kind == PART_PARAM:
+                    if not value in arguments:
+                        raise ValueError('unknown variable \'' + value + '\'')
+                    values.append(arguments[value])
+                else:
+                    val = self.settings.get_value(value, default_values=arguments)
+                    if val is None:
+                        raise ValueError('unknown variable \'' + value + '\'')
+                    values.append(val)
+            val = ''.join(values)
+            if is_input:
+                val = self.locate_input_file(val, is_file)
+            result.append(val)
+        return result
+
+    def line(self, arguments):
+        """Render the command line for an argument set.
+
+        Raises ValueError if a referenced variable is not set or if an input
+        file does not exist.
+
+        Parameters
+        ----------
+        arguments: dict
+            Command arguments
+
+        Returns
+        -------
+        string
+        """
+        if not self.format is None:
+            try:
+                return self.format % self.getter(arguments)
+            except KeyError as ex:
+                raise ValueError('unknown variable \'' + str(ex.args[0]) + '\'')
+        return ' '.join(self.cmd_components(arguments))
+
+    def lines(self, argument_sets):
+        """Generator for the command lines of a sequence of argument sets.
+
+        Parameters
+        ----------
+        argument_sets: iterable(dict)
+            Arguments for individual command runs
+
+        Returns
+        -------
+        iterator(string)
+        """
+        if not self.format is None:
+            fmt = self.format
+            getter = self.getter
+            for arguments in argument_sets:
+                try:
+                    yield fmt % getter(arguments)
+                except KeyError as ex:
+                    raise ValueError('unknown variable \'' + str(ex.args[0]) + '\'')
+        else:
+            for arguments in argument_sets:
+                yield ' '.join(self.cmd_components(arguments))
+
+    def locate_input_file(self, name, is_file):
+        """Locate an input file along the context path. Results are cached
+        since the same input is often shared by many argument sets.
+
+        Parameters
+        ----------
+        name: string
+            Relative path of file or directory
+        is_file: bool
+            Flag indicating whether the resource should be a file
+
+        Returns
+        -------
+        string
+        """
+        key = (name, is_file)
+        if not key in self.input_cache:
+            if len(self.input_cache) >= INPUT_CACHE_SIZE:
+                self.input_cache.clear()
+            self.input_cache[key] = self.context.locate_input_file(name, is_file)
+        return self.input_cache[key]
+
+    def write(self, argument_sets, out):
+        """Write the command lines for a sequence of argument sets to a file.
+        Returns the number of written lines.
+
+        Parameters
+        ----------
+        argument_sets: iterable(dict)
+            Arguments for individual command runs
+        out: file
+            Output file
+
+        Returns
+        -------
+        int
+        """
+        count = 0
+        lines = self.lines(argument_sets)
+        while True:
+            batch = list(itertools.islice(lines, WRITE_BATCH_SIZE))
+            if len(batch) == 0:
+                break
+            out.write('\n'.join(batch) + '\n')
+            count += len(batch)
+        return count
+
+
+class ArgumentProbe(dict):
+    """Empty dictionary of default values that records the names of all
+    variables that are looked up.
+    """
+    def __init__(self):
+        """Initialize the list of requested variables."""
+        super(ArgumentProbe, self).__init__()
+        self.requested = list()
+
+    def __contains__(self, key):
+        self.requested.append(key)
+        return False
+
+
+# ------------------------------------------------------------------------------
+# Parameter Spaces
+# ------------------------------------------------------------------------------
+
+def grid(parameters, arguments=None):
+    """Generator for the cartesian product of parameter values. The last
+    parameter varies fastest.
+
+    Parameters
+    ----------
+    parameters: list((string, list(string)))
+        Parameter names and their values
+    arguments: dict, optional
+        Arguments that are shared by all argument sets
+
+    Returns
+    -------
+    iterator(dict)
+    """
+    names = [p[0] for p in parameters]
+    base = arguments if not arguments is None else dict()
+    for values in itertools.product(*[p[1] for p in parameters]):
+        row = dict(base)
+        row.update(itertools.izip(names, values))
+        yield row
+
+
+def read_jsonl(f, arguments=None):
+    """Generator for argument sets that are read from a stream of Json
+    objects (one per line). Values in each object override the shared
+    arguments. Non-string values are converted to strings.
+
+    Raises ValueError if a line does not contain a Json object.
+
+    Parameters
+    ----------
+    f: file
+        Input stream
+    arguments: dict, optional
+        Arguments that are shared by all argument sets
+
+    Returns
+    -------
+    iterator(dict)
+    """
+    base = arguments if not arguments is None else dict()
+    for line in f:
+        line = line.strip()
+        if line == '':
+            continue
+        obj = json.loads(line)
+        if not isinstance(obj, dict):
+            raise ValueError('invalid argument set \'' + line + '\'')
+        row = dict(base)
+        for key, value in obj.iteritems():
+            if isinstance(value, basestring):
+                row[str(key)] = value
+            else:
+                row[str(key)] = json.dumps(value)
+        yield row
+
+
+def zipped(parameters, arguments=None):
+    """Generator for argument sets that combine the i-th values of all
+    parameters. Without parameters the shared arguments are the only argument
+    set.
+
+    Raises ValueError if the value lists are not of equal length.
+
+    Parameters
+    ----------
+    parameters: list((string, list(string)))
+        Parameter names and their values
+    arguments: dict, optional
+        Arguments that are shared by all argument sets
+
+    Returns
+    -------
+    iterator(dict)
+    """
+    if len(set([len(p[1]) for p in parameters])) > 1:
+        raise ValueError('parameter value lists differ in length')
+    names = [p[0] for p in parameters]
+    base = arguments if not arguments is None else dict()
+    if len(names) == 0:
+        yield dict(base)
+        return
+    for values in itertools.izip(*[p[1] for p in parameters]):
+        row = dict(base)
+        row.update(itertools.izip(names, values))
+        yield row
+
+
+# ------------------------------------------------------------------------------
+# Helper Methods
+# ------------------------------------------------------------------------------
+
+def is_constant(parts):
+    """Test if a list of template parts contains only a single constant part.
+
+    Parameters
+    ----------
+    parts: list((string, string))
+        Template parts
+
+    Returns
+    -------
+    bool
+    """
+    return len(parts) == 1 and parts[0][0] == PART_CONST
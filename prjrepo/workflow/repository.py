@@ -88,6 +88,21 @@ class DefaultCommandRepository(CommandRepository):
         #             value: string
         #             ioType: FILE or DIR (optional)
         #             asInput: bool (optional)
+        #             batchable: bool (optional)
+        #   output: (optional)
+        #       type: VALUE
+        #       location: STDOUT or STDERR (optional)
+        #       dtype: float32, float64, int32 or int64 (optional)
+        #   resources: (optional)
+        #       cpus: int
+        #       memory: int or string (e.g., 4G)
+        #   worker: (optional)
+        #       prefix: int
+        #       poolSize: int (optional)
+        #       maxJobs: int (optional)
+        #   batch: (optional)
+        #       maxSize: int
+        #       argFile: string (optional)
         components = []
         for el in doc['spec']['components']:
             components.append(
@@ -95,13 +110,60 @@ class DefaultCommandRepository(CommandRepository):
                     el['type'],
                     el['value'],
                     io_type=el['ioType'] if 'ioType' in el else None,
-                    as_input=el['asInput'] if 'asInput' in el else False
+                    as_input=el['asInput'] if 'asInput' in el else False,
+                    batchable=el['batchable'] if 'batchable' in el else False
                 )
             )
+        output_spec = None
+        if 'output' in doc:
+            out = doc['output']
+            output_spec = cmd.OutputSpec(
+                out['type'],
+                location=out.get('location', cmd.OUTPUT_LOCATION_STDOUT),
+                dtype=out.get('dtype', 'float64')
+            )
+        resources = None
+        if 'resources' in doc:
+            res = doc['resources']
+            resources = cmd.Resources(
+                cpus=int(res['cpus']) if 'cpus' in res else 1,
+                memory=cmd.parse_memory(res['memory']) if 'memory' in res else 0
+            )
+        worker = None
+        if 'worker' in doc:
+            spec = doc['worker']
+            worker = cmd.WorkerSpec(
+                int(spec['prefix']),
+                pool_size=int(spec.get('poolSize', 1)),
+                max_jobs=int(spec.get('maxJobs', 0))
+            )
+            if worker.prefix >= len(components):
+                raise ValueError('invalid worker prefix \'' + str(worker.prefix) + '\'')
+        batch = None
+        batchable = [el for el in components if el.batchable]
+        if 'batch' in doc:
+            spec = doc['batch']
+            batch = cmd.BatchSpec(
+                int(spec['maxSize']),
+                arg_file=spec.get('argFile')
+            )
+            if len(batchable) == 0:
+                raise ValueError('no batchable components in \'' + name + '\'')
+            if not worker is None:
+                raise ValueError('batch and worker mode in \'' + name + '\'')
+        elif len(batchable) > 0:
+            raise ValueError('batchable components without batch in \'' + name + '\'')
         if doc['type'] == cmd.COMMAND_TYPE_EXEC:
-            return cmd.ExecCommand(name, components, None)
+            return cmd.ExecCommand(
+                name,
+                components,
+                output_spec,
+                resources=resources,
+                worker=worker,
+                batch=batch
+            )
         elif doc['type'] == cmd.COMMAND_TYPE_SQL:
-            return cmd.SQLCommand(name, components, None)
+            return cmd.SQLCommand(name, components, output_spec, resources=resources)
         else:
             raise RuntimeError('unknown command type \'' + doc['vartype'] + '\'')
 
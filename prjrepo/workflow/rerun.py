@@ -0,0 +1,277 @@
+"""Re-execution of logged runs. Runs are selected from the log by command
+name, time range and component values and are streamed into a workflow
+engine without loading the whole log.
+
+Runs are either replayed exactly, i.e., the recorded command line is executed
+in the recorded working directory, or they are re-resolved, i.e., the command
+is rendered again from its current specification using the current context
+settings of the working directory and the recorded arguments.
+"""
+
+import fnmatch
+import os
+import time
+
+from prjrepo.config.context import ContextManager
+from prjrepo.workflow.asyncengine import Job
+from prjrepo.workflow.repository import DefaultCommandRepository
+import prjrepo.workflow.command as cmd
+
+
+# ------------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------------
+
+"""Accepted formats for points in time (in local time)."""
+TIME_FORMATS = ['%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M', '%Y-%m-%d']
+
+
+# ------------------------------------------------------------------------------
+# Replay
+# ------------------------------------------------------------------------------
+
+class RunReplay(object):
+    """Create jobs that re-execute logged runs. Runs that cannot be
+    re-executed (e.g., runs of SQL commands or runs whose command can no
+    longer be rendered) are skipped and counted.
+    """
+    def __init__(self, engine, context, resolve=False):
+        """Initialize the engine that renders commands and the replay mode.
+
+        Parameters
+        ----------
+        engine: prjrepo.workflow.asyncengine.AsyncWorkflowEngine
+            Engine that executes the jobs
+        context: prjrepo.config.context.ContextManager
+            Context for runs without recorded working directory
+        resolve: bool, optional
+            Render commands again instead of replaying the recorded command
+            lines
+        """
+        self.engine = engine
+        self.context = context
+        self.resolve = resolve
+        self.repository = DefaultCommandRepository(context.cmd_dir)
+        self.commands = dict()
+        self.skipped = 0
+
+    def get_command(self, name):
+        """Get the current specification of a command. Returns None if the
+        command no longer exists.
+
+        Parameters
+        ----------
+        name: string
+            Command name
+
+        Returns
+        -------
+        prjrepo.workflow.command.Command
+        """
+        if not name in self.commands:
+            try:
+                self.commands[name] = self.repository.get_command(name)
+            except ValueError:
+                self.commands[name] = None
+        return self.commands[name]
+
+    def job(self, entry, callback=None):
+        """Get a job that re-executes a logged run. Returns None if the run
+        cannot be re-executed.
+
+        Parameters
+        ----------
+        entry: dict
+            Log entry
+        callback: function, optional
+            Function that is called with the job when it terminates
+
+        Returns
+        -------
+        prjrepo.workflow.asyncengine.Job
+        """
+        spec = self.get_command(entry['name'])
+        if not spec is None and not spec.is_exec:
+            return None
+        work_dir = entry.get('workDir', self.context.work_dir)
+        if not self.resolve:
+            return Job(
+                replay_command(entry, spec),
+                None,
+                [comp['value'] for comp in entry['components']],
+                work_dir,
+                arguments=entry.get('arguments'),
+                callback=callback
+            )
+        if spec is None or not os.path.isdir(work_dir):
+            return None
+        arguments = entry_arguments(entry, spec)
+        try:
+            context = ContextManager(work_dir, store=self.context.store)
+            command, settings, cmd_components = self.engine.render_command(
+                context,
+                entry['name'],
+                arguments
+            )
+        except ValueError:
+            return None
+        return Job(
+            command,
+            settings,
+            cmd_components,
+            context.work_dir,
+            arguments=arguments,
+            callback=callback
+        )
+
+    def jobs(self, entries, callback=None):
+        """Generator for jobs that re-execute the given logged runs.
+
+        Parameters
+        ----------
+        entries: iterable(dict)
+            Log entries
+        callback: function, optional
+            Function that is called for each terminated job
+
+        Returns
+        -------
+        iterator(prjrepo.workflow.asyncengine.Job)
+        """
+        for entry in entries:
+            job = self.job(entry, callback=callback)
+            if job is None:
+                self.skipped += 1
+            else:
+                yield job
+
+
+# ------------------------------------------------------------------------------
+# Helper Methods
+# ------------------------------------------------------------------------------
+
+def entry_arguments(entry, spec):
+    """Get the arguments of a logged run. For entries that do not contain
+    the arguments, values of components that consist of a single variable are
+    recovered from the recorded command line if the number of components
+    did not change.
+
+    Parameters
+    ----------
+    entry: dict
+        Log entry
+    spec: prjrepo.workflow.command.Command
+        Current command specification
+
+    Returns
+    -------
+    dict
+    """
+    if 'arguments' in entry:
+        return dict(entry['arguments'])
+    arguments = dict()
+    if len(spec.components) == len(entry['components']):
+        for el, comp in zip(spec.components, entry['components']):
+            if el.is_var and len(el.tokens) == 1 and el.tokens[0].startswith('[['):
+                arguments[el.tokens[0][2:-2]] = comp['value']
+    return arguments
+
+
+def parse_time(value):
+    """Convert a point in time into seconds since the epoch. The value is
+    either a number of seconds or a local date and time in one of the
+    TIME_FORMATS.
+
+    Raises ValueError if the value cannot be parsed.
+
+    Parameters
+    ----------
+    value: string
+        Point in time
+
+    Returns
+    -------
+    float
+    """
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    for time_format in TIME_FORMATS:
+        try:
+            return time.mktime(time.strptime(value, time_format))
+        except ValueError:
+            pass
+    raise ValueError('invalid time \'' + value + '\'')
+
+
+def replay_command(entry, spec):
+    """Get a command that executes the recorded command line of a logged run.
+    All components are constants. IO types of the recorded components are
+    kept such that outputs are captured as for the original run. Output
+    specification and resources are taken from the current specification (if
+    the command still exists).
+
+    Parameters
+    ----------
+    entry: dict
+        Log entry
+    spec: prjrepo.workflow.command.Command
+        Current command specification or None
+
+    Returns
+    -------
+    prjrepo.workflow.command.ExecCommand
+    """
+    components = list()
+    for comp in entry['components']:
+        components.append(
+            cmd.CommandComponent(
+                cmd.COMPONENT_TYPE_CONST,
+                comp['value'],
+                io_type=comp.get('io'),
+                as_input=comp.get('input') == 'True'
+            )
+        )
+    return cmd.ExecCommand(
+        entry['name'],
+        components,
+        spec.output_spec if not spec is None else None,
+        resources=spec.resources if not spec is None else None
+    )
+
+
+def select_entries(logger, command=None, since=None, until=None, match=None, stop=None):
+    """Generator for log entries that match the given filters. The log is
+    read as a stream and only segments that can contain matching entries are
+    opened.
+
+    Parameters
+    ----------
+    logger: prjrepo.log.DefaultLogger
+        Command log
+    command: string, optional
+        Only select runs of the command with given name
+    since: float, optional
+        Only select runs at or after the given time
+    until: float, optional
+        Only select runs at or before the given time
+    match: string, optional
+        Only select runs with a component value that matches the given shell
+        pattern
+    stop: int, optional
+        Number of entries at the beginning of the log that are considered
+
+    Returns
+    -------
+    iterator(dict)
+    """
+    entries = logger.entries(command=command, since=since, until=until, stop=stop)
+    for entry in entries:
+        if match is None:
+            yield entry
+            continue
+        for comp in entry['components']:
+            if fnmatch.fnmatchcase(comp['value'], match):
+                yield entry
+                break
@@ -0,0 +1,218 @@
+"""Resource-aware job slots for the event-driven workflow engine. Queued runs
+are packed onto the available cores and memory of the host based on the
+resource requirements in their command specifications.
+"""
+
+import multiprocessing
+import time
+
+from prjrepo.workflow.asyncengine import JobSlots
+
+
+# ------------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------------
+
+"""File containing information about the memory of the host."""
+MEMINFO_FILE = '/proc/meminfo'
+
+"""Minimal time (in seconds) between two reads of the live memory headroom."""
+MEMINFO_INTERVAL = 0.5
+
+"""Default number of queued jobs that are considered when packing jobs."""
+DEFAULT_LOOKAHEAD = 64
+
+"""Default number of jobs that may be started ahead of a blocked job before
+capacity is reserved for the blocked job.
+"""
+DEFAULT_MAX_SKIPS = 16
+
+
+# ------------------------------------------------------------------------------
+# Scheduler
+# ------------------------------------------------------------------------------
+
+class ResourceSlots(JobSlots):
+    """Job slots that reserve CPUs and memory for each running job. A job is
+    only started if its requirements fit into the remaining capacity. Queued
+    jobs that fit are started ahead of larger jobs at the head of the queue
+    (backfilling within a fixed lookahead). To prevent a large job from being
+    bypassed forever, the first job that does not fit is remembered as the
+    blocked job. Once max_skips other jobs have been started ahead of it, no
+    other job is started until the blocked job has been started, i.e., the
+    capacity that is released by terminating jobs is reserved for it.
+
+    In addition to the reserved capacity the live memory headroom of the host
+    is read from /proc/meminfo. A job is held back if the available memory is
+    less than the memory required by the job. A job that is larger than the
+    host capacity is started when no other job is running.
+    """
+    def __init__(self, cpus=None, memory=None, lookahead=DEFAULT_LOOKAHEAD, meminfo=MEMINFO_FILE, max_skips=DEFAULT_MAX_SKIPS):
+        """Initialize the capacity of the host. By default, all cores and the
+        currently available memory are used.
+
+        Parameters
+        ----------
+        cpus: int, optional
+            Number of available CPUs
+        memory: int, optional
+            Available memory in bytes
+        lookahead: int, optional
+            Number of queued jobs that are considered when packing jobs
+        meminfo: string, optional
+            Path to the memory information file
+        max_skips: int, optional
+            Number of jobs that may be started ahead of a blocked job
+        """
+        self.meminfo = meminfo
+        self.cpus = cpus if not cpus is None else multiprocessing.cpu_count()
+        if memory is None:
+            memory = read_mem_available(meminfo)
+        self.memory = memory
+        self.used_cpus = 0
+        self.used_memory = 0
+        self.running = 0
+        self.lookahead = lookahead
+        self.mem_available = None
+        self.mem_timestamp = 0
+        self.max_skips = max_skips
+        # Oldest job that did not fit and the number of jobs that were started
+        # ahead of it
+        self.blocked = None
+        self.skips = 0
+        # Job of the last successful acquire and the blocked job and skip
+        # count before it (restored if the job is cancelled)
+        self.acquired = None
+
+    def acquire(self, job):
+        """Reserve CPUs and memory for the given job. Returns False if the job
+        does not fit into the remaining capacity or if the capacity is
+        reserved for a blocked job.
+
+        Parameters
+        ----------
+        job: prjrepo.workflow.asyncengine.Job
+            Job that is about to be started
+
+        Returns
+        -------
+        bool
+        """
+        if not self.blocked is None and not job is self.blocked:
+            if self.skips >= self.max_skips:
+                return False
+        if not self.fits(job):
+            if self.blocked is None:
+                self.blocked = job
+                self.skips = 0
+            return False
+        self.acquired = (job, self.blocked, self.skips)
+        if job is self.blocked:
+            self.blocked = None
+        elif not self.blocked is None:
+            self.skips += 1
+        res = job.cmd.resources
+        self.used_cpus += res.cpus
+        self.used_memory += res.memory
+        self.running += 1
+        return True
+
+    def cancel(self, job):
+        """Release the resources of a job that was acquired but could not be
+        started. If the job was the last acquired job, the blocked job and
+        the number of jobs that were started ahead of it are restored, i.e.,
+        a blocked job keeps its reservation.
+
+        Parameters
+        ----------
+        job: prjrepo.workflow.asyncengine.Job
+            Queued job
+        """
+        self.release(job)
+        if not self.acquired is None and self.acquired[0] is job:
+            self.blocked, self.skips = self.acquired[1], self.acquired[2]
+            self.acquired = None
+
+    def fits(self, job):
+        """Test whether the requirements of the given job fit into the
+        remaining capacity. Any job fits if no other job is running.
+
+        Parameters
+        ----------
+        job: prjrepo.workflow.asyncengine.Job
+            Queued job
+
+        Returns
+        -------
+        bool
+        """
+        if self.running == 0:
+            return True
+        res = job.cmd.resources
+        if self.used_cpus + res.cpus > self.cpus:
+            return False
+        if res.memory > 0:
+            if not self.memory is None and self.used_memory + res.memory > self.memory:
+                return False
+            available = self.live_memory()
+            if not available is None and available < res.memory:
+                return False
+        return True
+
+    def live_memory(self):
+        """Get the currently available memory of the host. The value is read
+        at most once every MEMINFO_INTERVAL seconds. Returns None if the value
+        cannot be determined.
+
+        Returns
+        -------
+        int
+        """
+        now = time.time()
+        if now - self.mem_timestamp >= MEMINFO_INTERVAL:
+            self.mem_available = read_mem_available(self.meminfo)
+            self.mem_timestamp = now
+        return self.mem_available
+
+    def release(self, job):
+        """Release the resources that were reserved for a terminated job.
+
+        Parameters
+        ----------
+        job: prjrepo.workflow.asyncengine.Job
+            Terminated job
+        """
+        res = job.cmd.resources
+        self.used_cpus -= res.cpus
+        self.used_memory -= res.memory
+        self.running -= 1
+        # Force a fresh read of the memory headroom
+        self.mem_timestamp = 0
+
+
+# ------------------------------------------------------------------------------
+# Helper Methods
+# ------------------------------------------------------------------------------
+
+def read_mem_available(filename=MEMINFO_FILE):
+    """Read the available memory (in bytes) from the memory information file.
+    Returns None if the file does not exist or does not contain the value.
+
+    Parameters
+    ----------
+    filename: string, optional
+        Path to the memory information file
+
+    Returns
+    -------
+    int
+    """
+    try:
+        with open(filename, 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    tokens = line.split()
+                    return int(tokens[1]) * 1024
+    except IOError:
+        pass
+    return None
@@ -0,0 +1,422 @@
+"""Watch mode that re-runs command instances when the files they depend on
+change. Dependencies of a command instance are its resolved input files and
+directories, the settings files along the context path, and the command
+specification file.
+
+Changes are detected with inotify on Linux. On other platforms (or if inotify
+is not available) files are polled for changes of their modification time and
+size.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+
+# ------------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------------
+
+"""Inotify event masks."""
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_WATCH_MASK = (
+    IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+    IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+)
+
+"""Header of an inotify event (wd, mask, cookie, len)."""
+INOTIFY_EVENT = struct.Struct('iIII')
+
+"""Default time (in seconds) without further changes before instances are
+re-run.
+"""
+DEFAULT_DEBOUNCE = 0.5
+
+"""Default interval (in seconds) for the polling watcher."""
+DEFAULT_POLL_INTERVAL = 1.0
+
+
+# ------------------------------------------------------------------------------
+# Watchers
+# ------------------------------------------------------------------------------
+
+class InotifyWatcher(object):
+    """Watcher that uses the Linux inotify interface. For each watched path
+    the parent directory is watched (to detect files that are replaced by
+    editors or tools) as well as the path itself if it is a directory.
+    """
+    def __init__(self):
+        """Initialize the inotify instance.
+
+        Raises OSError if inotify is not available.
+        """
+        libc_name = ctypes.util.find_library('c')
+        if libc_name is None:
+            raise OSError('libc not found')
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self.libc, 'inotify_init'):
+            raise OSError('inotify not available')
+        self.fd = self.libc.inotify_init()
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init failed')
+        self.watches = dict()
+        self.directories = dict()
+
+    def add(self, path):
+        """Watch the given file or directory for changes.
+
+        Parameters
+        ----------
+        path: string
+            Absolute path to file or directory
+        """
+        dirs = [os.path.dirname(path)]
+        if os.path.isdir(path):
+            dirs.append(path)
+        for directory in dirs:
+            if directory in self.directories or not os.path.isdir(directory):
+                continue
+            wd = self.libc.inotify_add_watch(self.fd, directory, IN_WATCH_MASK)
+            if wd >= 0:
+                self.watches[wd] = directory
+                self.directories[directory] = wd
+
+    def close(self):
+        """Release the inotify instance."""
+        os.close(self.fd)
+
+    def wait(self, timeout=None):
+        """Wait for changes. Returns the set of changed paths (empty if the
+        timeout expired).
+
+        Parameters
+        ----------
+        timeout: float, optional
+            Maximum time to wait in seconds (blocks if None)
+
+        Returns
+        -------
+        set(string)
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        changes = set()
+        if len(readable) == 0:
+            return changes
+        buf = os.read(self.fd, 65536)
+        pos = 0
+        while pos + INOTIFY_EVENT.size <= len(buf):
+            wd, mask, cookie, length = INOTIFY_EVENT.unpack_from(buf, pos)
+            pos += INOTIFY_EVENT.size
+            name = buf[pos:pos + length].rstrip('\0')
+            pos += length
+            if not wd in self.watches:
+                continue
+            directory = self.watches[wd]
+            changes.add(os.path.join(directory, name) if name else directory)
+        return changes
+
+
+class PollingWatcher(object):
+    """Watcher that polls the modification time and size of watched files.
+    For directories the entries of the directory are polled as well.
+    """
+    def __init__(self, interval=DEFAULT_POLL_INTERVAL):
+        """Initialize the polling interval.
+
+        Parameters
+        ----------
+        interval: float, optional
+            Polling interval in seconds
+        """
+        self.interval = interval
+        self.paths = set()
+        self.snapshot = dict()
+
+    def add(self, path):
+        """Watch the given file or directory for changes.
+
+        Parameters
+        ----------
+        path: string
+            Absolute path to file or directory
+        """
+        self.paths.add(path)
+        self.snapshot.update(self.stat(path))
+
+    def close(self):
+        """Nothing to release for the polling watcher."""
+        pass
+
+    def stat(self, path):
+        """Get modification time and size for the path and (for directories)
+        all its entries.
+
+        Parameters
+        ----------
+        path: string
+            Absolute path to file or directory
+
+        Returns
+        -------
+        dict
+        """
+        result = dict()
+        paths = [path]
+        if os.path.isdir(path):
+            paths.extend([os.path.join(path, name) for name in os.listdir(path)])
+        for p in paths:
+            try:
+                st = os.stat(p)
+                result[p] = (st.st_mtime, st.st_size)
+            except OSError:
+                result[p] = None
+        return result
+
+    def wait(self, timeout=None):
+        """Wait for changes. Returns the set of changed paths (empty if the
+        timeout expired).
+
+        Parameters
+        ----------
+        timeout: float, optional
+            Maximum time to wait in seconds (blocks if None)
+
+        Returns
+        -------
+        set(string)
+        """
+        start = time.time()
+        while True:
+            snapshot = dict()
+            for path in self.paths:
+                snapshot.update(self.stat(path))
+            changes = set()
+            for path in set(snapshot.keys()) | set(self.snapshot.keys()):
+                if snapshot.get(path) != self.snapshot.get(path):
+                    changes.add(path)
+            self.snapshot = snapshot
+            if len(changes) > 0:
+                return changes
+            if not timeout is None and time.time() - start >= timeout:
+                return changes
+            if timeout is None:
+                time.sleep(self.interval)
+            else:
+                time.sleep(max(0, min(self.interval, timeout - (time.time() - start))))
+
+
+def get_watcher():
+    """Get an inotify watcher if available or a polling watcher otherwise.
+
+    Returns
+    -------
+    InotifyWatcher or PollingWatcher
+    """
+    try:
+        return InotifyWatcher()
+    except (OSError, AttributeError):
+        return PollingWatcher()
+
+
+# ------------------------------------------------------------------------------
+# Watch Runner
+# ------------------------------------------------------------------------------
+
+class WatchRunner(object):
+    """Run instances of a command and re-run them whenever their dependencies
+    change. Each instance is defined by an argument set. Changes to input
+    files only re-run the instances that use them. Changes to settings files
+    or the command specification re-render all instances and re-run those
+    whose command line changed.
+    """
+    def __init__(self, engine, context, cmd_name, argument_sets, watcher=None, debounce=DEFAULT_DEBOUNCE, callback=None):
+        """Initialize the engine and the command instances.
+
+        Parameters
+        ----------
+        engine: prjrepo.workflow.asyncengine.AsyncWorkflowEngine
+            Engine that runs the command instances
+        context: prjrepo.config.context.ContextManager
+            Execution context
+        cmd_name: string
+            Command name
+        argument_sets: list(dict)
+            Arguments for the individual command instances
+        watcher: InotifyWatcher or PollingWatcher, optional
+            Watcher for file changes
+        debounce: float, optional
+            Time without further changes before affected instances are re-run
+        callback: function, optional
+            Function that is called for each terminated job
+        """
+        self.engine = engine
+        self.context = context
+        self.cmd_name = cmd_name
+        self.argument_sets = list(argument_sets)
+        self.watcher = watcher if not watcher is None else get_watcher()
+        self.debounce = debounce
+        self.callback = callback
+        # Rendered command line and input paths for each instance
+        self.cmd_lines = [None] * len(self.argument_sets)
+        self.inputs = [list() for a in self.argument_sets]
+        # Settings and command specification files shared by all instances
+        self.shared = set()
+
+    def affected(self, changes):
+        """Get the indexes of all instances that are affected by the given
+        changed paths. Returns None if a shared dependency changed.
+
+        Parameters
+        ----------
+        changes: set(string)
+            Changed paths
+
+        Returns
+        -------
+        list(int)
+        """
+        if len(changes & self.shared) > 0:
+            return None
+        result = list()
+        for i in range(len(self.inputs)):
+            for path in self.inputs[i]:
+                if is_affected(path, changes):
+                    result.append(i)
+                    break
+        return result
+
+    def collect_changes(self, timeout=None):
+        """Wait for changes and collect further changes until there has been
+        no change for the debounce interval.
+
+        Parameters
+        ----------
+        timeout: float, optional
+            Maximum time to wait for the first change (blocks if None)
+
+        Returns
+        -------
+        set(string)
+        """
+        changes = self.watcher.wait(timeout)
+        if len(changes) == 0:
+            return changes
+        while True:
+            more = self.watcher.wait(self.debounce)
+            if len(more) == 0:
+                return changes
+            changes |= more
+
+    def render(self, indexes, only_changed=False):
+        """Render the given instances and register their dependencies with
+        the watcher. Returns the list of rendered jobs. If only_changed is
+        True, instances whose command line did not change are skipped.
+
+        Parameters
+        ----------
+        indexes: list(int)
+            Instance indexes
+        only_changed: bool, optional
+            Skip instances with unchanged command line
+
+        Returns
+        -------
+        list(prjrepo.workflow.asyncengine.Job)
+        """
+        jobs = list()
+        cmd_file = os.path.join(self.context.cmd_dir, self.cmd_name + '.yaml')
+        self.shared = set([cmd_file] + [f for key, f in self.context.get_context_files()])
+        for path in self.shared:
+            self.watcher.add(path)
+        for i in indexes:
+            try:
+                job = next(self.engine.jobs(
+                    self.context,
+                    self.cmd_name,
+                    [self.argument_sets[i]],
+                    callback=self.callback
+                ))
+            except ValueError as ex:
+                sys.stderr.write('cannot render ' + self.cmd_name + ': ' + str(ex) + '\n')
+                continue
+            inputs = list()
+            for j in range(len(job.cmd.components)):
+                c = job.cmd.components[j]
+                if c.ref_io and c.as_input:
+                    path = os.path.normpath(
+                        os.path.join(self.context.work_dir, job.cmd_components[j])
+                    )
+                    inputs.append(path)
+                    self.watcher.add(path)
+            self.inputs[i] = inputs
+            if only_changed and self.cmd_lines[i] == job.cmd_line:
+                continue
+            self.cmd_lines[i] = job.cmd_line
+            jobs.append(job)
+        return jobs
+
+    def run(self, iterations=None, timeout=None):
+        """Run all instances and re-run affected instances on changes. Runs
+        until interrupted unless a maximum number of change iterations is
+        given. The timeout limits the time to wait for each change.
+
+        Parameters
+        ----------
+        iterations: int, optional
+            Maximum number of change iterations
+        timeout: float, optional
+            Maximum time to wait for changes in seconds
+        """
+        self.engine.run(self.render(range(len(self.argument_sets))))
+        count = 0
+        while iterations is None or count < iterations:
+            count += 1
+            changes = self.collect_changes(timeout)
+            if len(changes) == 0:
+                continue
+            indexes = self.affected(changes)
+            if indexes is None:
+                jobs = self.render(range(len(self.argument_sets)), only_changed=True)
+            else:
+                jobs = self.render(indexes)
+            self.engine.run(jobs)
+
+
+# ------------------------------------------------------------------------------
+# Helper Methods
+# ------------------------------------------------------------------------------
+
+def is_affected(path, changes):
+    """Test if a dependency path is affected by any of the changed paths. A
+    directory is affected by changes to any of its entries.
+
+    Parameters
+    ----------
+    path: string
+        Dependency path
+    changes: set(string)
+        Changed paths
+
+    Returns
+    -------
+    bool
+    """
+    if path in changes:
+        return True
+    prefix = path + os.sep
+    for change in changes:
+        if change.startswith(prefix):
+            return True
+    return False
@@ -0,0 +1,286 @@
+"""Persistent worker processes for commands with expensive startup (e.g., a
+JVM). A worker is started once with the prefix of the rendered command line
+and then runs many jobs. Jobs are exchanged over the worker's STDIN and STDOUT
+using one Json document per line:
+
+    request:  ["arg1", "arg2", ...]
+    response: {"returncode": 0, "stdout": "...", "stderr": "..."}
+
+Lines on STDOUT that are not Json objects are added to the STDERR of the
+current job. The STDERR of the worker process itself is not captured.
+"""
+
+import json
+import os
+import subprocess
+import time
+
+
+# ------------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------------
+
+"""Time (in seconds) that a worker has to terminate after its STDIN was
+closed before it is killed.
+"""
+CLOSE_TIMEOUT = 1.0
+
+"""Number of bytes that are read from a worker's STDOUT at once."""
+READ_SIZE = 65536
+
+
+# ------------------------------------------------------------------------------
+# Workers
+# ------------------------------------------------------------------------------
+
+class PersistentWorker(object):
+    """Worker process that runs one job at a time."""
+    def __init__(self, cmd_line, work_dir=None):
+        """Start the worker process.
+
+        Raises OSError if the process cannot be started.
+
+        Parameters
+        ----------
+        cmd_line: string
+            Command line that starts the worker
+        work_dir: string, optional
+            Working directory of the worker
+        """
+        self.cmd_line = cmd_line
+        self.work_dir = work_dir
+        # Replace the shell so that the worker can be terminated directly
+        self.proc = subprocess.Popen(
+            'exec ' + cmd_line,
+            shell=True,
+            cwd=work_dir,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            close_fds=True
+        )
+        self.fd = self.proc.stdout.fileno()
+        # Job that the worker is currently running and number of jobs that
+        # were sent to the worker.
+        self.job = None
+        self.jobs = 0
+        self.buffer = ''
+        self.messages = list()
+
+    def close(self):
+        """Close the worker's STDIN and wait for the process to terminate. The
+        process is terminated if it does not exit within CLOSE_TIMEOUT.
+        """
+        try:
+            self.proc.stdin.close()
+        except IOError:
+            pass
+        start = time.time()
+        while self.proc.poll() is None and time.time() - start < CLOSE_TIMEOUT:
+            time.sleep(0.01)
+        if self.proc.poll() is None:
+            try:
+                self.proc.terminate()
+            except OSError:
+                pass
+        self.proc.wait()
+        self.proc.stdout.close()
+
+    def feed(self, data):
+        """Add data that was read from the worker's STDOUT. Returns the
+        response for the current job once it is complete and None otherwise.
+        Lines that are not Json objects are collected in messages.
+
+        Parameters
+        ----------
+        data: string
+            Data read from STDOUT
+
+        Returns
+        -------
+        dict
+        """
+        self.buffer += data
+        while '\n' in self.buffer:
+            line, self.buffer = self.buffer.split('\n', 1)
+            try:
+                response = json.loads(line)
+            except ValueError:
+                response = None
+            if isinstance(response, dict):
+                return response
+            self.messages.append(line + '\n')
+        return None
+
+    def run(self, args):
+        """Run a job and wait for the response. Returns a tuple of STDOUT,
+        STDERR and returncode of the job.
+
+        Parameters
+        ----------
+        args: list(string)
+            Job arguments
+
+        Returns
+        -------
+        (string, string, int)
+        """
+        try:
+            self.send(args)
+        except IOError as ex:
+            return '', str(ex), -1
+        while True:
+            data = os.read(self.fd, READ_SIZE)
+            if not data:
+                return '', ''.join(self.messages) + 'worker terminated\n', -1
+            response = self.feed(data)
+            if not response is None:
+                return parse_response(response, self.take_messages())
+
+    def send(self, args):
+        """Send the arguments of a job to the worker.
+
+        Raises IOError if the worker is no longer running.
+
+        Parameters
+        ----------
+        args: list(string)
+            Job arguments
+        """
+        self.jobs += 1
+        self.proc.stdin.write(json.dumps(args) + '\n')
+        self.proc.stdin.flush()
+
+    def take_messages(self):
+        """Get and clear the non-protocol lines that the worker printed.
+
+        Returns
+        -------
+        string
+        """
+        messages = ''.join(self.messages)
+        self.messages = list()
+        return messages
+
+
+class WorkerPool(object):
+    """Pools of persistent workers. There is a separate pool for each distinct
+    worker command line and working directory.
+    """
+    def __init__(self):
+        """Initialize the empty pools."""
+        self.pools = dict()
+
+    def acquire(self, spec, cmd_line, work_dir):
+        """Get an idle worker for the given command line. A new worker is
+        started if all workers are busy and the pool is not full. Returns None
+        if no worker is available.
+
+        Raises OSError if a worker cannot be started.
+
+        Parameters
+        ----------
+        spec: prjrepo.workflow.command.WorkerSpec
+            Worker settings of the command
+        cmd_line: string
+            Command line that starts the worker
+        work_dir: string
+            Working directory of the worker
+
+        Returns
+        -------
+        prjrepo.workflow.workers.PersistentWorker
+        """
+        key = (cmd_line, work_dir)
+        pool = self.pools.setdefault(key, list())
+        for worker in pool:
+            if worker.job is None:
+                return worker
+        if len(pool) < spec.pool_size:
+            worker = PersistentWorker(cmd_line, work_dir=work_dir)
+            pool.append(worker)
+            return worker
+        return None
+
+    @property
+    def busy(self):
+        """Number of workers that are running a job.
+
+        Returns
+        -------
+        int
+        """
+        count = 0
+        for pool in self.pools.values():
+            count += len([w for w in pool if not w.job is None])
+        return count
+
+    def close(self):
+        """Stop all workers."""
+        for pool in self.pools.values():
+            for worker in pool:
+                worker.close()
+        self.pools = dict()
+
+    def release(self, worker, spec):
+        """Mark a worker as idle after it finished a job. Returns False if the
+        worker reached the maximum number of jobs and should be removed.
+
+        Parameters
+        ----------
+        worker: prjrepo.workflow.workers.PersistentWorker
+            Worker that finished a job
+        spec: prjrepo.workflow.command.WorkerSpec
+            Worker settings of the command
+
+        Returns
+        -------
+        bool
+        """
+        worker.job = None
+        return spec.max_jobs == 0 or worker.jobs < spec.max_jobs
+
+    def remove(self, worker):
+        """Stop a worker and remove it from its pool.
+
+        Parameters
+        ----------
+        worker: prjrepo.workflow.workers.PersistentWorker
+            Worker that is removed
+        """
+        pool = self.pools.get((worker.cmd_line, worker.work_dir), list())
+        if worker in pool:
+            pool.remove(worker)
+        worker.close()
+
+
+# ------------------------------------------------------------------------------
+# Helper Methods
+# ------------------------------------------------------------------------------
+
+def parse_response(response, messages=''):
+    """Get STDOUT, STDERR and returncode from a worker response. Messages are
+    lines that the worker printed outside of the protocol. They are prepended
+    to STDERR.
+
+    Parameters
+    ----------
+    response: dict
+        Worker response
+    messages: string, optional
+        Non-protocol output of the worker
+
+    Returns
+    -------
+    (string, string, int)
+    """
+    stdout = response.get('stdout', '')
+    stderr = response.get('stderr', '')
+    if isinstance(stdout, unicode):
+        stdout = stdout.encode('utf-8')
+    if isinstance(stderr, unicode):
+        stderr = stderr.encode('utf-8')
+    try:
+        returncode = int(response.get('returncode', 0))
+    except (TypeError, ValueError):
+        returncode = -1
+    return stdout, messages + stderr, returncode
@@ -13,5 +13,6 @@ setup(
     license='GPLv3',
     packages=['prjrepo'],
     package_data={'': ['LICENSE']},
-    install_requires=['pyyaml']
+    install_requires=['pyyaml'],
+    extras_require={'results': ['numpy']}
 )
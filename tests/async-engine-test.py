@@ -0,0 +1,103 @@
+import shutil
+import unittest
+
+from prjrepo.config.context import ContextManager
+from prjrepo.journal import RunJournal
+from prjrepo.log import DefaultLogger
+from prjrepo.workflow.asyncengine import AsyncWorkflowEngine
+
+from helpers import create_project, exec_command
+
+
+class TestAsyncWorkflowEngine(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a project with an echo command and a command that fails."""
+        self.base_dir = create_project(commands={
+            name: exec_command([
+                {'type': 'CONST', 'value': executable},
+                {'type': 'VAR', 'value': '[[value]]'}
+            ])
+            for name, executable in [('echo', 'echo'), ('fail', 'false')]
+        })
+        self.context = ContextManager(self.base_dir)
+        self.logger = DefaultLogger(self.context.log_file)
+
+    def tearDown(self):
+        """Remove the temporary project repository."""
+        shutil.rmtree(self.base_dir)
+
+    def test_run_jobs(self):
+        """Run multiple jobs concurrently and capture their output."""
+        engine = AsyncWorkflowEngine(self.logger, max_jobs=3)
+        outputs = dict()
+        def callback(job):
+            outputs[job.arguments['value']] = job.stdout
+        argument_sets = [{'value': str(i)} for i in range(10)]
+        success, failed = engine.run(
+            engine.jobs(self.context, 'echo', argument_sets, callback=callback)
+        )
+        self.assertEquals(success, 10)
+        self.assertEquals(failed, 0)
+        self.assertTrue(engine.is_idle)
+        for i in range(10):
+            self.assertEquals(outputs[str(i)], str(i) + '\n')
+        self.assertEquals(len(self.logger.lines()), 10)
+
+    def test_failed_jobs(self):
+        """Failed jobs are reported and logged with their exit code. Only
+        readers that ask for failed runs see them.
+        """
+        engine = AsyncWorkflowEngine(self.logger, max_jobs=2)
+        job = engine.submit(self.context, 'fail', {'value': '1'})
+        engine.submit(self.context, 'echo', {'value': '1'})
+        success, failed = engine.run()
+        self.assertEquals(success, 1)
+        self.assertEquals(failed, 1)
+        self.assertFalse(job.succeeded)
+        self.assertNotEquals(job.returncode, 0)
+        self.assertEquals(self.logger.lines(), ['echo echo 1'])
+        entries = [e for e in self.logger.entries(failed=True) if e['name'] == 'fail']
+        self.assertEquals(len(entries), 1)
+        self.assertEquals(entries[0]['returncode'], job.returncode)
+
+    def test_render_once(self):
+        """The command and the context settings are read once for all
+        jobs of a sweep.
+        """
+        engine = AsyncWorkflowEngine(self.logger)
+        calls = list()
+        render_command = engine.render_command
+        def counting_render(*args):
+            calls.append(args)
+            return render_command(*args)
+        engine.render_command = counting_render
+        jobs = list(engine.jobs(self.context, 'echo', [{'value': str(i)} for i in range(5)]))
+        self.assertEquals(len(calls), 1)
+        self.assertEquals([j.cmd_line for j in jobs], ['echo ' + str(i) for i in range(5)])
+        self.assertTrue(all([j.settings is jobs[0].settings for j in jobs]))
+
+    def test_resume_with_journal(self):
+        """Runs that are recorded in the journal are skipped on resume."""
+        journal = RunJournal(self.context.journal_file('test'))
+        engine = AsyncWorkflowEngine(self.logger, max_jobs=2)
+        argument_sets = [{'value': str(i)} for i in range(5)]
+        engine.run(
+            engine.jobs(
+                self.context,
+                'echo',
+                argument_sets[:3],
+                callback=journal.record
+            )
+        )
+        journal = RunJournal(self.context.journal_file('test'))
+        self.assertEquals(len(journal), 3)
+        success, failed = engine.run(
+            journal.filter(engine.jobs(self.context, 'echo', argument_sets))
+        )
+        self.assertEquals(success, 2)
+        self.assertEquals(journal.skipped, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
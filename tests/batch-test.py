@@ -0,0 +1,139 @@
+import os
+import shutil
+import unittest
+
+import prjrepo.config as conf
+from prjrepo.config.context import ContextManager
+from prjrepo.log import DefaultLogger
+from prjrepo.workflow.asyncengine import AsyncWorkflowEngine
+from prjrepo.workflow.repository import DefaultCommandRepository
+
+from helpers import create_project, exec_command, write_command
+
+
+"""Batch-capable script that prints one line for each value. Values are read
+from an argument file if the option --args is given. Each invocation is
+recorded in the file 'calls' and each argument file in the file 'args'. The
+value 'skip' does not produce any output.
+"""
+BATCH_SCRIPT = '''prefix=$1
+shift
+echo call >> calls
+if [ "$1" = "--args" ]; then
+    echo "$2" >> args
+    while read v; do echo "$prefix $v"; done < "$2"
+else
+    for v in "$@"; do [ "$v" = skip ] || echo "$prefix $v"; done
+fi
+'''
+
+
+class TestBatchJobs(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a project with a batch script that is run by two commands,
+        one with inline arguments and one with an argument file.
+        """
+        self.base_dir = create_project()
+        script = os.path.join(self.base_dir, 'batch.sh')
+        with open(script, 'w') as f:
+            f.write(BATCH_SCRIPT)
+        self.cmd_dir = os.path.join(self.base_dir, conf.REPO_DIR, conf.COMMAND_DIR)
+        for name, arg_file in [('inline', None), ('file', '--args')]:
+            batch = {'maxSize': 3}
+            if not arg_file is None:
+                batch['argFile'] = arg_file
+            write_command(self.base_dir, name, exec_command([
+                {'type': 'CONST', 'value': 'sh'},
+                {'type': 'CONST', 'value': script},
+                {'type': 'VAR', 'value': '[[prefix]]'},
+                {'type': 'VAR', 'value': '[[value]]', 'batchable': True}
+            ], batch=batch))
+        self.context = ContextManager(self.base_dir)
+        self.logger = DefaultLogger(self.context.log_file)
+
+    def tearDown(self):
+        """Remove the temporary project repository."""
+        shutil.rmtree(self.base_dir)
+
+    def calls(self):
+        """Number of invocations of the batch script."""
+        with open(os.path.join(self.base_dir, 'calls')) as f:
+            return len(f.readlines())
+
+    def run_batches(self, cmd_name, argument_sets):
+        """Run the given command and return the terminated runs."""
+        engine = AsyncWorkflowEngine(self.logger, max_jobs=2)
+        runs = list()
+        success, failed = engine.run(
+            engine.jobs(
+                self.context,
+                cmd_name,
+                argument_sets,
+                callback=runs.append
+            )
+        )
+        self.assertEquals(success + failed, len(argument_sets))
+        return runs
+
+    def test_batch_command_spec(self):
+        """Batchable components require a command in batch mode."""
+        repo = DefaultCommandRepository(self.cmd_dir)
+        cmd = repo.get_command('file')
+        self.assertEquals(cmd.batch.max_size, 3)
+        self.assertEquals(cmd.batch.arg_file, '--args')
+        self.assertEquals([el.batchable for el in cmd.components], [False] * 3 + [True])
+        write_command(self.base_dir, 'invalid', exec_command([
+            {'type': 'VAR', 'value': '[[value]]', 'batchable': True}
+        ]))
+        with self.assertRaises(ValueError):
+            repo.get_command('invalid')
+
+    def test_failed_batch(self):
+        """All runs of a batch fail if the output does not match."""
+        argument_sets = [{'prefix': 'a', 'value': v} for v in ['1', 'skip', '2']]
+        runs = self.run_batches('inline', argument_sets)
+        self.assertEquals(self.calls(), 1)
+        self.assertEquals(len(runs), 3)
+        for job in runs:
+            self.assertFalse(job.succeeded)
+            self.assertTrue('expected 3 output lines but got 2' in job.stderr)
+        self.assertEquals(len(self.logger.lines()), 0)
+
+    def test_inline_batches(self):
+        """Runs with the same constant values are combined into batches."""
+        argument_sets = list()
+        for i in range(10):
+            argument_sets.append({'prefix': 'ab'[i % 2], 'value': str(i)})
+        runs = self.run_batches('inline', argument_sets)
+        # Five runs for each prefix in batches of at most three runs
+        self.assertEquals(self.calls(), 4)
+        outputs = dict([(job.arguments['value'], job.stdout) for job in runs])
+        for i in range(10):
+            self.assertEquals(outputs[str(i)], 'ab'[i % 2] + ' ' + str(i) + '\n')
+        self.assertTrue(all([job.succeeded for job in runs]))
+        # Each run is logged individually with its own command line
+        lines = sorted(self.logger.lines())
+        self.assertEquals(len(lines), 10)
+        self.assertTrue(lines[0].endswith(' a 0'))
+
+    def test_argument_file(self):
+        """Batched values are passed in an argument file in the working
+        directory.
+        """
+        argument_sets = [{'prefix': 'x', 'value': str(i)} for i in range(3)]
+        runs = self.run_batches('file', argument_sets)
+        self.assertEquals(self.calls(), 1)
+        self.assertEquals(
+            sorted([job.stdout for job in runs]),
+            ['x 0\n', 'x 1\n', 'x 2\n']
+        )
+        with open(os.path.join(self.base_dir, 'args')) as f:
+            arg_file = f.read().strip()
+        self.assertEquals(os.path.dirname(arg_file), os.path.abspath(self.base_dir))
+        # The argument file is removed
+        self.assertFalse(os.path.exists(arg_file))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -45,6 +45,14 @@ class TestCommandRepository(unittest.TestCase):
         self.assertFalse(cmd.components[2].ref_file)
         self.assertFalse(cmd.components[2].ref_dir)
         self.assertFalse(cmd.components[2].as_input)
+        self.assertEquals(cmd.resources.cpus, 4)
+        self.assertEquals(cmd.resources.memory, 2 * 1024 ** 3)
+
+    def test_default_resources(self):
+        """Commands without resource specification require a single CPU."""
+        cmd = self.repo.get_command('list-datasets')
+        self.assertEquals(cmd.resources.cpus, 1)
+        self.assertEquals(cmd.resources.memory, 0)
 
 
 if __name__ == '__main__':
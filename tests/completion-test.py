@@ -0,0 +1,89 @@
+import os
+import shutil
+import unittest
+
+import prjrepo.config as conf
+from prjrepo.completion import CompletionIndex, completion_script
+from prjrepo.config.context import ContextManager
+
+from helpers import create_project, exec_command, write_command
+
+
+class TestCompletionIndex(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a project with a simulation command, a project setting and
+        a context in the sub-folder sub.
+        """
+        self.base_dir = create_project()
+        self.project_dir = os.path.join(self.base_dir, conf.REPO_DIR)
+        self.write_command('sim', ['[[eq1]]', '--out=[[out]]/[[eq1]]'])
+        context = ContextManager(self.base_dir)
+        context.project_settings().update_value('data.dir', value='/data')
+        sub_dir = os.path.join(self.base_dir, 'sub')
+        os.mkdir(sub_dir)
+        context = ContextManager(sub_dir)
+        context.create_context()
+        context.context_settings().update_value('eq1', value='1')
+
+    def tearDown(self):
+        """Remove the temporary project repository."""
+        shutil.rmtree(self.base_dir)
+
+    def write_command(self, name, values):
+        """Write an EXEC command with the given variable components."""
+        filename = write_command(self.base_dir, name, exec_command(
+            [{'type': 'CONST', 'value': 'sim'}] + [
+                {'type': 'VAR', 'value': value} for value in values
+            ]
+        ))
+        # Make sure that the modification is detected
+        os.utime(filename, (0, os.path.getmtime(filename) + 1))
+
+    def test_complete(self):
+        """Completion candidates for partial command lines."""
+        index = CompletionIndex(self.project_dir)
+        index.refresh()
+        commands = ['context', 'project', 'run']
+        self.assertEquals(index.complete(['r'], commands), ['run'])
+        self.assertEquals(index.complete(['run', ''], commands), ['sim'])
+        self.assertEquals(
+            index.complete(['run', '--jobs', '2', 'sim', ''], commands),
+            ['eq1=', 'out=']
+        )
+        self.assertEquals(index.complete(['run', 'sim', 'o'], commands), ['out='])
+        self.assertEquals(index.complete(['context', ''], commands), ['data.dir', 'eq1'])
+        self.assertEquals(index.complete(['project', ''], commands), ['data.dir'])
+        self.assertEquals(index.complete(['log', ''], commands), [])
+
+    def test_incremental_refresh(self):
+        """Only changed files are parsed and the index is only rewritten if
+        it changed.
+        """
+        index = CompletionIndex(self.project_dir)
+        self.assertTrue(index.refresh())
+        self.assertEquals(index.commands(), ['sim'])
+        self.assertEquals(index.variables('sim'), ['eq1', 'out'])
+        self.assertFalse(CompletionIndex(self.project_dir).refresh())
+        self.write_command('sim', ['[[eq2]]'])
+        self.write_command('new', ['[[x]]'])
+        index = CompletionIndex(self.project_dir)
+        self.assertTrue(index.refresh())
+        self.assertEquals(index.commands(), ['new', 'sim'])
+        self.assertEquals(index.variables('sim'), ['eq2'])
+        os.remove(os.path.join(self.project_dir, conf.COMMAND_DIR, 'new.yaml'))
+        index = CompletionIndex(self.project_dir)
+        self.assertTrue(index.refresh())
+        self.assertEquals(CompletionIndex(self.project_dir).commands(), ['sim'])
+
+    def test_completion_script(self):
+        """Completion scripts reference the program name."""
+        script = completion_script('bash', 'prm', ['run'])
+        self.assertTrue('complete -F _prm prm' in script)
+        self.assertTrue(completion_script('zsh', 'prm', ['run']).startswith('autoload'))
+        with self.assertRaises(ValueError):
+            completion_script('fish', 'prm', ['run'])
+
+
+if __name__ == '__main__':
+    unittest.main()
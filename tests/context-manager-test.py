@@ -1,10 +1,12 @@
+import copy
 import os
 import unittest
 import yaml
 
 
 import prjrepo.config as conf
-from prjrepo.config.context import ContextManager
+from prjrepo.config.context import ContextManager, SettingsChain
+from prjrepo.config.context import get_settings_value, merge_settings, nested_merge
 from prjrepo.workflow.repository import DefaultCommandRepository
 
 
@@ -27,6 +29,29 @@ class TestContextManager(unittest.TestCase):
         with open(os.path.join(PROJECT_DIR, conf.CONTEXTLIST_FILE), 'w') as f:
             f.write('db\tA.yaml\n')
 
+    def test_context_tree(self):
+        """Effective settings for all contexts match the merged settings."""
+        context_dir = os.path.join(PROJECT_DIR, conf.CONTEXT_DIR)
+        with open(os.path.join(context_dir, 'B.yaml'), 'w') as f:
+            yaml.dump({'c' : {'x': 3}}, f, default_flow_style=False)
+        contexts = {'db': 'A.yaml', 'db/sub': 'B.yaml', 'db/sub/x': 'C.yaml', 'x': 'B.yaml'}
+        tree = list(ContextManager(WORK_DIR).context_tree(contexts=contexts))
+        self.assertEquals([path for path, _ in tree], ['', 'db', 'db/sub', 'db/sub/x', 'x'])
+        settings = dict(tree)
+        self.assertEquals(settings[''], {'a' : 1, 'b': 2})
+        self.assertEquals(settings['db'], {'a' : 1, 'b': 1, 'c': 2})
+        self.assertEquals(settings['db/sub'], {'a' : 1, 'b': 1, 'c': {'x': 3}})
+        self.assertEquals(settings['db/sub/x'], settings['db/sub'])
+        self.assertEquals(settings['x'], {'a' : 1, 'b': 2, 'c': {'x': 3}})
+        self.assertEquals(dict(ContextManager(WORK_DIR).context_tree())['db'], settings['db'])
+        # Merging does not modify the parent or the child
+        parent = {'a': {'x': 1, 'y': 2}, 'b': {'x': 1}}
+        child = {'a': {'y': 3}, 'b': 'B'}
+        merged = merge_settings(parent, child)
+        self.assertEquals(parent, {'a': {'x': 1, 'y': 2}, 'b': {'x': 1}})
+        self.assertEquals(child, {'a': {'y': 3}, 'b': 'B'})
+        self.assertEquals(merged, nested_merge(nested_merge(dict(), parent), child))
+
     def test_create_context(self):
         """Test creation of new context in sub-folder"""
         context = ContextManager(SUB_DIR)
@@ -55,6 +80,28 @@ class TestContextManager(unittest.TestCase):
         with self.assertRaises(ValueError):
             ContextManager('..')
 
+    def test_layered_settings(self):
+        """Test lookup in layered settings against merged settings."""
+        project = {'a': {'x': 1, 'y': 2}, 'b': {'x': 1}, 'c': 'C'}
+        context = {'a': {'y': 3}, 'b': 'B', 'c': {'x': 4}}
+        chain = SettingsChain([context, project])
+        merged = nested_merge(
+            nested_merge(dict(), copy.deepcopy(project)),
+            copy.deepcopy(context)
+        )
+        self.assertEquals(chain.to_dict(), merged)
+        # The layers are not modified
+        self.assertEquals(project, {'a': {'x': 1, 'y': 2}, 'b': {'x': 1}, 'c': 'C'})
+        self.assertEquals(context, {'a': {'y': 3}, 'b': 'B', 'c': {'x': 4}})
+        for para in ['a.x', 'a.y', 'b', 'c.x', 'd', 'a.z']:
+            self.assertEquals(
+                get_settings_value(chain, para),
+                get_settings_value(merged, para)
+            )
+        for para in ['a', 'b.x', 'c']:
+            with self.assertRaises(ValueError):
+                get_settings_value(chain, para)
+
     def test_list_context_commands(self):
         """Command to execute SQL query that lists datasets."""
         for directory in [WORK_DIR, SUB_DIR]:
@@ -0,0 +1,162 @@
+import json
+import os
+import shutil
+import socket
+import threading
+import unittest
+
+from prjrepo.config.context import ContextManager
+from prjrepo.log import DefaultLogger
+from prjrepo.workflow.distributed import DEFAULT_HEARTBEAT, Coordinator, Worker, parse_address
+
+from helpers import create_project, exec_command, write_command
+
+
+class TestDistributedEngine(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a project with commands for successful and failing jobs and
+        the address of the coordinator socket.
+        """
+        self.base_dir = create_project(commands={
+            name: exec_command([
+                {'type': 'CONST', 'value': executable},
+                {'type': 'VAR', 'value': '[[value]]'}
+            ])
+            for name, executable in [('echo', 'echo'), ('fail', 'false')]
+        })
+        self.context = ContextManager(self.base_dir)
+        self.logger = DefaultLogger(self.context.log_file)
+        self.address = os.path.join(self.base_dir, 'coordinator.sock')
+
+    def tearDown(self):
+        """Remove the temporary project repository."""
+        shutil.rmtree(self.base_dir)
+
+    def start_workers(self, count, slots=2, heartbeat=DEFAULT_HEARTBEAT):
+        """Start the given number of workers in background threads."""
+        threads = list()
+        for i in range(count):
+            worker = Worker(
+                self.address,
+                slots=slots,
+                name='w' + str(i),
+                retry=5,
+                heartbeat=heartbeat
+            )
+            thread = threading.Thread(target=worker.run)
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        return threads
+
+    def test_run_jobs(self):
+        """Run jobs on multiple workers and log successful runs."""
+        engine = Coordinator(self.logger, self.address)
+        threads = self.start_workers(3)
+        outputs = dict()
+        def callback(job):
+            outputs[job.arguments['value']] = job.stdout
+        argument_sets = [{'value': str(i)} for i in range(20)]
+        jobs = list(engine.jobs(self.context, 'echo', argument_sets, callback=callback))
+        jobs.append(next(engine.jobs(self.context, 'fail', [{'value': '1'}])))
+        success, failed = engine.run(jobs)
+        engine.close()
+        for thread in threads:
+            thread.join(5)
+            self.assertFalse(thread.is_alive())
+        self.assertEquals(success, 20)
+        self.assertEquals(failed, 1)
+        for i in range(20):
+            self.assertEquals(outputs[str(i)], str(i) + '\n')
+        self.assertEquals(len(self.logger.lines()), 20)
+
+    def test_worker_loss(self):
+        """Jobs of a lost worker are dispatched to other workers."""
+        engine = Coordinator(self.logger, self.address)
+        received = list()
+        workers = list()
+        def lost_worker():
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.address)
+            sock.sendall(json.dumps({'type': 'hello', 'name': 'lost', 'slots': 4}) + '\n')
+            f = sock.makefile('r')
+            received.append(json.loads(f.readline()))
+            f.close()
+            sock.close()
+            workers.extend(self.start_workers(1))
+        thread = threading.Thread(target=lost_worker)
+        thread.daemon = True
+        thread.start()
+        argument_sets = [{'value': str(i)} for i in range(5)]
+        success, failed = engine.run(engine.jobs(self.context, 'echo', argument_sets))
+        engine.close()
+        for worker in workers:
+            worker.join(5)
+        self.assertEquals(received[0]['type'], 'job')
+        self.assertEquals(success, 5)
+        self.assertEquals(failed, 0)
+        self.assertEquals(
+            sorted(self.logger.lines()),
+            ['echo echo ' + str(i) for i in range(5)]
+        )
+
+    def test_worker_timeout(self):
+        """Jobs of a worker that stops sending messages are dispatched to
+        other workers.
+        """
+        engine = Coordinator(self.logger, self.address, heartbeat_timeout=0.5)
+        received = list()
+        workers = list()
+        def silent_worker():
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.address)
+            sock.sendall(json.dumps({'type': 'hello', 'name': 'silent', 'slots': 4}) + '\n')
+            f = sock.makefile('r')
+            received.append(json.loads(f.readline()))
+            workers.extend(self.start_workers(1, heartbeat=0.05))
+            # The connection is closed by the coordinator
+            while f.readline() != '':
+                pass
+            received.append(None)
+            f.close()
+            sock.close()
+        thread = threading.Thread(target=silent_worker)
+        thread.daemon = True
+        thread.start()
+        argument_sets = [{'value': str(i)} for i in range(5)]
+        success, failed = engine.run(engine.jobs(self.context, 'echo', argument_sets))
+        engine.close()
+        thread.join(5)
+        for worker in workers:
+            worker.join(5)
+        self.assertEquals(received[0]['type'], 'job')
+        self.assertIsNone(received[-1])
+        self.assertEquals(success, 5)
+        self.assertEquals(failed, 0)
+
+    def test_worker_command(self):
+        """Commands that run in persistent worker processes are rejected."""
+        write_command(self.base_dir, 'serve', exec_command(
+            [{'type': 'CONST', 'value': 'serve'}, {'type': 'VAR', 'value': '[[value]]'}],
+            worker={'prefix': 1}
+        ))
+        engine = Coordinator(self.logger, self.address)
+        try:
+            with self.assertRaises(ValueError):
+                engine.run(engine.jobs(self.context, 'serve', [{'value': '1'}]))
+        finally:
+            engine.close()
+        self.assertEquals(self.logger.count(), 0)
+
+    def test_parse_address(self):
+        """Test parsing of TCP and Unix socket addresses."""
+        self.assertEquals(parse_address('host:8000'), (socket.AF_INET, ('host', 8000)))
+        self.assertEquals(parse_address(':8000'), (socket.AF_INET, ('localhost', 8000)))
+        self.assertEquals(parse_address('/tmp/sock'), (socket.AF_UNIX, '/tmp/sock'))
+        with self.assertRaises(ValueError):
+            parse_address('host')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import shutil
+import unittest
+import yaml
+
+import prjrepo.config as conf
+from prjrepo.config.context import ContextManager
+from prjrepo.log import DefaultLogger
+from prjrepo.workflow.engine import WorkflowEngine
+from prjrepo.workflow.expand import CommandTemplate, grid, read_jsonl, zipped
+
+from helpers import create_project, exec_command
+
+
+class TestCommandTemplate(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a project whose commands mix constant, parameter and
+        resolved variables with input files.
+        """
+        self.base_dir = create_project(commands={
+            'cmd': exec_command([
+                {'type': 'CONST', 'value': 'echo'},
+                {'type': 'VAR', 'value': '[[tool]]-[[x]]%'},
+                {'type': 'VAR', 'value': '--y=[[y]]'},
+                {'type': 'VAR', 'value': '[[data.file]]', 'ioType': 'FILE', 'asInput': True}
+            ]),
+            'out': exec_command([
+                {'type': 'CONST', 'value': 'echo'},
+                {'type': 'VAR', 'value': '[[out]]'},
+                {'type': 'VAR', 'value': '[[name]]', 'ioType': 'FILE', 'asInput': True}
+            ])
+        })
+        settings_file = os.path.join(self.base_dir, conf.REPO_DIR, conf.SETTINGS_FILE)
+        with open(settings_file, 'w') as f:
+            yaml.dump({
+                'tool': 'run',
+                'out': 'result-[[x]].txt',
+                'data': {'file': 'in.txt'}
+            }, f, default_flow_style=False)
+        for name in ['in.txt', 'a.txt', 'b.txt']:
+            open(os.path.join(self.base_dir, name), 'w').close()
+        self.context = ContextManager(self.base_dir)
+        self.engine = WorkflowEngine(DefaultLogger(self.context.log_file))
+
+    def tearDown(self):
+        """Remove the temporary project repository."""
+        shutil.rmtree(self.base_dir)
+
+    def render(self, cmd_name, arguments):
+        """Render a command line using the workflow engine."""
+        cmd, settings, comps = self.engine.render_command(
+            self.context,
+            cmd_name,
+            arguments
+        )
+        return ' '.join(comps)
+
+    def test_expand(self):
+        """Template lines match the command lines of the workflow engine."""
+        for cmd_name, parameters in [
+            ('cmd', [('x', ['1', '2', '3']), ('y', ['a', 'b'])]),
+            ('out', [('x', ['1', '2']), ('name', ['a.txt', 'b.txt'])])
+        ]:
+            template = CommandTemplate(self.context, cmd_name)
+            rows = list(grid(parameters))
+            self.assertEquals(len(rows), 6 if cmd_name == 'cmd' else 4)
+            lines = list(template.lines(rows))
+            self.assertEquals(lines, [self.render(cmd_name, r) for r in rows])
+        template = CommandTemplate(self.context, 'cmd')
+        self.assertEquals(template.line({'x': '1', 'y': '2'}), 'echo run-1% --y=2 in.txt')
+        with self.assertRaises(ValueError):
+            template.line({'x': '1'})
+        with self.assertRaises(ValueError):
+            CommandTemplate(self.context, 'out').line({'x': '1', 'name': 'c.txt'})
+
+    def test_parameter_spaces(self):
+        """Test grid, zipped and Json parameter spaces."""
+        parameters = [('x', ['1', '2']), ('y', ['a', 'b'])]
+        rows = list(grid(parameters, {'z': '0'}))
+        self.assertEquals(
+            [(r['x'], r['y'], r['z']) for r in rows],
+            [('1', 'a', '0'), ('1', 'b', '0'), ('2', 'a', '0'), ('2', 'b', '0')]
+        )
+        rows = list(zipped(parameters))
+        self.assertEquals([(r['x'], r['y']) for r in rows], [('1', 'a'), ('2', 'b')])
+        self.assertEquals(list(zipped([], {'z': '0'})), [{'z': '0'}])
+        with self.assertRaises(ValueError):
+            list(zipped([('x', ['1']), ('y', ['a', 'b'])]))
+        rows = list(read_jsonl(['{"x": 1}', '', '{"x": "2", "y": "b"}'], {'y': 'a'}))
+        self.assertEquals(rows, [{'x': '1', 'y': 'a'}, {'x': '2', 'y': 'b'}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import shutil
+import StringIO
+import tempfile
+import unittest
+
+import prjrepo.config as conf
+from prjrepo.config.context import ContextManager
+from prjrepo.foreach import foreach
+
+from helpers import create_project
+
+
+class TestForeach(unittest.TestCase):
+
+    def setUp(self):
+        """Create a directory with three project repositories. Repository c
+        is nested in a sub-folder. Repositories in hidden directories and
+        inside other repositories are not part of the tree.
+        """
+        self.root = tempfile.mkdtemp()
+        for name in ['a', 'b', os.path.join('sub', 'c'), '.hidden', os.path.join('a', 'nested')]:
+            directory = os.path.join(self.root, name)
+            os.makedirs(directory)
+            if name != os.path.join('a', 'nested'):
+                create_project(directory)
+        for name in ['a', 'b', os.path.join('sub', 'c')]:
+            ContextManager(os.path.join(self.root, name)).project_settings().update_value(
+                'name',
+                value=os.path.basename(name)
+            )
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        shutil.rmtree(self.root)
+
+    def test_failure_isolation(self):
+        """An unexpected error in one repository is reported for that
+        repository only.
+        """
+        with open(os.path.join(self.root, 'b', conf.REPO_DIR, conf.SETTINGS_FILE), 'w') as f:
+            f.write('name: [unclosed\n')
+        out = StringIO.StringIO()
+        directories = conf.find_repositories(self.root)
+        failed = foreach('prm', directories, ['project'], processes=2, out=out)
+        self.assertEquals(failed, 1)
+        lines = out.getvalue().splitlines()
+        for name in ['a', os.path.join('sub', 'c')]:
+            prefix = os.path.relpath(os.path.join(self.root, name)) + ': '
+            self.assertTrue(prefix + 'name: ' + os.path.basename(name) in lines)
+        errors = [l for l in lines if '(ERROR)' in l]
+        self.assertEquals(len(errors), 1)
+        self.assertTrue(os.path.relpath(os.path.join(self.root, 'b')) + ': ' in errors[0])
+
+    def test_find_repositories(self):
+        """Repositories are found in a single walk, skipping hidden
+        directories and the inside of repositories.
+        """
+        self.assertEquals(
+            conf.find_repositories(self.root),
+            [os.path.join(self.root, d) for d in ['a', 'b', os.path.join('sub', 'c')]]
+        )
+        with self.assertRaises(ValueError):
+            conf.find_repositories(os.path.join(self.root, 'unknown'))
+
+
+if __name__ == '__main__':
+    unittest.main()
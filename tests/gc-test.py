@@ -0,0 +1,90 @@
+import os
+import shutil
+import tarfile
+import unittest
+
+from prjrepo.config.context import ContextManager, read_contexts
+from prjrepo.config.gc import collect_garbage
+from prjrepo.config.migrate import migrate_to_store
+
+from helpers import create_project
+
+
+class TestGarbageCollection(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a project with the contexts a, b and c."""
+        self.base_dir = create_project()
+        for name in ['a', 'b', 'c']:
+            work_dir = os.path.join(self.base_dir, name)
+            os.mkdir(work_dir)
+            context = ContextManager(work_dir)
+            context.create_context()
+            context.context_settings().update_value('name', value=name)
+        self.context = ContextManager(self.base_dir)
+
+    def tearDown(self):
+        """Remove the temporary project repository."""
+        shutil.rmtree(self.base_dir)
+
+    def test_collect_garbage(self):
+        """Dead and duplicate entries and orphaned files are removed."""
+        contexts = read_contexts(self.context.contextls_file)
+        os.rmdir(os.path.join(self.base_dir, 'b'))
+        with open(self.context.contextls_file, 'a') as f:
+            f.write('c\tnew.yaml\n')
+        shutil.copy(
+            os.path.join(self.context.context_dir, contexts['c']),
+            os.path.join(self.context.context_dir, 'new.yaml')
+        )
+        report = collect_garbage(self.context, dry_run=True)
+        self.assertEquals(report.entries_before, 4)
+        self.assertEquals(report.entries_after, 2)
+        self.assertEquals(len(read_contexts(self.context.contextls_file)), 3)
+        report = collect_garbage(self.context, archive=True)
+        self.assertEquals(report.dead_entries, 1)
+        self.assertEquals(report.duplicate_entries, 1)
+        self.assertEquals(sorted(report.orphan_files), sorted([contexts['b'], contexts['c']]))
+        self.assertEquals(
+            read_contexts(self.context.contextls_file),
+            {'a': contexts['a'], 'c': 'new.yaml'}
+        )
+        self.assertEquals(
+            sorted(os.listdir(self.context.context_dir)),
+            sorted([contexts['a'], 'new.yaml'])
+        )
+        with tarfile.open(report.archive_file) as tar:
+            self.assertEquals(sorted(tar.getnames()), sorted(report.orphan_files))
+        settings = ContextManager(os.path.join(self.base_dir, 'c')).context_settings()
+        self.assertEquals(settings.get_value('name'), 'c')
+        # A second run does not find any garbage
+        report = collect_garbage(self.context)
+        self.assertEquals(report.entries_before, report.entries_after)
+        self.assertEquals(len(report.orphan_files), 0)
+
+    def test_collect_store_garbage(self):
+        """Contexts of deleted directories are removed from the settings
+        store.
+        """
+        migrate_to_store(self.context)
+        os.rmdir(os.path.join(self.base_dir, 'b'))
+        report = collect_garbage(self.context, dry_run=True)
+        self.assertEquals(report.dead_contexts, ['b'])
+        self.assertEquals((report.entries_before, report.entries_after), (3, 2))
+        self.assertEquals(self.context.store.contexts(), set(['a', 'b', 'c']))
+        report = collect_garbage(self.context, archive=True)
+        self.assertEquals(report.dead_contexts, ['b'])
+        self.assertEquals((report.entries_before, report.entries_after), (3, 2))
+        self.assertEquals(self.context.store.contexts(), set(['a', 'c']))
+        self.assertEquals(self.context.store.read(''), dict())
+        with tarfile.open(report.archive_file) as tar:
+            self.assertEquals(tar.getnames(), ['b.yaml'])
+            self.assertEquals(tar.extractfile('b.yaml').read(), 'name: b\n')
+        settings = ContextManager(os.path.join(self.base_dir, 'c')).context_settings()
+        self.assertEquals(settings.get_value('name'), 'c')
+        report = collect_garbage(self.context)
+        self.assertEquals(report.dead_contexts, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
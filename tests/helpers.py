@@ -0,0 +1,83 @@
+"""Helper methods that set up temporary project repositories for the test
+cases.
+"""
+
+import os
+import tempfile
+import yaml
+
+import prjrepo.config as conf
+
+
+def create_project(base_dir=None, commands=None):
+    """Initialize a project repository in the given directory and write the
+    given command specifications to its command directory. Creates a new
+    temporary directory if no base directory is given.
+
+    Parameters
+    ----------
+    base_dir: string, optional
+        Directory for the project repository
+    commands: dict, optional
+        Command specifications keyed by the command name
+
+    Returns
+    -------
+    string
+    """
+    if base_dir is None:
+        base_dir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    os.chdir(base_dir)
+    try:
+        conf.init_repository()
+    finally:
+        os.chdir(cwd)
+    if not commands is None:
+        for name in commands:
+            write_command(base_dir, name, commands[name])
+    return base_dir
+
+
+def exec_command(components, **options):
+    """Get the specification of an EXEC command with the given components.
+    Additional top-level elements of the specification (e.g., batch or
+    worker) are given as keyword arguments.
+
+    Parameters
+    ----------
+    components: list(dict)
+        Specifications of the command components
+    options: dict
+        Additional elements of the command specification
+
+    Returns
+    -------
+    dict
+    """
+    spec = {'type': 'EXEC', 'spec': {'components': components}}
+    spec.update(options)
+    return spec
+
+
+def write_command(base_dir, name, spec):
+    """Write a command specification to the command directory of the project
+    in the given directory. Returns the name of the written file.
+
+    Parameters
+    ----------
+    base_dir: string
+        Directory of the project repository
+    name: string
+        Command name
+    spec: dict
+        Command specification
+
+    Returns
+    -------
+    string
+    """
+    filename = os.path.join(base_dir, conf.REPO_DIR, conf.COMMAND_DIR, name + '.yaml')
+    with open(filename, 'w') as f:
+        yaml.dump(spec, f, default_flow_style=False)
+    return filename
@@ -0,0 +1,123 @@
+import os
+import shutil
+import unittest
+
+from prjrepo.config.context import ContextManager
+from prjrepo.impact import DependencyGraph, invalidate, settings_references
+from prjrepo.journal import RunJournal
+from prjrepo.results import ResultCollector
+
+from helpers import create_project, exec_command
+
+
+class TestDependencyGraph(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a project with a train and a plot command. Context a
+        overrides the plot output and context b fixes the model.
+        """
+        self.base_dir = create_project(commands={
+            name: exec_command([{'type': 'CONST', 'value': name}] + [
+                {'type': 'VAR', 'value': value} for value in values
+            ])
+            for name, values in [('train', ['[[data.dir]]/[[model]]']), ('plot', ['[[out]]'])]
+        })
+        self.context = ContextManager(self.base_dir)
+        settings = self.context.project_settings()
+        settings.update_value('data.dir', value='/data')
+        settings.update_value('model', value='[[name]]-[[version]]')
+        settings.update_value('out', value='plot.png')
+        for name, para, value in [('a', 'out', '[[model]].png'), ('b', 'model', 'fixed')]:
+            os.mkdir(os.path.join(self.base_dir, name))
+            context = ContextManager(os.path.join(self.base_dir, name))
+            context.create_context()
+            context.context_settings().update_value(para, value=value)
+
+    def tearDown(self):
+        """Remove the temporary project repository."""
+        shutil.rmtree(self.base_dir)
+
+    def test_impact(self):
+        """Affected commands are derived from the effective settings of each
+        context.
+        """
+        graph = DependencyGraph(self.context)
+        self.assertEquals(
+            list(graph.impact('version')),
+            [('', ['train']), ('a', ['plot', 'train'])]
+        )
+        self.assertEquals(
+            list(graph.impact('data')),
+            [('', ['train']), ('a', ['train']), ('b', ['train'])]
+        )
+        self.assertEquals(list(graph.impact('unknown')), [])
+        self.assertEquals(
+            settings_references({'a': {'b': 'x[[c]]y[[d.e]]'}, 'c': 1}),
+            {'a.b': ['c', 'd.e']}
+        )
+
+    def test_shadowed_variable(self):
+        """Contexts that define the changed variable themselves are not
+        affected by a change in an ancestor, including their descendants.
+        """
+        for name, para, value in [('c', 'version', '2'), ('c/d', 'out', '[[model]]'), ('e', 'data.dir', '/e')]:
+            os.mkdir(os.path.join(self.base_dir, name))
+            context = ContextManager(os.path.join(self.base_dir, name))
+            context.create_context()
+            context.context_settings().update_value(para, value=value)
+        graph = DependencyGraph(self.context)
+        self.assertEquals(
+            list(graph.impact('version')),
+            [('', ['train']), ('a', ['plot', 'train']), ('e', ['train'])]
+        )
+        # A descendant value shadows changes of its ancestor
+        self.assertEquals(
+            list(graph.impact('data')),
+            [('', ['train']), ('a', ['train']), ('b', ['train']), ('c', ['train']), ('c/d', ['train'])]
+        )
+        # Changes in a context only affect its subtree
+        self.assertEquals(
+            list(graph.impact('version', path='c')),
+            [('c', ['train']), ('c/d', ['plot', 'train'])]
+        )
+        self.assertEquals(list(graph.impact('out', path='c')), [('c', ['plot'])])
+
+    def test_invalidate(self):
+        """Result rows and journal entries of affected commands are removed
+        for runs in contexts where the command is affected.
+        """
+        dir_a = os.path.join(self.base_dir, 'a')
+        dir_b = os.path.join(self.base_dir, 'b')
+        collector = ResultCollector(self.context.results_dir)
+        train = [self.base_dir, dir_a, dir_b, os.path.join(dir_a, 'sub'), None]
+        for i in range(len(train)):
+            collector.table('train').add({'x': str(i)}, float(i), work_dir=train[i])
+        collector.table('plot').add({'x': '0'}, 0.0, work_dir=dir_a)
+        collector.table('plot').add({'x': '1'}, 1.0, work_dir=dir_b)
+        collector.close()
+        journal = RunJournal(self.context.journal_file('sweep'))
+        journal.add('k1', 'train', work_dir=dir_a)
+        journal.add('k2', 'train', work_dir=dir_b)
+        journal.add('k3', 'plot', work_dir=dir_b)
+        journal.add('k4', 'train')
+        # Context b shadows the variable that depends on version
+        impact = list(DependencyGraph(self.context).impact('version'))
+        self.assertEquals(invalidate(self.context, impact), (5, 2))
+        self.assertEquals(RunJournal(journal.filename).keys, {'k2': 'train', 'k3': 'plot'})
+        collector = ResultCollector(self.context.results_dir)
+        columns = dict(collector.table('train').columns())
+        self.assertEquals(list(columns['value']), [2.0])
+        self.assertEquals(list(columns['arg.x']), ['2'])
+        columns = dict(collector.table('plot').columns())
+        self.assertEquals(list(columns['value']), [1.0])
+        self.assertEquals(list(columns['arg.x']), ['1'])
+        # Rows can be added after removal
+        collector.table('train').add({'x': '5'}, 5.0, work_dir=dir_a)
+        collector.close()
+        columns = dict(ResultCollector(self.context.results_dir).table('train').columns())
+        self.assertEquals(list(columns['arg.x']), ['2', '5'])
+        self.assertEquals(invalidate(self.context, impact), (1, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
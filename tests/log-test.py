@@ -0,0 +1,111 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from prjrepo.log import DefaultLogger
+from prjrepo.workflow.command import CommandComponent, ExecCommand
+
+
+class TestDefaultLogger(unittest.TestCase):
+
+    def setUp(self):
+        """Create an empty log file in a temporary directory."""
+        self.base_dir = tempfile.mkdtemp()
+        self.log_file = os.path.join(self.base_dir, 'LOG')
+        open(self.log_file, 'a').close()
+        self.commands = [
+            ExecCommand(name, [CommandComponent('VAR', '[[x]]')], None)
+            for name in ['A', 'B']
+        ]
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        shutil.rmtree(self.base_dir)
+
+    def test_compaction_while_reading(self):
+        """Segments are opened when they are read. Segments that are merged
+        by compaction while the log is read are read from the merged
+        segment. Segments that cannot contain matching entries are not
+        opened.
+        """
+        logger = DefaultLogger(self.log_file, max_size=None)
+        for i in range(9):
+            logger.log(self.commands[i // 6], [str(i)])
+            if i % 3 == 2:
+                logger.rotate()
+        values = lambda entries: [e['components'][0]['value'] for e in entries]
+        reader = logger.entries()
+        self.assertEquals(next(reader)['components'][0]['value'], '0')
+        logger.compact()
+        self.assertEquals(len(logger.segments()), 1)
+        self.assertEquals(values(reader), [str(i) for i in range(1, 9)])
+        reader = logger.entries(start=4)
+        self.assertEquals(next(reader)['components'][0]['value'], '4')
+        logger.rotate()
+        self.assertEquals(values(reader), [str(i) for i in range(5, 9)])
+        # Segments of other commands are not opened
+        os.mkdir(os.path.join(self.base_dir, 'other'))
+        logger = DefaultLogger(os.path.join(self.base_dir, 'other', 'LOG'), max_size=None)
+        open(logger.filename, 'a').close()
+        for i in range(9):
+            logger.log(self.commands[i // 6], [str(i)])
+            if i % 3 == 2:
+                logger.rotate()
+        for segment in logger.segments()[:2]:
+            os.remove(os.path.join(logger.segment_dir, segment['file']))
+        self.assertEquals(values(logger.entries(command='B')), ['6', '7', '8'])
+
+    def test_interrupted_rotation(self):
+        """Entries that were rotated but not truncated from the active log
+        file are read once and removed by the next rotation.
+        """
+        logger = DefaultLogger(self.log_file, max_size=None)
+        for i in range(3):
+            logger.log(self.commands[0], [str(i)])
+        with open(self.log_file, 'r') as f:
+            data = f.read()
+        logger.rotate()
+        # Simulate a crash after the manifest was written
+        with open(self.log_file, 'w') as f:
+            f.write(data)
+        logger.log(self.commands[1], ['3'])
+        lines = [self.commands[i // 3].name + ' ' + str(i) for i in range(4)]
+        self.assertEquals(logger.lines(), lines)
+        self.assertEquals(logger.count(), 4)
+        logger.rotate()
+        self.assertEquals(os.path.getsize(self.log_file), 0)
+        self.assertEquals([s['entries'] for s in logger.segments()], [3, 1])
+        self.assertEquals(logger.lines(), lines)
+        logger.compact()
+        self.assertEquals(logger.lines(), lines)
+
+    def test_segmented_log(self):
+        """Log entries are read across segments in order of creation."""
+        logger = DefaultLogger(self.log_file, max_size=500)
+        for i in range(50):
+            logger.log(self.commands[i // 25], [str(i)])
+        segments = logger.segments()
+        self.assertTrue(len(segments) > 1)
+        self.assertEquals(sum([s['entries'] for s in segments]) + len(open(self.log_file).readlines()), 50)
+        lines = logger.lines()
+        self.assertEquals(lines, [self.commands[i // 25].name + ' ' + str(i) for i in range(50)])
+        entries = list(logger.entries(command='B'))
+        self.assertEquals(len(entries), 25)
+        # Entries at or after the stop position are not read
+        entries = list(logger.entries(command='B', stop=30))
+        self.assertEquals([e['components'][0]['value'] for e in entries], [str(i) for i in range(25, 30)])
+        entries = list(logger.entries(start=10, stop=12))
+        self.assertEquals([e['components'][0]['value'] for e in entries], ['10', '11'])
+        self.assertEquals(logger.get_entry('26')['name'], 'B')
+        # Compact all segments into one
+        logger.compact()
+        self.assertEquals(len(logger.segments()), 1)
+        self.assertEquals(logger.lines(), lines)
+        logger.rotate()
+        self.assertEquals(os.path.getsize(self.log_file), 0)
+        self.assertEquals(logger.lines(), lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
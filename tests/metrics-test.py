@@ -0,0 +1,104 @@
+import shutil
+import StringIO
+import sys
+import unittest
+
+from prjrepo.config.context import ContextManager
+from prjrepo.log import DefaultLogger
+from prjrepo.metrics import RunMetrics
+from prjrepo.provenance import ProvenanceIndex
+from prjrepo.workflow.asyncengine import AsyncWorkflowEngine
+from prjrepo.workflow.engine import WorkflowEngine
+
+from helpers import create_project, exec_command, write_command
+
+
+class TestRunMetrics(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a project with a check command that fails for odd values
+        and a logger that updates the provenance index.
+        """
+        self.base_dir = create_project(commands={
+            'check': exec_command([
+                {'type': 'CONST', 'value': 'exit $(('},
+                {'type': 'VAR', 'value': '[[value]]'},
+                {'type': 'CONST', 'value': '% 2))'}
+            ])
+        })
+        self.context = ContextManager(self.base_dir)
+        self.index = ProvenanceIndex(self.context.provenance_file)
+        self.logger = DefaultLogger(self.context.log_file, index=self.index)
+
+    def tearDown(self):
+        """Remove the temporary project repository."""
+        self.index.close()
+        shutil.rmtree(self.base_dir)
+
+    def run_values(self, values):
+        """Run the command for the given values."""
+        engine = AsyncWorkflowEngine(self.logger, max_jobs=4)
+        engine.run(
+            engine.jobs(self.context, 'check', [{'value': str(v)} for v in values])
+        )
+
+    def export(self):
+        """Update the metrics and get the exported text."""
+        metrics = RunMetrics(self.context.metrics_file)
+        metrics.update(self.logger)
+        metrics.save()
+        out = StringIO.StringIO()
+        metrics.write(out)
+        return metrics, out.getvalue()
+
+    def test_failed_runs(self):
+        """Failed runs are logged with timing and exit code but are not
+        returned to readers of successful runs.
+        """
+        self.run_values([0, 1])
+        self.assertEquals(self.logger.count(), 2)
+        self.assertEquals(len(list(self.logger.entries())), 1)
+        entries = list(self.logger.entries(failed=True))
+        self.assertEquals(sorted([e['returncode'] for e in entries]), [0, 1])
+        for entry in entries:
+            self.assertTrue(entry['endTime'] >= entry['startTime'])
+            self.assertTrue('utime' in entry['rusage'])
+        # The provenance index counts all entries but only indexes successful
+        # runs
+        self.assertEquals(self.index.sync(self.logger), 0)
+
+    def test_sequential_rusage(self):
+        """Runs of the sequential engine are logged with the resource usage
+        of their own process.
+        """
+        write_command(self.base_dir, 'alloc', exec_command([
+            {'type': 'CONST', 'value': sys.executable + ' -c "x = \' \' * '},
+            {'type': 'VAR', 'value': '[[size]]'},
+            {'type': 'CONST', 'value': '"'}
+        ]))
+        engine = WorkflowEngine(self.logger)
+        engine.run_command(self.context, 'alloc', {'size': str(256 * 1024 * 1024)})
+        engine.run_command(self.context, 'alloc', {'size': '1'})
+        large, small = [e['rusage']['maxrss'] for e in self.logger.entries()]
+        self.assertTrue(large > 256 * 1024)
+        self.assertTrue(small < large / 2)
+
+    def test_incremental_export(self):
+        """Aggregates are only updated with new log entries."""
+        self.run_values([0, 1, 2, 3])
+        metrics, text = self.export()
+        self.assertEquals(metrics.offset, 4)
+        self.assertTrue('prm_runs_total{command="check"} 4\n' in text)
+        self.assertTrue('prm_run_failures_total{command="check"} 2\n' in text)
+        self.assertTrue('prm_run_failure_ratio{command="check"} 0.5\n' in text)
+        self.assertTrue('prm_run_duration_seconds_bucket{command="check",le="+Inf"} 4\n' in text)
+        self.assertTrue(text.endswith('# EOF\n'))
+        self.run_values([4])
+        metrics = RunMetrics(self.context.metrics_file)
+        self.assertEquals(metrics.update(self.logger), 1)
+        self.assertEquals(metrics.commands['check']['runs'], 5)
+        self.assertEquals(metrics.commands['check']['failures'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from prjrepo.outputs import OutputStore, INDEX_FILE, INDEX_RECORD
+
+
+class RefreshingIndex(dict):
+    """In-memory index that refreshes the store whenever a record is added
+    to simulate a reader that refreshes the index concurrently.
+    """
+    def __init__(self, store):
+        super(RefreshingIndex, self).__init__()
+        self.store = store
+        self.refreshing = False
+
+    def __setitem__(self, key, value):
+        super(RefreshingIndex, self).__setitem__(key, value)
+        if not self.refreshing:
+            self.refreshing = True
+            try:
+                self.store.refresh()
+            finally:
+                self.refreshing = False
+
+
+class TestOutputStore(unittest.TestCase):
+
+    def setUp(self):
+        """Create a temporary directory for the store."""
+        self.base_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Remove the temporary store directory."""
+        shutil.rmtree(self.base_dir)
+
+    def test_deduplicate_outputs(self):
+        """Identical outputs are only stored once."""
+        store = OutputStore(self.base_dir)
+        key1 = store.put('0.5\n')
+        key2 = store.put('0.5\n')
+        key3 = store.put('0.7\n')
+        self.assertEquals(key1, key2)
+        self.assertNotEquals(key1, key3)
+        index_size = os.path.getsize(os.path.join(self.base_dir, INDEX_FILE))
+        self.assertEquals(index_size, 2 * INDEX_RECORD.size)
+        self.assertEquals(store.get(key1), '0.5\n')
+        self.assertEquals(store.get(key3), '0.7\n')
+
+    def test_concurrent_refresh(self):
+        """Refreshing the index while an output is added does not skip
+        records that are added by other store instances.
+        """
+        store = OutputStore(self.base_dir)
+        store.refresh()
+        store._index = RefreshingIndex(store)
+        key1 = store.put('0.5\n')
+        index_size = os.path.getsize(os.path.join(self.base_dir, INDEX_FILE))
+        self.assertEquals(store._index_size, index_size)
+        key2 = OutputStore(self.base_dir).put('0.7\n')
+        self.assertEquals(store.get(key1), '0.5\n')
+        self.assertEquals(store.get(key2), '0.7\n')
+
+    def test_read_outputs(self):
+        """Read compressed outputs from a different store instance."""
+        data = ['', 'x' * 100000, 'abc\n' * 1000]
+        keys = dict()
+        for codec in ['raw', 'zlib', 'bz2']:
+            store = OutputStore(self.base_dir, codec=codec)
+            for d in data:
+                keys[store.put(d + codec)] = d + codec
+        store = OutputStore(self.base_dir)
+        for key in keys:
+            self.assertTrue(key in store)
+            self.assertEquals(store.get(key), keys[key])
+        self.assertFalse('0' * 40 in store)
+        with self.assertRaises(ValueError):
+            store.get('0' * 40)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from prjrepo.config.context import ContextManager
+from prjrepo.project import Project
+
+from helpers import create_project, exec_command
+
+
+class TestProject(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a project with an echo command and eight contexts a/0 to
+        a/7 that each define their own id.
+        """
+        self.base_dir = create_project(commands={
+            'echo': exec_command([
+                {'type': 'CONST', 'value': 'echo'},
+                {'type': 'VAR', 'value': '[[name]]-[[value]]'}
+            ])
+        })
+        context = ContextManager(self.base_dir)
+        context.project_settings().update_value('name', value='[[prefix]].[[id]]')
+        context.project_settings().update_value('prefix', value='run')
+        self.dirs = list()
+        for i in range(8):
+            sub_dir = os.path.join(self.base_dir, 'a', str(i))
+            os.makedirs(sub_dir)
+            context = ContextManager(sub_dir)
+            context.create_context()
+            context.context_settings().update_value('id', value=str(i))
+            self.dirs.append(sub_dir)
+
+    def tearDown(self):
+        """Remove the temporary project repository."""
+        shutil.rmtree(self.base_dir)
+
+    def test_cache(self):
+        """Files are read once and again after they were modified."""
+        project = Project(self.dirs[0])
+        self.assertEquals(project.list_commands(), ['echo'])
+        _, _, components = project.render_command(self.dirs[0], 'echo', {'value': 'x'})
+        self.assertEquals(components, ['echo', 'run.0-x'])
+        misses = project.settings_cache.misses
+        _, _, components = project.render_command(self.dirs[0], 'echo', {'value': 'y'})
+        self.assertEquals(components, ['echo', 'run.0-y'])
+        self.assertEquals(project.settings_cache.misses, misses)
+        self.assertEquals(project.command_cache.misses, 1)
+        project.project_settings().update_value('prefix', value='longer-name')
+        _, _, components = project.render_command(self.dirs[0], 'echo', {'value': 'y'})
+        self.assertEquals(components, ['echo', 'longer-name.0-y'])
+        project.invalidate()
+        self.assertEquals(project.context_settings(self.dirs[1]).get_value('id'), '1')
+        with self.assertRaises(ValueError):
+            project.get_command('unknown')
+        with self.assertRaises(ValueError):
+            project.context(tempfile.gettempdir())
+
+    def test_concurrent_resolution(self):
+        """Commands are rendered concurrently from multiple threads."""
+        project = Project(self.base_dir)
+        results = dict()
+        errors = list()
+        def render(i):
+            try:
+                for j in range(50):
+                    work_dir = self.dirs[(i + j) % len(self.dirs)]
+                    settings = project.context_settings(work_dir)
+                    _, _, components = project.render_command(
+                        work_dir,
+                        'echo',
+                        {'value': str(j)}
+                    )
+                    expected = 'run.' + settings.get_value('id') + '-' + str(j)
+                    if components[1] != expected:
+                        errors.append(components[1])
+                results[i] = True
+            except Exception as ex:
+                errors.append(ex)
+        threads = [threading.Thread(target=render, args=(i,)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEquals(errors, [])
+        self.assertEquals(len(results), 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
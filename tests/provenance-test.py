@@ -0,0 +1,114 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from prjrepo.log import DefaultLogger
+from prjrepo.provenance import ProvenanceIndex
+from prjrepo.workflow.command import CommandComponent, ExecCommand
+
+
+class TestProvenanceIndex(unittest.TestCase):
+
+    def setUp(self):
+        """Create an empty log file in a temporary directory."""
+        self.base_dir = tempfile.mkdtemp()
+        self.log_file = os.path.join(self.base_dir, 'LOG')
+        open(self.log_file, 'a').close()
+        self.db_file = os.path.join(self.base_dir, 'PROVENANCE')
+        self.command = ExecCommand(
+            'convert',
+            [
+                CommandComponent('CONST', 'convert'),
+                CommandComponent('VAR', '[[in]]', io_type='FILE', as_input=True),
+                CommandComponent('VAR', '[[out]]', io_type='FILE')
+            ],
+            None
+        )
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        shutil.rmtree(self.base_dir)
+
+    def test_lineage(self):
+        """Runs are indexed by their input and output files."""
+        index = ProvenanceIndex(self.db_file)
+        logger = DefaultLogger(self.log_file, index=index)
+        run_a = logger.log(self.command, ['convert', 'a.txt', 'b.txt'], work_dir=self.base_dir)
+        run_b = logger.log(self.command, ['convert', 'b.txt', 'c.txt'], work_dir=self.base_dir)
+        runs = index.runs(os.path.join(self.base_dir, 'b.txt'))
+        self.assertEquals([(r[0], r[1]) for r in runs], [(run_a, False), (run_b, True)])
+        inputs, outputs = index.files(run_b[:8])
+        self.assertEquals(inputs, [os.path.join(self.base_dir, 'b.txt')])
+        self.assertEquals(outputs, [os.path.join(self.base_dir, 'c.txt')])
+        self.assertEquals(index.sync(logger), 0)
+        index.close()
+
+    def test_sync(self):
+        """Entries that were logged before the index existed are added on
+        sync.
+        """
+        logger = DefaultLogger(self.log_file)
+        for i in range(5):
+            logger.log(self.command, ['convert', str(i), str(i + 1)], work_dir=self.base_dir)
+        index = ProvenanceIndex(self.db_file)
+        self.assertEquals(index.sync(logger), 5)
+        self.assertEquals(index.sync(logger), 0)
+        self.assertEquals(len(index.runs(os.path.join(self.base_dir, '3'))), 2)
+        index.close()
+
+    def test_sync_entries_without_id(self):
+        """Entries in the format of earlier versions (without identifier,
+        timestamp and working directory) are indexed under their position in
+        the log.
+        """
+        with open(self.log_file, 'w') as f:
+            for i in range(2):
+                f.write(json.dumps({
+                    'name': 'convert',
+                    'components': [
+                        {'value': 'convert'},
+                        {'value': str(i), 'io': 'FILE', 'input': 'True'},
+                        {'value': str(i + 1), 'io': 'FILE', 'input': 'False'}
+                    ]
+                }) + '\n')
+        logger = DefaultLogger(self.log_file)
+        run_id = logger.log(self.command, ['convert', '2', '3'], work_dir=self.base_dir)
+        index = ProvenanceIndex(self.db_file, base_dir=self.base_dir)
+        self.assertEquals(index.sync(logger), 3)
+        self.assertEquals(index.sync(logger), 0)
+        runs = index.runs(os.path.join(self.base_dir, '1'))
+        self.assertEquals([(r[0], r[1]) for r in runs], [('1', False), ('2', True)])
+        self.assertEquals(runs[0][4], 'convert convert 0 1')
+        self.assertEquals(
+            index.files('2'),
+            ([os.path.join(self.base_dir, '1')], [os.path.join(self.base_dir, '2')])
+        )
+        self.assertEquals(index.runs(os.path.join(self.base_dir, '2'))[1][0], run_id)
+        index.close()
+
+    def test_sync_existing_log(self):
+        """Entries that were logged before and after the index was created
+        are indexed once.
+        """
+        logger = DefaultLogger(self.log_file)
+        for i in range(3):
+            logger.log(self.command, ['convert', str(i), str(i + 1)], work_dir=self.base_dir)
+        index = ProvenanceIndex(self.db_file)
+        logger = DefaultLogger(self.log_file, index=index)
+        for i in range(3, 5):
+            logger.log(self.command, ['convert', str(i), str(i + 1)], work_dir=self.base_dir)
+        self.assertEquals(index.sync(logger), 3)
+        self.assertEquals(index.sync(logger), 0)
+        for i in range(6):
+            runs = index.runs(os.path.join(self.base_dir, str(i)))
+            self.assertEquals(len(runs), 1 if i in [0, 5] else 2)
+        # Entries that are logged after a sync are not indexed again
+        logger.log(self.command, ['convert', '5', '6'], work_dir=self.base_dir)
+        self.assertEquals(index.sync(logger), 0)
+        index.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import shutil
+import time
+import unittest
+
+from prjrepo.config.context import ContextManager
+from prjrepo.log import DefaultLogger
+from prjrepo.workflow.asyncengine import AsyncWorkflowEngine
+from prjrepo.workflow.repository import DefaultCommandRepository
+from prjrepo.workflow.rerun import RunReplay, entry_arguments, parse_time, select_entries
+
+from helpers import create_project, exec_command
+
+
+class TestRunReplay(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a project and log runs of its echo command for ten
+        values.
+        """
+        self.base_dir = create_project(commands={
+            'echo': exec_command([
+                {'type': 'CONST', 'value': 'echo'},
+                {'type': 'VAR', 'value': '[[value]]'},
+                {'type': 'VAR', 'value': '[[suffix]]'}
+            ])
+        })
+        self.context = ContextManager(self.base_dir)
+        self.context.project_settings().update_value('suffix', value='old')
+        self.logger = DefaultLogger(self.context.log_file)
+        engine = AsyncWorkflowEngine(self.logger, max_jobs=4)
+        engine.run(
+            engine.jobs(
+                self.context,
+                'echo',
+                [{'value': str(i)} for i in range(10)]
+            )
+        )
+
+    def tearDown(self):
+        """Remove the temporary project repository."""
+        shutil.rmtree(self.base_dir)
+
+    def replay(self, resolve=False, match=None):
+        """Re-execute the selected runs. Returns the output of all runs."""
+        engine = AsyncWorkflowEngine(self.logger, max_jobs=4)
+        replay = RunReplay(engine, self.context, resolve=resolve)
+        outputs = list()
+        entries = select_entries(self.logger, match=match, stop=self.logger.count())
+        success, failed = engine.run(
+            replay.jobs(entries, callback=lambda job: outputs.append(job.stdout))
+        )
+        self.assertEquals(failed, 0)
+        return sorted(outputs)
+
+    def test_exact_replay(self):
+        """Recorded command lines are executed unchanged."""
+        self.context.project_settings().update_value('suffix', value='new')
+        outputs = self.replay(match='[12]')
+        self.assertEquals(outputs, ['1 old\n', '2 old\n'])
+        # Replayed runs are logged again but not selected twice
+        self.assertEquals(self.logger.count(), 12)
+        self.assertEquals(len(self.replay()), 12)
+
+    def test_resolve(self):
+        """Commands are rendered with the current context settings."""
+        self.context.project_settings().update_value('suffix', value='new')
+        outputs = self.replay(resolve=True, match='3')
+        self.assertEquals(outputs, ['3 new\n'])
+        entry = list(self.logger.entries())[-1]
+        self.assertEquals(entry['arguments'], {'value': '3'})
+
+    def test_entry_arguments(self):
+        """Arguments of old log entries are recovered from the command line."""
+        spec = DefaultCommandRepository(self.context.cmd_dir).get_command('echo')
+        entry = list(self.logger.entries())[0]
+        del entry['arguments']
+        arguments = entry_arguments(entry, spec)
+        self.assertEquals(arguments['suffix'], 'old')
+        self.assertEquals(arguments['value'], entry['components'][1]['value'])
+
+    def test_select_entries(self):
+        """Entries are selected by time range and pattern."""
+        now = time.time()
+        self.assertEquals(len(list(select_entries(self.logger, since=now + 60))), 0)
+        self.assertEquals(len(list(select_entries(self.logger, until=now + 60))), 10)
+        self.assertEquals(len(list(select_entries(self.logger, match='o*'))), 10)
+        self.assertEquals(len(list(select_entries(self.logger, command='cat'))), 0)
+        self.assertEquals(len(list(select_entries(self.logger, stop=3))), 3)
+        self.assertEquals(parse_time('1.5'), 1.5)
+        self.assertEquals(
+            parse_time('2020-01-02'),
+            time.mktime((2020, 1, 2, 0, 0, 0, 0, 0, -1))
+        )
+        with self.assertRaises(ValueError):
+            parse_time('yesterday')
+
+
+if __name__ == '__main__':
+    unittest.main()
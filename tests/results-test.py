@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from prjrepo.results import ResultCollector, ResultTable, read_npy
+from prjrepo.workflow.command import CommandComponent, ExecCommand, OutputSpec
+
+
+class TestResultCollector(unittest.TestCase):
+
+    def setUp(self):
+        """Create a temporary results directory."""
+        self.base_dir = tempfile.mkdtemp()
+        components = [CommandComponent('VAR', '[[x]]')]
+        self.cmd = ExecCommand('sim', components, OutputSpec('VALUE'))
+        self.int_cmd = ExecCommand(
+            'count',
+            components,
+            OutputSpec('VALUE', location='STDERR', dtype='int32')
+        )
+        self.no_value = ExecCommand('echo', components, None)
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        shutil.rmtree(self.base_dir)
+
+    def test_collect_values(self):
+        """Values are stored in typed columns with encoded arguments."""
+        results = ResultCollector(self.base_dir)
+        for i in range(10):
+            args = {'eq1': str(i % 3), 'eq2': str(i)}
+            self.assertTrue(results.add(self.cmd, args, str(i / 10.0) + '\n', ''))
+        self.assertTrue(results.add(self.cmd, {'eq1': '0', 'mode': 'fast'}, '1.5', ''))
+        self.assertFalse(results.add(self.cmd, {'eq1': '0'}, 'error', ''))
+        self.assertFalse(results.add(self.no_value, {'eq1': '0'}, '1', ''))
+        self.assertTrue(results.add(self.int_cmd, {}, '', '42'))
+        results.close()
+        columns = dict(ResultCollector(self.base_dir).table('sim').columns())
+        self.assertEquals(sorted(columns.keys()), ['arg.eq1', 'arg.eq2', 'arg.mode', 'value'])
+        self.assertEquals(list(columns['value']), [i / 10.0 for i in range(10)] + [1.5])
+        self.assertEquals(list(columns['arg.eq1']), [str(i % 3) for i in range(10)] + ['0'])
+        self.assertEquals(list(columns['arg.eq2']), [str(i) for i in range(10)] + [''])
+        self.assertEquals(list(columns['arg.mode']), [''] * 10 + ['fast'])
+        table = ResultTable(os.path.join(self.base_dir, 'count'))
+        self.assertEquals(table.dtype, 'int32')
+        self.assertEquals(list(dict(table.columns())['value']), [42])
+        # Codes are stored once per run, distinct values once per column
+        self.assertEquals(len(read_npy(os.path.join(self.base_dir, 'sim', 'arg.eq1.npy'))), 11)
+        with open(os.path.join(self.base_dir, 'sim', 'arg.eq1.dict')) as f:
+            self.assertEquals(len(f.readlines()), 3)
+
+    def test_concurrent_writers(self):
+        """Tables that were appended to by another writer are re-opened."""
+        writer1 = ResultCollector(self.base_dir)
+        writer2 = ResultCollector(self.base_dir)
+        writer1.add(self.cmd, {'x': 'a'}, '1', '')
+        writer2.add(self.cmd, {'x': 'b'}, '2', '')
+        writer1.add(self.cmd, {'x': 'b', 'y': 'c'}, '3', '')
+        writer2.add(self.cmd, {'x': 'a'}, '4', '')
+        columns = dict(ResultCollector(self.base_dir).table('sim').columns())
+        self.assertEquals(list(columns['value']), [1.0, 2.0, 3.0, 4.0])
+        self.assertEquals(list(columns['arg.x']), ['a', 'b', 'b', 'a'])
+        self.assertEquals(list(columns['arg.y']), ['', '', 'c', ''])
+
+    def test_value_argument(self):
+        """An argument named value does not replace the value column."""
+        results = ResultCollector(self.base_dir)
+        results.add(self.cmd, {'value': 'a'}, '1', '')
+        results.add(self.cmd, {'value': 'b'}, '2', '')
+        columns = ResultCollector(self.base_dir).table('sim').columns()
+        self.assertEquals([name for name, values in columns], ['value', 'arg.value'])
+        columns = dict(columns)
+        self.assertEquals(list(columns['value']), [1.0, 2.0])
+        self.assertEquals(list(columns['arg.value']), ['a', 'b'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+import os
+import shutil
+import subprocess
+import threading
+import time
+import unittest
+
+import prjrepo.sampling as smpl
+from prjrepo.config.context import ContextManager
+from prjrepo.log import DefaultLogger
+from prjrepo.sampling import ResourceMonitor, read_series, running_jobs, sample_tree
+from prjrepo.workflow.asyncengine import AsyncWorkflowEngine
+from prjrepo.workflow.engine import WorkflowEngine
+
+from helpers import create_project, exec_command
+
+
+class TestResourceSampling(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a project with a command that runs a short-lived process
+        tree and a resource monitor with a short sampling interval.
+        """
+        self.base_dir = create_project(commands={
+            'wait': exec_command([
+                {'type': 'CONST', 'value': 'sleep 0.3 | cat; exit'},
+                {'type': 'VAR', 'value': '[[code]]'}
+            ])
+        })
+        self.context = ContextManager(self.base_dir)
+        self.logger = DefaultLogger(self.context.log_file)
+        self.monitor = ResourceMonitor(
+            self.context.series_dir,
+            self.context.running_dir,
+            interval=0.05
+        )
+
+    def tearDown(self):
+        """Stop the sampling thread and remove the temporary project
+        repository.
+        """
+        self.monitor.close()
+        shutil.rmtree(self.base_dir)
+
+    def check_series(self, entry):
+        """Assert that the log entry references a non-empty time series."""
+        start_time, interval, samples = read_series(
+            os.path.join(self.context.series_dir, entry['series'])
+        )
+        self.assertEquals(interval, 0.05)
+        self.assertTrue(len(samples) > 1)
+        # The shell, sleep and cat are part of the process tree
+        self.assertTrue(max([s[1] for s in samples]) >= 3)
+        self.assertTrue(samples[-1][3] > 0)
+
+    def test_async_engine(self):
+        """Runs of the asynchronous engine are sampled. Failed runs keep
+        their time series.
+        """
+        engine = AsyncWorkflowEngine(self.logger, max_jobs=2, sampling=self.monitor)
+        engine.run(engine.jobs(self.context, 'wait', [{'code': '0'}, {'code': '1'}]))
+        entries = list(self.logger.entries(failed=True))
+        self.assertEquals(len(entries), 2)
+        for entry in entries:
+            self.check_series(entry)
+        self.assertEquals(running_jobs(self.context.running_dir), [])
+
+    def test_monitor_thread(self):
+        """The process trees of concurrent runs are sampled by a single
+        thread.
+        """
+        threads = threading.active_count()
+        procs = [subprocess.Popen(['sleep', '0.3']) for i in range(3)]
+        samplers = [self.monitor.sampler('sleep', self.base_dir) for p in procs]
+        for sampler, proc in zip(samplers, procs):
+            sampler.start(proc)
+        self.assertEquals(threading.active_count(), threads + 1)
+        self.assertEquals(len(running_jobs(self.context.running_dir)), 3)
+        for proc in procs:
+            proc.wait()
+        for sampler in samplers:
+            start_time, interval, samples = read_series(
+                os.path.join(self.context.series_dir, sampler.stop())
+            )
+            self.assertTrue(len(samples) > 1)
+            self.assertEquals(max([s[1] for s in samples]), 1)
+        self.monitor.close()
+        self.assertEquals(threading.active_count(), threads)
+        self.assertEquals(os.listdir(self.context.running_dir), [])
+
+    def test_stop_during_scan(self):
+        """Samplers are stopped without waiting for a scan of the process
+        table that is in progress.
+        """
+        scanning = threading.Event()
+        release = threading.Event()
+        read_processes = smpl.read_processes
+        def slow_read():
+            scanning.set()
+            release.wait(5)
+            return read_processes()
+        smpl.read_processes = slow_read
+        try:
+            proc = subprocess.Popen(['sleep', '0.3'])
+            sampler = self.monitor.sampler('sleep', self.base_dir)
+            sampler.start(proc)
+            self.assertTrue(scanning.wait(5))
+            start = time.time()
+            series = sampler.stop()
+            self.assertTrue(time.time() - start < 1)
+            release.set()
+            proc.wait()
+        finally:
+            release.set()
+            smpl.read_processes = read_processes
+        self.monitor.close()
+        # The result of the scan is not written after the sampler stopped
+        start_time, interval, samples = read_series(
+            os.path.join(self.context.series_dir, series)
+        )
+        self.assertEquals(samples, [])
+
+    def test_register_only(self):
+        """Runs are registered as running without writing a time series if
+        the monitor has no sampling interval.
+        """
+        monitor = ResourceMonitor(
+            self.context.series_dir,
+            self.context.running_dir,
+            interval=None
+        )
+        proc = subprocess.Popen(['sleep', '0.3'])
+        sampler = monitor.sampler('sleep', self.base_dir)
+        sampler.start(proc)
+        jobs = running_jobs(self.context.running_dir)
+        self.assertEquals(len(jobs), 1)
+        self.assertEquals(jobs[0]['pid'], proc.pid)
+        self.assertIsNone(jobs[0]['series'])
+        self.assertIsNone(monitor.thread)
+        proc.wait()
+        self.assertIsNone(sampler.stop())
+        self.assertEquals(os.listdir(self.context.running_dir), [])
+        self.assertEquals(os.listdir(self.context.series_dir), [])
+        with self.assertRaises(ValueError):
+            ResourceMonitor(self.context.series_dir, self.context.running_dir, interval=0)
+
+    def test_run_command(self):
+        """Runs of the sequential engine are sampled and unregistered when
+        they terminate.
+        """
+        engine = WorkflowEngine(self.logger, sampling=self.monitor)
+        engine.run_command(self.context, 'wait', {'code': '0'})
+        entry = self.logger.get_entry('1')
+        self.check_series(entry)
+        self.assertEquals(os.listdir(self.context.running_dir), [])
+        # Without a monitor runs are not sampled
+        WorkflowEngine(self.logger).run_command(self.context, 'wait', {'code': '0'})
+        self.assertFalse('series' in self.logger.get_entry('2'))
+
+    def test_sample_tree(self):
+        """Samples of a terminated process are empty."""
+        proc = subprocess.Popen(['sleep', '0.3'])
+        # Wait for the process to replace the forked interpreter
+        time.sleep(0.1)
+        count, cpu, rss = sample_tree(proc.pid)
+        self.assertEquals(count, 1)
+        self.assertTrue(rss > 0)
+        proc.wait()
+        self.assertEquals(sample_tree(proc.pid), (0, 0.0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
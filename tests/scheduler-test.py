@@ -0,0 +1,130 @@
+import unittest
+
+from prjrepo.workflow.asyncengine import Job
+from prjrepo.workflow.command import ExecCommand, Resources
+from prjrepo.workflow.scheduler import ResourceSlots
+
+
+GB = 1024 * 1024 * 1024
+
+
+def job(cpus=1, memory=0):
+    """Create a job for a command with the given requirements."""
+    cmd = ExecCommand('cmd', [], None, resources=Resources(cpus=cpus, memory=memory))
+    return Job(cmd, None, [], '.')
+
+
+class TestResourceSlots(unittest.TestCase):
+
+    def slots(self, cpus=4, memory=8 * GB, max_skips=16):
+        """Get slots for a host with the given capacity. The live memory
+        headroom is not read.
+        """
+        return ResourceSlots(
+            cpus=cpus,
+            memory=memory,
+            meminfo='/nonexistent',
+            max_skips=max_skips
+        )
+
+    def test_blocked_job_reservation(self):
+        """Small jobs are only started ahead of a blocked job until the limit
+        of skips is reached.
+        """
+        slots = self.slots(cpus=4, max_skips=2)
+        running = [job(cpus=1) for i in range(3)]
+        for j in running:
+            self.assertTrue(slots.acquire(j))
+        large = job(cpus=4)
+        self.assertFalse(slots.acquire(large))
+        # Two small jobs are backfilled ahead of the large job
+        small = [job(cpus=1) for i in range(3)]
+        self.assertTrue(slots.acquire(small[0]))
+        slots.release(running[0])
+        self.assertTrue(slots.acquire(small[1]))
+        slots.release(running[1])
+        # The third small job fits but the capacity is reserved
+        self.assertFalse(slots.acquire(large))
+        self.assertFalse(slots.acquire(small[2]))
+        for j in [running[2], small[0], small[1]]:
+            slots.release(j)
+        self.assertTrue(slots.acquire(large))
+        self.assertIsNone(slots.blocked)
+        slots.release(large)
+        self.assertTrue(slots.acquire(small[2]))
+
+    def test_cancelled_blocked_job(self):
+        """A blocked job that fits but cannot be started keeps its
+        reservation.
+        """
+        slots = self.slots(cpus=4, max_skips=1)
+        running = [job(cpus=2), job(cpus=2)]
+        for j in running:
+            self.assertTrue(slots.acquire(j))
+        large = job(cpus=4)
+        self.assertFalse(slots.acquire(large))
+        small = [job(cpus=1), job(cpus=1)]
+        slots.release(running[0])
+        self.assertTrue(slots.acquire(small[0]))
+        slots.release(running[1])
+        slots.release(small[0])
+        self.assertTrue(slots.acquire(large))
+        self.assertIsNone(slots.blocked)
+        # The job could not be started (e.g., all workers are busy)
+        slots.cancel(large)
+        self.assertIs(slots.blocked, large)
+        self.assertEquals(slots.skips, 1)
+        self.assertEquals(slots.running, 0)
+        # The capacity remains reserved for the blocked job
+        self.assertFalse(slots.acquire(small[1]))
+        self.assertTrue(slots.acquire(large))
+        self.assertFalse(slots.acquire(small[1]))
+        slots.release(large)
+        self.assertTrue(slots.acquire(small[1]))
+
+    def test_cpu_packing(self):
+        """Jobs are started while their CPUs fit into the capacity."""
+        slots = self.slots(cpus=4)
+        jobs = [job(cpus=2), job(cpus=1), job(cpus=2), job(cpus=1)]
+        self.assertTrue(slots.acquire(jobs[0]))
+        self.assertTrue(slots.acquire(jobs[1]))
+        self.assertFalse(slots.acquire(jobs[2]))
+        self.assertTrue(slots.acquire(jobs[3]))
+        self.assertEquals(slots.used_cpus, 4)
+        slots.release(jobs[0])
+        self.assertEquals(slots.used_cpus, 2)
+        self.assertEquals(slots.running, 2)
+        self.assertTrue(slots.acquire(jobs[2]))
+
+    def test_memory_packing(self):
+        """Jobs are started while their memory fits into the capacity."""
+        slots = self.slots(cpus=8, memory=4 * GB)
+        jobs = [job(memory=3 * GB), job(memory=2 * GB), job(memory=1 * GB)]
+        self.assertTrue(slots.acquire(jobs[0]))
+        self.assertFalse(slots.acquire(jobs[1]))
+        self.assertTrue(slots.acquire(jobs[2]))
+        self.assertEquals(slots.used_memory, 4 * GB)
+        slots.release(jobs[0])
+        self.assertEquals(slots.used_memory, 1 * GB)
+        self.assertTrue(slots.acquire(jobs[1]))
+
+    def test_oversized_job(self):
+        """A job that is larger than the host is only started when no other
+        job is running.
+        """
+        slots = self.slots(cpus=2, memory=1 * GB)
+        small = job(cpus=1)
+        large = job(cpus=4, memory=2 * GB)
+        self.assertTrue(slots.acquire(small))
+        self.assertFalse(slots.acquire(large))
+        slots.release(small)
+        self.assertTrue(slots.acquire(large))
+        self.assertFalse(slots.acquire(job(cpus=1)))
+        slots.release(large)
+        self.assertEquals(slots.running, 0)
+        self.assertEquals(slots.used_cpus, 0)
+        self.assertEquals(slots.used_memory, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from prjrepo.config.context import ContextManager
+from prjrepo.log import DefaultLogger
+from prjrepo.staging import StagingCache
+from prjrepo.workflow.asyncengine import JOB_STATE_PENDING, AsyncWorkflowEngine
+
+from helpers import create_project, exec_command
+
+
+class TestStagingCache(unittest.TestCase):
+
+    def setUp(self):
+        """Create a temporary directory with input files and a cache
+        directory.
+        """
+        self.base_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.base_dir, 'cache')
+        self.input_dir = os.path.join(self.base_dir, 'inputs')
+        os.makedirs(os.path.join(self.input_dir, 'index'))
+        for name, size in [('a', 100), ('b', 100), ('c', 100), ('index/x', 50)]:
+            with open(os.path.join(self.input_dir, name), 'w') as f:
+                f.write('x' * size)
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        shutil.rmtree(self.base_dir)
+
+    def init_project(self):
+        """Create a project with a command that prints the path of its input
+        file. Returns the context and the logger of the project.
+        """
+        work_dir = os.path.join(self.base_dir, 'project')
+        os.mkdir(work_dir)
+        create_project(work_dir, commands={
+            'show': exec_command([
+                {'type': 'CONST', 'value': 'echo'},
+                {'type': 'VAR', 'value': '[[name]]', 'ioType': 'FILE', 'asInput': True}
+            ])
+        })
+        with open(os.path.join(work_dir, 'data.txt'), 'w') as f:
+            f.write('data\n')
+        context = ContextManager(work_dir)
+        return context, DefaultLogger(context.log_file)
+
+    def test_background_staging(self):
+        """Inputs are staged without blocking the engine. Jobs are started
+        once their inputs are staged.
+        """
+        context, logger = self.init_project()
+        release = threading.Event()
+        class SlowCache(StagingCache):
+            def stage(self, path):
+                release.wait(5)
+                return StagingCache.stage(self, path)
+        engine = AsyncWorkflowEngine(logger, staging=SlowCache(self.cache_dir))
+        job = engine.submit(context, 'show', {'name': 'data.txt'})
+        start = time.time()
+        self.assertEquals(engine.poll(timeout=0.05), [])
+        self.assertTrue(time.time() - start < 1)
+        self.assertEquals(job.state, JOB_STATE_PENDING)
+        release.set()
+        self.assertEquals(engine.run(), (1, 0))
+        engine.close()
+        self.assertTrue(job.stdout.startswith(os.path.abspath(self.cache_dir)))
+
+    def test_engine(self):
+        """Executed command lines reference staged inputs while logged
+        command lines reference the original files.
+        """
+        context, logger = self.init_project()
+        engine = AsyncWorkflowEngine(
+            logger,
+            max_jobs=2,
+            staging=StagingCache(self.cache_dir)
+        )
+        outputs = list()
+        engine.run(
+            engine.jobs(
+                context,
+                'show',
+                [{'name': 'data.txt'}] * 3,
+                callback=lambda job: outputs.append(job.stdout.strip())
+            )
+        )
+        self.assertEquals(len(set(outputs)), 1)
+        self.assertTrue(outputs[0].startswith(os.path.abspath(self.cache_dir)))
+        with open(outputs[0], 'r') as f:
+            self.assertEquals(f.read(), 'data\n')
+        self.assertEquals(engine.staging.misses, 1)
+        self.assertEquals(engine.staging.hits, 2)
+        for entry in logger.entries():
+            self.assertEquals(entry['components'][1]['value'], 'data.txt')
+
+    def test_shared_cache(self):
+        """Entries that are used by another process are not evicted until
+        the process releases them.
+        """
+        path_a = os.path.join(self.input_dir, 'a')
+        path_b = os.path.join(self.input_dir, 'b')
+        other = StagingCache(self.cache_dir, max_size=150)
+        staged_a = other.stage(path_a)
+        old = time.time() - 60
+        os.utime(os.path.dirname(staged_a), (old, old))
+        cache = StagingCache(self.cache_dir, max_size=150)
+        self.assertEquals(cache.stage(path_b), path_b)
+        self.assertTrue(os.path.isfile(staged_a))
+        # Hits are pinned as well
+        self.assertEquals(cache.stage(path_a), staged_a)
+        other.close()
+        self.assertEquals(cache.stage(path_b), path_b)
+        cache.close()
+        staged_b = cache.stage(path_b)
+        self.assertNotEquals(staged_b, path_b)
+        self.assertFalse(os.path.exists(staged_a))
+        cache.close()
+
+    def test_stage(self):
+        """Inputs are staged once, restaged after they change and evicted in
+        least recently used order.
+        """
+        cache = StagingCache(self.cache_dir, max_size=240)
+        path = os.path.join(self.input_dir, 'a')
+        staged = cache.stage(path)
+        self.assertNotEquals(staged, path)
+        self.assertEquals(cache.stage(path), staged)
+        self.assertEquals((cache.hits, cache.misses), (1, 1))
+        staged_dir = cache.stage(os.path.join(self.input_dir, 'index'))
+        self.assertTrue(os.path.isfile(os.path.join(staged_dir, 'x')))
+        # Entries used by this process are not evicted
+        path_b = os.path.join(self.input_dir, 'b')
+        self.assertEquals(cache.stage(path_b), path_b)
+        # A new process evicts the least recently used entry once the
+        # entries are released
+        cache.close()
+        cache = StagingCache(self.cache_dir, max_size=240)
+        old = time.time() - 60
+        os.utime(os.path.dirname(staged), (old, old))
+        self.assertNotEquals(cache.stage(path_b), path_b)
+        self.assertFalse(os.path.exists(staged))
+        self.assertTrue(os.path.exists(staged_dir))
+        # Modified inputs are staged again
+        with open(path_b, 'a') as f:
+            f.write('y')
+        staged_b = cache.stage(path_b)
+        with open(staged_b, 'r') as f:
+            self.assertEquals(len(f.read()), 101)
+        # Missing inputs and inputs that exceed the budget are not staged
+        missing = os.path.join(self.input_dir, 'missing')
+        self.assertEquals(cache.stage(missing), missing)
+        self.assertEquals(StagingCache(self.cache_dir, max_size=10).stage(path), path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import shutil
+import unittest
+
+import prjrepo.config as conf
+from prjrepo.completion import CompletionIndex
+from prjrepo.config.context import ContextManager
+from prjrepo.config.migrate import migrate_to_files, migrate_to_store
+from prjrepo.project import Project
+
+from helpers import create_project
+
+
+class TestSettingsStore(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a project with settings in the project file and in the
+        nested contexts a and a/b.
+        """
+        self.base_dir = create_project()
+        ContextManager(self.base_dir).project_settings().update_value('x.y', value='p')
+        self.dir_a = os.path.join(self.base_dir, 'a')
+        self.dir_b = os.path.join(self.dir_a, 'b')
+        os.makedirs(self.dir_b)
+        for work_dir, name in [(self.dir_a, 'A'), (self.dir_b, 'B')]:
+            context = ContextManager(work_dir)
+            context.create_context()
+            context.context_settings().update_value('name', value=name)
+        ContextManager(self.dir_a).context_settings().update_value('x.z', value='[[name]]')
+
+    def tearDown(self):
+        """Remove the temporary project repository."""
+        shutil.rmtree(self.base_dir)
+
+    def snapshot(self):
+        """Get the effective settings of all contexts and the project."""
+        return list(ContextManager(self.base_dir).context_tree())
+
+    def test_context_operations(self):
+        """Creating contexts and updating values uses the store."""
+        migrate_to_store(ContextManager(self.base_dir))
+        dir_c = os.path.join(self.base_dir, 'c')
+        os.mkdir(dir_c)
+        context = ContextManager(dir_c)
+        context.create_context()
+        with self.assertRaises(RuntimeError):
+            context.create_context()
+        context.context_settings().update_value('name', value='C')
+        self.assertEquals(os.listdir(context.context_dir), [])
+        self.assertEquals(os.path.getsize(context.contextls_file), 0)
+        # Cascading updates change all contexts along the path but not the
+        # project settings
+        settings = ContextManager(self.dir_b).context_settings()
+        settings.update_value('x.y', value=None, cascade=True)
+        self.assertEquals(settings.get_value('x.y'), 'p')
+        settings.update_value('name', value='D', cascade=True)
+        self.assertEquals(ContextManager(self.dir_a).context_settings().get_value('name'), 'D')
+        self.assertEquals(ContextManager(self.base_dir).project_settings().settings, {'x': {'y': 'p'}})
+        # The project facade sees the changes
+        project = Project(self.base_dir)
+        self.assertEquals(project.context_settings(dir_c).get_value('name'), 'C')
+        self.assertEquals(project.context_settings(self.dir_b).get_value('x.z'), 'D')
+        project.project_settings().update_value('x.y', value='q')
+        self.assertEquals(project.context_settings(self.dir_b).get_value('x.y'), 'q')
+        # All context managers of the project share its store
+        self.assertIs(project.context(dir_c).store, project.store)
+        self.assertIs(project.context(self.dir_b).store, project.store)
+        project.close()
+
+    def test_completion(self):
+        """Completion keys are taken from the store."""
+        migrate_to_store(ContextManager(self.base_dir))
+        index = CompletionIndex(os.path.join(self.base_dir, conf.REPO_DIR))
+        index.refresh()
+        self.assertEquals(index.keys(project_only=True), ['x.y'])
+        self.assertEquals(index.keys(), ['name', 'x.y', 'x.z'])
+
+    def test_migrate(self):
+        """Settings are unchanged by migrating to the store and back."""
+        before = self.snapshot()
+        context = ContextManager(self.dir_b)
+        self.assertEquals(migrate_to_store(context), 2)
+        self.assertFalse(context.store is None)
+        with self.assertRaises(RuntimeError):
+            migrate_to_store(context)
+        self.assertEquals(os.listdir(context.context_dir), [])
+        self.assertEquals(self.snapshot(), before)
+        self.assertEquals(ContextManager(self.dir_b).context_settings().get_value('x.z'), 'B')
+        self.assertEquals(migrate_to_files(ContextManager(self.base_dir)), 2)
+        self.assertFalse(os.path.isfile(os.path.join(self.base_dir, conf.REPO_DIR, conf.STORE_FILE)))
+        self.assertTrue(ContextManager(self.base_dir).store is None)
+        self.assertEquals(self.snapshot(), before)
+
+
+if __name__ == '__main__':
+    unittest.main()
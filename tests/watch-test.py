@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from prjrepo.config.context import ContextManager
+from prjrepo.log import DefaultLogger
+from prjrepo.workflow.asyncengine import AsyncWorkflowEngine
+from prjrepo.workflow.watch import PollingWatcher, WatchRunner, get_watcher, is_affected
+
+from helpers import create_project, exec_command
+
+
+class TestWatch(unittest.TestCase):
+
+    def setUp(self):
+        """Create a temporary directory with an input file and directory."""
+        self.base_dir = tempfile.mkdtemp()
+        self.input_file = os.path.join(self.base_dir, 'input.txt')
+        self.input_dir = os.path.join(self.base_dir, 'data')
+        with open(self.input_file, 'w') as f:
+            f.write('A')
+        os.mkdir(self.input_dir)
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        shutil.rmtree(self.base_dir)
+
+    def test_is_affected(self):
+        """Directories are affected by changes to their entries."""
+        changes = set([os.path.join(self.input_dir, 'x.csv')])
+        self.assertTrue(is_affected(self.input_dir, changes))
+        self.assertFalse(is_affected(self.input_file, changes))
+        self.assertFalse(is_affected(self.input_dir + 'x', changes))
+
+    def test_watch_runner(self):
+        """Changing an input file only re-runs the instances that read it."""
+        create_project(self.base_dir, commands={
+            'cat': exec_command([
+                {'type': 'CONST', 'value': 'cat'},
+                {'type': 'VAR', 'value': '[[in]]', 'ioType': 'FILE', 'asInput': True}
+            ])
+        })
+        for name in ['a.txt', 'b.txt']:
+            with open(os.path.join(self.base_dir, name), 'w') as f:
+                f.write(name)
+        context = ContextManager(self.base_dir)
+        engine = AsyncWorkflowEngine(DefaultLogger(context.log_file), max_jobs=2)
+        runs = list()
+        def callback(job):
+            runs.append(job.arguments['in'])
+            # Change one input after the initial run of all instances
+            if len(runs) == 2:
+                with open(os.path.join(self.base_dir, 'a.txt'), 'a') as f:
+                    f.write('B')
+        runner = WatchRunner(
+            engine,
+            context,
+            'cat',
+            [{'in': 'a.txt'}, {'in': 'b.txt'}],
+            watcher=PollingWatcher(interval=0.01),
+            debounce=0.05,
+            callback=callback
+        )
+        runner.run(iterations=1, timeout=5)
+        self.assertEquals(sorted(runs[:2]), ['a.txt', 'b.txt'])
+        self.assertEquals(runs[2:], ['a.txt'])
+
+    def test_watchers(self):
+        """Detect changes to watched files and directories."""
+        for watcher in [PollingWatcher(interval=0.01), get_watcher()]:
+            watcher.add(self.input_file)
+            watcher.add(self.input_dir)
+            self.assertEquals(len(watcher.wait(0.05)), 0)
+            with open(self.input_file, 'a') as f:
+                f.write('B')
+            self.assertTrue(self.input_file in watcher.wait(1))
+            open(os.path.join(self.input_dir, 'x.csv'), 'w').close()
+            changes = watcher.wait(1)
+            self.assertTrue(is_affected(self.input_dir, changes))
+            watcher.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import os
+import shutil
+import sys
+import unittest
+
+from prjrepo.config.context import ContextManager
+from prjrepo.log import DefaultLogger
+from prjrepo.workflow.asyncengine import AsyncWorkflowEngine
+from prjrepo.workflow.command import WorkerSpec
+from prjrepo.workflow.workers import WorkerPool
+
+from helpers import create_project, exec_command, write_command
+
+
+"""Worker that answers each request with its process id and the arguments.
+The worker terminates when it receives the argument 'crash'.
+"""
+WORKER_SCRIPT = '''import json
+import os
+import sys
+
+line = sys.stdin.readline()
+while line:
+    args = json.loads(line)
+    if args == ['crash']:
+        sys.exit(3)
+    print('log ' + args[0])
+    print(json.dumps({
+        'returncode': 0,
+        'stdout': str(os.getpid()) + ' ' + ' '.join(args),
+        'stderr': ''
+    }))
+    sys.stdout.flush()
+    line = sys.stdin.readline()
+'''
+
+
+class TestPersistentWorkers(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a project whose work command runs in a pool of persistent
+        worker processes.
+        """
+        self.base_dir = create_project()
+        self.script = os.path.join(self.base_dir, 'worker.py')
+        with open(self.script, 'w') as f:
+            f.write(WORKER_SCRIPT)
+        write_command(self.base_dir, 'work', exec_command(
+            [
+                {'type': 'CONST', 'value': sys.executable},
+                {'type': 'CONST', 'value': self.script},
+                {'type': 'VAR', 'value': '[[value]]'}
+            ],
+            worker={'prefix': 2, 'poolSize': 2, 'maxJobs': 3}
+        ))
+        self.context = ContextManager(self.base_dir)
+        self.logger = DefaultLogger(self.context.log_file)
+
+    def tearDown(self):
+        """Remove the temporary project repository."""
+        shutil.rmtree(self.base_dir)
+
+    def test_engine_workers(self):
+        """Jobs are run by a bounded pool of recycled workers."""
+        engine = AsyncWorkflowEngine(self.logger, max_jobs=4)
+        outputs = dict()
+        def callback(job):
+            outputs[job.arguments['value']] = job.stdout
+        argument_sets = [{'value': str(i)} for i in range(12)]
+        try:
+            success, failed = engine.run(
+                engine.jobs(self.context, 'work', argument_sets, callback=callback)
+            )
+        finally:
+            engine.close()
+        self.assertEquals(success, 12)
+        self.assertEquals(failed, 0)
+        self.assertTrue(engine.is_idle)
+        pids = dict()
+        for i in range(12):
+            pid, value = outputs[str(i)].split()
+            self.assertEquals(value, str(i))
+            pids[pid] = pids.get(pid, 0) + 1
+        # Each worker runs at most three jobs
+        self.assertTrue(len(pids) >= 4)
+        self.assertTrue(max(pids.values()) <= 3)
+        self.assertEquals(len(self.logger.lines()), 12)
+
+    def test_worker_crash(self):
+        """Jobs of terminated workers are retried once and then fail."""
+        engine = AsyncWorkflowEngine(self.logger, max_jobs=2)
+        try:
+            crash = engine.submit(self.context, 'work', {'value': 'crash'})
+            job = engine.submit(self.context, 'work', {'value': 'a'})
+            success, failed = engine.run()
+        finally:
+            engine.close()
+        self.assertEquals(success, 1)
+        self.assertEquals(failed, 1)
+        self.assertEquals(crash.attempts, 2)
+        self.assertEquals(crash.returncode, 3)
+        self.assertTrue(job.succeeded)
+        self.assertEquals(job.stdout.split()[1], 'a')
+        self.assertEquals(job.stderr, 'log a\n')
+
+    def test_worker_pool(self):
+        """Idle workers are reused for the same command line."""
+        pool = WorkerPool()
+        spec = WorkerSpec(2, pool_size=1)
+        cmd_line = sys.executable + ' ' + self.script
+        try:
+            worker = pool.acquire(spec, cmd_line, self.base_dir)
+            worker.job = 'job'
+            self.assertIsNone(pool.acquire(spec, cmd_line, self.base_dir))
+            self.assertEquals(pool.busy, 1)
+            stdout, stderr, returncode = worker.run(['x', 'y'])
+            self.assertEquals(stdout, str(worker.proc.pid) + ' x y')
+            self.assertEquals(stderr, 'log x\n')
+            self.assertEquals(returncode, 0)
+            self.assertTrue(pool.release(worker, spec))
+            self.assertEquals(pool.busy, 0)
+            self.assertIs(pool.acquire(spec, cmd_line, self.base_dir), worker)
+            stdout, stderr, returncode = worker.run(['crash'])
+            self.assertEquals(returncode, -1)
+            pool.remove(worker)
+            self.assertIsNot(pool.acquire(spec, cmd_line, self.base_dir), worker)
+        finally:
+            pool.close()
+
+
+if __name__ == '__main__':
+    unittest.main()